@@ -0,0 +1,117 @@
+"""
+Management command to benchmark the orjson renderer/parser against DRF's.
+
+Renders and parses two large list payloads with DRF's JSONRenderer /
+JSONParser and with FastJSONRenderer / FastJSONParser:
+    - serialized: a TransactionLogListView page of --rows transactions as
+      produced by TransactionLogSerializer (amounts and datetimes already
+      strings)
+    - raw: the same rows as hand-built dicts holding Decimal, datetime and
+      UUID values, as several views return them
+
+The rows are built in memory, nothing is read from or written to the
+database.
+
+Usage:
+    python manage.py benchmark_json_renderer
+    python manage.py benchmark_json_renderer --rows 5000 --repeat 50
+"""
+
+import io
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from bill_pay.models import PaymentStatus, TransactionLog
+from bill_pay.serializers import TransactionLogSerializer
+from credbuzzpay_backend.renderers import ORJSON_AVAILABLE, FastJSONParser, FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Compare render/parse time of the orjson JSON renderer and parser with DRF defaults'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per payload (default: 1000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement (default: 20)')
+
+    def handle(self, *args, **options):
+        if not ORJSON_AVAILABLE:
+            self.stdout.write(self.style.WARNING('orjson is not installed: FastJSONRenderer falls back to DRF'))
+
+        rows = self._transactions(options['rows'])
+        payloads = {
+            'serialized': self._envelope(TransactionLogSerializer(rows, many=True).data),
+            'raw': self._envelope([self._raw(row) for row in rows]),
+        }
+
+        self.stdout.write(self.style.SUCCESS(
+            f"JSON benchmark: {options['rows']} rows, best of {options['repeat']} runs"
+        ))
+        for name, data in payloads.items():
+            body = JSONRenderer().render(data)
+            self.stdout.write(f'  {name} payload ({len(body) / 1024:.0f} KiB)')
+
+            drf = self._best(lambda: JSONRenderer().render(data), options['repeat'])
+            fast = self._best(lambda: FastJSONRenderer().render(data), options['repeat'])
+            self.stdout.write(f'    render: DRF {drf:.2f} ms, orjson {fast:.2f} ms ({drf / fast:.1f}x)')
+
+            drf = self._best(lambda: JSONParser().parse(io.BytesIO(body)), options['repeat'])
+            fast = self._best(lambda: FastJSONParser().parse(io.BytesIO(body)), options['repeat'])
+            self.stdout.write(f'    parse:  DRF {drf:.2f} ms, orjson {fast:.2f} ms ({drf / fast:.1f}x)')
+
+    def _transactions(self, count):
+        """Unsaved TransactionLog rows with realistic values"""
+        now = timezone.now()
+        rows = []
+        for i in range(count):
+            amount = Decimal(f'{(i * 37) % 50000}.{i % 100:02d}')
+            rows.append(TransactionLog(
+                id=i + 1,
+                transaction_id=f'TXN{i:016d}',
+                transaction_type='BILL_PAYMENT',
+                status=PaymentStatus.SUCCESS,
+                amount=amount,
+                fee=Decimal('1.50'),
+                total_amount=amount + Decimal('1.50'),
+                payment_method='UPI',
+                description=f'Electricity bill for consumer {i:08d}',
+                initiated_at=now - timedelta(minutes=i),
+                completed_at=now - timedelta(minutes=i, seconds=-3),
+            ))
+        return rows
+
+    def _raw(self, row):
+        return {
+            'id': row.id,
+            'reference': uuid.uuid4(),
+            'transaction_id': row.transaction_id,
+            'status': row.status,
+            'amount': row.amount,
+            'fee': row.fee,
+            'total_amount': row.total_amount,
+            'initiated_at': row.initiated_at,
+            'completed_at': row.completed_at,
+        }
+
+    def _envelope(self, transactions):
+        return {
+            'success': True,
+            'message': 'Transaction logs retrieved successfully.',
+            'data': {'transactions': transactions, 'pagination': {'page': 1, 'total_count': len(transactions)}},
+        }
+
+    def _best(self, func, repeat):
+        """Fastest of repeat runs, in milliseconds"""
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000
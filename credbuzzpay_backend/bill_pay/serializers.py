@@ -4,6 +4,7 @@ Bill Pay Serializers
 Serializers for bill payment APIs.
 """
 
+from django.db.models import Count, Q
 from rest_framework import serializers
 from .models import BillCategory, Biller, BillPayment, SavedBiller, PaymentStatus
 
@@ -18,7 +19,14 @@ class BillCategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'code', 'description', 'icon', 'is_active', 'display_order', 'billers_count']
         read_only_fields = ['id', 'created_at', 'updated_at']
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Count active billers in the list query instead of once per category"""
+        return queryset.annotate(active_billers_count=Count('billers', filter=Q(billers__is_active=True)))
+    
     def get_billers_count(self, obj):
+        if hasattr(obj, 'active_billers_count'):
+            return obj.active_billers_count
         return obj.billers.filter(is_active=True).count()
 
 
@@ -612,3 +612,178 @@ class PaymentGatewayTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data.get('success'))
         self.assertGreaterEqual(len(response.data['data']['gateways']), 1)
+
+
+class ConditionalCatalogTests(APITestCase):
+    """Tests for ETag / Last-Modified revalidation of the catalog endpoints."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='catalogpoller',
+            email='catalogpoller@example.com',
+            phone_number='9876543218'
+        )
+        cls.category = BillCategory.objects.create(name='Water', code='WATER', display_order=1)
+        Biller.objects.create(category=cls.category, name='City Water', code='CITY_WATER')
+    
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+    
+    def test_matching_etag_returns_not_modified(self):
+        """Test If-None-Match with the current ETag gets an empty 304."""
+        response = self.client.get('/api/bills/categories/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        
+        response = self.client.get('/api/bills/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+    
+    def test_catalog_change_changes_etag(self):
+        """Test editing a category invalidates both category and biller ETags."""
+        categories = self.client.get('/api/bills/categories/')['ETag']
+        billers = self.client.get('/api/bills/billers/')['ETag']
+        
+        self.category.description = 'Municipal water supply'
+        self.category.save()
+        
+        response = self.client.get('/api/bills/categories/', HTTP_IF_NONE_MATCH=categories)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], categories)
+        response = self.client.get('/api/bills/billers/', HTTP_IF_NONE_MATCH=billers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_query_string_is_part_of_etag(self):
+        """Test filtered lists don't share an ETag with the full list."""
+        full = self.client.get('/api/bills/billers/')['ETag']
+        response = self.client.get('/api/bills/billers/?search=city', HTTP_IF_NONE_MATCH=full)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_if_modified_since(self):
+        """Test If-Modified-Since with the Last-Modified value gets a 304."""
+        last_modified = self.client.get('/api/bills/categories/')['Last-Modified']
+        response = self.client.get('/api/bills/categories/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class FastJSONCompatibilityTests(TestCase):
+    """Tests that the orjson renderer/parser match DRF's JSONRenderer/JSONParser byte for byte."""
+    
+    SERIALIZER_MODULES = (
+        'users_auth.serializers', 'rbac.serializers', 'kyc_verification.serializers', 'bill_pay.serializers',
+    )
+    
+    @classmethod
+    def setUpTestData(cls):
+        from kyc_verification.models import KYCApplication
+        from rbac.models import App, Feature, RoleAppMapping, UserRole, UserRoleAssignment
+        
+        cls.user = User.objects.create(
+            username='jsonuser', email='jsonuser@example.com', phone_number='9876543219', first_name='Zoë'
+        )
+        KYCApplication.objects.create(user=cls.user)
+        role = UserRole.objects.create(name='JSON Client', code='JSON_CLIENT', level=5)
+        app = App.objects.create(name='JSON App', code='JSON_APP')
+        Feature.objects.create(app=app, name='JSON Feature', code='JSON_FEATURE')
+        RoleAppMapping.objects.create(role=role, app=app, can_view=True)
+        UserRoleAssignment.objects.create(user=cls.user, role=role, is_primary=True)
+        
+        category = BillCategory.objects.create(name='Gas ₹', code='GAS', display_order=1)
+        biller = Biller.objects.create(
+            category=category, name='City Gas', code='CITY_GAS',
+            min_amount=Decimal('1.00'), max_amount=Decimal('99999.99')
+        )
+        BillPayment.objects.create(
+            user=cls.user, biller=biller, consumer_number='C123', bill_amount=Decimal('1234.50'),
+            total_amount=Decimal('1235.50'), consumer_details={'name': 'Zoë', 'units': [1, 2.5]}
+        )
+        TransactionLog.objects.create(
+            user=cls.user, transaction_type='BILL_PAYMENT', amount=Decimal('1234.50'),
+            fee=Decimal('1.00'), total_amount=Decimal('1235.50'), description='line\u2028separator'
+        )
+    
+    def assertSameRender(self, data):
+        from rest_framework.renderers import JSONRenderer
+        from credbuzzpay_backend.renderers import FastJSONRenderer
+        
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+    
+    def test_all_model_serializers(self):
+        """Test every ModelSerializer's output of the fixture rows renders identically."""
+        import importlib
+        import inspect
+        from rest_framework import serializers
+        
+        checked = 0
+        for module_name in self.SERIALIZER_MODULES:
+            module = importlib.import_module(module_name)
+            for name, serializer_class in inspect.getmembers(module, inspect.isclass):
+                if not issubclass(serializer_class, serializers.ModelSerializer) or serializer_class.__module__ != module_name:
+                    continue
+                instances = serializer_class.Meta.model._default_manager.all()[:5]
+                if not instances:
+                    continue
+                with self.subTest(serializer=f'{module_name}.{name}'):
+                    try:
+                        data = serializer_class(instances, many=True).data
+                    except Exception:
+                        # Serializers needing request context can't run here
+                        continue
+                    self.assertSameRender({'success': True, 'message': name, 'data': data})
+                    checked += 1
+        self.assertGreater(checked, 10)
+    
+    def test_native_types(self):
+        """Test raw values placed in response envelopes render identically."""
+        import datetime
+        import uuid
+        from django.utils import timezone
+        from django.utils.translation import gettext_lazy
+        
+        now = timezone.now()
+        self.assertSameRender({
+            'success': True,
+            'message': gettext_lazy('Done'),
+            'data': {
+                'amounts': [Decimal('0.10'), Decimal('1234.50'), Decimal('-7'), Decimal('1E+2')],
+                'aware': now,
+                'utc_no_micro': now.replace(microsecond=0),
+                'ist': now.astimezone(datetime.timezone(datetime.timedelta(hours=5, minutes=30))),
+                'naive': datetime.datetime(2024, 1, 2, 3, 4, 5, 600),
+                'date': datetime.date(2024, 1, 2),
+                'time': datetime.time(3, 4, 5),
+                'duration': datetime.timedelta(minutes=5),
+                'id': uuid.uuid4(),
+                'ints': {1: 'one', 2: 'two'},
+                'tuple': (1, 'a', None, True, 1.5),
+                'queryset': BillCategory.objects.values_list('code', flat=True),
+                'text': 'Zoë ₹ \u2028 \u2029 "quoted" \\ \n',
+                'big': 2 ** 70,
+            },
+        })
+    
+    def test_parser(self):
+        """Test request bodies parse like JSONParser and errors raise ParseError."""
+        import io
+        from rest_framework.exceptions import ParseError
+        from rest_framework.parsers import JSONParser
+        from credbuzzpay_backend.renderers import FastJSONParser
+        
+        body = '{"amount": 12.5, "name": "Zoë", "items": [1, null, true], "nested": {"a": "\\u20b9"}}'.encode()
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for bad in (b'{"a": ', b'NaN', b'\xff'):
+            with self.subTest(body=bad), self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(bad))
+    
+    def test_api_response(self):
+        """Test an API response goes through the configured renderer."""
+        from rest_framework.test import APIClient
+        
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/bills/transactions/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'\\u2028', response.content)
+        self.assertEqual(response.json()['data']['transactions'][0]['amount'], '1234.50')
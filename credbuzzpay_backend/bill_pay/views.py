@@ -12,6 +12,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
+from credbuzzpay_backend.conditional import conditional_get, queryset_version
 from .models import BillCategory, Biller, BillPayment, SavedBiller, BillFetchLog, PaymentStatus
 from .serializers import (
     BillCategorySerializer, BillerSerializer, BillerListSerializer,
@@ -22,16 +23,33 @@ from .serializers import (
 )
 
 
+def categories_version(view, request):
+    latest, count = queryset_version(BillCategory.objects.filter(is_active=True))
+    return (latest, count), latest
+
+
+def billers_version(view, request):
+    """Biller lists also show category names"""
+    biller_latest, biller_count = queryset_version(Biller.objects.filter(is_active=True))
+    category_latest, category_count = queryset_version(BillCategory.objects.all())
+    latest = max(filter(None, (biller_latest, category_latest)), default=None)
+    return (biller_latest, biller_count, category_latest, category_count), latest
+
+
 class BillCategoryListView(APIView):
     """
     List all active bill categories.
     
     GET /api/bills/categories/
+    
+    Supports conditional GET (ETag / Last-Modified).
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
+    @conditional_get(categories_version)
     def get(self, request):
-        categories = BillCategory.objects.filter(is_active=True)
+        categories = BillCategorySerializer.setup_eager_loading(BillCategory.objects.filter(is_active=True))
         serializer = BillCategorySerializer(categories, many=True)
         
         return Response({
@@ -51,9 +69,13 @@ class BillerListView(APIView):
     GET /api/bills/billers/?category_id=1
     GET /api/bills/billers/?search=electricity
     GET /api/bills/billers/?featured=true
+    
+    Supports conditional GET (ETag / Last-Modified).
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 7
     
+    @conditional_get(billers_version)
     def get(self, request):
         billers = Biller.objects.filter(is_active=True).select_related('category')
         
@@ -98,6 +120,7 @@ class BillerDetailView(APIView):
     GET /api/bills/billers/<biller_id>/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request, biller_id):
         try:
@@ -126,6 +149,7 @@ class FeaturedBillersView(APIView):
     GET /api/bills/featured/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         billers = Biller.objects.filter(
@@ -156,6 +180,7 @@ class BillFetchView(APIView):
     }
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def post(self, request):
         serializer = BillFetchRequestSerializer(data=request.data)
@@ -229,6 +254,7 @@ class BillPaymentView(APIView):
     }
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 8
     
     def post(self, request):
         serializer = BillPaymentRequestSerializer(data=request.data)
@@ -307,6 +333,7 @@ class PaymentHistoryView(APIView):
     GET /api/bills/history/?start_date=2025-01-01&end_date=2025-01-31
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def get(self, request):
         payments = BillPayment.objects.filter(user=request.user).select_related('biller', 'biller__category')
@@ -375,6 +402,7 @@ class PaymentDetailView(APIView):
     GET /api/bills/payments/<transaction_id>/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request, transaction_id):
         try:
@@ -406,6 +434,7 @@ class RecentPaymentsView(APIView):
     GET /api/bills/recent/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         payments = BillPayment.objects.filter(
@@ -431,6 +460,7 @@ class SavedBillerListView(APIView):
     POST /api/bills/saved/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 8}
     
     def get(self, request):
         saved_billers = SavedBiller.objects.filter(user=request.user).select_related('biller', 'biller__category')
@@ -473,6 +503,7 @@ class SavedBillerDetailView(APIView):
     DELETE /api/bills/saved/<id>/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'put': 6, 'delete': 6}
     
     def get_object(self, pk, user):
         try:
@@ -562,6 +593,7 @@ class BankAccountListView(APIView):
     POST /api/bills/bank-accounts/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 6}
     
     def get(self, request):
         accounts = UserBankAccount.objects.filter(user=request.user, is_active=True)
@@ -605,6 +637,7 @@ class BankAccountDetailView(APIView):
     DELETE /api/bills/bank-accounts/<id>/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'put': 7, 'delete': 6}
     
     def get_object(self, pk, user):
         try:
@@ -689,6 +722,7 @@ class BankAccountVerifyView(APIView):
     POST /api/bills/bank-accounts/<id>/verify/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def post(self, request, pk):
         try:
@@ -738,6 +772,7 @@ class CardListView(APIView):
     POST /api/bills/cards/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 6}
     
     def get(self, request):
         cards = UserCard.objects.filter(user=request.user, is_active=True)
@@ -781,6 +816,7 @@ class CardDetailView(APIView):
     DELETE /api/bills/cards/<id>/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'put': 7, 'delete': 6}
     
     def get_object(self, pk, user):
         try:
@@ -869,6 +905,7 @@ class MPINSetupView(APIView):
     POST /api/bills/mpin/setup/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 7}
     
     def get(self, request):
         # Check if MPIN is already set
@@ -918,6 +955,7 @@ class MPINVerifyView(APIView):
     POST /api/bills/mpin/verify/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def post(self, request):
         try:
@@ -978,6 +1016,7 @@ class MPINChangeView(APIView):
     POST /api/bills/mpin/change/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def post(self, request):
         try:
@@ -1032,6 +1071,7 @@ class PaymentGatewayListView(APIView):
     GET /api/bills/gateways/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         gateways = PaymentGateway.objects.filter(is_active=True)
@@ -1063,6 +1103,7 @@ class IFSCVerifyView(APIView):
     GET /api/bills/ifsc/<ifsc_code>/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 4
     
     def get(self, request, ifsc_code):
         # Validate IFSC format
@@ -1122,6 +1163,7 @@ class TransactionLogListView(APIView):
     GET /api/bills/transactions/?status=SUCCESS
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def get(self, request):
         transactions = TransactionLog.objects.filter(user=request.user)
@@ -1179,6 +1221,7 @@ class TransactionLogDetailView(APIView):
     GET /api/bills/transactions/<transaction_id>/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request, transaction_id):
         try:
@@ -1214,6 +1257,7 @@ class MoneyTransferView(APIView):
     POST /api/bills/transfer/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 9
     
     def post(self, request):
         serializer = MoneyTransferSerializer(data=request.data)
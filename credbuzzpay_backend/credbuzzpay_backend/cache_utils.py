@@ -0,0 +1,126 @@
+"""
+Cache Utilities
+===============
+Shared building blocks for the caches used across apps:
+
+- LocalLRUCache: a small bounded, thread-safe in-process LRU with TTL.
+  Used in front of Django's configured cache backend so hot lookups
+  don't even need a cache round trip.
+- Generation counters: monotonically increasing numbers stored in the
+  shared cache. Cached entries are stamped with the generation they were
+  built from; bumping the generation invalidates them on every worker.
+- cache_is_shared(): generation counters only reach every worker when the
+  cache backend is shared. Caches relying on them turn themselves off
+  otherwise.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+GENERATION_KEY_PREFIX = 'gen'
+
+# Backends whose data only the current process sees
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    """
+    Check if the default cache is seen by every worker process.
+
+    A process-local backend only counts as shared with
+    CACHE_LOCAL_IS_SHARED, for single-process deployments (runserver,
+    tests, one gunicorn worker).
+    """
+    if settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS:
+        return True
+    return getattr(settings, 'CACHE_LOCAL_IS_SHARED', False)
+
+
+class LocalLRUCache:
+    """
+    Bounded in-process LRU cache with a per-entry TTL.
+
+    Entries are only visible to the current worker process, so callers
+    must validate them against a shared generation counter (or accept
+    staleness up to ``ttl`` seconds).
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing/expired"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value for key, evicting the least recently used entry if full"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _generation_key(name):
+    return f"{GENERATION_KEY_PREFIX}:{name}"
+
+
+def get_generation(name):
+    """
+    Get the current generation number for name.
+
+    A missing counter (never set, or evicted by the backend) is initialised
+    from the wall clock so it can never collide with a generation that
+    cached entries were previously stamped with.
+    """
+    key = _generation_key(name)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(name):
+    """Advance the generation number for name, invalidating entries stamped with older values"""
+    key = _generation_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        value = time.time_ns()
+        cache.set(key, value, timeout=None)
+        return value
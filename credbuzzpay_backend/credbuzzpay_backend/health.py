@@ -26,6 +26,7 @@ class HealthCheckView(APIView):
     """
     permission_classes = [AllowAny]
     authentication_classes = []  # No auth required
+    query_budget = 1
     
     def get(self, request):
         health_data = {
@@ -66,6 +67,7 @@ class DetailedHealthCheckView(APIView):
     Returns detailed system information (requires authentication).
     """
     permission_classes = [AllowAny]  # Can change to IsAuthenticated for production
+    query_budget = 2
     
     def get(self, request):
         from django.conf import settings
@@ -0,0 +1,85 @@
+"""
+Keyset (cursor) pagination
+==========================
+OFFSET pagination makes the database walk and discard every skipped row,
+and a separate COUNT(*) scans the whole filtered set again. KeysetPaginator
+instead orders by (timestamp DESC, id DESC) and continues after the last
+row of the previous page, so every page is one index range scan no matter
+how deep it is.
+
+Cursors are opaque URL-safe tokens encoding the (timestamp, id) of the last
+row returned. Back the ordering with an index on the same two columns.
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset newest first by a timestamp field, ties broken by id.
+    """
+
+    def __init__(self, field='created_at'):
+        self.field = field
+
+    def ordering(self):
+        return (f'-{self.field}', '-id')
+
+    def encode_cursor(self, instance):
+        """Build the cursor pointing just after instance"""
+        position = [getattr(instance, self.field).isoformat(), instance.id]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Decode a cursor into (timestamp, id).
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            timestamp = parse_datetime(value)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise ValueError('Invalid cursor')
+        if timestamp is None or not isinstance(pk, int):
+            raise ValueError('Invalid cursor')
+        return timestamp, pk
+
+    def after(self, queryset, cursor):
+        """Restrict queryset to rows after the cursor position"""
+        timestamp, pk = self.decode_cursor(cursor) if isinstance(cursor, str) else cursor
+        return queryset.filter(
+            Q(**{f'{self.field}__lt': timestamp}) | Q(**{self.field: timestamp, 'id__lt': pk})
+        )
+
+    def page(self, queryset, page_size, cursor=None):
+        """
+        Get one page of rows.
+
+        Returns:
+            tuple: (rows, next_cursor) - next_cursor is None on the last page
+        """
+        queryset = queryset.order_by(*self.ordering())
+        if cursor:
+            queryset = self.after(queryset, cursor)
+        rows = list(queryset[:page_size + 1])
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            return rows, self.encode_cursor(rows[-1])
+        return rows, None
+
+    def chunks(self, queryset, chunk_size):
+        """Iterate over every row in pages of chunk_size, holding one page at a time"""
+        cursor = None
+        while True:
+            rows, cursor = self.page(queryset, chunk_size, cursor)
+            if rows:
+                yield rows
+            if cursor is None:
+                return
@@ -0,0 +1,204 @@
+"""
+Query budgets and N+1 detection
+===============================
+QueryBudgetMiddleware records every SQL statement a request runs: the
+count, the total time, and a fingerprint of each statement (literals and
+IN lists replaced by '?'). It checks them against two limits:
+
+- query budget: the view's `query_budget` class attribute, either an int
+  or a dict of budgets per HTTP method ({'get': 3, 'post': 6}). Views
+  without one get QUERY_BUDGET_DEFAULT. Budgets include JWT
+  authentication on a cold auth cache (3 queries) and the periodic
+  session-activity flush (1).
+- N+1: any fingerprint executed more than QUERY_BUDGET_N_PLUS_ONE_THRESHOLD
+  times in one request, i.e. a query issued once per row of a list.
+
+Overruns are logged as warnings on this module's logger. With
+QUERY_BUDGET_HEADERS (DEBUG by default) every response carries
+X-Query-Count, X-Query-Time-Ms and X-Query-Budget headers, plus
+X-Query-N-Plus-One naming the most repeated statement.
+
+Tests assert the same budgets with QueryBudgetTestMixin.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|NULL)\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Normalize a statement so executions that differ only in their values
+    compare equal.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def is_enabled():
+    """Check if requests are recorded"""
+    return getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG)
+
+
+def get_default_budget():
+    """Get the budget of views that don't declare query_budget"""
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', 20)
+
+
+def get_n_plus_one_threshold():
+    """Get how often one fingerprint may run per request before it is flagged"""
+    return getattr(settings, 'QUERY_BUDGET_N_PLUS_ONE_THRESHOLD', 5)
+
+
+def get_view_budget(view_class, method):
+    """
+    Get a view's query budget for an HTTP method.
+
+    Returns:
+        int or None: None if the view declares no budget for the method
+    """
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method.lower())
+    return budget
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording count, time and fingerprints.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @contextmanager
+    def record(self):
+        """Record statements run on every database connection"""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold=None):
+        """
+        Get the fingerprints executed more than threshold times.
+
+        Returns:
+            list: (fingerprint, count) pairs, most repeated first
+        """
+        if threshold is None:
+            threshold = get_n_plus_one_threshold()
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > threshold]
+
+    def describe(self):
+        """Statements by execution count, one per line, for failure messages"""
+        return '\n'.join(f'{count}x {sql}' for sql, count in self.fingerprints.most_common())
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the SQL each request runs and flag budget overruns and N+1
+    patterns. Place it first in MIDDLEWARE so authentication and session
+    queries are counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        budget = self.get_budget(request)
+        repeated = recorder.repeated()
+        label = f'{request.method} {request.path}'
+
+        if recorder.count > budget:
+            logger.warning(
+                'Query budget exceeded: %s ran %d queries (budget %d)\n%s',
+                label, recorder.count, budget, recorder.describe()
+            )
+        for sql, count in repeated:
+            logger.warning('Possible N+1 in %s: %dx %s', label, count, sql)
+
+        if getattr(settings, 'QUERY_BUDGET_HEADERS', settings.DEBUG):
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.2f}'
+            response['X-Query-Budget'] = str(budget)
+            if repeated:
+                sql, count = repeated[0]
+                response['X-Query-N-Plus-One'] = f'{count}x {sql[:200]}'
+        return response
+
+    def get_budget(self, request):
+        """Budget of the view that handled the request"""
+        match = getattr(request, 'resolver_match', None)
+        view_class = getattr(match.func, 'view_class', None) if match else None
+        budget = get_view_budget(view_class, request.method) if view_class else None
+        return get_default_budget() if budget is None else budget
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin asserting query budgets:
+
+        with self.assertQueryBudget(UserRoleListView):
+            self.client.get('/api/rbac/roles/')
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, method='get', n_plus_one_threshold=None):
+        """
+        Assert the block runs at most budget queries and no N+1 pattern.
+
+        Args:
+            budget: A number of queries, or a view class whose query_budget
+                for method is used
+        """
+        if not isinstance(budget, int):
+            view_budget = get_view_budget(budget, method)
+            self.assertIsNotNone(view_budget, f'{budget.__name__} declares no query budget for {method.upper()}')
+            budget = view_budget
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            yield recorder
+
+        self.assertLessEqual(
+            recorder.count, budget,
+            f'{recorder.count} queries run, budget is {budget}:\n{recorder.describe()}'
+        )
+        repeated = recorder.repeated(n_plus_one_threshold)
+        self.assertFalse(
+            repeated, 'Possible N+1:\n' + '\n'.join(f'{count}x {sql}' for sql, count in repeated)
+        )
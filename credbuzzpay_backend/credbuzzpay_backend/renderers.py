@@ -0,0 +1,100 @@
+"""
+Fast JSON renderer and parser
+=============================
+Drop-in replacements for DRF's JSONRenderer and JSONParser backed by orjson,
+registered in REST_FRAMEWORK (DEFAULT_RENDERER_CLASSES / DEFAULT_PARSER_CLASSES).
+
+orjson encodes straight to UTF-8 bytes and handles datetime, date, time and
+UUID natively, so the response envelope is built without the intermediate
+str that json.dumps() returns and DRF then encodes. Decimal amounts take a
+fast path in `default()`; other types (lazy translation strings, timedelta,
+querysets, ...) go through DRF's own JSONEncoder, so the output is the same
+bytes DRF would produce:
+- compact separators, non-ASCII characters left unescaped
+- UTC datetimes end in 'Z', Decimals become numbers
+- U+2028 / U+2029 are escaped
+
+Anything orjson can't express the DRF way falls back to the stock classes:
+indented output (the browsable API), UNICODE_JSON / COMPACT_JSON /
+STRICT_JSON turned off, integers beyond 64 bits, request bodies in a charset
+other than UTF-8, and a missing orjson package.
+
+Known differences: NaN / Infinity floats render as null instead of raising,
+and request bodies with integers beyond 64 bits parse them as floats.
+"""
+
+import decimal
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+_drf_encoder = encoders.JSONEncoder()
+
+
+def default(obj):
+    """Encode the types orjson doesn't know the way DRF's JSONEncoder does"""
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    return _drf_encoder.default(obj)
+
+
+if ORJSON_AVAILABLE:
+    OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes with orjson.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or not ORJSON_AVAILABLE
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=default, option=OPTIONS)
+        except TypeError:
+            # orjson.JSONEncodeError: e.g. an int beyond 64 bits; let DRF
+            # encode it or raise its own error
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, so the output stays a strict
+        # javascript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser parsing UTF-8 request bodies with orjson.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not ORJSON_AVAILABLE or not self.strict or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -58,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'credbuzzpay_backend.query_budget.QueryBudgetMiddleware',  # First, so every query is counted
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Added for Vercel/Static files
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -92,7 +94,6 @@ WSGI_APPLICATION = 'credbuzzpay_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-import os
 import dj_database_url
 
 # If DATABASE_URL environment variable is set (e.g. on Vercel with Postgres), use it.
@@ -156,6 +157,35 @@ MEDIA_ROOT = BASE_DIR / 'media'
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# =============================================================================
+# CACHE CONFIGURATION
+# =============================================================================
+# Production: set REDIS_URL so caches, throttles and counters are shared by all
+# gunicorn workers. Without it each worker gets its own in-memory cache.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'KEY_PREFIX': 'credbuzz',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'credbuzz-default',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Caches invalidated through generation counters (cached JWT authentication,
+# permission snapshots and decisions, RBAC matrix / catalog) switch themselves
+# off on a process-local cache, since a write on one worker would never reach
+# the others. Set CACHE_LOCAL_IS_SHARED only when a single process serves
+# requests; it defaults to DEBUG (runserver).
+CACHE_LOCAL_IS_SHARED = os.getenv('CACHE_LOCAL_IS_SHARED', str(DEBUG)).lower() in ('true', '1', 'yes')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -183,9 +213,14 @@ REST_FRAMEWORK = {
         'otp': '5/minute',       # OTP requests: 5/minute (custom)
         'sensitive': '20/hour',  # Sensitive operations: 20/hour (custom)
     },
+    # Response rendering: orjson-backed JSON, same output as DRF's JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'credbuzzpay_backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     # Request parsing
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'credbuzzpay_backend.renderers.FastJSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ],
@@ -200,6 +235,49 @@ JWT_ALGORITHM = 'HS256'
 JWT_ACCESS_TOKEN_EXPIRY_MINUTES = 60  # 1 hour
 JWT_REFRESH_TOKEN_EXPIRY_DAYS = 7  # 7 days
 JWT_INACTIVITY_TIMEOUT_MINUTES = 30  # Auto-logout after 30 minutes of inactivity (like bank apps)
+# Encode app_access/feature_access token claims as bitmaps (+ perm_ver) instead of ID lists
+JWT_COMPACT_PERMISSION_CLAIMS = os.getenv('JWT_COMPACT_PERMISSION_CLAIMS', 'True').lower() in ('true', '1', 'yes')
+
+# Cached authentication: resolved user + session per access token (jti)
+JWT_AUTH_CACHE_ENABLED = os.getenv('JWT_AUTH_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+JWT_AUTH_CACHE_TTL_SECONDS = int(os.getenv('JWT_AUTH_CACHE_TTL_SECONDS', '300'))
+JWT_AUTH_CACHE_LOCAL_MAXSIZE = 2048  # Per-worker in-process LRU entries
+
+# Write-behind session activity: heartbeats go to the cache and are flushed to
+# UserSession.last_activity in one bulk UPDATE every N seconds per worker (on a
+# timer if the worker is idle). Workers that can't see a heartbeat read the
+# database, so a session may expire up to N seconds early there. 0 = write through.
+JWT_ACTIVITY_FLUSH_SECONDS = int(os.getenv('JWT_ACTIVITY_FLUSH_SECONDS', '60'))
+JWT_ACTIVITY_FLUSH_MAX_PENDING = 500  # Flush early once this many sessions are pending
+
+# Effective-permission snapshots (app/feature IDs per user), invalidated by the
+# RBAC generation that any role/app/feature/mapping/assignment change bumps
+RBAC_PERMISSION_CACHE_ENABLED = os.getenv('RBAC_PERMISSION_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RBAC_PERMISSION_CACHE_TTL_SECONDS = 3600
+RBAC_PERMISSION_CACHE_LOCAL_MAXSIZE = 2048
+
+# Per-worker cache of has_app_permission / has_feature_permission decisions,
+# stamped with the same RBAC generation so changes apply on every worker at once
+# (off unless the cache is shared, see CACHE_LOCAL_IS_SHARED)
+RBAC_DECISION_CACHE_ENABLED = os.getenv('RBAC_DECISION_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RBAC_DECISION_CACHE_TTL_SECONDS = 300
+RBAC_DECISION_CACHE_LOCAL_MAXSIZE = 8192
+
+# Compiled permission matrix (rbac.permission_matrix): incremental refreshes re-read
+# rows updated up to this many seconds before the last refresh, covering slow commits
+RBAC_MATRIX_REFRESH_LAG_SECONDS = 60
+# Rebuilt from a full reload this often, catching commits slower than the lag
+RBAC_MATRIX_MAX_AGE_SECONDS = 300
+# App / feature / role catalog snapshot (rbac.catalog): rebuilt on RBAC changes and at least this often
+RBAC_CATALOG_MAX_AGE_SECONDS = 300
+
+# Query budgets (credbuzzpay_backend.query_budget): count the SQL each request runs
+# and log views over their `query_budget` or repeating one statement per row (N+1).
+# With QUERY_BUDGET_HEADERS, responses carry X-Query-Count / X-Query-Time-Ms headers.
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED', str(DEBUG)).lower() in ('true', '1', 'yes')
+QUERY_BUDGET_HEADERS = DEBUG
+QUERY_BUDGET_DEFAULT = 20  # Views without a query_budget attribute
+QUERY_BUDGET_N_PLUS_ONE_THRESHOLD = 5  # Same statement more often than this in one request
 
 
 # Security Settings - Login Attempt Tracking
@@ -215,6 +293,39 @@ LOGIN_LOCKOUT_STAGES = [
     (6, -1),     # Stage 6: Blocked (requires manual unblock)
 ]
 
+# Lockout engine (users_auth.lockout): failures are counted in the cache with
+# sliding windows; LoginAttempt rows are written only on stage transitions.
+# Without a shared cache (cache_is_shared) failures are counted on LoginAttempt.
+LOGIN_FAILURE_WINDOW_SECONDS = 3600  # Failures older than this don't count towards a stage
+LOGIN_LOCKOUT_STATE_TTL_SECONDS = 86400  # Cached stage lifetime (reloaded from LoginAttempt after)
+LOGIN_IP_MAX_FAILURES = 100  # Failed logins per IP address per window before the IP is locked out
+LOGIN_IP_WINDOW_SECONDS = 600
+LOGIN_IP_LOCKOUT_MINUTES = 15
+
+# Buffered activity logs (users_auth.activity_buffer): entries are queued per
+# worker, spooled to disk and written with bulk_create after a response once
+# the batch is full or the flush window has passed. Spool files left by killed
+# workers are loaded with `manage.py replay_activity_spool`.
+# Off by default (entries are written inline): the temp dir spool and the exit
+# flush don't survive a recycled Vercel instance, so buffering is only turned
+# on with an explicit, durable ACTIVITY_LOG_SPOOL_DIR.
+ACTIVITY_LOG_SPOOL_DIR = os.getenv(
+    'ACTIVITY_LOG_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'credbuzzpay', 'activity_spool')
+)
+ACTIVITY_LOG_BUFFERED = os.getenv(
+    'ACTIVITY_LOG_BUFFERED', str('ACTIVITY_LOG_SPOOL_DIR' in os.environ)
+).lower() in ('true', '1', 'yes')
+ACTIVITY_LOG_BATCH_SIZE = 200
+ACTIVITY_LOG_FLUSH_SECONDS = int(os.getenv('ACTIVITY_LOG_FLUSH_SECONDS', '5'))
+
+# Retention (`manage.py purge_old_records`): rows older than this are deleted in
+# primary-key chunks. Blocked login attempts are always kept.
+ACTIVITY_LOG_RETENTION_DAYS = 90
+LOGIN_ATTEMPT_RETENTION_DAYS = 30
+
+# User codes are handed out from per-worker blocks of pre-verified codes
+USER_CODE_BLOCK_SIZE = 1000
+
 
 # CORS Settings
 # Production: Use environment variable to specify allowed origins
@@ -294,6 +405,19 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'CredBuzzPay <credbuzzpay@g
 # For testing/development: Use console backend to see emails in terminal
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Outbound queue (users_auth.email_queue): requests insert OutboundEmail rows and
+# `manage.py run_email_worker` delivers them over persistent SMTP connections.
+# Off by default (emails are sent inline from the request): only enable it where
+# a run_email_worker process is deployed, which the Vercel build doesn't run.
+EMAIL_QUEUE_ENABLED = os.getenv('EMAIL_QUEUE_ENABLED', 'False').lower() in ('true', '1', 'yes')
+EMAIL_QUEUE_CONNECTIONS = int(os.getenv('EMAIL_QUEUE_CONNECTIONS', '4'))  # Persistent SMTP connections per worker
+EMAIL_QUEUE_BATCH_SIZE = 50
+EMAIL_QUEUE_MAX_ATTEMPTS = 6  # Then the message is marked FAILED
+EMAIL_QUEUE_RETRY_BASE_SECONDS = 30  # Backoff doubles per attempt...
+EMAIL_QUEUE_RETRY_MAX_SECONDS = 3600  # ...up to this
+EMAIL_QUEUE_LEASE_SECONDS = 300  # Messages of a crashed worker are retried after this
+OUTBOUND_EMAIL_RETENTION_DAYS = 30  # Delivered / failed / expired rows (`purge_old_records`)
+
 # =============================================================================
 # OTP SETTINGS
 # =============================================================================
@@ -301,3 +425,12 @@ OTP_EXPIRY_MINUTES = int(os.getenv('OTP_EXPIRY_MINUTES', '10'))
 OTP_LENGTH = int(os.getenv('OTP_LENGTH', '6'))
 OTP_MAX_ATTEMPTS = 3  # Max verification attempts before OTP expires
 
+# Pending OTPs are kept (hashed) in the cache when it is shared between workers
+# (see CACHE_LOCAL_IS_SHARED), else in OTPVerification; see kyc_verification/otp_store.py
+# A send within this many seconds of the previous one returns the pending OTP
+OTP_RESEND_COALESCE_SECONDS = int(os.getenv('OTP_RESEND_COALESCE_SECONDS', '30'))
+OTP_SEND_WINDOW_SECONDS = 900  # Window over which OTP sends are counted for rate limits
+# OTPVerification audit rows are written in batches after responses
+OTP_AUDIT_BATCH_SIZE = 100
+OTP_AUDIT_FLUSH_SECONDS = 5
+
@@ -12,4 +12,5 @@ class KycVerificationConfig(AppConfig):
             from . import models  # noqa: F401
         except ImportError:
             pass
+        from . import signals  # noqa: F401
 
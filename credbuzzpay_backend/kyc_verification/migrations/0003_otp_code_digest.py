@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kyc_verification', '0002_otp_issue_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otpverification',
+            name='code_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -19,8 +19,10 @@ Security Features:
 
 import uuid
 import hashlib
+import hmac
 import os
 from django.db import models
+from django.db.models import F
 from django.conf import settings
 from django.utils import timezone
 from django.core.validators import RegexValidator, FileExtensionValidator
@@ -261,10 +263,14 @@ class OTPVerification(models.Model):
         default=OTPType.EMAIL
     )
     otp_code = models.CharField(max_length=6)
+    # Keyed hash of the code (see OTPStore.digest); set when the row is the
+    # pending OTP itself rather than an audit entry
+    code_digest = models.CharField(max_length=64, blank=True, default='')
     is_verified = models.BooleanField(default=False)
     attempts = models.PositiveSmallIntegerField(default=0)
     max_attempts = models.PositiveSmallIntegerField(default=3)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the issuer, not on insert: audit rows are written in batches
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     expires_at = models.DateTimeField()
     verified_at = models.DateTimeField(null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
@@ -293,20 +299,41 @@ class OTPVerification(models.Model):
         """Check if OTP is still valid (not expired, not used, attempts remaining)."""
         return not self.is_expired and not self.is_verified and self.attempts < self.max_attempts
     
-    def verify(self, code):
-        """Verify OTP code."""
-        self.attempts += 1
-        self.save(update_fields=['attempts'])
+    def check_code(self, code):
+        """Check code against the stored hash, or the plain code of a legacy row."""
+        if self.code_digest:
+            from .otp_store import OTPStore
+            return hmac.compare_digest(self.code_digest, OTPStore.digest(self.user_id, self.otp_type, code))
+        return bool(self.otp_code) and hmac.compare_digest(self.otp_code, code)
+    
+    def verify(self, code, now=None):
+        """
+        Verify OTP code, storing the attempt and its outcome in one write.
         
-        if not self.is_valid:
+        The write is conditional on the OTP still being valid, so concurrent
+        attempts from several workers never exceed max_attempts.
+        """
+        now = now or timezone.now()
+        matched = self.check_code(code)
+        fields = {'attempts': F('attempts') + 1}
+        if matched:
+            fields.update(is_verified=True, verified_at=now)
+        
+        counted = OTPVerification.objects.filter(
+            pk=self.pk,
+            is_verified=False,
+            attempts__lt=F('max_attempts'),
+            expires_at__gt=now,
+        ).update(**fields)
+        if not counted:
             return False, 'OTP expired or max attempts exceeded'
         
-        if self.otp_code != code:
+        self.attempts += 1
+        if not matched:
             return False, 'Invalid OTP code'
         
         self.is_verified = True
-        self.verified_at = timezone.now()
-        self.save(update_fields=['is_verified', 'verified_at'])
+        self.verified_at = now
         return True, 'OTP verified successfully'
 
 
@@ -1070,13 +1097,15 @@ def create_related_models(sender, instance, created, **kwargs):
             (8, 'Bank Details', MegaStep.SELFIE_AND_BUSINESS),
         ]
         
-        for step_number, step_name, mega_step in steps:
-            KYCProgressTracker.objects.create(
+        KYCProgressTracker.objects.bulk_create([
+            KYCProgressTracker(
                 kyc_application=instance,
                 step_name=step_name,
                 step_number=step_number,
                 mega_step=mega_step
             )
+            for step_number, step_name, mega_step in steps
+        ])
         
         # Log KYC started
         KYCAuditLog.log_action(
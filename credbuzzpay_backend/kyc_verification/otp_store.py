@@ -0,0 +1,533 @@
+"""
+Cache-resident OTP store
+========================
+Pending OTPs live in the shared cache instead of the OTPVerification table:
+
+- one entry per (user, otp type) holds an HMAC of the code, the attempt
+  count and the expiry, and expires with the OTP itself, so issuing a new
+  OTP replaces the old one without an UPDATE over previous rows
+- verifying counts the attempt, checks the code and consumes the OTP in a
+  single operation (one script call with the Redis backend)
+- a send arriving within OTP_RESEND_COALESCE_SECONDS of the previous one
+  returns the OTP already in flight instead of mailing a second code
+
+OTPVerification rows are then kept as an audit trail only. They are queued
+once the surrounding transaction commits and written in batches after
+responses (see OTPAuditBuffer); the plain code is never stored.
+
+With the Redis cache backend every operation is atomic across workers.
+Other shared backends run under a process lock. A per-process cache (see
+cache_is_shared) would strand each OTP on the worker that issued it, so
+without a shared cache the OTPVerification row is the pending OTP: it is
+inserted with the hashed code when issued and verified with one conditional
+UPDATE that counts the attempt, and sends are counted from those rows.
+"""
+import atexit
+import hashlib
+import hmac
+import logging
+import math
+import secrets
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches, cache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connection, transaction
+
+from credbuzzpay_backend.cache_utils import cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+
+IssuedOTP = namedtuple('IssuedOTP', 'id code expires_at coalesced')
+IssuedOTP.__doc__ = """An issued OTP; code is None when the send was coalesced"""
+
+OTPResult = namedtuple('OTPResult', 'found success message remaining_attempts verified_at')
+OTPResult.__doc__ = """Outcome of a verification; found is False if no OTP was pending"""
+
+
+# KEYS[1] = OTP key; ARGV = id, digest, max attempts, now, expires at,
+# coalesce window (microseconds). Returns {issued, id, expires at}: the new
+# OTP and the id it replaced, or the pending OTP when the send is coalesced.
+ISSUE_SCRIPT = """
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'id', 'issued_at', 'expires_at', 'attempts', 'max_attempts')
+if state[1] and now - tonumber(state[2]) < tonumber(ARGV[6]) and tonumber(state[4]) < tonumber(state[5]) then
+    return {0, state[1], state[3]}
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'id', ARGV[1], 'digest', ARGV[2], 'attempts', 0,
+    'max_attempts', ARGV[3], 'issued_at', ARGV[4], 'expires_at', ARGV[5])
+redis.call('PEXPIRE', KEYS[1], string.format('%d', math.ceil((tonumber(ARGV[5]) - now) / 1000)))
+return {1, state[1] or '', ARGV[5]}
+"""
+
+# KEYS[1] = OTP key; ARGV[1] = digest of the submitted code.
+# Returns {status, id, attempts, max attempts}: status 1 verified, 0 wrong
+# code, -1 nothing pending, -2 attempts already exhausted.
+VERIFY_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'id', 'digest', 'attempts', 'max_attempts')
+if not state[1] then
+    return {-1, '', 0, 0}
+end
+local attempts = tonumber(state[3])
+local max_attempts = tonumber(state[4])
+if attempts >= max_attempts then
+    return {-2, state[1], attempts, max_attempts}
+end
+attempts = attempts + 1
+if state[2] == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return {1, state[1], attempts, max_attempts}
+end
+redis.call('HSET', KEYS[1], 'attempts', attempts)
+return {0, state[1], attempts, max_attempts}
+"""
+
+
+class OTPStore:
+    """
+    Issue and verify OTPs held in the shared cache, or in the database.
+    """
+
+    KEY_PREFIX = 'otp'
+
+    timer = staticmethod(time.time)
+
+    _lock = threading.Lock()
+    _scripts = {}
+
+    @staticmethod
+    def get_length():
+        """Get the number of digits in an OTP"""
+        return getattr(settings, 'OTP_LENGTH', 6)
+
+    @staticmethod
+    def get_expiry_seconds():
+        """Get how long an OTP stays valid in seconds"""
+        return getattr(settings, 'OTP_EXPIRY_MINUTES', 10) * 60
+
+    @staticmethod
+    def get_max_attempts():
+        """Get the number of verification attempts allowed per OTP"""
+        return getattr(settings, 'OTP_MAX_ATTEMPTS', 3)
+
+    @staticmethod
+    def get_coalesce_seconds():
+        """Get the window in which a repeated send returns the pending OTP"""
+        return getattr(settings, 'OTP_RESEND_COALESCE_SECONDS', 30)
+
+    @staticmethod
+    def get_send_window_seconds():
+        """Get the window over which OTP sends are counted"""
+        return getattr(settings, 'OTP_SEND_WINDOW_SECONDS', 900)
+
+    @classmethod
+    def make_key(cls, user_id, otp_type):
+        return f'{cls.KEY_PREFIX}:{user_id}:{otp_type}'
+
+    @classmethod
+    def make_send_count_key(cls, user_id, otp_type):
+        return f'{cls.KEY_PREFIX}_sends:{user_id}:{otp_type}'
+
+    @staticmethod
+    def digest(user_id, otp_type, code):
+        """Keyed hash of a code, bound to its user and OTP type"""
+        message = f'{user_id}:{otp_type}:{code}'.encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _datetime(microseconds):
+        return datetime.fromtimestamp(microseconds / 1_000_000, tz=dt_timezone.utc)
+
+    @classmethod
+    def _run_script(cls, backend, name, source, key, args):
+        key = backend.make_and_validate_key(key)
+        client = backend._cache.get_client(key, write=True)
+        if name not in cls._scripts:
+            cls._scripts[name] = client.register_script(source)
+        return cls._scripts[name](keys=[key], args=args, client=client)
+
+    @classmethod
+    def issue(cls, user, otp_type, ip_address=None, user_agent=None, coalesce=True):
+        """
+        Issue a new OTP for user, replacing any pending one of the same type.
+
+        Returns:
+            IssuedOTP: The new OTP, or the pending one (code None) if a send
+            within the coalesce window already issued it
+        """
+        code = ''.join(secrets.choice('0123456789') for _ in range(cls.get_length()))
+        otp_id = str(uuid.uuid4())
+        digest = cls.digest(user.pk, otp_type, code)
+        max_attempts = cls.get_max_attempts()
+        now = int(cls.timer() * 1_000_000)
+        expires_at = now + cls.get_expiry_seconds() * 1_000_000
+        window = cls.get_coalesce_seconds() * 1_000_000 if coalesce else 0
+        key = cls.make_key(user.pk, otp_type)
+
+        if not cache_is_shared():
+            return cls._issue_db(
+                user, otp_type, otp_id, code, digest, max_attempts, now, expires_at, window,
+                ip_address, user_agent,
+            )
+
+        backend = caches[DEFAULT_CACHE_ALIAS]
+        if isinstance(backend, RedisCache):
+            issued, returned_id, returned_expiry = cls._run_script(
+                backend, 'issue', ISSUE_SCRIPT, key,
+                [otp_id, digest, max_attempts, now, expires_at, window],
+            )
+            returned_id = returned_id.decode() if isinstance(returned_id, bytes) else returned_id
+            returned_expiry = int(returned_expiry)
+        else:
+            issued, returned_id, returned_expiry = cls._issue_local(
+                key, otp_id, digest, max_attempts, now, expires_at, window
+            )
+
+        if not issued:
+            return IssuedOTP(returned_id, None, cls._datetime(returned_expiry), True)
+
+        cls._count_send(user.pk, otp_type)
+        OTPAuditBuffer.record_issued(
+            otp_id=otp_id,
+            user_id=user.pk,
+            otp_type=otp_type,
+            max_attempts=max_attempts,
+            created_at=cls._datetime(now),
+            expires_at=cls._datetime(expires_at),
+            ip_address=ip_address,
+            user_agent=user_agent,
+            replaced_id=returned_id or None,
+        )
+        return IssuedOTP(otp_id, code, cls._datetime(expires_at), False)
+
+    @classmethod
+    def _issue_db(cls, user, otp_type, otp_id, code, digest, max_attempts, now, expires_at, window,
+                  ip_address, user_agent):
+        """Insert the OTP row with its hash, unless a send within window is coalesced"""
+        from .models import OTPVerification
+
+        pending = OTPVerification.objects.filter(user=user, otp_type=otp_type).values_list(
+            'id', 'created_at', 'expires_at', 'attempts', 'max_attempts', 'is_verified'
+        ).first()
+        if pending is not None:
+            pending_id, issued_at, pending_expiry, attempts, pending_max, verified = pending
+            issued_at = int(issued_at.timestamp() * 1_000_000)
+            pending_expiry = int(pending_expiry.timestamp() * 1_000_000)
+            if (
+                not verified and now < pending_expiry and now - issued_at < window
+                and attempts < pending_max
+            ):
+                return IssuedOTP(str(pending_id), None, cls._datetime(pending_expiry), True)
+
+        # Only the latest row can verify, so the one replaced needs no write now
+        OTPVerification.objects.create(
+            id=otp_id,
+            user=user,
+            otp_type=otp_type,
+            otp_code='',
+            code_digest=digest,
+            max_attempts=max_attempts,
+            created_at=cls._datetime(now),
+            expires_at=cls._datetime(expires_at),
+            ip_address=ip_address,
+            user_agent=user_agent,
+        )
+        if pending is not None:
+            OTPAuditBuffer.record_replaced(str(pending[0]), cls._datetime(now))
+        return IssuedOTP(otp_id, code, cls._datetime(expires_at), False)
+
+    @classmethod
+    def _issue_local(cls, key, otp_id, digest, max_attempts, now, expires_at, window):
+        """Run the issue step as a read-modify-write under a process lock"""
+        with cls._lock:
+            state = cache.get(key)
+            if (
+                state is not None and now < state['expires_at']
+                and now - state['issued_at'] < window
+                and state['attempts'] < state['max_attempts']
+            ):
+                return 0, state['id'], state['expires_at']
+            cache.set(key, {
+                'id': otp_id,
+                'digest': digest,
+                'attempts': 0,
+                'max_attempts': max_attempts,
+                'issued_at': now,
+                'expires_at': expires_at,
+            }, math.ceil((expires_at - now) / 1_000_000))
+        return 1, state['id'] if state is not None else '', expires_at
+
+    @classmethod
+    def verify(cls, user, otp_type, code):
+        """
+        Count an attempt and check code against the pending OTP in one step.
+        A correct code consumes the OTP.
+
+        Returns:
+            OTPResult: found is False when no OTP is pending
+        """
+        if not cache_is_shared():
+            return cls._verify_db(user, otp_type, code)
+
+        digest = cls.digest(user.pk, otp_type, code)
+        key = cls.make_key(user.pk, otp_type)
+
+        backend = caches[DEFAULT_CACHE_ALIAS]
+        if isinstance(backend, RedisCache):
+            result, otp_id, attempts, max_attempts = cls._run_script(backend, 'verify', VERIFY_SCRIPT, key, [digest])
+            otp_id = otp_id.decode() if isinstance(otp_id, bytes) else otp_id
+        else:
+            result, otp_id, attempts, max_attempts = cls._verify_local(key, digest)
+
+        if result == -1:
+            return cls._verify_db(user, otp_type, code)
+        if result == -2:
+            return OTPResult(True, False, 'OTP expired or max attempts exceeded', 0, None)
+
+        verified_at = cls._datetime(int(cls.timer() * 1_000_000)) if result == 1 else None
+        OTPAuditBuffer.record_attempt(otp_id, attempts, verified_at)
+        if result == 1:
+            return OTPResult(True, True, 'OTP verified successfully', max_attempts - attempts, verified_at)
+        return OTPResult(True, False, 'Invalid OTP code', max_attempts - attempts, None)
+
+    @classmethod
+    def _verify_local(cls, key, digest):
+        """Run the verify step as a read-modify-write under a process lock"""
+        now = int(cls.timer() * 1_000_000)
+        with cls._lock:
+            state = cache.get(key)
+            if state is None or now >= state['expires_at']:
+                return -1, '', 0, 0
+            if state['attempts'] >= state['max_attempts']:
+                return -2, state['id'], state['attempts'], state['max_attempts']
+            state['attempts'] += 1
+            if hmac.compare_digest(state['digest'], digest):
+                cache.delete(key)
+                return 1, state['id'], state['attempts'], state['max_attempts']
+            cache.set(key, state, math.ceil((state['expires_at'] - now) / 1_000_000))
+            return 0, state['id'], state['attempts'], state['max_attempts']
+
+    @classmethod
+    def _verify_db(cls, user, otp_type, code):
+        """
+        Verify against the latest OTP row: the pending OTP when the cache is
+        not shared, or a row issued before OTPs moved to the cache.
+        """
+        from .models import OTPVerification
+
+        now = cls._datetime(int(cls.timer() * 1_000_000))
+        otp = OTPVerification.objects.filter(user=user, otp_type=otp_type).first()
+        if (
+            otp is None or otp.is_verified or otp.expires_at <= now
+            or not (otp.code_digest or otp.otp_code)
+        ):
+            return OTPResult(False, False, 'No pending OTP found. Please request a new OTP.', 0, None)
+
+        success, message = otp.verify(code, now)
+        return OTPResult(True, success, message, max(0, otp.max_attempts - otp.attempts), otp.verified_at)
+
+    @classmethod
+    def _count_send(cls, user_id, otp_type):
+        key = cls.make_send_count_key(user_id, otp_type)
+        cache.add(key, 0, cls.get_send_window_seconds())
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Window expired between add and incr
+            cache.set(key, 1, cls.get_send_window_seconds())
+
+    @classmethod
+    def recent_sends(cls, user_id, otp_type):
+        """Get the number of OTPs issued in the current send window"""
+        if not cache_is_shared():
+            # Every send inserts its row, so the table counts them across workers
+            from .models import OTPVerification
+            window_start = cls.timer() - cls.get_send_window_seconds()
+            return OTPVerification.objects.filter(
+                user_id=user_id,
+                otp_type=otp_type,
+                created_at__gte=datetime.fromtimestamp(window_start, tz=dt_timezone.utc),
+            ).count()
+        return cache.get(cls.make_send_count_key(user_id, otp_type), 0)
+
+    @classmethod
+    def discard(cls, user_id, otp_type):
+        """Drop the pending OTP of a type"""
+        cache.delete(cls.make_key(user_id, otp_type))
+
+
+class OTPAuditBuffer:
+    """
+    Process-wide queue of OTPVerification audit writes, applied in batches.
+    """
+
+    _created = {}
+    _updates = {}
+    _lock = threading.Lock()
+    _last_flush = time.monotonic()
+    # Whether the queued writes include a batch that already failed once
+    _retrying = False
+
+    @staticmethod
+    def get_batch_size():
+        """Get the number of pending writes that triggers a flush"""
+        return getattr(settings, 'OTP_AUDIT_BATCH_SIZE', 100)
+
+    @staticmethod
+    def get_flush_interval():
+        """Get the maximum time a write waits in the queue in seconds"""
+        return getattr(settings, 'OTP_AUDIT_FLUSH_SECONDS', 5)
+
+    @classmethod
+    def record_issued(cls, otp_id, user_id, otp_type, max_attempts, created_at, expires_at,
+                      ip_address=None, user_agent=None, replaced_id=None):
+        """Queue the audit row of a new OTP, expiring the one it replaced"""
+        row = {
+            'id': uuid.UUID(otp_id),
+            'user_id': user_id,
+            'otp_type': otp_type,
+            'otp_code': '',
+            'max_attempts': max_attempts,
+            'created_at': created_at,
+            'expires_at': expires_at,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+        }
+
+        def queue():
+            with cls._lock:
+                cls._created[row['id']] = row
+                if replaced_id:
+                    cls._queue_update(uuid.UUID(replaced_id), {'expires_at': created_at})
+        transaction.on_commit(queue)
+
+    @classmethod
+    def record_replaced(cls, otp_id, replaced_at):
+        """Queue the expiry of an OTP row replaced by a newer one"""
+        def queue():
+            with cls._lock:
+                cls._queue_update(uuid.UUID(otp_id), {'expires_at': replaced_at})
+        transaction.on_commit(queue)
+
+    @classmethod
+    def record_attempt(cls, otp_id, attempts, verified_at=None):
+        """Queue the outcome of a verification attempt"""
+        fields = {'attempts': attempts}
+        if verified_at is not None:
+            fields.update(is_verified=True, verified_at=verified_at)
+
+        def queue():
+            with cls._lock:
+                cls._queue_update(uuid.UUID(otp_id), fields)
+        transaction.on_commit(queue)
+
+    @classmethod
+    def _queue_update(cls, otp_id, fields):
+        """Merge fields into the pending row or update (lock held)"""
+        if otp_id in cls._created:
+            cls._created[otp_id].update(fields)
+        else:
+            cls._updates.setdefault(otp_id, {}).update(fields)
+
+    @classmethod
+    def _requeue(cls, created, updates):
+        """Put a failed batch back behind the writes queued since (lock held)"""
+        for otp_id, fields in cls._updates.items():
+            if otp_id in created:
+                created[otp_id].update(fields)
+            else:
+                updates.setdefault(otp_id, {}).update(fields)
+        created.update(cls._created)
+        cls._created, cls._updates = created, updates
+
+    @classmethod
+    def pending(cls):
+        with cls._lock:
+            return len(cls._created) + len(cls._updates)
+
+    @classmethod
+    def flush_if_due(cls):
+        """Flush if the batch is full or the flush interval has passed"""
+        pending = cls.pending()
+        due = pending and (
+            pending >= cls.get_batch_size()
+            or time.monotonic() - cls._last_flush >= cls.get_flush_interval()
+        )
+        # Never write from inside someone else's transaction
+        if not due or connection.in_atomic_block:
+            return 0
+        try:
+            return cls.flush()
+        except Exception as e:
+            logger.error(f"Failed to write OTP audit rows: {str(e)}")
+            return 0
+
+    @classmethod
+    def flush(cls):
+        """
+        Insert new audit rows and apply queued updates. A batch that fails
+        is queued again once; if it fails a second time it is dropped and
+        logged.
+
+        Returns:
+            int: Number of rows written
+        """
+        with cls._lock:
+            created, cls._created = cls._created, {}
+            updates, cls._updates = cls._updates, {}
+            retried, cls._retrying = cls._retrying, False
+            cls._last_flush = time.monotonic()
+
+        try:
+            return cls._write(created, updates)
+        except Exception:
+            if retried:
+                logger.error(
+                    f"Dropping {len(created)} OTP audit rows and {len(updates)} updates after a second failed write"
+                )
+            else:
+                with cls._lock:
+                    cls._requeue(created, updates)
+                    cls._retrying = True
+            raise
+
+    @classmethod
+    @transaction.atomic
+    def _write(cls, created, updates):
+        """Apply one batch; all or nothing, so a failed batch can be queued again"""
+        from users_auth.models import User
+        from .models import OTPVerification
+
+        written = 0
+        if created:
+            user_ids = set(
+                User.objects.filter(pk__in={row['user_id'] for row in created.values()}).values_list('pk', flat=True)
+            )
+            rows = [OTPVerification(**row) for row in created.values() if row['user_id'] in user_ids]
+            OTPVerification.objects.bulk_create(rows, batch_size=cls.get_batch_size())
+            written += len(rows)
+
+        # bulk_update needs one field list per call, so group rows by the fields they change
+        groups = {}
+        for otp_id, fields in updates.items():
+            groups.setdefault(tuple(sorted(fields)), []).append(OTPVerification(id=otp_id, **fields))
+        for fields, rows in groups.items():
+            written += OTPVerification.objects.bulk_update(rows, list(fields), batch_size=cls.get_batch_size())
+        return written
+
+
+def _flush_on_exit():
+    try:
+        OTPAuditBuffer.flush()
+    except Exception as e:
+        logger.error(f"Failed to write OTP audit rows on exit: {str(e)}")
+
+
+atexit.register(_flush_on_exit)
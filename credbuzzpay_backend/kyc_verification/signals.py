@@ -0,0 +1,13 @@
+"""
+Signal handlers for kyc_verification app
+"""
+from django.core.signals import request_finished
+from django.dispatch import receiver
+
+from .otp_store import OTPAuditBuffer
+
+
+@receiver(request_finished)
+def flush_otp_audit(sender, **kwargs):
+    """Write buffered OTP audit rows after the response, once a batch is due"""
+    OTPAuditBuffer.flush_if_due()
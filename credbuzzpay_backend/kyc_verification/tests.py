@@ -13,7 +13,12 @@ Tests cover:
 """
 
 import json
+import shutil
+import tempfile
+import uuid
 from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
@@ -21,6 +26,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
+from credbuzzpay_backend.query_budget import QueryBudgetTestMixin
 from users_auth.models import User
 from .models import (
     OTPVerification, KYCApplication, IdentityProof, BusinessDetails,
@@ -28,6 +34,8 @@ from .models import (
     OTPType, KYCStatus, MegaStep, StepStatus, AccountType, AuditAction,
     encrypt_value, decrypt_value, mask_aadhaar, mask_pan, mask_account_number
 )
+from .otp_store import OTPStore, OTPAuditBuffer
+from .views import KYCAdminDetailView, KYCStartView
 
 
 # =============================================================================
@@ -541,6 +549,13 @@ class BankDetailsAPITests(APITestCase):
     """Tests for Bank Details API endpoints."""
     
     def setUp(self):
+        # Uploads go to a throwaway MEDIA_ROOT, not the project's media/
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = self.settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        
         self.client = APIClient()
         self.user = create_test_user()
         self.auth_header = get_auth_header(self.client, self.user)
@@ -762,3 +777,350 @@ class KYCAuditLogTests(TestCase):
         self.assertEqual(log.old_status, KYCStatus.UNDER_REVIEW)
         self.assertEqual(log.new_status, KYCStatus.APPROVED)
 
+
+class OTPStoreTests(APITestCase):
+    """Tests for the cache-resident OTP store."""
+    
+    def setUp(self):
+        cache.clear()
+        OTPAuditBuffer.flush()
+        self.addCleanup(OTPAuditBuffer.flush)
+        self.user = create_test_user()
+        self.now = 1_700_000_000.0
+        patcher = mock.patch.object(OTPStore, 'timer', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def issue(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return OTPStore.issue(self.user, OTPType.EMAIL, **kwargs)
+    
+    def verify(self, code):
+        with self.captureOnCommitCallbacks(execute=True):
+            return OTPStore.verify(self.user, OTPType.EMAIL, code)
+    
+    def test_only_hash_is_stored(self):
+        """The cache entry holds a keyed hash, never the code."""
+        otp = self.issue()
+        
+        state = cache.get(OTPStore.make_key(self.user.pk, OTPType.EMAIL))
+        self.assertEqual(len(otp.code), 6)
+        self.assertNotIn(otp.code, state.values())
+        self.assertEqual(state['digest'], OTPStore.digest(self.user.pk, OTPType.EMAIL, otp.code))
+    
+    def test_verify_consumes_otp(self):
+        """A correct code verifies once; the OTP is then gone."""
+        otp = self.issue()
+        
+        result = self.verify(otp.code)
+        self.assertTrue(result.success)
+        self.assertIsNotNone(result.verified_at)
+        
+        result = self.verify(otp.code)
+        self.assertFalse(result.found)
+    
+    def test_attempts_are_limited(self):
+        """Wrong codes count down the attempts, then the OTP is locked."""
+        otp = self.issue()
+        wrong = '000000' if otp.code != '000000' else '111111'
+        
+        self.assertEqual(self.verify(wrong).remaining_attempts, 2)
+        self.assertEqual(self.verify(wrong).remaining_attempts, 1)
+        self.assertEqual(self.verify(wrong).remaining_attempts, 0)
+        
+        result = self.verify(otp.code)
+        self.assertTrue(result.found)
+        self.assertFalse(result.success)
+        self.assertEqual(result.message, 'OTP expired or max attempts exceeded')
+    
+    def test_expired_otp_not_found(self):
+        """An OTP past its expiry cannot be verified."""
+        otp = self.issue()
+        self.now += OTPStore.get_expiry_seconds() + 1
+        
+        self.assertFalse(self.verify(otp.code).found)
+    
+    def test_resend_within_window_is_coalesced(self):
+        """A repeated send returns the pending OTP instead of a new code."""
+        first = self.issue()
+        
+        self.now += 5
+        second = self.issue()
+        self.assertTrue(second.coalesced)
+        self.assertIsNone(second.code)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(OTPStore.recent_sends(self.user.pk, OTPType.EMAIL), 1)
+        
+        self.now += OTPStore.get_coalesce_seconds()
+        third = self.issue()
+        self.assertFalse(third.coalesced)
+        self.assertNotEqual(third.id, first.id)
+        self.assertEqual(OTPStore.recent_sends(self.user.pk, OTPType.EMAIL), 2)
+        
+        # The replaced code no longer works
+        if first.code != third.code:
+            self.assertFalse(self.verify(first.code).success)
+        self.assertTrue(self.verify(third.code).success)
+    
+    def test_audit_rows_written_in_batch(self):
+        """Issue and verify reach OTPVerification only when the buffer flushes."""
+        first = self.issue(ip_address='10.0.0.1')
+        self.now += OTPStore.get_coalesce_seconds()
+        second = self.issue()
+        self.verify(second.code)
+        self.assertFalse(OTPVerification.objects.filter(user=self.user).exists())
+        
+        # Updates to rows still queued are merged into the insert (plus a savepoint)
+        with self.assertNumQueries(4):
+            OTPAuditBuffer.flush()
+        
+        replaced = OTPVerification.objects.get(id=first.id)
+        self.assertEqual(replaced.otp_code, '')
+        self.assertEqual(replaced.ip_address, '10.0.0.1')
+        self.assertEqual(replaced.expires_at.timestamp(), self.now)
+        self.assertEqual(replaced.created_at.timestamp(), self.now - OTPStore.get_coalesce_seconds())
+        
+        verified = OTPVerification.objects.get(id=second.id)
+        self.assertTrue(verified.is_verified)
+        self.assertEqual(verified.attempts, 1)
+    
+    def test_rolled_back_issue_is_not_audited(self):
+        """Audit rows are queued only when the transaction commits."""
+        with self.captureOnCommitCallbacks(execute=False):
+            OTPStore.issue(self.user, OTPType.EMAIL)
+        
+        self.assertEqual(OTPAuditBuffer.pending(), 0)
+    
+    def test_legacy_row_still_verifies(self):
+        """OTP rows issued before the store existed can still be verified."""
+        OTPVerification.objects.create(
+            user=self.user,
+            otp_type=OTPType.EMAIL,
+            otp_code='123456',
+            expires_at=timezone.now() + timedelta(minutes=10)
+        )
+        
+        result = self.verify('123456')
+        self.assertTrue(result.success)
+        self.assertTrue(OTPVerification.objects.get(user=self.user).is_verified)
+    
+    def test_registration_otp_endpoints(self):
+        """Resend and verify registration OTPs through the store."""
+        User.objects.filter(pk=self.user.pk).update(is_email_verified=False)
+        
+        with mock.patch('users_auth.email_service.send_otp_email', return_value=True) as send:
+            response = self.client.post(
+                '/api/auth-user/resend-registration-otp/',
+                {'email': self.user.email, 'otp_type': 'EMAIL'},
+                format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        code = send.call_args.kwargs['otp_code']
+        
+        response = self.client.post(
+            '/api/auth-user/verify-registration-otp/',
+            {'email': self.user.email, 'otp_type': 'EMAIL', 'otp_code': code},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_email_verified)
+
+
+class OTPDatabaseStoreTests(APITestCase):
+    """Tests for OTPs kept in OTPVerification when the cache is not shared."""
+    
+    def setUp(self):
+        cache.clear()
+        OTPAuditBuffer.flush()
+        self.addCleanup(OTPAuditBuffer.flush)
+        self.user = create_test_user()
+        self.now = 1_700_000_000.0
+        patcher = mock.patch.object(OTPStore, 'timer', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings = self.settings(CACHE_LOCAL_IS_SHARED=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+    
+    def issue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return OTPStore.issue(self.user, OTPType.EMAIL)
+    
+    def verify(self, code):
+        return OTPStore.verify(self.user, OTPType.EMAIL, code)
+    
+    def test_row_holds_hashed_code(self):
+        """The pending OTP is a row with the keyed hash, not a cache entry."""
+        otp = self.issue()
+        
+        row = OTPVerification.objects.get(id=otp.id)
+        self.assertEqual(row.otp_code, '')
+        self.assertEqual(row.code_digest, OTPStore.digest(self.user.pk, OTPType.EMAIL, otp.code))
+        self.assertIsNone(cache.get(OTPStore.make_key(self.user.pk, OTPType.EMAIL)))
+    
+    def test_other_worker_verifies(self):
+        """An OTP issued on one worker verifies on another with its own cache."""
+        otp = self.issue()
+        cache.clear()
+        wrong = '000000' if otp.code != '000000' else '111111'
+        
+        self.assertEqual(self.verify(wrong).remaining_attempts, 2)
+        result = self.verify(otp.code)
+        self.assertTrue(result.success)
+        
+        row = OTPVerification.objects.get(id=otp.id)
+        self.assertTrue(row.is_verified)
+        self.assertEqual(row.attempts, 2)
+        self.assertFalse(self.verify(otp.code).found)
+    
+    def test_attempts_are_limited(self):
+        """Attempts are counted on the row and stop at max_attempts."""
+        otp = self.issue()
+        wrong = '000000' if otp.code != '000000' else '111111'
+        for _ in range(3):
+            self.verify(wrong)
+        
+        result = self.verify(otp.code)
+        self.assertTrue(result.found)
+        self.assertFalse(result.success)
+        self.assertEqual(OTPVerification.objects.get(id=otp.id).attempts, 3)
+    
+    def test_resend_coalesced_and_replaced(self):
+        """A resend within the window is coalesced; a later one replaces the code."""
+        first = self.issue()
+        self.now += 5
+        self.assertEqual(self.issue().id, first.id)
+        
+        self.now += OTPStore.get_coalesce_seconds()
+        second = self.issue()
+        self.assertFalse(second.coalesced)
+        if first.code != second.code:
+            self.assertFalse(self.verify(first.code).success)
+        self.assertTrue(self.verify(second.code).success)
+        
+        OTPAuditBuffer.flush()
+        self.assertEqual(OTPVerification.objects.get(id=first.id).expires_at.timestamp(), self.now)
+    
+    def test_sends_counted_across_workers(self):
+        """Sends on workers with their own caches count towards one window."""
+        for _ in range(3):
+            self.issue()
+            cache.clear()
+            self.now += OTPStore.get_coalesce_seconds()
+        
+        self.assertEqual(OTPStore.recent_sends(self.user.pk, OTPType.EMAIL), 3)
+        self.assertEqual(OTPStore.recent_sends(self.user.pk, OTPType.PHONE), 0)
+        
+        self.now += OTPStore.get_send_window_seconds()
+        self.assertEqual(OTPStore.recent_sends(self.user.pk, OTPType.EMAIL), 0)
+
+
+class OTPAuditBufferTests(TestCase):
+    """Tests for failed OTP audit writes."""
+    
+    def setUp(self):
+        OTPAuditBuffer.flush()
+        self.addCleanup(OTPAuditBuffer.flush)
+        self.user = create_test_user()
+        self.now = timezone.now()
+    
+    def record(self):
+        otp_id = str(uuid.uuid4())
+        with self.captureOnCommitCallbacks(execute=True):
+            OTPAuditBuffer.record_issued(
+                otp_id, self.user.pk, OTPType.EMAIL, 3, self.now, self.now + timedelta(minutes=10)
+            )
+        return otp_id
+    
+    def test_failed_batch_is_queued_again(self):
+        """A batch that fails to write is kept for the next flush."""
+        otp_id = self.record()
+        
+        with mock.patch.object(OTPAuditBuffer, '_write', side_effect=Exception('database is locked')), \
+                mock.patch('kyc_verification.otp_store.connection') as outside_transaction:
+            outside_transaction.in_atomic_block = False
+            with self.settings(OTP_AUDIT_FLUSH_SECONDS=0), self.assertLogs('kyc_verification.otp_store', 'ERROR'):
+                self.assertEqual(OTPAuditBuffer.flush_if_due(), 0)
+        self.assertEqual(OTPAuditBuffer.pending(), 1)
+        
+        OTPAuditBuffer.flush()
+        self.assertTrue(OTPVerification.objects.filter(id=otp_id).exists())
+    
+    def test_batch_failing_twice_is_dropped(self):
+        """A batch is retried once, then dropped with an error."""
+        self.record()
+        
+        with mock.patch.object(OTPAuditBuffer, '_write', side_effect=Exception('database is locked')):
+            with self.assertRaises(Exception):
+                OTPAuditBuffer.flush()
+            with self.assertLogs('kyc_verification.otp_store', 'ERROR') as logs:
+                with self.assertRaises(Exception):
+                    OTPAuditBuffer.flush()
+        self.assertIn('Dropping 1 OTP audit rows', logs.output[0])
+        self.assertEqual(OTPAuditBuffer.pending(), 0)
+
+
+class OTPSendResponseTests(APITestCase):
+    """Tests for what the OTP send endpoints report."""
+    
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(OTPAuditBuffer.flush)
+        self.user = create_test_user()
+        self.auth_header = get_auth_header(self.client, self.user)
+    
+    def test_coalesced_send_reports_no_email(self):
+        """A send coalesced into the pending OTP does not claim an email went out."""
+        with mock.patch('users_auth.email_service.send_otp_email', return_value=True) as send:
+            for _ in range(2):
+                response = self.client.post(
+                    '/api/auth-user/send-otp/', {'otp_type': 'EMAIL', 'email': self.user.email},
+                    format='json', **self.auth_header
+                )
+        
+        self.assertEqual(send.call_count, 1)
+        self.assertTrue(response.data['coalesced'])
+        self.assertFalse(response.data['email_sent'])
+    
+    def test_resend_hides_code_outside_debug(self):
+        """The resend endpoint returns the code only in DEBUG."""
+        with self.settings(DEBUG=False):
+            response = self.client.post(
+                '/api/auth-user/resend-otp/', {'otp_type': 'PHONE'}, format='json', **self.auth_header
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('otp_code_dev', response.data)
+
+
+class KYCQueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """Tests that KYC start and admin review stay within their query budgets."""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = create_test_user(email='budget@example.com')
+        self.user_auth = get_auth_header(self.client, self.user)
+        self.admin = create_test_user(email='budgetadmin@example.com', user_role='SUPER_ADMIN')
+        self.admin_auth = get_auth_header(self.client, self.admin)
+    
+    def test_start_creates_progress_trackers_in_bulk(self):
+        """Test starting KYC inserts the step trackers with one statement."""
+        with self.assertQueryBudget(KYCStartView, 'post'):
+            response = self.client.post('/api/kyc/start/', **self.user_auth)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(KYCProgressTracker.objects.filter(kyc_application__user=self.user).count(), 8)
+    
+    def test_admin_detail_with_many_audit_logs(self):
+        """Test admin detail doesn't query the performer of each audit log."""
+        self.client.post('/api/kyc/start/', **self.user_auth)
+        kyc = KYCApplication.objects.get(user=self.user)
+        for i in range(10):
+            KYCAuditLog.objects.create(
+                kyc_application=kyc, action=AuditAction.STATUS_CHANGED,
+                performed_by=self.admin if i % 2 else self.user, remarks=f'Change {i}'
+            )
+        
+        with self.assertQueryBudget(KYCAdminDetailView):
+            response = self.client.get(f'/api/kyc/admin/applications/{kyc.application_id}/', **self.admin_auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -11,12 +11,9 @@ API views for KYC/Onboarding system with:
 - Admin review endpoints
 """
 
-import random
-import string
-from datetime import timedelta
-
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 
 from rest_framework import status, generics
@@ -44,6 +41,7 @@ from .serializers import (
     KYCProgressSerializer, IdentityProofAdminSerializer, BankDetailsAdminSerializer
 )
 from .permissions import IsKYCOwner, IsKYCAdmin, CanAccessKYCStep
+from .otp_store import OTPStore
 
 
 def get_client_ip(request):
@@ -54,11 +52,6 @@ def get_client_ip(request):
     return request.META.get('REMOTE_ADDR')
 
 
-def generate_otp(length=6):
-    """Generate numeric OTP."""
-    return ''.join(random.choices(string.digits, k=length))
-
-
 # =============================================================================
 # OTP VIEWS
 # =============================================================================
@@ -75,6 +68,7 @@ class OTPSendView(APIView):
     }
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def post(self, request):
         from users_auth.email_service import send_otp_email
@@ -86,47 +80,33 @@ class OTPSendView(APIView):
         user = request.user
         otp_type = serializer.validated_data['otp_type']
         
-        # Invalidate any existing unused OTPs of same type
-        OTPVerification.objects.filter(
-            user=user,
-            otp_type=otp_type,
-            is_verified=False
-        ).update(expires_at=timezone.now())
-        
-        # Generate new OTP using configured length
-        otp_length = getattr(settings, 'OTP_LENGTH', 6)
-        otp_code = generate_otp(length=otp_length)
-        
-        # Use configured expiry time
-        otp_expiry = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
-        expires_at = timezone.now() + timedelta(minutes=otp_expiry)
-        
-        otp = OTPVerification.objects.create(
-            user=user,
-            otp_type=otp_type,
-            otp_code=otp_code,
-            expires_at=expires_at,
+        otp = OTPStore.issue(
+            user,
+            otp_type,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
         
         # Send OTP via email if type is EMAIL
+        # A coalesced send (code is None) reuses the OTP already on its way
+        # and sends nothing
         email_sent = False
-        if otp_type == OTPType.EMAIL:
+        if otp_type == OTPType.EMAIL and not otp.coalesced:
             user_email = serializer.validated_data.get('email') or user.email
             user_name = user.first_name or user.email.split('@')[0]
             email_sent = send_otp_email(
                 email=user_email,
-                otp_code=otp_code,
+                otp_code=otp.code,
                 user_name=user_name
             )
         
         response_data = {
             'success': True,
             'message': f'OTP sent successfully to your {otp_type.lower()}.',
-            'otp_id': str(otp.id),
+            'otp_id': otp.id,
             'expires_at': otp.expires_at.isoformat(),
-            'expires_in_seconds': otp_expiry * 60,
+            'expires_in_seconds': OTPStore.get_expiry_seconds(),
+            'coalesced': otp.coalesced,
         }
         
         # Add email delivery status
@@ -135,8 +115,8 @@ class OTPSendView(APIView):
         
         # Development only - return OTP in response for testing
         # Remove this in production by setting DEBUG=False
-        if settings.DEBUG:
-            response_data['otp_code_dev'] = otp_code
+        if settings.DEBUG and otp.code:
+            response_data['otp_code_dev'] = otp.code
         
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -152,6 +132,7 @@ class OTPVerifyView(APIView):
     }
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def post(self, request):
         serializer = OTPVerifySerializer(data=request.data)
@@ -161,22 +142,15 @@ class OTPVerifyView(APIView):
         otp_type = serializer.validated_data['otp_type']
         otp_code = serializer.validated_data['otp_code']
         
-        # Get the latest OTP for this user and type
-        otp = OTPVerification.objects.filter(
-            user=user,
-            otp_type=otp_type,
-            is_verified=False
-        ).order_by('-created_at').first()
+        result = OTPStore.verify(user, otp_type, otp_code)
         
-        if not otp:
+        if not result.found:
             return Response({
                 'success': False,
                 'message': 'No pending OTP found. Please request a new OTP.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        success, message = otp.verify(otp_code)
-        
-        if success:
+        if result.success:
             # Update KYC application verification status
             if hasattr(user, 'kyc_application'):
                 kyc_app = user.kyc_application
@@ -192,13 +166,13 @@ class OTPVerifyView(APIView):
             return Response({
                 'success': True,
                 'message': f'{otp_type.replace("_", " ").title()} verified successfully.',
-                'verified_at': otp.verified_at.isoformat()
+                'verified_at': result.verified_at.isoformat()
             }, status=status.HTTP_200_OK)
         
         return Response({
             'success': False,
-            'message': message,
-            'remaining_attempts': max(0, otp.max_attempts - otp.attempts)
+            'message': result.message,
+            'remaining_attempts': result.remaining_attempts
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -212,8 +186,11 @@ class OTPResendView(APIView):
     }
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def post(self, request):
+        from django.conf import settings
+        
         otp_type = request.data.get('otp_type')
         
         if otp_type not in [choice[0] for choice in OTPType.choices]:
@@ -225,35 +202,15 @@ class OTPResendView(APIView):
         user = request.user
         
         # Check for rate limiting (max 3 OTPs per 15 minutes)
-        fifteen_min_ago = timezone.now() - timedelta(minutes=15)
-        recent_otps = OTPVerification.objects.filter(
-            user=user,
-            otp_type=otp_type,
-            created_at__gte=fifteen_min_ago
-        ).count()
-        
-        if recent_otps >= 3:
+        if OTPStore.recent_sends(user.pk, otp_type) >= 3:
             return Response({
                 'success': False,
                 'message': 'Too many OTP requests. Please wait before requesting a new OTP.'
             }, status=status.HTTP_429_TOO_MANY_REQUESTS)
         
-        # Invalidate existing OTPs
-        OTPVerification.objects.filter(
-            user=user,
-            otp_type=otp_type,
-            is_verified=False
-        ).update(expires_at=timezone.now())
-        
-        # Generate new OTP
-        otp_code = generate_otp()
-        expires_at = timezone.now() + timedelta(minutes=10)
-        
-        otp = OTPVerification.objects.create(
-            user=user,
-            otp_type=otp_type,
-            otp_code=otp_code,
-            expires_at=expires_at,
+        otp = OTPStore.issue(
+            user,
+            otp_type,
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
@@ -261,14 +218,16 @@ class OTPResendView(APIView):
         response_data = {
             'success': True,
             'message': f'OTP resent successfully to your {otp_type.lower()}.',
-            'otp_id': str(otp.id),
+            'otp_id': otp.id,
             'expires_at': otp.expires_at.isoformat(),
-            'expires_in_seconds': 600,
+            'expires_in_seconds': OTPStore.get_expiry_seconds(),
+            'coalesced': otp.coalesced,
         }
         
-        # Development only - remove in production
-        if hasattr(request, 'is_test') or True:  # TODO: Remove True in production
-            response_data['otp_code_dev'] = otp_code
+        # Development only - return OTP in response for testing
+        # Remove this in production by setting DEBUG=False
+        if settings.DEBUG and otp.code:
+            response_data['otp_code_dev'] = otp.code
         
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -284,6 +243,7 @@ class KYCStatusView(APIView):
     GET /api/kyc/status/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         user = request.user
@@ -312,6 +272,7 @@ class KYCStartView(APIView):
     POST /api/kyc/start/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 17
     
     def post(self, request):
         user = request.user
@@ -358,6 +319,7 @@ class KYCDetailView(APIView):
     GET /api/kyc/detail/
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         user = request.user
@@ -396,6 +358,7 @@ class AadhaarDetailsView(APIView):
     GET /api/kyc/identity/aadhaar/
     """
     permission_classes = [IsAuthenticated, IsKYCOwner]
+    query_budget = {'get': 4, 'post': 8}
     
     def get(self, request):
         user = request.user
@@ -498,6 +461,7 @@ class AadhaarUploadView(APIView):
     permission_classes = [IsAuthenticated, IsKYCOwner]
     parser_classes = [MultiPartParser, FormParser]
     throttle_classes = []  # Using custom throttle below
+    query_budget = 8
     
     def get_throttles(self):
         """Apply KYC upload rate throttle."""
@@ -573,6 +537,7 @@ class PANDetailsView(APIView):
     GET /api/kyc/identity/pan/
     """
     permission_classes = [IsAuthenticated, IsKYCOwner]
+    query_budget = {'get': 4, 'post': 9}
     
     def get(self, request):
         user = request.user
@@ -667,6 +632,7 @@ class PANUploadView(APIView):
     permission_classes = [IsAuthenticated, IsKYCOwner]
     parser_classes = [MultiPartParser, FormParser]
     throttle_classes = []  # Using custom throttle below
+    query_budget = 8
     
     def get_throttles(self):
         """Apply KYC upload rate throttle."""
@@ -748,6 +714,7 @@ class BusinessDetailsView(APIView):
     GET /api/kyc/business/
     """
     permission_classes = [IsAuthenticated, IsKYCOwner]
+    query_budget = {'get': 4, 'post': 8, 'put': 8}
     
     def get(self, request):
         user = request.user
@@ -843,6 +810,7 @@ class SelfieUploadView(APIView):
     permission_classes = [IsAuthenticated, IsKYCOwner]
     parser_classes = [MultiPartParser, FormParser]
     throttle_classes = []  # Using custom throttle below
+    query_budget = 6
     
     def get_throttles(self):
         """Apply KYC upload rate throttle."""
@@ -907,6 +875,7 @@ class OfficePhotosUploadView(APIView):
     permission_classes = [IsAuthenticated, IsKYCOwner]
     parser_classes = [MultiPartParser, FormParser]
     throttle_classes = []  # Using custom throttle below
+    query_budget = 8
     
     def get_throttles(self):
         """Apply KYC upload rate throttle."""
@@ -979,6 +948,7 @@ class AddressProofUploadView(APIView):
     permission_classes = [IsAuthenticated, IsKYCOwner]
     parser_classes = [MultiPartParser, FormParser]
     throttle_classes = []  # Using custom throttle below
+    query_budget = 8
     
     def get_throttles(self):
         """Apply KYC upload rate throttle."""
@@ -1044,6 +1014,7 @@ class VerificationImagesView(APIView):
     GET /api/kyc/verification/
     """
     permission_classes = [IsAuthenticated, IsKYCOwner]
+    query_budget = 4
     
     def get(self, request):
         user = request.user
@@ -1087,6 +1058,7 @@ class BankDetailsView(APIView):
     """
     permission_classes = [IsAuthenticated, IsKYCOwner]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    query_budget = {'get': 4, 'post': 9, 'put': 9}
     
     def get(self, request):
         user = request.user
@@ -1194,6 +1166,7 @@ class KYCSubmitView(APIView):
     POST /api/kyc/submit/
     """
     permission_classes = [IsAuthenticated, IsKYCOwner]
+    query_budget = 10
     
     def post(self, request):
         user = request.user
@@ -1275,6 +1248,7 @@ class KYCAdminListView(generics.ListAPIView):
     """
     permission_classes = [IsAuthenticated, IsKYCAdmin]
     serializer_class = KYCAdminListSerializer
+    query_budget = 7
     
     def get_queryset(self):
         queryset = KYCApplication.objects.filter(is_deleted=False).select_related('user')
@@ -1320,11 +1294,15 @@ class KYCAdminDetailView(APIView):
     GET /api/kyc/admin/applications/<application_id>/
     """
     permission_classes = [IsAuthenticated, IsKYCAdmin]
+    query_budget = 11
     
     def get(self, request, application_id):
         kyc_app = get_object_or_404(
             KYCApplication.objects.select_related('user', 'reviewed_by')
-                .prefetch_related('progress_steps', 'audit_logs'),
+                .prefetch_related(
+                    'progress_steps',
+                    Prefetch('audit_logs', queryset=KYCAuditLog.objects.select_related('performed_by')),
+                ),
             application_id=application_id,
             is_deleted=False
         )
@@ -1348,6 +1326,7 @@ class KYCAdminReviewView(APIView):
     }
     """
     permission_classes = [IsAuthenticated, IsKYCAdmin]
+    query_budget = 14
     
     def post(self, request, application_id):
         kyc_app = get_object_or_404(
@@ -1425,6 +1404,7 @@ class KYCAdminStartReviewView(APIView):
     POST /api/kyc/admin/applications/<application_id>/start-review/
     """
     permission_classes = [IsAuthenticated, IsKYCAdmin]
+    query_budget = 11
     
     def post(self, request, application_id):
         kyc_app = get_object_or_404(
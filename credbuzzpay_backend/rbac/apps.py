@@ -7,5 +7,5 @@ class RbacConfig(AppConfig):
     verbose_name = 'Role-Based Access Control'
     
     def ready(self):
-        # Import signals if any
-        pass
+        # Import signals to register them
+        from . import signals  # noqa: F401
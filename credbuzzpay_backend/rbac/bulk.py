@@ -0,0 +1,309 @@
+"""
+Set-based bulk RBAC operations
+==============================
+Assigning a role to thousands of users, or many apps/features to a role,
+is done in a fixed number of statements per batch instead of a get() and
+get_or_create() per item:
+
+1. resolve the submitted ids in one query (per BATCH_SIZE chunk)
+2. load the role's existing rows for them in one query
+3. bulk_create(ignore_conflicts=True) the missing rows, bulk_update the
+   rows whose flags differ or that were deactivated
+4. in sync mode, deactivate the role's rows that were not submitted
+5. insert one AuditLog row per change with a single bulk_create
+
+Bulk writes bypass model signals, so the affected UserEffectiveAccess rows
+are refreshed and the RBAC generation is bumped here. Every write sets
+updated_at, which the permission matrix's incremental refresh relies on.
+
+Callers run these inside transaction.atomic(), holding a select_for_update()
+lock on the role row so concurrent bulk operations on a role are serialized.
+"""
+from django.utils import timezone
+
+from .cache import bump_rbac_generation
+from .effective_access import EffectiveAccess, PERMISSION_FIELDS
+from .models import App, AuditLog, Feature, RoleAppMapping, RoleFeatureMapping, UserRoleAssignment
+
+
+BATCH_SIZE = 5000
+
+
+def chunks(items, size=BATCH_SIZE):
+    """Split a list into lists of at most size items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BulkResult:
+    """
+    Outcome of a bulk operation, by target id (app, feature or user).
+    """
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.deactivated = []
+        self.unchanged = []
+        self.not_found = []
+        # Ids of the created / changed rows (mappings or assignments)
+        self.created_row_ids = []
+        self.changed_row_ids = []
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'deactivated': self.deactivated,
+            'unchanged': len(self.unchanged),
+            'not_found': self.not_found,
+        }
+
+
+class BulkRBAC:
+    """
+    Set-based bulk assignment of apps, features and users to a role.
+    """
+
+    @staticmethod
+    def _existing_ids(model, ids):
+        found = set()
+        for chunk in chunks(ids):
+            found.update(model.objects.filter(id__in=chunk).values_list('id', flat=True))
+        return found
+
+    @staticmethod
+    def _audit(action, entity_type, rows, describe, user, request=None):
+        """Insert one AuditLog row per (id, uuid, new_values) in rows"""
+        ip_address = request.META.get('REMOTE_ADDR') if request else None
+        user_agent = request.META.get('HTTP_USER_AGENT', '')[:500] if request else None
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                action=action,
+                entity_type=entity_type,
+                entity_id=row_id,
+                entity_uuid=row_uuid,
+                description=describe(new_values),
+                performed_by=user,
+                new_values=new_values,
+                ip_address=ip_address,
+                user_agent=user_agent,
+            )
+            for row_id, row_uuid, new_values in rows
+        ], batch_size=BATCH_SIZE)
+
+    @classmethod
+    def _assign_mappings(cls, model, target_field, target_model, entity_type, refresh,
+                         role, target_ids, permissions, assigned_by, sync=False, request=None):
+        """
+        Make role's mappings to target_ids carry permissions; in sync mode,
+        also deactivate the role's other mappings.
+        """
+        result = BulkResult()
+        now = timezone.now()
+        target_ids = list(dict.fromkeys(target_ids))
+        found = cls._existing_ids(target_model, target_ids)
+        result.not_found = [pk for pk in target_ids if pk not in found]
+        target_ids = [pk for pk in target_ids if pk in found]
+        desired = dict(permissions, is_active=True)
+
+        existing = {}
+        for chunk in chunks(target_ids):
+            for mapping in model.objects.filter(role=role, **{f'{target_field}_id__in': chunk}):
+                existing[getattr(mapping, f'{target_field}_id')] = mapping
+
+        to_update = []
+        for target_id in target_ids:
+            mapping = existing.get(target_id)
+            if mapping is None:
+                continue
+            if all(getattr(mapping, field) == value for field, value in desired.items()):
+                result.unchanged.append(target_id)
+                continue
+            for field, value in desired.items():
+                setattr(mapping, field, value)
+            mapping.updated_at = now
+            to_update.append(mapping)
+            result.updated.append(target_id)
+        model.objects.bulk_update(to_update, list(desired) + ['updated_at'], batch_size=BATCH_SIZE)
+
+        missing = [pk for pk in target_ids if pk not in existing]
+        model.objects.bulk_create([
+            model(role=role, assigned_by=assigned_by, **{f'{target_field}_id': pk}, **desired)
+            for pk in missing
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        created_rows = []
+        for chunk in chunks(missing):
+            created_rows.extend(
+                model.objects.filter(role=role, **{f'{target_field}_id__in': chunk})
+                .values_list('id', 'uuid', f'{target_field}_id')
+            )
+        result.created = [target_id for _, _, target_id in created_rows]
+        result.created_row_ids = [row_id for row_id, _, _ in created_rows]
+
+        deactivated_rows = []
+        if sync:
+            keep = set(target_ids)
+            deactivated_rows = [
+                row for row in model.objects.filter(role=role, is_active=True)
+                .values_list('id', 'uuid', f'{target_field}_id')
+                if row[2] not in keep
+            ]
+            for chunk in chunks([row_id for row_id, _, _ in deactivated_rows]):
+                model.objects.filter(id__in=chunk).update(is_active=False, updated_at=now)
+            result.deactivated = [target_id for _, _, target_id in deactivated_rows]
+
+        result.changed_row_ids = (
+            result.created_row_ids
+            + [mapping.id for mapping in to_update]
+            + [row_id for row_id, _, _ in deactivated_rows]
+        )
+        for chunk in chunks(result.changed_row_ids):
+            refresh(chunk)
+        if result.changed_row_ids:
+            bump_rbac_generation()
+
+        label = target_model._meta.verbose_name
+        cls._audit('ASSIGN', entity_type, [
+            (row_id, row_uuid, dict(desired, role_id=role.id, **{f'{target_field}_id': target_id}))
+            for row_id, row_uuid, target_id in created_rows
+        ] + [
+            (mapping.id, mapping.uuid, dict(desired, role_id=role.id, **{f'{target_field}_id': target_id}))
+            for target_id, mapping in ((pk, existing[pk]) for pk in result.updated)
+        ], lambda values: f"Bulk assigned {label} {values[f'{target_field}_id']} to role: {role.name}",
+            assigned_by, request)
+        cls._audit('REVOKE', entity_type, [
+            (row_id, row_uuid, {'role_id': role.id, f'{target_field}_id': target_id, 'is_active': False})
+            for row_id, row_uuid, target_id in deactivated_rows
+        ], lambda values: f"Bulk sync revoked {label} {values[f'{target_field}_id']} from role: {role.name}",
+            assigned_by, request)
+        return result
+
+    @classmethod
+    def assign_apps(cls, role, app_ids, permissions, assigned_by=None, sync=False, request=None):
+        """
+        Map apps to a role with the given CRUD flags.
+
+        Args:
+            permissions: dict of can_view / can_create / can_update / can_delete
+            sync: Also deactivate the role's mappings to apps not in app_ids
+
+        Returns:
+            BulkResult: by app id
+        """
+        return cls._assign_mappings(
+            RoleAppMapping, 'app', App, 'ROLE_APP_MAPPING', EffectiveAccess.refresh_app_mappings,
+            role, app_ids, {field: permissions[field] for field in PERMISSION_FIELDS}, assigned_by, sync, request,
+        )
+
+    @classmethod
+    def assign_features(cls, role, feature_ids, permissions, assigned_by=None, sync=False, request=None):
+        """
+        Map features to a role with the given CRUD flags.
+
+        Returns:
+            BulkResult: by feature id
+        """
+        return cls._assign_mappings(
+            RoleFeatureMapping, 'feature', Feature, 'ROLE_FEATURE_MAPPING', EffectiveAccess.refresh_feature_mappings,
+            role, feature_ids, {field: permissions[field] for field in PERMISSION_FIELDS}, assigned_by, sync, request,
+        )
+
+    @classmethod
+    def assign_role(cls, role, user_ids, is_primary=False, assigned_by=None, sync=False, request=None):
+        """
+        Assign a role to users. Inactive assignments are reactivated; with
+        is_primary the role becomes each user's primary role. In sync mode
+        the role's assignments of users not in user_ids are deactivated.
+
+        Returns:
+            BulkResult: by user id
+        """
+        from users_auth.models import User
+
+        result = BulkResult()
+        now = timezone.now()
+        user_ids = list(dict.fromkeys(user_ids))
+        found = cls._existing_ids(User, user_ids)
+        result.not_found = [pk for pk in user_ids if pk not in found]
+        user_ids = [pk for pk in user_ids if pk in found]
+
+        existing = {}
+        for chunk in chunks(user_ids):
+            for assignment in UserRoleAssignment.objects.filter(role=role, user_id__in=chunk).order_by('-is_active', 'id'):
+                existing.setdefault(assignment.user_id, assignment)
+
+        if is_primary:
+            # Same rule as UserRoleAssignment.save(): one primary role per user
+            for chunk in chunks(user_ids):
+                UserRoleAssignment.objects.filter(user_id__in=chunk, is_primary=True).exclude(role=role).update(
+                    is_primary=False, updated_at=now
+                )
+
+        to_update = []
+        for user_id in user_ids:
+            assignment = existing.get(user_id)
+            if assignment is None:
+                continue
+            if assignment.is_active and (assignment.is_primary or not is_primary):
+                result.unchanged.append(user_id)
+                continue
+            assignment.is_active = True
+            assignment.is_primary = assignment.is_primary or is_primary
+            assignment.updated_at = now
+            to_update.append(assignment)
+            result.updated.append(user_id)
+        UserRoleAssignment.objects.bulk_update(to_update, ['is_active', 'is_primary', 'updated_at'], batch_size=BATCH_SIZE)
+
+        missing = [pk for pk in user_ids if pk not in existing]
+        UserRoleAssignment.objects.bulk_create([
+            UserRoleAssignment(user_id=pk, role=role, is_primary=is_primary, assigned_by=assigned_by, valid_from=now)
+            for pk in missing
+        ], batch_size=BATCH_SIZE)
+
+        created_rows = []
+        for chunk in chunks(missing):
+            created_rows.extend(
+                UserRoleAssignment.objects.filter(role=role, user_id__in=chunk)
+                .order_by().values_list('id', 'uuid', 'user_id')
+            )
+        result.created = [user_id for _, _, user_id in created_rows]
+        result.created_row_ids = [row_id for row_id, _, _ in created_rows]
+
+        deactivated_rows = []
+        if sync:
+            keep = set(user_ids)
+            deactivated_rows = [
+                row for row in UserRoleAssignment.objects.filter(role=role, is_active=True)
+                .order_by().values_list('id', 'uuid', 'user_id')
+                if row[2] not in keep
+            ]
+            for chunk in chunks([row_id for row_id, _, _ in deactivated_rows]):
+                UserRoleAssignment.objects.filter(id__in=chunk).update(is_active=False, updated_at=now)
+            result.deactivated = [user_id for _, _, user_id in deactivated_rows]
+
+        result.changed_row_ids = (
+            result.created_row_ids
+            + [assignment.id for assignment in to_update]
+            + [row_id for row_id, _, _ in deactivated_rows]
+        )
+        for chunk in chunks(result.changed_row_ids):
+            EffectiveAccess.refresh_assignments(chunk)
+        if result.changed_row_ids:
+            bump_rbac_generation()
+
+        cls._audit('ASSIGN', 'USER_ROLE_ASSIGNMENT', [
+            (row_id, row_uuid, {'user_id': user_id, 'role_id': role.id, 'is_primary': is_primary})
+            for row_id, row_uuid, user_id in created_rows
+        ] + [
+            (assignment.id, assignment.uuid, {
+                'user_id': assignment.user_id, 'role_id': role.id, 'is_primary': assignment.is_primary,
+            })
+            for assignment in to_update
+        ], lambda values: f"Bulk assigned role {role.name} to user {values['user_id']}", assigned_by, request)
+        cls._audit('REVOKE', 'USER_ROLE_ASSIGNMENT', [
+            (row_id, row_uuid, {'user_id': user_id, 'role_id': role.id, 'is_active': False})
+            for row_id, row_uuid, user_id in deactivated_rows
+        ], lambda values: f"Bulk sync revoked role {role.name} from user {values['user_id']}", assigned_by, request)
+        return result
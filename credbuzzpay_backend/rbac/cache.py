@@ -0,0 +1,86 @@
+"""
+RBAC cache generation
+
+A single generation number, kept in the shared cache, versions every cache
+derived from RBAC data (permission snapshots, decisions, catalogs). Any
+change to roles, apps, features, mappings or assignments bumps it, which
+invalidates all derived entries on every worker at once.
+
+A process-local cache keeps a generation per worker, so versions handed
+to clients (ETags) are then built from the RBAC rows themselves.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, Max
+
+from credbuzzpay_backend.cache_utils import bump_generation, cache_is_shared, get_generation
+
+
+RBAC_GENERATION = 'rbac'
+
+
+def get_rbac_generation():
+    """Get the current RBAC generation number"""
+    return get_generation(RBAC_GENERATION)
+
+
+def bump_rbac_generation():
+    """
+    Invalidate everything derived from RBAC data.
+
+    Inside a transaction the generation is bumped again on commit, so a
+    concurrent reader can't re-cache the pre-commit state.
+    """
+    bump_generation(RBAC_GENERATION)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_generation(RBAC_GENERATION))
+
+
+def _rbac_data_version(user):
+    """
+    Version the RBAC rows deciding user's access without a shared
+    generation: the latest updated_at and row count of the user's
+    assignments, their roles, the roles' mappings and the mapped apps and
+    features. Counts catch deletions, updated_at catches every other write.
+    """
+    from .models import UserRoleAssignment
+
+    assignments = UserRoleAssignment.objects.filter(user=user)
+    apps = assignments.aggregate(
+        assignments=Count('id', distinct=True),
+        assignment_at=Max('updated_at'),
+        role_at=Max('role__updated_at'),
+        mappings=Count('role__role_app_mappings', distinct=True),
+        mapping_at=Max('role__role_app_mappings__updated_at'),
+        app_at=Max('role__role_app_mappings__app__updated_at'),
+    )
+    features = assignments.aggregate(
+        mappings=Count('role__role_feature_mappings', distinct=True),
+        mapping_at=Max('role__role_feature_mappings__updated_at'),
+        feature_at=Max('role__role_feature_mappings__feature__updated_at'),
+    )
+    return tuple(sorted(apps.items())) + tuple(sorted(features.items()))
+
+
+def get_user_access_version(user):
+    """
+    Get a version of everything deciding user's effective permissions: the
+    RBAC generation (or, without a shared cache, a version of the RBAC rows)
+    plus the user's assignments inside their validity window (a window
+    opening or closing changes access without any write).
+
+    Returns:
+        tuple: (generation or RBAC data version, ids of assignments currently in effect)
+    """
+    from django.utils import timezone
+    from .models import UserRoleAssignment
+
+    now = timezone.now()
+    windows = UserRoleAssignment.objects.filter(user=user, is_active=True).values_list(
+        'id', 'valid_from', 'valid_until'
+    )
+    in_effect = tuple(sorted(
+        pk for pk, valid_from, valid_until in windows
+        if valid_from <= now and (valid_until is None or valid_until >= now)
+    ))
+    version = get_rbac_generation() if cache_is_shared() else _rbac_data_version(user)
+    return version, in_effect
@@ -0,0 +1,192 @@
+"""
+RBAC catalog snapshot
+=====================
+The app / feature / role catalog changes a few times a month but is read on
+every AllAppsAndFeaturesView call and for every developer's permission
+listing. RBACCatalog is an immutable snapshot of it - active apps, features
+and roles, their code -> id maps, and the catalog endpoint's response
+already rendered to JSON bytes - built with three queries once per RBAC
+generation (see rbac.cache) and shared by every request on the worker.
+
+Any save or delete of a role, app or feature bumps the generation, so the
+next read on each worker rebuilds the snapshot. Writes that bypass signals
+(queryset .update()) or a bump lost from the shared cache are covered by
+RBAC_CATALOG_MAX_AGE_SECONDS, after which the snapshot is rebuilt anyway.
+Without a shared cache (see cache_is_shared) the generation says nothing
+about other workers' writes, so the snapshot is rebuilt on every call.
+Callers must treat entries as read-only; they are tuples and read-only
+mappings for that reason.
+"""
+import threading
+import time
+from types import MappingProxyType
+from typing import NamedTuple
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+
+from credbuzzpay_backend.cache_utils import cache_is_shared
+
+from .cache import get_rbac_generation
+from .models import App, Feature, UserRole
+
+
+class AppEntry(NamedTuple):
+    id: int
+    code: str
+    name: str
+    description: str
+    icon: str
+
+
+class FeatureEntry(NamedTuple):
+    id: int
+    app_id: int
+    app_code: str
+    code: str
+    name: str
+    description: str
+    feature_type: str
+
+
+class RoleEntry(NamedTuple):
+    id: int
+    code: str
+    name: str
+    level: int
+    is_system_role: bool
+
+
+class RBACCatalog:
+    """
+    Immutable snapshot of the active apps, features and roles.
+    """
+
+    def __init__(self, apps, features, roles, generation=None):
+        # Active apps in display order, active features of any app (app
+        # display order, then their own), active roles by level
+        self.apps = tuple(apps)
+        self.features = tuple(features)
+        self.roles = tuple(roles)
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+
+        features_by_app = {}
+        for feature in self.features:
+            features_by_app.setdefault(feature.app_id, []).append(feature)
+        self.features_by_app = MappingProxyType({
+            app_id: tuple(features) for app_id, features in features_by_app.items()
+        })
+
+        self.app_ids = MappingProxyType({app.code: app.id for app in self.apps})
+        self.feature_ids = MappingProxyType({
+            (feature.app_code, feature.code): feature.id for feature in self.features
+        })
+        self.role_ids = MappingProxyType({role.code: role.id for role in self.roles})
+
+        self.response_bytes = self._render()
+
+    def as_payload(self):
+        """The AllAppsAndFeaturesView response data"""
+        apps = [{
+            'app_id': app.id,
+            'app_code': app.code,
+            'app_name': app.name,
+            'app_description': app.description,
+            'app_icon': app.icon,
+            'features': [{
+                'feature_id': feature.id,
+                'feature_code': feature.code,
+                'feature_name': feature.name,
+                'feature_description': feature.description,
+                'feature_type': feature.feature_type,
+            } for feature in self.features_by_app.get(app.id, ())]
+        } for app in self.apps]
+
+        roles = [{
+            'role_id': role.id,
+            'role_code': role.code,
+            'role_name': role.name,
+            'role_level': role.level,
+            'is_system_role': role.is_system_role,
+        } for role in self.roles]
+
+        return {
+            'apps': apps,
+            'roles': roles,
+            'total_apps': len(apps),
+            'total_features': sum(len(app['features']) for app in apps),
+            'total_roles': len(roles),
+        }
+
+    def _render(self):
+        """Render the success envelope once, with the project's JSON renderer"""
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        return renderer.render({'success': True, 'message': 'Success', 'data': self.as_payload()})
+
+    @classmethod
+    def load(cls, generation=None):
+        """Build a snapshot from the database (three queries)"""
+        apps = [
+            AppEntry(*row) for row in App.objects.filter(is_active=True).values_list(
+                'id', 'code', 'name', 'description', 'icon'
+            )
+        ]
+        features = [
+            FeatureEntry(*row) for row in Feature.objects.filter(is_active=True).values_list(
+                'id', 'app_id', 'app__code', 'code', 'name', 'description', 'feature_type'
+            )
+        ]
+        roles = [
+            RoleEntry(*row) for row in UserRole.objects.filter(is_active=True).values_list(
+                'id', 'code', 'name', 'level', 'is_system_role'
+            )
+        ]
+        return cls(apps, features, roles, generation)
+
+
+class CatalogService:
+    """
+    Per-worker RBACCatalog, rebuilt when the RBAC generation moves.
+    """
+
+    _catalog = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_max_age():
+        """Get how long (seconds) a snapshot is reused at most"""
+        return getattr(settings, 'RBAC_CATALOG_MAX_AGE_SECONDS', 300)
+
+    @classmethod
+    def _is_current(cls, catalog, generation):
+        return (
+            catalog is not None
+            and cache_is_shared()
+            and catalog.generation == generation
+            and time.monotonic() - catalog.loaded_at < cls.get_max_age()
+        )
+
+    @classmethod
+    def get_catalog(cls):
+        """
+        Get the catalog snapshot of the current RBAC generation.
+
+        Returns:
+            RBACCatalog
+        """
+        generation = get_rbac_generation()
+        catalog = cls._catalog
+        if cls._is_current(catalog, generation):
+            return catalog
+
+        with cls._lock:
+            if not cls._is_current(cls._catalog, generation):
+                cls._catalog = RBACCatalog.load(generation)
+            return cls._catalog
+
+    @classmethod
+    def reset(cls):
+        """Drop this worker's snapshot; the next call rebuilds it"""
+        with cls._lock:
+            cls._catalog = None
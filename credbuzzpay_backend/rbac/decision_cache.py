@@ -0,0 +1,103 @@
+"""
+RBAC decision cache for has_app_permission / has_feature_permission
+
+HasAppAccess and HasFeatureAccess check a permission on every request, and
+each check resolves the user's roles and probes the mappings. Decisions are
+therefore kept in an in-process LRU, keyed by
+(RBAC generation, user, app code, feature code, permission), so repeat
+checks on a worker are one shared-cache read of the generation plus a
+dictionary lookup.
+
+Correctness across gunicorn workers comes from the generation (see
+rbac.cache): any role, app, feature, mapping or assignment change bumps it
+in the shared cache, and every worker's next check looks decisions up under
+the new number. Old entries are never read again and age out of the LRU.
+A per-process cache backend would keep each bump on the worker that made
+it, so decisions are not cached at all unless the cache is shared (see
+cache_is_shared). Temporary role assignments are handled by never keeping a decision past
+the next valid_from / valid_until boundary of the user's assignments.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from credbuzzpay_backend.cache_utils import LocalLRUCache, cache_is_shared
+
+from .cache import get_rbac_generation
+
+
+class PermissionDecisionCache:
+    """
+    In-process cache of permission decisions per user and RBAC generation.
+    """
+
+    _local = None
+
+    @staticmethod
+    def is_enabled():
+        """Check if permission decisions are cached"""
+        return getattr(settings, 'RBAC_DECISION_CACHE_ENABLED', True) and cache_is_shared()
+
+    @staticmethod
+    def get_ttl():
+        """Get maximum lifetime of a decision in seconds"""
+        return getattr(settings, 'RBAC_DECISION_CACHE_TTL_SECONDS', 300)
+
+    @classmethod
+    def get_local_cache(cls):
+        """Get (lazily creating) the in-process LRU for this worker"""
+        if cls._local is None:
+            cls._local = LocalLRUCache(
+                maxsize=getattr(settings, 'RBAC_DECISION_CACHE_LOCAL_MAXSIZE', 8192),
+                ttl=cls.get_ttl(),
+            )
+        return cls._local
+
+    @staticmethod
+    def _user_key(user):
+        # created_at guards against a recycled primary key picking up stale decisions
+        created = user.created_at.timestamp() if user.created_at else ''
+        return (user.pk, created)
+
+    @classmethod
+    def _cached(cls, key, resolve):
+        """
+        Look key up under the current generation, resolving and caching it
+        on a miss. resolve() returns (value, changes_at), where changes_at
+        is the earliest moment the value may change without an RBAC write,
+        or None.
+        """
+        if not cls.is_enabled():
+            return resolve()[0]
+
+        key = (get_rbac_generation(),) + key
+        local = cls.get_local_cache()
+        value = local.get(key)
+        if value is not None:
+            return value
+
+        value, changes_at = resolve()
+        ttl = cls.get_ttl()
+        if changes_at is not None:
+            ttl = min(ttl, (changes_at - timezone.now()).total_seconds())
+        if ttl > 0:
+            local.set(key, value, ttl=ttl)
+        return value
+
+    @classmethod
+    def decide(cls, user, app_code, feature_code, permission, resolve):
+        """
+        Get a cached decision, resolving and caching it on a miss.
+
+        Args:
+            resolve: Callable returning (allowed, changes_at)
+
+        Returns:
+            bool: Whether the permission is granted
+        """
+        return cls._cached(cls._user_key(user) + (app_code, feature_code, permission), resolve)
+
+    @classmethod
+    def clear(cls):
+        """Drop every decision cached by this worker"""
+        if cls._local is not None:
+            cls._local.clear()
@@ -0,0 +1,271 @@
+"""
+Materialized effective access
+=============================
+UserEffectiveAccess projects users x apps/features: one row per active role
+assignment and active mapping of the assigned role, with the CRUD flags and
+the granting role. Reading a user's access is one indexed query instead of
+a query per role and mapping.
+
+Rows are kept in step incrementally (see rbac.signals):
+- saving a UserRoleAssignment rebuilds that assignment's rows
+- saving a RoleAppMapping / RoleFeatureMapping rebuilds that mapping's rows
+- deleting a user, assignment, role, app, feature or mapping removes its
+  rows by cascade
+
+Flags that are cheap to check while reading - role, app and feature
+is_active and the assignment's validity window - are applied by
+`for_user()` rather than stored, so toggling them needs no rebuild.
+
+Queryset .update() calls bypass signals: call the matching refresh method
+afterwards. The rebuild_effective_access and check_effective_access
+management commands rebuild the table and report drift.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RoleAppMapping, RoleFeatureMapping, UserEffectiveAccess, UserRoleAssignment
+
+
+PERMISSION_FIELDS = ('can_view', 'can_create', 'can_update', 'can_delete')
+
+# Fields identifying a row's content, compared by the consistency check
+ROW_FIELDS = (
+    'assignment_id', 'app_mapping_id', 'feature_mapping_id', 'user_id', 'role_id',
+    'app_id', 'feature_id', 'valid_from', 'valid_until',
+) + PERMISSION_FIELDS
+
+ASSIGNMENT_FIELDS = ('id', 'user_id', 'role_id', 'valid_from', 'valid_until')
+
+
+class EffectiveAccess:
+    """
+    Maintain and read the UserEffectiveAccess projection.
+    """
+
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def for_user(user):
+        """
+        Get the user's access rows currently in effect, apps first.
+        """
+        now = timezone.now()
+        return UserEffectiveAccess.objects.filter(
+            Q(valid_until__isnull=True) | Q(valid_until__gte=now),
+            Q(feature__isnull=True) | Q(feature__is_active=True),
+            user=user,
+            valid_from__lte=now,
+            role__is_active=True,
+            app__is_active=True,
+        ).select_related('role', 'app', 'feature').order_by(
+            'app__display_order', 'app__name', 'feature__display_order', 'feature__name'
+        )
+
+    @staticmethod
+    def _app_mappings(**filters):
+        return list(
+            RoleAppMapping.objects.filter(is_active=True, **filters)
+            .values('id', 'role_id', 'app_id', *PERMISSION_FIELDS)
+        )
+
+    @staticmethod
+    def _feature_mappings(**filters):
+        return list(
+            RoleFeatureMapping.objects.filter(is_active=True, **filters)
+            .values('id', 'role_id', 'feature_id', 'feature__app_id', *PERMISSION_FIELDS)
+        )
+
+    @staticmethod
+    def build_rows(assignments, app_mappings, feature_mappings):
+        """
+        Join assignments with the mappings of their roles.
+
+        Args:
+            assignments: dicts of ASSIGNMENT_FIELDS (active assignments only)
+            app_mappings, feature_mappings: dicts as returned by
+                _app_mappings() / _feature_mappings()
+
+        Returns:
+            list: Unsaved UserEffectiveAccess rows
+        """
+        by_role = {}
+        for mapping in app_mappings:
+            by_role.setdefault(mapping['role_id'], []).append({
+                'app_mapping_id': mapping['id'],
+                'app_id': mapping['app_id'],
+                **{field: mapping[field] for field in PERMISSION_FIELDS},
+            })
+        for mapping in feature_mappings:
+            by_role.setdefault(mapping['role_id'], []).append({
+                'feature_mapping_id': mapping['id'],
+                'feature_id': mapping['feature_id'],
+                'app_id': mapping['feature__app_id'],
+                **{field: mapping[field] for field in PERMISSION_FIELDS},
+            })
+
+        rows = []
+        for assignment in assignments:
+            for target in by_role.get(assignment['role_id'], ()):
+                rows.append(UserEffectiveAccess(
+                    user_id=assignment['user_id'],
+                    assignment_id=assignment['id'],
+                    role_id=assignment['role_id'],
+                    valid_from=assignment['valid_from'],
+                    valid_until=assignment['valid_until'],
+                    **target,
+                ))
+        return rows
+
+    @classmethod
+    def _active_assignments(cls, **filters):
+        """Iterate active assignments as dicts, in primary-key batches"""
+        last_id = 0
+        while True:
+            batch = list(
+                UserRoleAssignment.objects.filter(is_active=True, id__gt=last_id, **filters)
+                .order_by('id').values(*ASSIGNMENT_FIELDS)[:cls.BATCH_SIZE]
+            )
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1]['id']
+
+    @classmethod
+    def _insert(cls, rows):
+        UserEffectiveAccess.objects.bulk_create(rows, batch_size=cls.BATCH_SIZE)
+        return len(rows)
+
+    @classmethod
+    def refresh_assignments(cls, assignment_ids):
+        """
+        Rebuild the rows of the given assignments.
+
+        Returns:
+            int: Number of rows written
+        """
+        assignment_ids = list(assignment_ids)
+        with transaction.atomic():
+            UserEffectiveAccess.objects.filter(assignment_id__in=assignment_ids).delete()
+            assignments = list(
+                UserRoleAssignment.objects.filter(id__in=assignment_ids, is_active=True).values(*ASSIGNMENT_FIELDS)
+            )
+            if not assignments:
+                return 0
+            role_ids = {a['role_id'] for a in assignments}
+            return cls._insert(cls.build_rows(
+                assignments,
+                cls._app_mappings(role_id__in=role_ids),
+                cls._feature_mappings(role_id__in=role_ids),
+            ))
+
+    @classmethod
+    def refresh_users(cls, user_ids):
+        """Rebuild every row of the given users"""
+        assignment_ids = set(
+            UserRoleAssignment.objects.filter(user_id__in=list(user_ids)).values_list('id', flat=True)
+        )
+        with transaction.atomic():
+            UserEffectiveAccess.objects.filter(user_id__in=list(user_ids)).exclude(
+                assignment_id__in=assignment_ids
+            ).delete()
+            return cls.refresh_assignments(assignment_ids)
+
+    @classmethod
+    def _refresh_mappings(cls, mapping_field, app_mappings, feature_mappings, mapping_ids):
+        with transaction.atomic():
+            UserEffectiveAccess.objects.filter(**{f'{mapping_field}__in': mapping_ids}).delete()
+            role_ids = {m['role_id'] for m in app_mappings} | {m['role_id'] for m in feature_mappings}
+            if not role_ids:
+                return 0
+
+            written = 0
+            for batch in cls._active_assignments(role_id__in=role_ids):
+                written += cls._insert(cls.build_rows(batch, app_mappings, feature_mappings))
+            return written
+
+    @classmethod
+    def refresh_app_mappings(cls, mapping_ids):
+        """
+        Rebuild the rows derived from the given RoleAppMappings.
+
+        Returns:
+            int: Number of rows written
+        """
+        mapping_ids = list(mapping_ids)
+        return cls._refresh_mappings('app_mapping_id', cls._app_mappings(id__in=mapping_ids), [], mapping_ids)
+
+    @classmethod
+    def refresh_feature_mappings(cls, mapping_ids):
+        """
+        Rebuild the rows derived from the given RoleFeatureMappings.
+
+        Returns:
+            int: Number of rows written
+        """
+        mapping_ids = list(mapping_ids)
+        return cls._refresh_mappings(
+            'feature_mapping_id', [], cls._feature_mappings(id__in=mapping_ids), mapping_ids
+        )
+
+    @staticmethod
+    def sync_feature_app(feature):
+        """Follow a feature moved to another app"""
+        UserEffectiveAccess.objects.filter(feature=feature).exclude(app_id=feature.app_id).update(
+            app_id=feature.app_id
+        )
+
+    @classmethod
+    def _assignment_batches(cls, batch_size=None):
+        """Iterate all assignment ids in primary-key batches"""
+        last_id = 0
+        while True:
+            ids = list(
+                UserRoleAssignment.objects.filter(id__gt=last_id)
+                .order_by('id').values_list('id', flat=True)[:batch_size or cls.BATCH_SIZE]
+            )
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    @classmethod
+    def rebuild(cls, batch_size=None, progress=None):
+        """
+        Rebuild the whole table, one transaction per batch of assignments.
+
+        Returns:
+            int: Number of rows written
+        """
+        written = 0
+        for ids in cls._assignment_batches(batch_size):
+            written += cls.refresh_assignments(ids)
+            if progress:
+                progress(ids[-1], written)
+        return written
+
+    @classmethod
+    def check(cls):
+        """
+        Compare the table with the rows the current RBAC data implies.
+
+        Returns:
+            tuple: (missing, stale) - lists of ROW_FIELDS tuples absent from
+            the table, and present in it but no longer implied
+        """
+        app_mappings = cls._app_mappings()
+        feature_mappings = cls._feature_mappings()
+        missing, stale = [], []
+
+        for ids in cls._assignment_batches():
+            assignments = UserRoleAssignment.objects.filter(id__in=ids, is_active=True).values(*ASSIGNMENT_FIELDS)
+            expected = {
+                tuple(getattr(row, field) for field in ROW_FIELDS)
+                for row in cls.build_rows(assignments, app_mappings, feature_mappings)
+            }
+            actual = set(
+                UserEffectiveAccess.objects.filter(assignment_id__in=ids).values_list(*ROW_FIELDS)
+            )
+            missing.extend(sorted(expected - actual, key=str))
+            stale.extend(sorted(actual - expected, key=str))
+        return missing, stale
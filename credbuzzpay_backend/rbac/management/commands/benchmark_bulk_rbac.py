@@ -0,0 +1,94 @@
+"""
+Management command to benchmark set-based bulk role assignment.
+
+For each size, creates that many throwaway users and a role, then assigns
+the role to all of them twice:
+    - legacy: one get() and get_or_create() per user, as the bulk endpoint
+      used to (skipped above --legacy-max, it grows linearly)
+    - bulk: BulkRBAC.assign_role(), including the AuditLog rows and the
+      UserEffectiveAccess refresh
+
+Query counts and wall time are reported for both. Everything runs in a
+transaction that is rolled back, so the database is left untouched.
+
+Usage:
+    python manage.py benchmark_bulk_rbac
+    python manage.py benchmark_bulk_rbac --sizes 10,1000,50000 --legacy-max 5000
+"""
+
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from rbac.bulk import BulkRBAC
+from rbac.models import RoleLevel, UserRole, UserRoleAssignment
+from users_auth.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare per-item and set-based bulk role assignment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,1000,50000', help='Comma-separated user counts (default: 10,1000,50000)')
+        parser.add_argument('--legacy-max', type=int, default=5000, help='Largest size run with the per-item loop (default: 5000)')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        self.stdout.write(self.style.SUCCESS('Bulk role assignment benchmark'))
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    self._run(size, options['legacy_max'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def _run(self, size, legacy_max):
+        tag = uuid.uuid4().hex[:8]
+        User.objects.bulk_create([
+            User(
+                user_code=f'BB{tag}{i:08d}',
+                email=f'bench-{tag}-{i}@example.com',
+                username=f'bench-{tag}-{i}',
+            )
+            for i in range(size)
+        ], batch_size=5000)
+        user_ids = list(User.objects.filter(username__startswith=f'bench-{tag}-').values_list('id', flat=True))
+        self.stdout.write(f'  {size} users')
+
+        if size <= legacy_max:
+            role = UserRole.objects.create(name=f'Bench Legacy {tag}', code=f'BL_{tag}', level=RoleLevel.CLIENT)
+            queries, elapsed = self._measure(lambda: self._legacy(role, user_ids))
+            self.stdout.write(f'    legacy: {queries} queries, {elapsed:.1f} ms')
+        else:
+            self.stdout.write('    legacy: skipped')
+
+        role = UserRole.objects.create(name=f'Bench Bulk {tag}', code=f'BB_{tag}', level=RoleLevel.CLIENT)
+        queries, elapsed = self._measure(lambda: BulkRBAC.assign_role(role, user_ids))
+        self.stdout.write(f'    bulk:   {queries} queries, {elapsed:.1f} ms')
+
+    def _legacy(self, role, user_ids):
+        """The per-item loop the bulk endpoint ran before BulkRBAC"""
+        for user_id in user_ids:
+            user = User.objects.get(id=user_id)
+            UserRoleAssignment.objects.get_or_create(user=user, role=role, defaults={'is_primary': False})
+
+    def _measure(self, func):
+        # Count with a wrapper: the debug query log keeps only the last 9000
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+        return queries[0], elapsed * 1000
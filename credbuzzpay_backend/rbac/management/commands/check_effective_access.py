@@ -0,0 +1,53 @@
+"""
+Management command to check the materialized effective-access table.
+
+Compares UserEffectiveAccess with the rows implied by the current role
+assignments and mappings, and reports missing and stale rows. With --fix
+the assignments involved are rebuilt. Exits with status 1 if drift was
+found and not fixed, so it can run as a scheduled check.
+
+Usage:
+    python manage.py check_effective_access
+    python manage.py check_effective_access --fix
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from rbac.effective_access import EffectiveAccess, ROW_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Report drift between UserEffectiveAccess and the RBAC data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rebuild the rows of every assignment with drift',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=10,
+            help='Number of drifted rows to print (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        missing, stale = EffectiveAccess.check()
+
+        if not missing and not stale:
+            self.stdout.write(self.style.SUCCESS('Effective access is consistent'))
+            return
+
+        self.stdout.write(self.style.WARNING(f'{len(missing)} missing rows, {len(stale)} stale rows'))
+        for label, rows in (('missing', missing), ('stale', stale)):
+            for row in rows[:options['show']]:
+                self.stdout.write(f'  {label}: {dict(zip(ROW_FIELDS, row))}')
+
+        if not options['fix']:
+            raise CommandError('Effective access has drifted; rerun with --fix')
+
+        assignment_ids = {row[0] for row in missing} | {row[0] for row in stale}
+        written = EffectiveAccess.refresh_assignments(assignment_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(assignment_ids)} assignments ({written} rows)'
+        ))
@@ -0,0 +1,37 @@
+"""
+Management command to rebuild the materialized effective-access table.
+
+UserEffectiveAccess is maintained incrementally by signals; run this after
+bulk changes made with queryset .update() or raw SQL, or when
+check_effective_access reports drift. Each batch of role assignments is
+rebuilt in its own transaction.
+
+Usage:
+    python manage.py rebuild_effective_access
+    python manage.py rebuild_effective_access --batch-size 500
+"""
+
+from django.core.management.base import BaseCommand
+from rbac.effective_access import EffectiveAccess
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the UserEffectiveAccess table from role assignments and mappings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=EffectiveAccess.BATCH_SIZE,
+            help=f'Role assignments rebuilt per transaction (default: {EffectiveAccess.BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        def progress(last_id, written):
+            self.stdout.write(f'  ...assignments up to id {last_id}: {written} rows')
+
+        written = EffectiveAccess.rebuild(
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt effective access: {written} rows'))
@@ -0,0 +1,50 @@
+"""
+Management command to check and rebuild the role hierarchy closure table.
+
+RoleHierarchyClosure is maintained incrementally by signals; run this after
+changing RoleHierarchy rows with queryset .update() or raw SQL. Without
+--fix it only compares the table with the active edges and exits with
+status 1 on drift, so it can run as a scheduled check.
+
+Usage:
+    python manage.py rebuild_role_closure
+    python manage.py rebuild_role_closure --fix
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from rbac.role_closure import RoleClosure, ROW_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Report drift between RoleHierarchyClosure and the role hierarchy, and rebuild it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rebuild the table if it has drifted',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=10,
+            help='Number of drifted rows to print (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        missing, stale = RoleClosure.check()
+
+        if not missing and not stale:
+            self.stdout.write(self.style.SUCCESS('Role hierarchy closure is consistent'))
+            return
+
+        self.stdout.write(self.style.WARNING(f'{len(missing)} missing rows, {len(stale)} stale rows'))
+        for label, rows in (('missing', missing), ('stale', stale)):
+            for row in rows[:options['show']]:
+                self.stdout.write(f'  {label}: {dict(zip(ROW_FIELDS, row))}')
+
+        if not options['fix']:
+            raise CommandError('Role hierarchy closure has drifted; rerun with --fix')
+
+        written = RoleClosure.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt role hierarchy closure ({written} rows)'))
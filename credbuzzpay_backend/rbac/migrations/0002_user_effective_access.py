@@ -0,0 +1,91 @@
+# Generated by Django 4.2.20 on 2026-10-19 00:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+PERMISSION_FIELDS = ('can_view', 'can_create', 'can_update', 'can_delete')
+
+
+def populate_effective_access(apps, schema_editor):
+    """Project existing assignments and mappings in assignment batches"""
+    UserRoleAssignment = apps.get_model('rbac', 'UserRoleAssignment')
+    RoleAppMapping = apps.get_model('rbac', 'RoleAppMapping')
+    RoleFeatureMapping = apps.get_model('rbac', 'RoleFeatureMapping')
+    UserEffectiveAccess = apps.get_model('rbac', 'UserEffectiveAccess')
+
+    by_role = {}
+    for mapping in RoleAppMapping.objects.filter(is_active=True).values('id', 'role_id', 'app_id', *PERMISSION_FIELDS):
+        by_role.setdefault(mapping['role_id'], []).append({
+            'app_mapping_id': mapping['id'],
+            'app_id': mapping['app_id'],
+            **{field: mapping[field] for field in PERMISSION_FIELDS},
+        })
+    for mapping in RoleFeatureMapping.objects.filter(is_active=True).values(
+        'id', 'role_id', 'feature_id', 'feature__app_id', *PERMISSION_FIELDS
+    ):
+        by_role.setdefault(mapping['role_id'], []).append({
+            'feature_mapping_id': mapping['id'],
+            'feature_id': mapping['feature_id'],
+            'app_id': mapping['feature__app_id'],
+            **{field: mapping[field] for field in PERMISSION_FIELDS},
+        })
+
+    last_id = 0
+    while True:
+        assignments = list(
+            UserRoleAssignment.objects.filter(is_active=True, id__gt=last_id).order_by('id')
+            .values('id', 'user_id', 'role_id', 'valid_from', 'valid_until')[:1000]
+        )
+        if not assignments:
+            break
+        UserEffectiveAccess.objects.bulk_create([
+            UserEffectiveAccess(
+                user_id=assignment['user_id'],
+                assignment_id=assignment['id'],
+                role_id=assignment['role_id'],
+                valid_from=assignment['valid_from'],
+                valid_until=assignment['valid_until'],
+                **target,
+            )
+            for assignment in assignments
+            for target in by_role.get(assignment['role_id'], ())
+        ], batch_size=1000)
+        last_id = assignments[-1]['id']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_auth', '0001_initial'),
+        ('rbac', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEffectiveAccess',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('can_view', models.BooleanField(default=True)),
+                ('can_create', models.BooleanField(default=False)),
+                ('can_update', models.BooleanField(default=False)),
+                ('can_delete', models.BooleanField(default=False)),
+                ('valid_from', models.DateTimeField()),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rbac.app')),
+                ('app_mapping', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rbac.roleappmapping')),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_access', to='rbac.userroleassignment')),
+                ('feature', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rbac.feature')),
+                ('feature_mapping', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rbac.rolefeaturemapping')),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rbac.userrole')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_access', to='users_auth.user')),
+            ],
+            options={
+                'verbose_name': 'User Effective Access',
+                'verbose_name_plural': 'User Effective Access',
+                'db_table': 'rbac_user_effective_access',
+                'indexes': [models.Index(fields=['user', 'app', 'feature'], name='effective_access_user_idx')],
+            },
+        ),
+        migrations.RunPython(populate_effective_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.20 on 2026-10-19 01:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+CAPABILITY_FIELDS = ('can_assign', 'can_revoke', 'can_modify_permissions')
+
+
+def populate_role_closure(apps, schema_editor):
+    """Walk the existing active edges from every parent role"""
+    RoleHierarchy = apps.get_model('rbac', 'RoleHierarchy')
+    RoleHierarchyClosure = apps.get_model('rbac', 'RoleHierarchyClosure')
+
+    edges = {}
+    for parent_id, child_id, *flags in RoleHierarchy.objects.filter(is_active=True).values_list(
+        'parent_role_id', 'child_role_id', *CAPABILITY_FIELDS
+    ):
+        edges.setdefault(parent_id, []).append((child_id, tuple(flags)))
+
+    rows = []
+    for ancestor_id in edges:
+        depth, granted = {}, {}
+        frontier, level = [(ancestor_id, (True, True, True))], 0
+        while frontier:
+            level += 1
+            next_frontier = []
+            for role_id, chain in frontier:
+                for child_id, flags in edges.get(role_id, ()):
+                    known = granted.get(child_id)
+                    merged = tuple(bool(k) or (c and f) for k, c, f in zip(known or (False,) * 3, chain, flags))
+                    if child_id == ancestor_id or merged == known:
+                        continue
+                    granted[child_id] = merged
+                    depth.setdefault(child_id, level)
+                    next_frontier.append((child_id, merged))
+            frontier = next_frontier
+        rows.extend(
+            RoleHierarchyClosure(
+                ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth[descendant_id],
+                **dict(zip(CAPABILITY_FIELDS, flags)),
+            )
+            for descendant_id, flags in granted.items()
+        )
+    RoleHierarchyClosure.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rbac', '0002_user_effective_access'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleHierarchyClosure',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('can_assign', models.BooleanField(default=False)),
+                ('can_revoke', models.BooleanField(default=False)),
+                ('can_modify_permissions', models.BooleanField(default=False)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closure', to='rbac.userrole')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closure', to='rbac.userrole')),
+            ],
+            options={
+                'verbose_name': 'Role Hierarchy Closure',
+                'verbose_name_plural': 'Role Hierarchy Closure',
+                'db_table': 'rbac_role_hierarchy_closure',
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='role_closure_descendant_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='rolehierarchyclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='role_closure_pair_uniq'),
+        ),
+        migrations.RunPython(populate_role_closure, migrations.RunPython.noop),
+    ]
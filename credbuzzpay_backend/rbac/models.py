@@ -81,9 +81,17 @@ class UserRole(models.Model):
     def __str__(self):
         return f"{self.name} (Level {self.level})"
     
-    def can_manage_role(self, other_role):
-        """Check if this role can manage another role (based on level)"""
-        return self.level < other_role.level
+    def can_manage_role(self, other_role, capability=None):
+        """
+        Check if this role can manage another role: through its RoleHierarchy
+        delegation chain if there is one, granting capability (can_assign,
+        can_revoke or can_modify_permissions; any chain if None), else by
+        level.
+        """
+        chain = RoleHierarchyClosure.objects.filter(ancestor=self, descendant=other_role).first()
+        if chain is None:
+            return self.level < other_role.level
+        return capability is None or getattr(chain, capability)
     
     def get_accessible_apps(self):
         """Get all apps accessible by this role"""
@@ -382,6 +390,61 @@ class UserRoleAssignment(models.Model):
         super().save(*args, **kwargs)
 
 
+class UserEffectiveAccess(models.Model):
+    """
+    Materialized effective access.
+    
+    One row per active role assignment and active app or feature mapping of
+    the assigned role, holding the CRUD flags and the granting role. Rows
+    are maintained by rbac.effective_access; never edit them directly.
+    """
+    
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        'users_auth.User',
+        on_delete=models.CASCADE,
+        related_name='effective_access'
+    )
+    assignment = models.ForeignKey(
+        UserRoleAssignment,
+        on_delete=models.CASCADE,
+        related_name='effective_access'
+    )
+    role = models.ForeignKey(UserRole, on_delete=models.CASCADE, related_name='+')
+    app = models.ForeignKey(App, on_delete=models.CASCADE, related_name='+')
+    feature = models.ForeignKey(Feature, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    
+    # Exactly one of the two is set: the mapping the row was derived from
+    app_mapping = models.ForeignKey(
+        RoleAppMapping, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    feature_mapping = models.ForeignKey(
+        RoleFeatureMapping, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    
+    # CRUD Permissions (copied from the mapping)
+    can_view = models.BooleanField(default=True)
+    can_create = models.BooleanField(default=False)
+    can_update = models.BooleanField(default=False)
+    can_delete = models.BooleanField(default=False)
+    
+    # Validity period (copied from the assignment)
+    valid_from = models.DateTimeField()
+    valid_until = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'rbac_user_effective_access'
+        verbose_name = 'User Effective Access'
+        verbose_name_plural = 'User Effective Access'
+        indexes = [
+            models.Index(fields=['user', 'app', 'feature'], name='effective_access_user_idx'),
+        ]
+    
+    def __str__(self):
+        target = f"feature {self.feature_id}" if self.feature_id else f"app {self.app_id}"
+        return f"User {self.user_id} -> {target} via role {self.role_id}"
+
+
 class RoleHierarchy(models.Model):
     """
     Model for defining custom role hierarchy/delegation.
@@ -428,6 +491,50 @@ class RoleHierarchy(models.Model):
     
     def __str__(self):
         return f"{self.parent_role.name} -> {self.child_role.name}"
+    
+    def clean(self):
+        """Reject self-loops and edges closing a cycle"""
+        from django.core.exceptions import ValidationError
+        from .role_closure import RoleClosure
+        
+        if self.parent_role_id and self.child_role_id and RoleClosure.creates_cycle(
+            self.parent_role_id, self.child_role_id
+        ):
+            raise ValidationError('This hierarchy relationship would create a cycle')
+
+
+class RoleHierarchyClosure(models.Model):
+    """
+    Transitive closure of the active RoleHierarchy edges.
+    
+    One row per (ancestor, descendant) pair connected by a chain of active
+    edges, with the shortest chain length and the capabilities granted by
+    any chain (a chain grants a capability if every edge on it does). Rows
+    are maintained by rbac.role_closure; never edit them directly.
+    """
+    
+    id = models.BigAutoField(primary_key=True)
+    ancestor = models.ForeignKey(UserRole, on_delete=models.CASCADE, related_name='descendant_closure')
+    descendant = models.ForeignKey(UserRole, on_delete=models.CASCADE, related_name='ancestor_closure')
+    depth = models.PositiveSmallIntegerField()
+    
+    can_assign = models.BooleanField(default=False)
+    can_revoke = models.BooleanField(default=False)
+    can_modify_permissions = models.BooleanField(default=False)
+    
+    class Meta:
+        db_table = 'rbac_role_hierarchy_closure'
+        verbose_name = 'Role Hierarchy Closure'
+        verbose_name_plural = 'Role Hierarchy Closure'
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='role_closure_pair_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor'], name='role_closure_descendant_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Role {self.ancestor_id} -> role {self.descendant_id} (depth {self.depth})"
 
 
 class AuditLog(models.Model):
@@ -491,6 +598,14 @@ class AuditLog(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Audit Log'
         verbose_name_plural = 'Audit Logs'
+        # Keyset pagination walks (created_at, id) newest first, optionally
+        # after an equality filter on one of the list view's filters
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='audit_log_created_idx'),
+            models.Index(fields=['action', 'created_at', 'id'], name='audit_log_action_idx'),
+            models.Index(fields=['entity_type', 'created_at', 'id'], name='audit_log_entity_type_idx'),
+            models.Index(fields=['performed_by', 'created_at', 'id'], name='audit_log_performed_by_idx'),
+        ]
     
     def __str__(self):
         return f"{self.action} - {self.entity_type} ({self.entity_id})"
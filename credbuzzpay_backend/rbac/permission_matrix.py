@@ -0,0 +1,355 @@
+"""
+Compiled RBAC permission matrix
+===============================
+Answers bulk authorization questions - "which users can update feature X",
+"which features do these 10k users have" - with NumPy instead of a
+has_feature_permission() / get_user_permissions() call per user.
+
+The RBAC tables are compiled into boolean arrays:
+- user_roles:    users x roles, the assignments in effect
+- role_apps:     permissions x roles x apps
+- role_features: permissions x roles x features
+
+so a user x feature answer is one matrix product, and reverse lookups are
+a column slice followed by any() over roles. The rules are the ones of
+has_app_permission / has_feature_permission: active assignments of active
+roles inside their validity window, active mappings of active apps
+(features: active features), and Developer roles granting everything.
+Only active apps and features have columns.
+
+Each worker keeps its own matrix and refreshes it when the RBAC generation
+(see rbac.cache) moves or an assignment window opens or closes. Refreshes
+are incremental: only rows with an updated_at newer than the last refresh
+(minus RBAC_MATRIX_REFRESH_LAG_SECONDS, for transactions that commit late)
+are read, and a table whose row count no longer adds up - rows were
+deleted - is reloaded in full. Queryset .update() calls on RBAC models must
+therefore set updated_at.
+
+A transaction that commits more than the lag after its rows were written
+is missed by incremental refreshes. Every RBAC_MATRIX_MAX_AGE_SECONDS the
+matrix is therefore rebuilt from a full reload, which bounds how long such
+a change (or a generation bump lost with a per-process cache) can go
+unseen. Without a shared cache (see cache_is_shared) the generation says
+nothing about other workers' writes, so every call refreshes first.
+"""
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from credbuzzpay_backend.cache_utils import cache_is_shared
+
+from .cache import get_rbac_generation
+from .models import App, Feature, RoleAppMapping, RoleFeatureMapping, RoleLevel, UserRole, UserRoleAssignment
+
+
+PERMISSIONS = ('view', 'create', 'update', 'delete')
+
+PERMISSION_FLAGS = ('can_view', 'can_create', 'can_update', 'can_delete')
+
+# Model -> fields loaded per row (the primary key comes first)
+SOURCES = {
+    'roles': (UserRole, ('id', 'is_active', 'level')),
+    'apps': (App, ('id', 'is_active')),
+    'features': (Feature, ('id', 'is_active', 'app_id')),
+    'app_mappings': (RoleAppMapping, ('id', 'role_id', 'app_id', 'is_active') + PERMISSION_FLAGS),
+    'feature_mappings': (RoleFeatureMapping, ('id', 'role_id', 'feature_id', 'is_active') + PERMISSION_FLAGS),
+    'assignments': (UserRoleAssignment, ('id', 'user_id', 'role_id', 'is_active', 'valid_from', 'valid_until')),
+}
+
+
+def permission_index(permission):
+    """Get the array index of 'view' / 'create' / 'update' / 'delete'"""
+    try:
+        return PERMISSIONS.index(permission)
+    except ValueError:
+        raise ValueError(f"Unknown permission '{permission}', expected one of {', '.join(PERMISSIONS)}")
+
+
+def _positions(ids, wanted):
+    """
+    Map ids to their positions in the sorted array ids.
+
+    Returns:
+        tuple: (positions, found) arrays - positions are only meaningful
+        where found is True
+    """
+    wanted = np.asarray(wanted, dtype=np.int64)
+    positions = np.searchsorted(ids, wanted)
+    clipped = np.minimum(positions, max(len(ids) - 1, 0))
+    found = (positions < len(ids)) & (ids[clipped] == wanted) if len(ids) else np.zeros(len(wanted), dtype=bool)
+    return clipped, found
+
+
+class PermissionMatrix:
+    """
+    A compiled, read-only snapshot of effective permissions.
+    """
+
+    def __init__(self, user_ids, role_ids, app_ids, feature_ids, user_roles, role_apps, role_features,
+                 generation=None, built_at=None, expires_at=None):
+        self.user_ids = user_ids
+        self.role_ids = role_ids
+        self.app_ids = app_ids
+        self.feature_ids = feature_ids
+        self.user_roles = user_roles
+        self.role_apps = role_apps
+        self.role_features = role_features
+        self.generation = generation
+        self.built_at = built_at
+        self.expires_at = expires_at
+
+    @property
+    def shape(self):
+        """(users, roles, apps, features)"""
+        return len(self.user_ids), len(self.role_ids), len(self.app_ids), len(self.feature_ids)
+
+    def _holders(self, role_targets, target_ids, target_id, permission):
+        position, found = _positions(target_ids, [target_id])
+        if not found[0]:
+            return []
+        roles = role_targets[permission_index(permission), :, position[0]]
+        users = self.user_roles[:, roles].any(axis=1)
+        return self.user_ids[users].tolist()
+
+    def users_with_app(self, app_id, permission='view'):
+        """Get the ids of the users holding permission on an app"""
+        return self._holders(self.role_apps, self.app_ids, app_id, permission)
+
+    def users_with_feature(self, feature_id, permission='view'):
+        """Get the ids of the users holding permission on a feature"""
+        return self._holders(self.role_features, self.feature_ids, feature_id, permission)
+
+    def _grants(self, role_targets, user_ids, permission):
+        """
+        Get a len(user_ids) x targets boolean grant matrix; unknown users
+        (no role in effect) get an empty row.
+        """
+        positions, found = _positions(self.user_ids, user_ids)
+        if len(self.user_ids):
+            user_roles = np.where(found[:, None], self.user_roles[positions], False)
+        else:
+            user_roles = np.zeros((len(positions), len(self.role_ids)), dtype=bool)
+        targets = role_targets[permission_index(permission)]
+        # float32 products are exact for any realistic number of roles, and use BLAS
+        return (user_roles.astype(np.float32) @ targets.astype(np.float32)) > 0
+
+    def app_grants(self, user_ids, permission='view'):
+        """Get the users x apps (columns: app_ids) grant matrix"""
+        return self._grants(self.role_apps, user_ids, permission)
+
+    def feature_grants(self, user_ids, permission='view'):
+        """Get the users x features (columns: feature_ids) grant matrix"""
+        return self._grants(self.role_features, user_ids, permission)
+
+    def _by_user(self, grants, user_ids, target_ids):
+        rows, columns = np.nonzero(grants)
+        result = {int(user_id): [] for user_id in user_ids}
+        for user_id, target_id in zip(np.asarray(user_ids)[rows].tolist(), target_ids[columns].tolist()):
+            result[user_id].append(target_id)
+        return result
+
+    def apps_for_users(self, user_ids, permission='view'):
+        """Get {user_id: [app ids]} of the apps each user holds permission on"""
+        return self._by_user(self.app_grants(user_ids, permission), user_ids, self.app_ids)
+
+    def features_for_users(self, user_ids, permission='view'):
+        """Get {user_id: [feature ids]} of the features each user holds permission on"""
+        return self._by_user(self.feature_grants(user_ids, permission), user_ids, self.feature_ids)
+
+
+class PermissionMatrixBuilder:
+    """
+    Keep the RBAC rows a matrix is compiled from, refreshed incrementally.
+    """
+
+    def __init__(self, lag_seconds=60):
+        self.lag = timedelta(seconds=lag_seconds)
+        self.rows = {name: {} for name in SOURCES}
+        self.watermarks = {name: None for name in SOURCES}
+        # When the tables were last read in full (first refresh)
+        self.loaded_at = timezone.now()
+
+    def _load(self, name, since=None):
+        model, fields = SOURCES[name]
+        queryset = model.objects.order_by()
+        if since is not None:
+            queryset = queryset.filter(updated_at__gte=since - self.lag)
+        else:
+            self.rows[name] = {}
+
+        rows = self.rows[name]
+        latest = self.watermarks[name] if since is not None else None
+        for row in queryset.values_list(*fields, 'updated_at'):
+            rows[row[0]] = row[1:-1]
+            if latest is None or row[-1] > latest:
+                latest = row[-1]
+        self.watermarks[name] = latest
+        return len(rows)
+
+    def refresh(self):
+        """
+        Read the rows changed since the last refresh.
+
+        Returns:
+            int: Number of tables reloaded in full
+        """
+        reloaded = 0
+        for name, (model, fields) in SOURCES.items():
+            since = self.watermarks[name]
+            if since is None:
+                self._load(name)
+                reloaded += 1
+                continue
+            known = self._load(name, since)
+            # Fewer rows in the table than known ids: something was deleted
+            if model.objects.count() != known:
+                self._load(name)
+                reloaded += 1
+        return reloaded
+
+    def compile(self, now=None, generation=None):
+        """
+        Compile the current rows into a PermissionMatrix valid at now.
+        """
+        now = now or timezone.now()
+        roles, apps, features = self.rows['roles'], self.rows['apps'], self.rows['features']
+
+        role_ids = np.array(sorted(roles), dtype=np.int64)
+        active_roles = {pk for pk, (is_active, level) in roles.items() if is_active}
+        developer_roles = [pk for pk, (is_active, level) in roles.items() if is_active and level == RoleLevel.DEVELOPER]
+        app_ids = np.array(sorted(pk for pk, (is_active,) in apps.items() if is_active), dtype=np.int64)
+        feature_ids = np.array(sorted(pk for pk, (is_active, app_id) in features.items() if is_active), dtype=np.int64)
+
+        # Assignments in effect, and the next moment one starts or ends
+        pairs = []
+        boundaries = []
+        for user_id, role_id, is_active, valid_from, valid_until in self.rows['assignments'].values():
+            if not is_active or role_id not in active_roles or (valid_until is not None and valid_until < now):
+                continue
+            if valid_from > now:
+                boundaries.append(valid_from)
+                continue
+            pairs.append((user_id, role_id))
+            if valid_until is not None:
+                boundaries.append(valid_until)
+
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        user_ids = np.unique(pairs[:, 0])
+        user_roles = np.zeros((len(user_ids), len(role_ids)), dtype=bool)
+        user_roles[np.searchsorted(user_ids, pairs[:, 0]), np.searchsorted(role_ids, pairs[:, 1])] = True
+
+        role_apps = self._role_targets(self.rows['app_mappings'], role_ids, app_ids)
+        role_features = self._role_targets(self.rows['feature_mappings'], role_ids, feature_ids)
+        developer_positions = np.searchsorted(role_ids, developer_roles)
+        role_apps[:, developer_positions, :] = True
+        role_features[:, developer_positions, :] = True
+
+        return PermissionMatrix(
+            user_ids, role_ids, app_ids, feature_ids, user_roles, role_apps, role_features,
+            generation=generation, built_at=now, expires_at=min(boundaries, default=None),
+        )
+
+    @staticmethod
+    def _role_targets(mappings, role_ids, target_ids):
+        """Compile (role_id, target_id, is_active, *flags) rows into permissions x roles x targets"""
+        grid = np.zeros((len(PERMISSIONS), len(role_ids), len(target_ids)), dtype=bool)
+        rows = np.array(
+            [(role_id, target_id, *flags) for role_id, target_id, is_active, *flags in mappings.values() if is_active],
+            dtype=np.int64,
+        ).reshape(-1, 2 + len(PERMISSIONS))
+        roles, role_found = _positions(role_ids, rows[:, 0])
+        targets, target_found = _positions(target_ids, rows[:, 1])
+        keep = role_found & target_found
+        for index in range(len(PERMISSIONS)):
+            granted = keep & (rows[:, 2 + index] == 1)
+            grid[index, roles[granted], targets[granted]] = True
+        return grid
+
+
+class PermissionMatrixService:
+    """
+    Per-worker permission matrix, refreshed on RBAC changes.
+    """
+
+    _builder = None
+    _matrix = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_refresh_lag():
+        """Get how far back (seconds) incremental refreshes re-read rows"""
+        return getattr(settings, 'RBAC_MATRIX_REFRESH_LAG_SECONDS', 60)
+
+    @staticmethod
+    def get_max_age():
+        """Get how long (seconds) rows are refreshed incrementally before a full reload"""
+        return getattr(settings, 'RBAC_MATRIX_MAX_AGE_SECONDS', 300)
+
+    @classmethod
+    def _is_fresh(cls, now):
+        """Check the builder's full load is younger than the max age"""
+        return cls._builder is not None and now - cls._builder.loaded_at < timedelta(seconds=cls.get_max_age())
+
+    @classmethod
+    def _is_current(cls, matrix, generation, now):
+        return (
+            matrix is not None
+            and cache_is_shared()
+            and matrix.generation == generation
+            and (matrix.expires_at is None or now < matrix.expires_at)
+            and cls._is_fresh(now)
+        )
+
+    @classmethod
+    def get_matrix(cls):
+        """
+        Get the permission matrix, refreshing it first if RBAC data changed
+        or it is past its max age.
+
+        Returns:
+            PermissionMatrix
+        """
+        generation = get_rbac_generation()
+        matrix = cls._matrix
+        if cls._is_current(matrix, generation, timezone.now()):
+            return matrix
+
+        with cls._lock:
+            now = timezone.now()
+            if cls._is_current(cls._matrix, generation, now):
+                return cls._matrix
+            if not cls._is_fresh(now):
+                cls._builder = PermissionMatrixBuilder(cls.get_refresh_lag())
+            cls._builder.refresh()
+            cls._matrix = cls._builder.compile(now, generation)
+            return cls._matrix
+
+    @classmethod
+    def reset(cls):
+        """Drop this worker's matrix; the next call rebuilds it from scratch"""
+        with cls._lock:
+            cls._builder = None
+            cls._matrix = None
+
+    @classmethod
+    def users_with_app(cls, app_id, permission='view'):
+        """Get the ids of the users holding permission on an app"""
+        return cls.get_matrix().users_with_app(app_id, permission)
+
+    @classmethod
+    def users_with_feature(cls, feature_id, permission='view'):
+        """Get the ids of the users holding permission on a feature"""
+        return cls.get_matrix().users_with_feature(feature_id, permission)
+
+    @classmethod
+    def apps_for_users(cls, user_ids, permission='view'):
+        """Get {user_id: [app ids]} for a batch of users"""
+        return cls.get_matrix().apps_for_users(user_ids, permission)
+
+    @classmethod
+    def features_for_users(cls, user_ids, permission='view'):
+        """Get {user_id: [feature ids]} for a batch of users"""
+        return cls.get_matrix().features_for_users(user_ids, permission)
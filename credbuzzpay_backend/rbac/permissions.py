@@ -4,6 +4,7 @@ RBAC Permissions - Custom permission classes for role-based access control
 
 from rest_framework.permissions import BasePermission
 from django.utils import timezone
+from .decision_cache import PermissionDecisionCache
 from .models import UserRole, UserRoleAssignment, RoleAppMapping, RoleFeatureMapping, RoleLevel
 
 
@@ -128,18 +129,8 @@ class CanManageRole(BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
         
-        # Get user's highest privilege level
-        user_level = get_user_level(request.user)
-        if user_level is None:
-            return False
-        
-        # Developer has full access
-        if user_level == RoleLevel.DEVELOPER:
-            return True
-        
-        # Can only manage roles with lower privilege (higher level number)
         if isinstance(obj, UserRole):
-            return user_level < obj.level
+            return can_manage_role(request.user, obj)
         
         return False
 
@@ -225,88 +216,214 @@ def has_any_role(user, role_codes):
     ).exists()
 
 
-def has_app_permission(user, app_code, permission='view'):
-    """Check if user has specific permission for an app"""
+def _resolve_active_roles(user):
+    """
+    Resolve the user's roles in effect with a single query.
+    
+    Returns:
+        tuple: (role_ids, is_developer, changes_at) - changes_at is the next
+        valid_from / valid_until boundary of the user's assignments, or None
+    """
     from django.db import models as django_models
     now = timezone.now()
     
-    # Get user's active roles
-    role_ids = UserRoleAssignment.objects.filter(
+    assignments = UserRoleAssignment.objects.filter(
         user=user,
         is_active=True,
-        role__is_active=True,
-        valid_from__lte=now
+        role__is_active=True
     ).filter(
         django_models.Q(valid_until__isnull=True) | django_models.Q(valid_until__gte=now)
-    ).values_list('role_id', flat=True)
+    ).order_by().values_list('role_id', 'role__level', 'valid_from', 'valid_until')
     
-    if not role_ids:
-        return False
+    role_ids = []
+    is_developer = False
+    boundaries = []
+    for role_id, level, valid_from, valid_until in assignments:
+        if valid_from > now:
+            boundaries.append(valid_from)
+            continue
+        role_ids.append(role_id)
+        is_developer = is_developer or level == RoleLevel.DEVELOPER
+        if valid_until is not None:
+            boundaries.append(valid_until)
     
-    # Check if user is developer (full access)
-    if UserRole.objects.filter(id__in=role_ids, level=RoleLevel.DEVELOPER).exists():
-        return True
+    return role_ids, is_developer, min(boundaries, default=None)
+
+
+def has_app_permission(user, app_code, permission='view'):
+    """Check if user has specific permission for an app"""
+    def resolve():
+        role_ids, is_developer, changes_at = _resolve_active_roles(user)
+        if not role_ids:
+            return False, changes_at
+        
+        # Developer has full access
+        if is_developer:
+            return True, changes_at
+        
+        # Check app permissions
+        permission_field = f'can_{permission}'
+        allowed = RoleAppMapping.objects.filter(
+            role_id__in=role_ids,
+            app__code=app_code,
+            app__is_active=True,
+            is_active=True,
+            **{permission_field: True}
+        ).exists()
+        return allowed, changes_at
     
-    # Check app permissions
-    permission_field = f'can_{permission}'
-    return RoleAppMapping.objects.filter(
-        role_id__in=role_ids,
-        app__code=app_code,
-        app__is_active=True,
-        is_active=True,
-        **{permission_field: True}
-    ).exists()
+    return PermissionDecisionCache.decide(user, app_code, None, permission, resolve)
 
 
 def has_feature_permission(user, app_code, feature_code, permission='view'):
     """Check if user has specific permission for a feature"""
+    def resolve():
+        role_ids, is_developer, changes_at = _resolve_active_roles(user)
+        if not role_ids:
+            return False, changes_at
+        
+        # Developer has full access
+        if is_developer:
+            return True, changes_at
+        
+        # Build feature filter
+        feature_filter = {'feature__code': feature_code, 'feature__is_active': True}
+        if app_code:
+            feature_filter['feature__app__code'] = app_code
+        
+        # Check feature permissions
+        permission_field = f'can_{permission}'
+        allowed = RoleFeatureMapping.objects.filter(
+            role_id__in=role_ids,
+            is_active=True,
+            **feature_filter,
+            **{permission_field: True}
+        ).exists()
+        return allowed, changes_at
+    
+    return PermissionDecisionCache.decide(user, app_code, feature_code, permission, resolve)
+
+
+class PermissionSnapshot:
+    """
+    Everything a user may do, loaded at once, for evaluating many checks.
+    
+    Answers exactly like has_app_permission / has_feature_permission.
+    """
+    
+    PERMISSIONS = ('view', 'create', 'update', 'delete')
+    
+    def __init__(self, is_developer=False, apps=None, features=None):
+        self.is_developer = is_developer
+        # app_code -> permissions
+        self.apps = apps or {}
+        # (app_code, feature_code) -> permissions
+        self.features = features or {}
+        # feature_code -> permissions over every app
+        self.features_any_app = {}
+        for (app_code, feature_code), permissions in self.features.items():
+            self.features_any_app[feature_code] = self.features_any_app.get(feature_code, frozenset()) | permissions
+    
+    def has_app_permission(self, app_code, permission='view'):
+        """Check a permission for an app"""
+        return self.is_developer or permission in self.apps.get(app_code, ())
+    
+    def has_feature_permission(self, app_code, feature_code, permission='view'):
+        """Check a permission for a feature; app_code may be None"""
+        if self.is_developer:
+            return True
+        if app_code:
+            return permission in self.features.get((app_code, feature_code), ())
+        return permission in self.features_any_app.get(feature_code, ())
+    
+    def check(self, app_code=None, feature_code=None, permission='view'):
+        """Evaluate one check the way CheckPermissionView does"""
+        if feature_code:
+            return self.has_feature_permission(app_code, feature_code, permission)
+        if app_code:
+            return self.has_app_permission(app_code, permission)
+        return False
+
+
+def get_permission_snapshot(user):
+    """
+    Get the user's PermissionSnapshot for the current request: the roles in
+    effect plus one read of the UserEffectiveAccess projection (see
+    rbac.effective_access). Nothing is cached across requests.
+    """
+    from django.db.models import Q
+    from .models import UserEffectiveAccess
+    
+    role_ids, is_developer, _ = _resolve_active_roles(user)
+    if not role_ids or is_developer:
+        return PermissionSnapshot(is_developer=is_developer)
+    
+    now = timezone.now()
+    # Same filters as the single checks: app rows need an active app, feature
+    # rows an active feature
+    rows = UserEffectiveAccess.objects.filter(
+        Q(valid_until__isnull=True) | Q(valid_until__gte=now),
+        Q(feature__isnull=True, app__is_active=True) | Q(feature__is_active=True),
+        user=user,
+        role_id__in=role_ids,
+        valid_from__lte=now,
+    ).order_by().values_list('app__code', 'feature__code', 'can_view', 'can_create', 'can_update', 'can_delete')
+    
+    apps = {}
+    features = {}
+    for app_code, feature_code, *flags in rows:
+        granted = {p for p, flag in zip(PermissionSnapshot.PERMISSIONS, flags) if flag}
+        if feature_code is None:
+            apps[app_code] = apps.get(app_code, frozenset()) | granted
+        else:
+            features[(app_code, feature_code)] = features.get((app_code, feature_code), frozenset()) | granted
+    
+    return PermissionSnapshot(apps=apps, features=features)
+
+
+def can_manage_role(user, role, capability=None):
+    """
+    Check if a user can manage a role.
+    
+    Developers can manage any role. Otherwise one of the user's roles must
+    grant it: a role with a RoleHierarchy delegation chain to role grants
+    what the chain grants (capability 'can_assign', 'can_revoke' or
+    'can_modify_permissions'; any chain if None), looked up in the closure
+    table (see rbac.role_closure); a role without one falls back to having a
+    lower privilege level number than role.
+    """
     from django.db import models as django_models
+    from .role_closure import RoleClosure
     now = timezone.now()
     
-    # Get user's active roles
-    role_ids = UserRoleAssignment.objects.filter(
+    levels = dict(UserRoleAssignment.objects.filter(
         user=user,
         is_active=True,
         role__is_active=True,
         valid_from__lte=now
     ).filter(
         django_models.Q(valid_until__isnull=True) | django_models.Q(valid_until__gte=now)
-    ).values_list('role_id', flat=True)
-    
-    if not role_ids:
+    ).order_by().values_list('role_id', 'role__level'))
+    if not levels:
         return False
     
-    # Check if user is developer (full access)
-    if UserRole.objects.filter(id__in=role_ids, level=RoleLevel.DEVELOPER).exists():
+    if min(levels.values()) == RoleLevel.DEVELOPER:
         return True
     
-    # Build feature filter
-    feature_filter = {'feature__code': feature_code, 'feature__is_active': True}
-    if app_code:
-        feature_filter['feature__app__code'] = app_code
-    
-    # Check feature permissions
-    permission_field = f'can_{permission}'
-    return RoleFeatureMapping.objects.filter(
-        role_id__in=role_ids,
-        is_active=True,
-        **feature_filter,
-        **{permission_field: True}
-    ).exists()
+    # Hierarchy edges are explicit, so they override the level rule
+    chains = RoleClosure.capabilities(levels, role.pk)
+    for role_id, level in levels.items():
+        if role_id in chains:
+            if capability is None or capability in chains[role_id]:
+                return True
+        elif level < role.level:
+            return True
+    return False
 
 
 def can_assign_role(assigner, role_to_assign):
     """Check if a user can assign a specific role"""
-    assigner_level = get_user_level(assigner)
-    if assigner_level is None:
-        return False
-    
-    # Developer can assign any role
-    if assigner_level == RoleLevel.DEVELOPER:
-        return True
-    
-    # Can only assign roles with lower privilege (higher level number)
-    return assigner_level < role_to_assign.level
+    return can_manage_role(assigner, role_to_assign, 'can_assign')
 
 
 def get_user_permissions(user):
@@ -343,17 +460,17 @@ def get_user_permissions(user):
     # Get app permissions
     apps = []
     if is_developer:
-        from .models import App
-        for app in App.objects.filter(is_active=True):
-            apps.append({
-                'id': app.id,
-                'name': app.name,
-                'code': app.code,
-                'can_view': True,
-                'can_create': True,
-                'can_update': True,
-                'can_delete': True
-            })
+        from .catalog import CatalogService
+        catalog = CatalogService.get_catalog()
+        apps = [{
+            'id': app.id,
+            'name': app.name,
+            'code': app.code,
+            'can_view': True,
+            'can_create': True,
+            'can_update': True,
+            'can_delete': True
+        } for app in catalog.apps]
     else:
         app_mappings = RoleAppMapping.objects.filter(
             role_id__in=role_ids,
@@ -384,18 +501,16 @@ def get_user_permissions(user):
     # Get feature permissions
     features = []
     if is_developer:
-        from .models import Feature
-        for feature in Feature.objects.filter(is_active=True).select_related('app'):
-            features.append({
-                'id': feature.id,
-                'name': feature.name,
-                'code': feature.code,
-                'app_code': feature.app.code,
-                'can_view': True,
-                'can_create': True,
-                'can_update': True,
-                'can_delete': True
-            })
+        features = [{
+            'id': feature.id,
+            'name': feature.name,
+            'code': feature.code,
+            'app_code': feature.app_code,
+            'can_view': True,
+            'can_create': True,
+            'can_update': True,
+            'can_delete': True
+        } for feature in catalog.features]
     else:
         feature_mappings = RoleFeatureMapping.objects.filter(
             role_id__in=role_ids,
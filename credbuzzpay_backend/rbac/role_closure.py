@@ -0,0 +1,171 @@
+"""
+Role hierarchy closure
+======================
+RoleHierarchy stores direct parent -> child delegation edges.
+RoleHierarchyClosure holds every (ancestor, descendant) pair they connect,
+so "can role A manage role B" is one lookup on the unique
+(ancestor, descendant) index instead of a walk of the graph per request.
+
+A chain of edges grants a capability (can_assign, can_revoke,
+can_modify_permissions) if every edge on it does; a pair's row carries the
+capabilities of all its chains combined and the length of the shortest one.
+
+Rows are kept in step incrementally (see rbac.signals): saving or deleting
+the edge parent -> child can only change pairs whose ancestor is the parent
+or one of its ancestors, so only those ancestors' rows are recomputed, from
+the active edges loaded in one query. Edges closing a cycle are rejected by
+RoleHierarchy.clean() and the hierarchy serializer; the recomputation
+tolerates them anyway (a role is never its own descendant).
+
+Queryset .update() calls bypass signals: call refresh_ancestors() with the
+parent roles afterwards. The rebuild_role_closure management command
+reports drift and rebuilds the table.
+"""
+from django.db import transaction
+
+from .models import RoleHierarchy, RoleHierarchyClosure
+
+
+CAPABILITY_FIELDS = ('can_assign', 'can_revoke', 'can_modify_permissions')
+
+# Fields identifying a row's content, compared by the consistency check
+ROW_FIELDS = ('ancestor_id', 'descendant_id', 'depth') + CAPABILITY_FIELDS
+
+
+class RoleClosure:
+    """
+    Maintain and query the RoleHierarchyClosure table.
+    """
+
+    @staticmethod
+    def capabilities(role_ids, target_role_id):
+        """
+        Get the capabilities each of role_ids holds over target_role_id
+        through active hierarchy edges.
+
+        Returns:
+            dict: {role_id: frozenset of capability names}, only for the
+            roles with a chain to the target
+        """
+        chains = RoleHierarchyClosure.objects.filter(
+            ancestor_id__in=list(role_ids), descendant_id=target_role_id
+        ).values_list('ancestor_id', *CAPABILITY_FIELDS)
+        return {
+            ancestor_id: frozenset(field for field, flag in zip(CAPABILITY_FIELDS, flags) if flag)
+            for ancestor_id, *flags in chains
+        }
+
+    @staticmethod
+    def creates_cycle(parent_id, child_id):
+        """Check if an edge parent -> child would close a cycle"""
+        return parent_id == child_id or RoleHierarchyClosure.objects.filter(
+            ancestor_id=child_id, descendant_id=parent_id
+        ).exists()
+
+    @staticmethod
+    def _edges():
+        """Active edges as {parent_id: [(child_id, capabilities)]}"""
+        edges = {}
+        for parent_id, child_id, *flags in RoleHierarchy.objects.filter(is_active=True).values_list(
+            'parent_role_id', 'child_role_id', *CAPABILITY_FIELDS
+        ):
+            edges.setdefault(parent_id, []).append((child_id, tuple(flags)))
+        return edges
+
+    @staticmethod
+    def build_rows(ancestor_ids, edges):
+        """
+        Walk the edges breadth-first from each ancestor.
+
+        A role is revisited only when a chain brings capabilities the
+        earlier chains to it lacked, so the walk ends after at most
+        len(CAPABILITY_FIELDS) + 1 visits per role, cycles included.
+
+        Returns:
+            list: Unsaved RoleHierarchyClosure rows
+        """
+        rows = []
+        for ancestor_id in ancestor_ids:
+            depth, granted = {}, {}
+            frontier = [(ancestor_id, (True,) * len(CAPABILITY_FIELDS))]
+            level = 0
+            while frontier:
+                level += 1
+                next_frontier = []
+                for role_id, chain in frontier:
+                    for child_id, flags in edges.get(role_id, ()):
+                        if child_id == ancestor_id:
+                            continue
+                        known = granted.get(child_id)
+                        merged = tuple(
+                            bool(k) or (c and f)
+                            for k, c, f in zip(known or (False,) * len(flags), chain, flags)
+                        )
+                        if merged == known:
+                            continue
+                        granted[child_id] = merged
+                        depth.setdefault(child_id, level)
+                        next_frontier.append((child_id, merged))
+                frontier = next_frontier
+
+            rows.extend(
+                RoleHierarchyClosure(
+                    ancestor_id=ancestor_id,
+                    descendant_id=descendant_id,
+                    depth=depth[descendant_id],
+                    **dict(zip(CAPABILITY_FIELDS, flags)),
+                )
+                for descendant_id, flags in granted.items()
+            )
+        return rows
+
+    @classmethod
+    def refresh_ancestors(cls, role_ids):
+        """
+        Recompute the rows of the given roles and of all their ancestors,
+        after an edge leaving one of the roles changed.
+
+        Returns:
+            int: Number of rows written
+        """
+        role_ids = set(role_ids)
+        with transaction.atomic():
+            ancestor_ids = role_ids | set(
+                RoleHierarchyClosure.objects.filter(descendant_id__in=role_ids).values_list('ancestor_id', flat=True)
+            )
+            RoleHierarchyClosure.objects.filter(ancestor_id__in=ancestor_ids).delete()
+            rows = cls.build_rows(sorted(ancestor_ids), cls._edges())
+            RoleHierarchyClosure.objects.bulk_create(rows)
+        return len(rows)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rebuild the whole table.
+
+        Returns:
+            int: Number of rows written
+        """
+        with transaction.atomic():
+            RoleHierarchyClosure.objects.all().delete()
+            edges = cls._edges()
+            rows = cls.build_rows(sorted(edges), edges)
+            RoleHierarchyClosure.objects.bulk_create(rows)
+        return len(rows)
+
+    @classmethod
+    def check(cls):
+        """
+        Compare the table with the rows the active edges imply.
+
+        Returns:
+            tuple: (missing, stale) - lists of ROW_FIELDS tuples absent from
+            the table, and present in it but no longer implied
+        """
+        edges = cls._edges()
+        expected = {
+            tuple(getattr(row, field) for field in ROW_FIELDS)
+            for row in cls.build_rows(sorted(edges), edges)
+        }
+        actual = set(RoleHierarchyClosure.objects.values_list(*ROW_FIELDS))
+        return sorted(expected - actual), sorted(actual - expected)
@@ -2,11 +2,13 @@
 RBAC Serializers - Serializers for Role-Based Access Control System
 """
 
+from django.db.models import Count, Q
 from rest_framework import serializers
 from .models import (
     UserRole, App, Feature, RoleAppMapping, 
     RoleFeatureMapping, UserRoleAssignment, RoleHierarchy, AuditLog, RoleLevel
 )
+from .role_closure import RoleClosure
 
 
 # =============================================================================
@@ -26,10 +28,19 @@ class UserRoleListSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Count active users in the list query instead of once per role"""
+        return queryset.annotate(
+            active_users_count=Count('user_assignments', filter=Q(user_assignments__is_active=True))
+        )
+    
     def get_level_display(self, obj):
         return RoleLevel.get_name(obj.level)
     
     def get_users_count(self, obj):
+        if hasattr(obj, 'active_users_count'):
+            return obj.active_users_count
         return obj.user_assignments.filter(is_active=True).count()
 
 
@@ -162,7 +173,16 @@ class AppListSerializer(serializers.ModelSerializer):
             'features_count', 'created_at'
         ]
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load parent apps and count active features in the list query"""
+        return queryset.select_related('parent_app').annotate(
+            active_features_count=Count('features', filter=Q(features__is_active=True))
+        )
+    
     def get_features_count(self, obj):
+        if hasattr(obj, 'active_features_count'):
+            return obj.active_features_count
         return obj.features.filter(is_active=True).count()
     
     def get_parent_app_name(self, obj):
@@ -190,7 +210,8 @@ class AppDetailSerializer(serializers.ModelSerializer):
         return FeatureListSerializer(obj.features.filter(is_active=True), many=True).data
     
     def get_child_apps(self, obj):
-        return AppListSerializer(obj.child_apps.filter(is_active=True), many=True).data
+        child_apps = AppListSerializer.setup_eager_loading(obj.child_apps.filter(is_active=True))
+        return AppListSerializer(child_apps, many=True).data
     
     def get_parent_app_name(self, obj):
         return obj.parent_app.name if obj.parent_app else None
@@ -274,6 +295,10 @@ class FeatureListSerializer(serializers.ModelSerializer):
             'description', 'feature_type', 'display_order', 'is_active', 'created_at'
         ]
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('app')
+    
     def get_app_name(self, obj):
         return obj.app.name
 
@@ -373,6 +398,10 @@ class RoleAppMappingSerializer(serializers.ModelSerializer):
             'is_active', 'assigned_by_email', 'created_at', 'updated_at'
         ]
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('role', 'app', 'assigned_by')
+    
     def get_role_name(self, obj):
         return obj.role.name
     
@@ -435,6 +464,10 @@ class RoleFeatureMappingSerializer(serializers.ModelSerializer):
             'is_active', 'assigned_by_email', 'created_at', 'updated_at'
         ]
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('role', 'feature__app', 'assigned_by')
+    
     def get_role_name(self, obj):
         return obj.role.name
     
@@ -504,6 +537,10 @@ class UserRoleAssignmentSerializer(serializers.ModelSerializer):
             'assigned_by_email', 'created_at', 'updated_at'
         ]
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('user', 'role', 'assigned_by')
+    
     def get_user_email(self, obj):
         return obj.user.email
     
@@ -636,6 +673,12 @@ class RoleHierarchyCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({
                     'non_field_errors': 'This hierarchy relationship already exists'
                 })
+            
+            # The child must not already reach the parent
+            if RoleClosure.creates_cycle(parent_role.id, child_role.id):
+                raise serializers.ValidationError({
+                    'non_field_errors': 'This hierarchy relationship would create a cycle'
+                })
         
         return data
     
@@ -679,6 +722,7 @@ class BulkRoleAppMappingSerializer(serializers.Serializer):
     can_create = serializers.BooleanField(default=False)
     can_update = serializers.BooleanField(default=False)
     can_delete = serializers.BooleanField(default=False)
+    sync = serializers.BooleanField(default=False, help_text="Deactivate the role's mappings to apps not listed")
 
 
 class BulkRoleFeatureMappingSerializer(serializers.Serializer):
@@ -689,6 +733,7 @@ class BulkRoleFeatureMappingSerializer(serializers.Serializer):
     can_create = serializers.BooleanField(default=False)
     can_update = serializers.BooleanField(default=False)
     can_delete = serializers.BooleanField(default=False)
+    sync = serializers.BooleanField(default=False, help_text="Deactivate the role's mappings to features not listed")
 
 
 class BulkUserRoleAssignmentSerializer(serializers.Serializer):
@@ -696,6 +741,7 @@ class BulkUserRoleAssignmentSerializer(serializers.Serializer):
     user_ids = serializers.ListField(child=serializers.IntegerField())
     role_id = serializers.IntegerField()
     is_primary = serializers.BooleanField(default=False)
+    sync = serializers.BooleanField(default=False, help_text="Deactivate the role for users not listed")
 
 
 # =============================================================================
@@ -0,0 +1,74 @@
+"""
+Signal handlers for rbac app
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_rbac_generation
+from .effective_access import EffectiveAccess
+from .models import UserRole, App, Feature, RoleAppMapping, RoleFeatureMapping, UserRoleAssignment, RoleHierarchy
+from .role_closure import RoleClosure
+
+
+# Models whose changes affect effective permissions or the app/feature catalog
+RBAC_MODELS = (UserRole, App, Feature, RoleAppMapping, RoleFeatureMapping, UserRoleAssignment)
+
+
+def invalidate_rbac_caches(sender, instance, **kwargs):
+    """Any change to RBAC data invalidates all caches derived from it"""
+    bump_rbac_generation()
+
+
+for model in RBAC_MODELS:
+    post_save.connect(invalidate_rbac_caches, sender=model, dispatch_uid=f'rbac_post_save_{model.__name__}')
+    post_delete.connect(invalidate_rbac_caches, sender=model, dispatch_uid=f'rbac_post_delete_{model.__name__}')
+
+
+# Deletes reach UserEffectiveAccess by cascade; saves rebuild the affected rows
+
+@receiver(post_save, sender=UserRoleAssignment)
+def refresh_assignment_access(sender, instance, raw=False, **kwargs):
+    if not raw:
+        EffectiveAccess.refresh_assignments([instance.pk])
+
+
+@receiver(post_save, sender=RoleAppMapping)
+def refresh_app_mapping_access(sender, instance, raw=False, **kwargs):
+    if not raw:
+        EffectiveAccess.refresh_app_mappings([instance.pk])
+
+
+@receiver(post_save, sender=RoleFeatureMapping)
+def refresh_feature_mapping_access(sender, instance, raw=False, **kwargs):
+    if not raw:
+        EffectiveAccess.refresh_feature_mappings([instance.pk])
+
+
+@receiver(post_save, sender=Feature)
+def sync_feature_access(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created:
+        EffectiveAccess.sync_feature_app(instance)
+
+
+# Hierarchy edits recompute the closure rows of the edge's parent and its ancestors
+
+@receiver(pre_save, sender=RoleHierarchy)
+def remember_hierarchy_parent(sender, instance, raw=False, **kwargs):
+    """An edge moved to another parent changes the old parent's rows too"""
+    instance._previous_parent_role_id = None
+    if not raw and instance.pk:
+        instance._previous_parent_role_id = (
+            RoleHierarchy.objects.filter(pk=instance.pk).values_list('parent_role_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=RoleHierarchy)
+def refresh_hierarchy_closure(sender, instance, raw=False, **kwargs):
+    if not raw:
+        previous = getattr(instance, '_previous_parent_role_id', None)
+        RoleClosure.refresh_ancestors({instance.parent_role_id, previous} - {None})
+
+
+@receiver(post_delete, sender=RoleHierarchy)
+def remove_hierarchy_closure(sender, instance, **kwargs):
+    RoleClosure.refresh_ancestors([instance.parent_role_id])
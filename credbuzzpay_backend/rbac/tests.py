@@ -2,8 +2,17 @@
 RBAC Tests - Unit tests for Role-Based Access Control System
 """
 
-from django.test import TestCase
-from django.urls import reverse
+import csv
+import io
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.utils import timezone
@@ -12,9 +21,25 @@ import json
 
 from users_auth.models import User
 from users_auth.jwt_utils import JWTManager
+from credbuzzpay_backend.query_budget import QueryBudgetTestMixin, fingerprint, get_view_budget
 from .models import (
     UserRole, App, Feature, RoleAppMapping,
-    RoleFeatureMapping, UserRoleAssignment, RoleHierarchy, AuditLog, RoleLevel
+    RoleFeatureMapping, UserRoleAssignment, RoleHierarchy, AuditLog, RoleLevel,
+    RoleHierarchyClosure, UserEffectiveAccess
+)
+from .effective_access import EffectiveAccess
+from .bulk import BulkRBAC
+from .catalog import CatalogService
+from .decision_cache import PermissionDecisionCache
+from .permission_matrix import PermissionMatrixService
+from .permissions import (
+    can_assign_role, can_manage_role, get_user_permissions, has_app_permission, has_feature_permission,
+)
+from .role_closure import RoleClosure, ROW_FIELDS as ROLE_CLOSURE_FIELDS
+from .serializers import RoleHierarchyCreateSerializer, UserRoleListSerializer
+from .views import (
+    AllAppsAndFeaturesView, AppListView, AssignAccessToUserView, AuditLogExportView, AuditLogListView,
+    FeatureListView, RoleAppMappingListView, RoleFeatureMappingListView, UserRoleAssignmentListView, UserRoleListView,
 )
 
 
@@ -1026,3 +1051,1208 @@ class RBACPermissionHelperTests(TestCase):
         role_names = [r['name'] for r in permissions['roles']]
         self.assertIn('Admin', role_names)
 
+
+
+class RBACPermissionSnapshotCacheTests(TestCase):
+    """Test cases for cached effective permissions and RBAC generation invalidation"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create(
+            username='snapshotuser',
+            email='snapshot@example.com'
+        )
+        self.role = UserRole.objects.create(
+            name='Snapshot Admin',
+            code='SNAPSHOT_ADMIN',
+            level=RoleLevel.ADMIN
+        )
+        self.app = App.objects.create(name='Snapshot App', code='SNAPSHOT_APP')
+        self.feature = Feature.objects.create(
+            app=self.app,
+            name='Snapshot Feature',
+            code='SNAPSHOT_FEATURE'
+        )
+        self.assignment = UserRoleAssignment.objects.create(
+            user=self.user,
+            role=self.role,
+            is_primary=True
+        )
+        self.app_mapping = RoleAppMapping.objects.create(role=self.role, app=self.app, can_view=True)
+    
+    def test_repeat_lookup_is_served_from_cache(self):
+        """Test a second lookup issues no queries"""
+        first = JWTManager.get_user_permissions(self.user)
+        
+        with self.assertNumQueries(0):
+            second = JWTManager.get_user_permissions(self.user)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(second, ([self.app.id], []))
+    
+    def test_mapping_change_invalidates(self):
+        """Test adding a feature mapping is visible immediately"""
+        JWTManager.get_user_permissions(self.user)
+        
+        RoleFeatureMapping.objects.create(role=self.role, feature=self.feature, can_view=True)
+        
+        self.assertEqual(JWTManager.get_user_permissions(self.user), ([self.app.id], [self.feature.id]))
+    
+    def test_assignment_revocation_invalidates(self):
+        """Test deactivating a role assignment is visible immediately"""
+        JWTManager.get_user_permissions(self.user)
+        
+        self.assignment.is_active = False
+        self.assignment.save()
+        
+        self.assertEqual(JWTManager.get_user_permissions(self.user), ([], []))
+    
+    def test_queryset_update_with_explicit_bump(self):
+        """Test bulk updates invalidate once the generation is bumped"""
+        from .cache import bump_rbac_generation
+        
+        JWTManager.get_user_permissions(self.user)
+        RoleAppMapping.objects.filter(role=self.role).update(is_active=False)
+        bump_rbac_generation()
+        
+        self.assertEqual(JWTManager.get_user_permissions(self.user), ([], []))
+    
+    def test_snapshot_not_kept_past_assignment_boundary(self):
+        """Test a snapshot is never kept beyond the next valid_from/valid_until boundary"""
+        from users_auth.permission_cache import PermissionSnapshotCache
+        from .cache import get_rbac_generation
+        
+        PermissionSnapshotCache.set(
+            self.user, get_rbac_generation(), [], [],
+            valid_until=timezone.now() - timedelta(seconds=1)
+        )
+        
+        self.assertIsNone(PermissionSnapshotCache.get(self.user, get_rbac_generation()))
+    
+    def test_shared_hit_keeps_snapshot_expiry(self):
+        """Test a worker copying a shared snapshot keeps it no longer than the boundary"""
+        from users_auth.permission_cache import PermissionSnapshotCache
+        from .cache import get_rbac_generation
+        
+        generation = get_rbac_generation()
+        PermissionSnapshotCache.set(
+            self.user, generation, [self.app.id], [],
+            valid_until=timezone.now() + timedelta(seconds=30)
+        )
+        # Another worker: only the shared cache holds the snapshot
+        local = PermissionSnapshotCache.get_local_cache()
+        local.clear()
+        
+        self.assertEqual(PermissionSnapshotCache.get(self.user, generation), ([self.app.id], []))
+        key = PermissionSnapshotCache._key(self.user, generation)
+        expires_at, _ = local._data[key]
+        self.assertLessEqual(expires_at - time.monotonic(), 30)
+        
+        local.clear()
+        with mock.patch('users_auth.permission_cache.time.time', return_value=time.time() + 31):
+            self.assertIsNone(PermissionSnapshotCache.get(self.user, generation))
+    
+    def test_disabled_without_shared_cache(self):
+        """Test snapshots are not used when an RBAC change can't reach other workers"""
+        JWTManager.get_user_permissions(self.user)
+        with self.settings(CACHE_LOCAL_IS_SHARED=False), self.assertNumQueries(3):
+            JWTManager.get_user_permissions(self.user)
+
+
+class EffectiveAccessTests(APITestCase):
+    """Test cases for the materialized UserEffectiveAccess projection"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.admin_user = User.objects.create(username='accessadmin', email='accessadmin@example.com')
+        self.user = User.objects.create(username='accessuser', email='accessuser@example.com')
+        self.developer_role = UserRole.objects.create(
+            name='Access Developer',
+            code='ACCESS_DEVELOPER',
+            level=RoleLevel.DEVELOPER
+        )
+        self.role = UserRole.objects.create(name='Access Client', code='ACCESS_CLIENT', level=RoleLevel.CLIENT)
+        self.other_role = UserRole.objects.create(name='Access Viewer', code='ACCESS_VIEWER', level=RoleLevel.CLIENT)
+        self.app = App.objects.create(name='Access App', code='ACCESS_APP')
+        self.feature = Feature.objects.create(app=self.app, name='Access Feature', code='ACCESS_FEATURE')
+        
+        self.app_mapping = RoleAppMapping.objects.create(role=self.role, app=self.app, can_view=True)
+        self.feature_mapping = RoleFeatureMapping.objects.create(
+            role=self.role, feature=self.feature, can_view=True, can_create=True
+        )
+        UserRoleAssignment.objects.create(user=self.admin_user, role=self.developer_role, is_primary=True)
+        self.assignment = UserRoleAssignment.objects.create(user=self.user, role=self.role, is_primary=True)
+    
+    def targets(self, user=None):
+        return sorted(
+            ((entry.app_id, entry.feature_id, entry.role_id) for entry in EffectiveAccess.for_user(user or self.user)),
+            key=lambda target: (target[0], target[1] or 0, target[2])
+        )
+    
+    def test_assignment_projects_role_mappings(self):
+        """Test a new assignment gets one row per app and feature mapping"""
+        self.assertEqual(self.targets(), [(self.app.id, None, self.role.id), (self.app.id, self.feature.id, self.role.id)])
+        
+        row = UserEffectiveAccess.objects.get(user=self.user, feature=self.feature)
+        self.assertTrue(row.can_create)
+        self.assertEqual(row.feature_mapping_id, self.feature_mapping.id)
+    
+    def test_mapping_changes_reach_every_assigned_user(self):
+        """Test saving a mapping rebuilds only that mapping's rows for all its users"""
+        second = User.objects.create(username='accessuser2', email='accessuser2@example.com')
+        UserRoleAssignment.objects.create(user=second, role=self.role)
+        
+        self.feature_mapping.can_delete = True
+        self.feature_mapping.save()
+        self.assertEqual(
+            UserEffectiveAccess.objects.filter(feature=self.feature, can_delete=True).count(), 2
+        )
+        
+        self.app_mapping.is_active = False
+        self.app_mapping.save()
+        self.assertEqual(self.targets(second), [(self.app.id, self.feature.id, self.role.id)])
+    
+    def test_revoked_or_deleted_assignment_removes_rows(self):
+        """Test deactivating or deleting an assignment removes its rows"""
+        self.assignment.is_active = False
+        self.assignment.save()
+        self.assertEqual(self.targets(), [])
+        
+        self.assignment.is_active = True
+        self.assignment.save()
+        self.assignment.delete()
+        self.assertFalse(UserEffectiveAccess.objects.filter(user=self.user).exists())
+    
+    def test_flags_checked_on_read(self):
+        """Test inactive roles/apps and expired assignments are filtered without a rebuild"""
+        UserRole.objects.filter(pk=self.role.pk).update(is_active=False)
+        self.assertEqual(self.targets(), [])
+        UserRole.objects.filter(pk=self.role.pk).update(is_active=True)
+        
+        Feature.objects.filter(pk=self.feature.pk).update(is_active=False)
+        self.assertEqual(self.targets(), [(self.app.id, None, self.role.id)])
+        
+        self.assignment.valid_until = timezone.now() - timedelta(minutes=1)
+        self.assignment.save()
+        self.assertEqual(self.targets(), [])
+    
+    def test_consistency_check_and_rebuild(self):
+        """Test drift from a queryset update is reported, fixed and rebuilt"""
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        
+        RoleAppMapping.objects.filter(pk=self.app_mapping.pk).update(can_delete=True)
+        missing, stale = EffectiveAccess.check()
+        self.assertEqual(len(missing), 1)
+        self.assertEqual(len(stale), 1)
+        
+        with self.assertRaises(CommandError):
+            call_command('check_effective_access', stdout=StringIO())
+        call_command('check_effective_access', '--fix', stdout=StringIO())
+        self.assertEqual(EffectiveAccess.check(), ([], []))
+        
+        UserEffectiveAccess.objects.all().delete()
+        call_command('rebuild_effective_access', stdout=StringIO())
+        self.assertEqual(EffectiveAccess.check(), ([], []))
+        self.assertTrue(UserEffectiveAccess.objects.get(app_mapping=self.app_mapping).can_delete)
+    
+    def test_access_overview_endpoint(self):
+        """Test the overview lists apps and features per granting role"""
+        UserRoleAssignment.objects.create(user=self.user, role=self.other_role)
+        RoleAppMapping.objects.create(role=self.other_role, app=self.app, can_view=True, can_update=True)
+        self.client.force_authenticate(user=self.admin_user)
+        
+        response = self.client.get(f'/api/rbac/users/{self.user.id}/access/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()['data']
+        self.assertEqual(
+            sorted((a['app_code'], a['assigned_via_role'], a['can_update']) for a in data['apps']),
+            [('ACCESS_APP', 'Access Client', False), ('ACCESS_APP', 'Access Viewer', True)]
+        )
+        self.assertEqual([f['feature_code'] for f in data['features']], ['ACCESS_FEATURE'])
+        self.assertTrue(data['features'][0]['can_create'])
+    
+    def test_profile_merges_role_permissions(self):
+        """Test the full profile merges the permissions of all roles per app"""
+        UserRoleAssignment.objects.create(user=self.user, role=self.other_role)
+        RoleAppMapping.objects.create(role=self.other_role, app=self.app, can_view=True, can_update=True)
+        self.client.force_authenticate(user=self.user)
+        
+        response = self.client.get('/api/auth-user/profile-full/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()['data']
+        self.assertEqual(len(data['app_access']), 1)
+        self.assertTrue(data['app_access'][0]['can_update'])
+        self.assertEqual(data['feature_access'][0]['feature_code'], 'ACCESS_FEATURE')
+
+
+class ConditionalPermissionsTests(APITestCase):
+    """Test cases for ETag revalidation of the current user's permissions"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create(username='etaguser', email='etaguser@example.com')
+        self.role = UserRole.objects.create(name='ETag Client', code='ETAG_CLIENT', level=RoleLevel.CLIENT)
+        self.app = App.objects.create(name='ETag App', code='ETAG_APP')
+        self.mapping = RoleAppMapping.objects.create(role=self.role, app=self.app, can_view=True)
+        UserRoleAssignment.objects.create(user=self.user, role=self.role, is_primary=True)
+        self.client.force_authenticate(user=self.user)
+    
+    def test_unchanged_permissions_return_not_modified(self):
+        """Test the current ETag is answered with an empty 304"""
+        etag = self.client.get('/api/rbac/my-permissions/')['ETag']
+        
+        response = self.client.get('/api/rbac/my-permissions/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+    
+    def test_mapping_change_changes_etag(self):
+        """Test granting a permission to the user's role invalidates the ETag"""
+        etag = self.client.get('/api/rbac/my-permissions/')['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mapping.can_update = True
+            self.mapping.save()
+        response = self.client.get('/api/rbac/my-permissions/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_expired_assignment_changes_etag(self):
+        """Test an assignment leaving its validity window invalidates the ETag"""
+        etag = self.client.get('/api/rbac/my-permissions/')['ETag']
+        
+        UserRoleAssignment.objects.filter(user=self.user).update(valid_until=timezone.now() - timedelta(minutes=1))
+        response = self.client.get('/api/rbac/my-permissions/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_etag_is_per_user(self):
+        """Test another user's ETag is never answered with 304"""
+        other = User.objects.create(username='etagother', email='etagother@example.com')
+        UserRoleAssignment.objects.create(user=other, role=self.role, is_primary=True)
+        etag = self.client.get('/api/rbac/my-permissions/')['ETag']
+        
+        self.client.force_authenticate(user=other)
+        response = self.client.get('/api/rbac/my-permissions/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    
+    def test_etag_without_shared_cache_follows_rbac_data(self):
+        """Test a worker that never saw the generation bump still serves fresh permissions"""
+        with self.settings(CACHE_LOCAL_IS_SHARED=False), \
+                mock.patch('rbac.cache.get_rbac_generation', return_value=1):
+            etag = self.client.get('/api/rbac/my-permissions/')['ETag']
+            response = self.client.get('/api/rbac/my-permissions/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            
+            self.mapping.can_update = True
+            self.mapping.save()
+            response = self.client.get('/api/rbac/my-permissions/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+            
+            self.mapping.delete()
+            response = self.client.get('/api/rbac/my-permissions/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class PermissionDecisionCacheTests(TestCase):
+    """Test cases for the in-process RBAC decision cache"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        PermissionDecisionCache.clear()
+        self.user = User.objects.create(username='decisionuser', email='decisionuser@example.com')
+        self.role = UserRole.objects.create(name='Decision Client', code='DECISION_CLIENT', level=RoleLevel.CLIENT)
+        self.app = App.objects.create(name='Decision App', code='DECISION_APP')
+        self.feature = Feature.objects.create(app=self.app, name='Decision Feature', code='DECISION_FEATURE')
+        self.mapping = RoleAppMapping.objects.create(role=self.role, app=self.app, can_view=True)
+        RoleFeatureMapping.objects.create(role=self.role, feature=self.feature, can_view=True)
+        self.assignment = UserRoleAssignment.objects.create(user=self.user, role=self.role, is_primary=True)
+    
+    def test_repeat_checks_skip_the_database(self):
+        """Test a repeated check is answered without queries"""
+        with self.assertNumQueries(4):
+            self.assertTrue(has_app_permission(self.user, 'DECISION_APP', 'view'))
+            self.assertTrue(has_feature_permission(self.user, 'DECISION_APP', 'DECISION_FEATURE', 'view'))
+        with self.assertNumQueries(0):
+            self.assertTrue(has_app_permission(self.user, 'DECISION_APP', 'view'))
+            self.assertTrue(has_feature_permission(self.user, 'DECISION_APP', 'DECISION_FEATURE', 'view'))
+        
+        with self.assertNumQueries(2):
+            self.assertFalse(has_app_permission(self.user, 'DECISION_APP', 'delete'))
+    
+    def test_mapping_change_invalidates(self):
+        """Test changing a mapping is seen by the next check"""
+        self.assertFalse(has_app_permission(self.user, 'DECISION_APP', 'create'))
+        
+        self.mapping.can_create = True
+        self.mapping.save()
+        
+        self.assertTrue(has_app_permission(self.user, 'DECISION_APP', 'create'))
+    
+    def test_generation_bump_from_another_worker_invalidates(self):
+        """Test a generation bumped only in the shared cache invalidates local decisions"""
+        from credbuzzpay_backend.cache_utils import bump_generation
+        from .cache import RBAC_GENERATION
+        
+        self.assertTrue(has_app_permission(self.user, 'DECISION_APP', 'view'))
+        # Another worker revokes the mapping: the row changes and the shared
+        # generation moves, while this worker's LRU still holds the decision
+        RoleAppMapping.objects.filter(pk=self.mapping.pk).update(can_view=False)
+        bump_generation(RBAC_GENERATION)
+        
+        self.assertFalse(has_app_permission(self.user, 'DECISION_APP', 'view'))
+    
+    def test_decision_expires_with_assignment(self):
+        """Test a decision is not kept past the assignment's valid_until"""
+        valid_until = timezone.now() + timedelta(seconds=30)
+        UserRoleAssignment.objects.filter(pk=self.assignment.pk).update(valid_until=valid_until)
+        PermissionDecisionCache.clear()
+        self.assertTrue(has_app_permission(self.user, 'DECISION_APP', 'view'))
+        
+        later = timezone.now() + timedelta(seconds=31)
+        with mock.patch('django.utils.timezone.now', return_value=later), \
+                mock.patch('credbuzzpay_backend.cache_utils.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertFalse(has_app_permission(self.user, 'DECISION_APP', 'view'))
+    
+    def test_revocation_on_worker_with_own_cache(self):
+        """Test a change made on another worker is seen when the cache is per process"""
+        with self.settings(CACHE_LOCAL_IS_SHARED=False):
+            self.assertTrue(has_app_permission(self.user, 'DECISION_APP', 'view'))
+            # The other worker bumps the generation in its own local-memory
+            # cache, which never reaches this one
+            RoleAppMapping.objects.filter(pk=self.mapping.pk).update(can_view=False)
+            
+            self.assertFalse(has_app_permission(self.user, 'DECISION_APP', 'view'))
+    
+    def test_disabled(self):
+        """Test decisions are resolved every time when disabled"""
+        with self.settings(RBAC_DECISION_CACHE_ENABLED=False):
+            has_app_permission(self.user, 'DECISION_APP', 'view')
+            with self.assertNumQueries(2):
+                has_app_permission(self.user, 'DECISION_APP', 'view')
+
+
+class PermissionMatrixTests(APITestCase):
+    """Test cases for the compiled permission matrix"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        PermissionDecisionCache.clear()
+        PermissionMatrixService.reset()
+        self.admin = User.objects.create(username='matrixadmin', email='matrixadmin@example.com')
+        self.developer_role = UserRole.objects.create(name='Matrix Dev', code='MATRIX_DEV', level=RoleLevel.DEVELOPER)
+        UserRoleAssignment.objects.create(user=self.admin, role=self.developer_role, is_primary=True)
+        
+        self.editor = UserRole.objects.create(name='Matrix Editor', code='MATRIX_EDITOR', level=RoleLevel.CLIENT)
+        self.viewer = UserRole.objects.create(name='Matrix Viewer', code='MATRIX_VIEWER', level=RoleLevel.CLIENT)
+        self.app = App.objects.create(name='Matrix App', code='MATRIX_APP')
+        self.other_app = App.objects.create(name='Matrix Other', code='MATRIX_OTHER')
+        self.feature = Feature.objects.create(app=self.app, name='Matrix Feature', code='MATRIX_FEATURE')
+        self.other_feature = Feature.objects.create(app=self.other_app, name='Matrix Other', code='MATRIX_OTHER_F')
+        
+        RoleAppMapping.objects.create(role=self.editor, app=self.app, can_view=True, can_update=True)
+        RoleAppMapping.objects.create(role=self.viewer, app=self.app, can_view=True)
+        self.editor_feature = RoleFeatureMapping.objects.create(
+            role=self.editor, feature=self.feature, can_view=True, can_update=True
+        )
+        RoleFeatureMapping.objects.create(role=self.viewer, feature=self.other_feature, can_view=True)
+        
+        self.users = [
+            User.objects.create(username=f'matrixuser{i}', email=f'matrixuser{i}@example.com') for i in range(6)
+        ]
+        for i, user in enumerate(self.users):
+            if i % 2 == 0:
+                UserRoleAssignment.objects.create(user=user, role=self.editor)
+            if i % 3 == 0:
+                UserRoleAssignment.objects.create(user=user, role=self.viewer)
+    
+    def test_matches_per_user_checks(self):
+        """Test every bulk answer agrees with has_app_permission / has_feature_permission"""
+        users = self.users + [self.admin]
+        user_ids = [user.id for user in users]
+        for permission in ('view', 'create', 'update', 'delete'):
+            apps = PermissionMatrixService.apps_for_users(user_ids, permission)
+            features = PermissionMatrixService.features_for_users(user_ids, permission)
+            for user in users:
+                for app in (self.app, self.other_app):
+                    self.assertEqual(
+                        app.id in apps[user.id], has_app_permission(user, app.code, permission),
+                        (user.username, app.code, permission)
+                    )
+                for feature in (self.feature, self.other_feature):
+                    self.assertEqual(
+                        feature.id in features[user.id],
+                        has_feature_permission(user, feature.app.code, feature.code, permission),
+                        (user.username, feature.code, permission)
+                    )
+    
+    def test_reverse_lookup(self):
+        """Test listing the users holding a feature permission"""
+        editors = {self.users[0].id, self.users[2].id, self.users[4].id, self.admin.id}
+        self.assertEqual(set(PermissionMatrixService.users_with_feature(self.feature.id, 'update')), editors)
+        self.assertEqual(
+            set(PermissionMatrixService.users_with_app(self.app.id, 'view')),
+            editors | {self.users[3].id}
+        )
+        self.assertEqual(PermissionMatrixService.users_with_feature(-1), [])
+    
+    def test_incremental_refresh(self):
+        """Test changes are picked up by reading only the changed rows"""
+        matrix = PermissionMatrixService.get_matrix()
+        self.assertNotIn(self.users[1].id, PermissionMatrixService.users_with_feature(self.feature.id))
+        
+        UserRoleAssignment.objects.create(user=self.users[1], role=self.editor)
+        self.editor_feature.can_update = False
+        self.editor_feature.save()
+        
+        self.assertIsNot(PermissionMatrixService.get_matrix(), matrix)
+        self.assertIn(self.users[1].id, PermissionMatrixService.users_with_feature(self.feature.id))
+        self.assertEqual(PermissionMatrixService.users_with_feature(self.feature.id, 'update'), [self.admin.id])
+    
+    def test_deleted_rows_reload_table(self):
+        """Test a deleted assignment is noticed through the row count"""
+        self.assertIn(self.users[0].id, PermissionMatrixService.users_with_app(self.app.id))
+        
+        UserRoleAssignment.objects.filter(user=self.users[0]).delete()
+        
+        self.assertNotIn(self.users[0].id, PermissionMatrixService.users_with_app(self.app.id))
+    
+    def test_unchanged_generation_reuses_matrix(self):
+        """Test repeat queries need no database access"""
+        PermissionMatrixService.get_matrix()
+        with self.assertNumQueries(0):
+            PermissionMatrixService.features_for_users([user.id for user in self.users])
+    
+    def test_late_commit_seen_after_max_age(self):
+        """Test a change older than the refresh lag is picked up by the full reload"""
+        self.assertIn(self.users[0].id, PermissionMatrixService.users_with_app(self.app.id))
+        
+        # Committed long after it was written, without a generation bump
+        stale = timezone.now() - timedelta(hours=1)
+        UserRoleAssignment.objects.filter(user=self.users[0]).update(is_active=False, updated_at=stale)
+        self.assertIn(self.users[0].id, PermissionMatrixService.users_with_app(self.app.id))
+        
+        later = timezone.now() + timedelta(seconds=PermissionMatrixService.get_max_age())
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertNotIn(self.users[0].id, PermissionMatrixService.users_with_app(self.app.id))
+    
+    def test_refreshes_every_call_without_shared_cache(self):
+        """Test a change made on another worker is read when the cache is per process"""
+        with self.settings(CACHE_LOCAL_IS_SHARED=False):
+            self.assertIn(self.users[0].id, PermissionMatrixService.users_with_app(self.app.id))
+            # The other worker's generation bump stays in its own cache
+            UserRoleAssignment.objects.filter(user=self.users[0]).update(is_active=False, updated_at=timezone.now())
+            
+            self.assertNotIn(self.users[0].id, PermissionMatrixService.users_with_app(self.app.id))
+    
+    def test_endpoint(self):
+        """Test the admin endpoint answers both directions and rejects non-admins"""
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/rbac/permission-matrix/', {'app_code': 'MATRIX_APP', 'feature_code': 'MATRIX_FEATURE'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['data']['count'], 4)
+        
+        response = self.client.post(
+            '/api/rbac/permission-matrix/',
+            {'user_ids': [self.users[3].id], 'permission': 'view'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()['data']['users'][str(self.users[3].id)],
+            {'app_ids': [self.app.id], 'feature_ids': [self.other_feature.id]}
+        )
+        
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get('/api/rbac/permission-matrix/', {'app_id': self.app.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BatchCheckPermissionTests(APITestCase):
+    """Test cases for batch permission checks"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        PermissionDecisionCache.clear()
+        self.user = User.objects.create(username='batchuser', email='batchuser@example.com')
+        self.role = UserRole.objects.create(name='Batch Client', code='BATCH_CLIENT', level=RoleLevel.CLIENT)
+        self.app = App.objects.create(name='Batch App', code='BATCH_APP')
+        self.inactive_app = App.objects.create(name='Batch Off', code='BATCH_OFF', is_active=False)
+        self.feature = Feature.objects.create(app=self.app, name='Batch Feature', code='BATCH_FEATURE')
+        Feature.objects.create(app=self.app, name='Batch Hidden', code='BATCH_HIDDEN')
+        RoleAppMapping.objects.create(role=self.role, app=self.app, can_view=True, can_create=True)
+        RoleAppMapping.objects.create(role=self.role, app=self.inactive_app, can_view=True)
+        RoleFeatureMapping.objects.create(role=self.role, feature=self.feature, can_view=True, can_delete=True)
+        off_feature = Feature.objects.create(app=self.inactive_app, name='Batch Off Feature', code='BATCH_OFF_FEATURE')
+        RoleFeatureMapping.objects.create(role=self.role, feature=off_feature, can_view=True)
+        UserRoleAssignment.objects.create(user=self.user, role=self.role, is_primary=True)
+        self.client.force_authenticate(user=self.user)
+    
+    def all_checks(self):
+        checks = []
+        for permission in ('view', 'create', 'update', 'delete'):
+            for app_code in ('BATCH_APP', 'BATCH_OFF', 'MISSING', None):
+                checks.append({'app_code': app_code, 'permission': permission})
+                for feature_code in ('BATCH_FEATURE', 'BATCH_HIDDEN', 'BATCH_OFF_FEATURE'):
+                    checks.append({'app_code': app_code, 'feature_code': feature_code, 'permission': permission})
+        return checks
+    
+    def test_matches_single_checks(self):
+        """Test every batch result equals the single-check answer"""
+        checks = self.all_checks()
+        
+        response = self.client.post('/api/rbac/check-permissions/', {'checks': checks}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['data']['results']
+        self.assertEqual(len(results), len(checks))
+        for check, result in zip(checks, results):
+            single = self.client.get('/api/rbac/check-permission/', {
+                key: value for key, value in check.items() if value is not None
+            }).json()['data']['has_permission']
+            self.assertEqual(result['has_permission'], single, check)
+    
+    def test_query_count_does_not_grow_with_checks(self):
+        """Test a batch is evaluated against one read of the effective access"""
+        checks = (self.all_checks() * 7)[:200]
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/rbac/check-permissions/', {'checks': checks}, format='json')
+        access_queries = [q for q in queries.captured_queries if 'rbac_' in q['sql']]
+        self.assertEqual(len(access_queries), 2)
+    
+    def test_developer_gets_everything(self):
+        """Test developers pass every check"""
+        developer = UserRole.objects.create(name='Batch Dev', code='BATCH_DEV', level=RoleLevel.DEVELOPER)
+        UserRoleAssignment.objects.create(user=self.user, role=developer)
+        
+        response = self.client.post('/api/rbac/check-permissions/', {'checks': [
+            {'app_code': 'ANYTHING', 'permission': 'delete'},
+        ]}, format='json')
+        
+        self.assertTrue(response.json()['data']['results'][0]['has_permission'])
+    
+    def test_validation(self):
+        """Test malformed batches are rejected"""
+        for body in ({}, {'checks': []}, {'checks': [{'app_code': 'BATCH_APP', 'permission': 'execute'}]},
+                     {'checks': [{'app_code': 'BATCH_APP'}] * 501},
+                     {'checks': [{'app_code': ['BATCH_APP'], 'feature_code': 'BATCH_FEATURE'}]},
+                     {'checks': [{'app_code': 'BATCH_APP', 'feature_code': {'code': 'BATCH_FEATURE'}}]}):
+            response = self.client.post('/api/rbac/check-permissions/', body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkRBACTests(APITestCase):
+    """Test cases for set-based bulk mapping and assignment operations"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.admin = User.objects.create(username='bulkadmin', email='bulkadmin@example.com')
+        developer = UserRole.objects.create(name='Bulk Dev', code='BULK_DEV', level=RoleLevel.DEVELOPER)
+        UserRoleAssignment.objects.create(user=self.admin, role=developer, is_primary=True)
+        self.role = UserRole.objects.create(name='Bulk Client', code='BULK_CLIENT', level=RoleLevel.CLIENT)
+        self.other_role = UserRole.objects.create(name='Bulk Other', code='BULK_OTHER', level=RoleLevel.CLIENT)
+        self.apps = [App.objects.create(name=f'Bulk App {i}', code=f'BULK_APP_{i}') for i in range(4)]
+        self.users = [User.objects.create(username=f'bulkuser{i}', email=f'bulkuser{i}@example.com') for i in range(60)]
+    
+    def permissions(self, **flags):
+        return dict({'can_view': True, 'can_create': False, 'can_update': False, 'can_delete': False}, **flags)
+    
+    def test_assign_role_query_count_is_constant(self):
+        """Test assigning a role costs the same number of queries for 10 or 50 users"""
+        counts = []
+        for users, role in ((self.users[:10], self.role), (self.users[10:60], self.other_role)):
+            with CaptureQueriesContext(connection) as queries:
+                result = BulkRBAC.assign_role(role, [user.id for user in users], assigned_by=self.admin)
+            self.assertEqual(len(result.created), len(users))
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(AuditLog.objects.filter(entity_type='USER_ROLE_ASSIGNMENT').count(), 60)
+    
+    def test_assign_role_diffs_existing_rows(self):
+        """Test existing assignments are reactivated or promoted, never duplicated"""
+        active = UserRoleAssignment.objects.create(user=self.users[0], role=self.role)
+        inactive = UserRoleAssignment.objects.create(user=self.users[1], role=self.role, is_active=False)
+        other_primary = UserRoleAssignment.objects.create(user=self.users[2], role=self.other_role, is_primary=True)
+        
+        result = BulkRBAC.assign_role(self.role, [u.id for u in self.users[:3]] + [999999], is_primary=True)
+        
+        self.assertEqual(result.created, [self.users[2].id])
+        self.assertEqual(sorted(result.updated), [self.users[0].id, self.users[1].id])
+        self.assertEqual(result.not_found, [999999])
+        self.assertEqual(UserRoleAssignment.objects.filter(role=self.role).count(), 3)
+        active.refresh_from_db()
+        inactive.refresh_from_db()
+        other_primary.refresh_from_db()
+        self.assertTrue(active.is_primary)
+        self.assertTrue(inactive.is_active)
+        self.assertFalse(other_primary.is_primary)
+    
+    def test_assign_role_sync(self):
+        """Test sync mode makes the role's active users exactly the submitted set"""
+        BulkRBAC.assign_role(self.role, [u.id for u in self.users[:5]])
+        
+        result = BulkRBAC.assign_role(self.role, [u.id for u in self.users[3:7]], sync=True)
+        
+        self.assertEqual(sorted(result.deactivated), [u.id for u in self.users[:3]])
+        self.assertEqual(
+            set(UserRoleAssignment.objects.filter(role=self.role, is_active=True).values_list('user_id', flat=True)),
+            {u.id for u in self.users[3:7]}
+        )
+    
+    def test_assign_apps_updates_flags_and_access(self):
+        """Test mappings are created or updated and effective access follows"""
+        UserRoleAssignment.objects.create(user=self.users[0], role=self.role)
+        existing = RoleAppMapping.objects.create(role=self.role, app=self.apps[0], can_view=True)
+        RoleAppMapping.objects.create(role=self.role, app=self.apps[3], can_view=True)
+        
+        result = BulkRBAC.assign_apps(
+            self.role, [self.apps[0].id, self.apps[1].id, self.apps[2].id], self.permissions(can_update=True), sync=True
+        )
+        
+        self.assertEqual(result.updated, [self.apps[0].id])
+        self.assertEqual(sorted(result.created), [self.apps[1].id, self.apps[2].id])
+        self.assertEqual(result.deactivated, [self.apps[3].id])
+        existing.refresh_from_db()
+        self.assertTrue(existing.can_update)
+        self.assertEqual(
+            sorted(row.app_id for row in EffectiveAccess.for_user(self.users[0]) if row.can_update),
+            [self.apps[0].id, self.apps[1].id, self.apps[2].id]
+        )
+        
+        result = BulkRBAC.assign_apps(self.role, [self.apps[0].id], self.permissions(can_update=True))
+        self.assertEqual(result.unchanged, [self.apps[0].id])
+    
+    def test_bulk_endpoints(self):
+        """Test the bulk endpoints report the diff"""
+        self.client.force_authenticate(user=self.admin)
+        feature = Feature.objects.create(app=self.apps[0], name='Bulk Feature', code='BULK_FEATURE')
+        
+        response = self.client.post('/api/rbac/role-feature-mappings/bulk/', {
+            'role_id': self.role.id, 'feature_ids': [feature.id, 424242], 'can_create': True,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()['data']
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['not_found'], [424242])
+        
+        response = self.client.post('/api/rbac/user-role-assignments/bulk/', {
+            'role_id': self.role.id, 'user_ids': [u.id for u in self.users[:3]], 'sync': True,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['data']['created_assignments']), 3)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """Test cases for per-view query budgets and N+1 detection"""
+    
+    def setUp(self):
+        """Set up test data"""
+        cache.clear()
+        self.admin = User.objects.create(username='budgetadmin', email='budgetadmin@example.com')
+        developer = UserRole.objects.create(name='Budget Dev', code='BUDGET_DEV', level=RoleLevel.DEVELOPER)
+        UserRoleAssignment.objects.create(user=self.admin, role=developer, is_primary=True)
+        self.client.force_authenticate(user=self.admin)
+    
+    def seed(self, count):
+        """Create count roles, apps and features, mapped and assigned"""
+        for i in range(count):
+            role = UserRole.objects.create(name=f'Budget Role {i}', code=f'BUDGET_ROLE_{i}', level=RoleLevel.CLIENT)
+            app = App.objects.create(name=f'Budget App {i}', code=f'BUDGET_APP_{i}')
+            feature = Feature.objects.create(app=app, name=f'Budget Feature {i}', code=f'BUDGET_FEATURE_{i}')
+            RoleAppMapping.objects.create(role=role, app=app, can_view=True, assigned_by=self.admin)
+            RoleFeatureMapping.objects.create(role=role, feature=feature, can_view=True, assigned_by=self.admin)
+            user = User.objects.create(username=f'budgetuser{i}', email=f'budgetuser{i}@example.com')
+            UserRoleAssignment.objects.create(user=user, role=role, assigned_by=self.admin)
+    
+    def test_fingerprint_ignores_values(self):
+        """Test statements differing only in values share a fingerprint"""
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a''b'"),
+            fingerprint("SELECT  *  FROM t WHERE id = 22 AND name = 'c'"),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+        )
+    
+    def test_list_endpoints_stay_within_budget(self):
+        """Test list endpoints run a constant number of queries as rows grow"""
+        self.seed(12)
+        endpoints = [
+            ('/api/rbac/roles/', UserRoleListView),
+            ('/api/rbac/apps/', AppListView),
+            ('/api/rbac/features/', FeatureListView),
+            ('/api/rbac/role-app-mappings/', RoleAppMappingListView),
+            ('/api/rbac/role-feature-mappings/', RoleFeatureMappingListView),
+            ('/api/rbac/user-role-assignments/', UserRoleAssignmentListView),
+            ('/api/rbac/all-access-items/', AllAppsAndFeaturesView),
+        ]
+        for url, view in endpoints:
+            with self.subTest(url=url), self.assertQueryBudget(view):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        roles = {role['code']: role for role in self.client.get('/api/rbac/roles/').json()['data']}
+        self.assertEqual(roles['BUDGET_ROLE_0']['users_count'], 1)
+        apps = {app['code']: app for app in self.client.get('/api/rbac/apps/').json()['data']}
+        self.assertEqual(apps['BUDGET_APP_0']['features_count'], 1)
+    
+    def test_assign_access_is_set_based(self):
+        """Test assigning access by code costs the same for one or many codes"""
+        self.seed(8)
+        users = [User.objects.create(username=f'target{i}', email=f'target{i}@example.com') for i in range(2)]
+        
+        counts = []
+        for user, codes in ((users[0], range(1)), (users[1], range(1, 8))):
+            UserRole.objects.create(name=f'Target Role {user.id}', code=f'TARGET_ROLE_{user.id}', level=RoleLevel.CLIENT)
+            with self.assertQueryBudget(AssignAccessToUserView, 'post') as recorder:
+                response = self.client.post(f'/api/rbac/users/{user.id}/assign-access/', {
+                    'role_code': f'TARGET_ROLE_{user.id}',
+                    'app_codes': [f'BUDGET_APP_{i}' for i in codes] + ['MISSING_APP'],
+                    'feature_codes': [f'BUDGET_FEATURE_{i}' for i in codes],
+                }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.json()['data']['features_assigned']), len(codes))
+            counts.append(recorder.count)
+        self.assertEqual(counts[0], counts[1])
+        self.assertTrue(has_feature_permission(users[1], 'BUDGET_APP_7', 'BUDGET_FEATURE_7', 'update'))
+    
+    def test_every_view_declares_a_budget(self):
+        """Test every project view has a query budget for each method it serves"""
+        def walk(patterns):
+            for pattern in patterns:
+                if isinstance(pattern, URLResolver):
+                    yield from walk(pattern.url_patterns)
+                else:
+                    yield getattr(pattern.callback, 'view_class', None)
+        
+        project_apps = ('rbac.', 'users_auth.', 'kyc_verification.', 'bill_pay.', 'credbuzzpay_backend.')
+        views = {view for view in walk(get_resolver().url_patterns) if view and view.__module__.startswith(project_apps)}
+        self.assertGreater(len(views), 80)
+        for view in views:
+            for method in ('get', 'post', 'put', 'patch', 'delete'):
+                if hasattr(view, method):
+                    with self.subTest(view=view.__name__, method=method):
+                        self.assertIsNotNone(get_view_budget(view, method))
+    
+    @override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_HEADERS=True, QUERY_BUDGET_N_PLUS_ONE_THRESHOLD=3)
+    def test_middleware_reports_queries_and_n_plus_one(self):
+        """Test the middleware adds query headers and flags repeated statements"""
+        self.seed(5)
+        response = self.client.get('/api/rbac/roles/')
+        self.assertEqual(response['X-Query-Budget'], str(UserRoleListView.query_budget['get']))
+        self.assertLessEqual(int(response['X-Query-Count']), UserRoleListView.query_budget['get'])
+        self.assertNotIn('X-Query-N-Plus-One', response)
+        
+        role = UserRole.objects.get(code='BUDGET_ROLE_0')
+        with mock.patch.object(UserRoleListSerializer, 'setup_eager_loading', side_effect=lambda queryset: queryset):
+            with self.assertLogs('credbuzzpay_backend.query_budget', 'WARNING') as logs:
+                response = self.client.get('/api/rbac/roles/')
+        self.assertIn('rbac_user_role_assignment', response['X-Query-N-Plus-One'])
+        self.assertTrue(any('Possible N+1 in GET /api/rbac/roles/' in line for line in logs.output))
+        self.assertTrue(any('Query budget exceeded' in line for line in logs.output))
+        self.assertEqual(
+            {r['code']: r['users_count'] for r in response.json()['data']}[role.code], 1
+        )
+
+
+class RoleHierarchyClosureTests(APITestCase):
+    """Test cases for the role hierarchy closure table and role management checks"""
+    
+    def setUp(self):
+        """Set up a chain of client-level roles A -> B -> C -> D"""
+        self.roles = {
+            code: UserRole.objects.create(name=f'Delegate {code}', code=f'DELEGATE_{code}', level=RoleLevel.CLIENT)
+            for code in 'ABCDE'
+        }
+        self.edge('A', 'B')
+        self.edge('B', 'C', can_revoke=False)
+        self.edge('C', 'D')
+    
+    def edge(self, parent, child, **flags):
+        return RoleHierarchy.objects.create(
+            parent_role=self.roles[parent], child_role=self.roles[child], **flags
+        )
+    
+    def closure(self):
+        """Closure rows as {(ancestor, descendant): (depth, can_assign, can_revoke)}"""
+        codes = {role.id: code for code, role in self.roles.items()}
+        return {
+            (codes[row.ancestor_id], codes[row.descendant_id]): (row.depth, row.can_assign, row.can_revoke)
+            for row in RoleHierarchyClosure.objects.filter(ancestor__in=self.roles.values())
+        }
+    
+    def test_chain_capabilities_are_intersected(self):
+        """Test a chain grants only the capabilities of all its edges"""
+        closure = self.closure()
+        self.assertEqual(closure[('A', 'B')], (1, True, True))
+        self.assertEqual(closure[('A', 'C')], (2, True, False))
+        self.assertEqual(closure[('A', 'D')], (3, True, False))
+        self.assertEqual(closure[('C', 'D')], (1, True, True))
+        self.assertNotIn(('D', 'A'), closure)
+        self.assertEqual(len(closure), 6)
+    
+    def test_parallel_chains_are_merged(self):
+        """Test a second chain adds its capabilities and shortens the depth"""
+        self.edge('A', 'D', can_assign=False)
+        self.assertEqual(self.closure()[('A', 'D')], (1, True, True))
+    
+    def test_edge_removal_updates_ancestors(self):
+        """Test deactivating or deleting an edge drops the chains through it"""
+        middle = RoleHierarchy.objects.get(parent_role=self.roles['B'])
+        middle.is_active = False
+        middle.save()
+        self.assertEqual(set(self.closure()), {('A', 'B'), ('C', 'D')})
+        
+        middle.is_active = True
+        middle.save()
+        self.assertEqual(len(self.closure()), 6)
+        
+        self.roles['C'].delete()
+        self.assertEqual(set(self.closure()), {('A', 'B')})
+        self.assertEqual(RoleClosure.check(), ([], []))
+    
+    def test_moved_edge_refreshes_old_parent(self):
+        """Test moving an edge to another parent updates both parents' ancestors"""
+        edge = RoleHierarchy.objects.get(parent_role=self.roles['C'])
+        edge.parent_role = self.roles['E']
+        edge.save()
+        closure = self.closure()
+        self.assertNotIn(('A', 'D'), closure)
+        self.assertEqual(closure[('E', 'D')], (1, True, True))
+        self.assertEqual(RoleClosure.check(), ([], []))
+    
+    def test_cycles_are_rejected(self):
+        """Test edges closing a cycle fail validation"""
+        self.assertTrue(RoleClosure.creates_cycle(self.roles['D'].id, self.roles['A'].id))
+        self.assertTrue(RoleClosure.creates_cycle(self.roles['A'].id, self.roles['A'].id))
+        self.assertFalse(RoleClosure.creates_cycle(self.roles['A'].id, self.roles['E'].id))
+        
+        with self.assertRaises(ValidationError):
+            RoleHierarchy(parent_role=self.roles['D'], child_role=self.roles['B']).full_clean()
+        
+        top = UserRole.objects.create(name='Delegate Top', code='DELEGATE_TOP', level=RoleLevel.SUPER_ADMIN)
+        RoleHierarchy.objects.create(parent_role=self.roles['A'], child_role=top)
+        serializer = RoleHierarchyCreateSerializer(data={'parent_role': top.id, 'child_role': self.roles['A'].id})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('cycle', str(serializer.errors))
+    
+    def test_rebuild_matches_incremental_rows(self):
+        """Test a full rebuild produces the rows maintained incrementally"""
+        self.edge('A', 'D', can_assign=False)
+        self.edge('D', 'E', can_modify_permissions=True)
+        before = set(RoleHierarchyClosure.objects.values_list(*ROLE_CLOSURE_FIELDS))
+        RoleHierarchyClosure.objects.all().delete()
+        self.assertTrue(RoleClosure.check()[0])
+        RoleClosure.rebuild()
+        self.assertEqual(set(RoleHierarchyClosure.objects.values_list(*ROLE_CLOSURE_FIELDS)), before)
+    
+    def test_delegated_role_management(self):
+        """Test delegation chains let a role manage a role of the same level"""
+        delegate = User.objects.create(username='delegate', email='delegate@example.com')
+        UserRoleAssignment.objects.create(user=delegate, role=self.roles['A'], is_primary=True)
+        outsider = User.objects.create(username='outsider', email='outsider@example.com')
+        UserRoleAssignment.objects.create(user=outsider, role=self.roles['E'], is_primary=True)
+        
+        self.assertTrue(self.roles['A'].can_manage_role(self.roles['D']))
+        self.assertFalse(self.roles['A'].can_manage_role(self.roles['D'], 'can_revoke'))
+        self.assertFalse(self.roles['E'].can_manage_role(self.roles['D']))
+        
+        with self.assertNumQueries(2):
+            self.assertTrue(can_assign_role(delegate, self.roles['C']))
+        self.assertTrue(can_manage_role(delegate, self.roles['B'], 'can_revoke'))
+        self.assertFalse(can_manage_role(delegate, self.roles['C'], 'can_revoke'))
+        self.assertFalse(can_assign_role(outsider, self.roles['C']))
+        
+        # Level-based management is unchanged
+        admin = User.objects.create(username='delegateadmin', email='delegateadmin@example.com')
+        UserRoleAssignment.objects.create(
+            user=admin, role=UserRole.objects.create(name='Delegate Admin', code='DELEGATE_ADMIN', level=RoleLevel.ADMIN)
+        )
+        self.assertTrue(can_manage_role(admin, self.roles['E'], 'can_modify_permissions'))
+    
+    def test_revoke_assignment_requires_revoke_capability(self):
+        """Test the assignment endpoints check the delegated capability"""
+        admin_role = UserRole.objects.create(name='Delegate Admin', code='DELEGATE_ADMIN', level=RoleLevel.ADMIN)
+        peer = UserRole.objects.create(name='Delegate Peer', code='DELEGATE_PEER', level=RoleLevel.ADMIN)
+        RoleHierarchy.objects.create(parent_role=admin_role, child_role=peer, can_revoke=False)
+        delegate = User.objects.create(username='delegate', email='delegate@example.com')
+        UserRoleAssignment.objects.create(user=delegate, role=admin_role, is_primary=True)
+        member = User.objects.create(username='member', email='member@example.com')
+        self.client.force_authenticate(user=delegate)
+        
+        response = self.client.post('/api/rbac/user-role-assignments/', {'user': member.id, 'role': peer.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        assignment_id = response.json()['data']['id']
+        
+        response = self.client.delete(f'/api/rbac/user-role-assignments/{assignment_id}/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(UserRoleAssignment.objects.get(id=assignment_id).is_active)
+
+
+    def test_edge_overrides_level(self):
+        """Test an edge to a lower-privilege role denies what it does not grant"""
+        admin_role = UserRole.objects.create(name='Delegate Admin', code='DELEGATE_ADMIN', level=RoleLevel.ADMIN)
+        RoleHierarchy.objects.create(parent_role=admin_role, child_role=self.roles['A'], can_revoke=False)
+        delegate = User.objects.create(username='delegate', email='delegate@example.com')
+        UserRoleAssignment.objects.create(user=delegate, role=admin_role, is_primary=True)
+        member = User.objects.create(username='member', email='member@example.com')
+        assignment = UserRoleAssignment.objects.create(user=member, role=self.roles['A'])
+        
+        self.assertFalse(admin_role.can_manage_role(self.roles['A'], 'can_revoke'))
+        self.assertTrue(can_assign_role(delegate, self.roles['A']))
+        # No edge to E: the level rule still applies
+        self.assertTrue(can_manage_role(delegate, self.roles['E'], 'can_revoke'))
+        
+        self.client.force_authenticate(user=delegate)
+        response = self.client.delete(f'/api/rbac/user-role-assignments/{assignment.id}/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(UserRoleAssignment.objects.get(id=assignment.id).is_active)
+
+
+class AuditLogPaginationExportTests(QueryBudgetTestMixin, APITestCase):
+    """Test cases for audit log keyset pagination, date filters and export"""
+    
+    def setUp(self):
+        """Set up audit logs spread over four days, two sharing a timestamp"""
+        self.admin = User.objects.create(username='auditadmin', email='auditadmin@example.com')
+        super_admin = UserRole.objects.create(name='Audit Super Admin', code='AUDIT_SUPER_ADMIN', level=RoleLevel.SUPER_ADMIN)
+        UserRoleAssignment.objects.create(user=self.admin, role=super_admin, is_primary=True)
+        self.client.force_authenticate(user=self.admin)
+        AuditLog.objects.all().delete()
+        
+        self.base = timezone.make_aware(timezone.datetime(2026, 3, 10, 12, 0))
+        # Logs 2 and 3 share a timestamp; the id breaks the tie
+        offsets = [
+            ('CREATE', timedelta(0)), ('UPDATE', timedelta(hours=1)),
+            ('ASSIGN', timedelta(days=1)), ('ASSIGN', timedelta(days=1)),
+            ('REVOKE', timedelta(days=2)), ('DELETE', timedelta(days=3)), ('ASSIGN', timedelta(days=3, hours=1)),
+        ]
+        self.logs = []
+        for i, (action, offset) in enumerate(offsets):
+            performer = User.objects.create(username=f'auditor{i}', email=f'auditor{i}@example.com')
+            log = AuditLog.objects.create(
+                action=action, entity_type='USER_ROLE', entity_id=i,
+                description='=HYPERLINK("x") 0' if i == 0 else f'Change {i}',
+                performed_by=performer, new_values={'step': i, 'name': 'Zoë'},
+            )
+            AuditLog.objects.filter(id=log.id).update(created_at=self.base + offset)
+            self.logs.append(log)
+    
+    def ids(self, response):
+        return [row['id'] for row in response.json()['data']]
+    
+    def test_pages_cover_every_log_once(self):
+        """Test walking pages returns every log once, newest first"""
+        expected = list(AuditLog.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen, cursor = [], None
+        while True:
+            params = {'page_size': 3}
+            if cursor:
+                params['cursor'] = cursor
+            with self.assertQueryBudget(AuditLogListView):
+                response = self.client.get('/api/rbac/audit-logs/', params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(self.ids(response))
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(response.json()['data'][-1]['performed_by_email'], 'auditor0@example.com')
+        
+        response = self.client.get('/api/rbac/audit-logs/', {'limit': 2})
+        self.assertEqual(response.json()['count'], 2)
+        response = self.client.get('/api/rbac/audit-logs/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_filters_and_date_range(self):
+        """Test equality filters combine with inclusive date and datetime ranges"""
+        response = self.client.get('/api/rbac/audit-logs/', {
+            'action': 'ASSIGN', 'start_date': '2026-03-11', 'end_date': '2026-03-11',
+        })
+        self.assertEqual(sorted(self.ids(response)), [self.logs[2].id, self.logs[3].id])
+        
+        response = self.client.get('/api/rbac/audit-logs/', {'start_date': '2026-03-12T00:00:00'})
+        self.assertEqual(len(self.ids(response)), 3)
+        
+        response = self.client.get('/api/rbac/audit-logs/', {'user_id': self.logs[4].performed_by_id})
+        self.assertEqual(self.ids(response), [self.logs[4].id])
+        
+        for params in ({'start_date': '10/03/2026'}, {'user_id': 'me'}):
+            response = self.client.get('/api/rbac/audit-logs/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_filtered_listing_uses_index(self):
+        """Test the action filter and ordering are served by the composite index"""
+        plan = AuditLog.objects.filter(action='ASSIGN').order_by('-created_at', '-id')[:10].explain()
+        self.assertIn('audit_log_action_idx', plan)
+    
+    def test_export_csv(self):
+        """Test the CSV export streams every matching row with a header"""
+        response = self.client.get('/api/rbac/audit-logs/export/csv/', {'end_date': '2026-03-11'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="audit-logs-', response['Content-Disposition'])
+        
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([int(row['id']) for row in rows], [log.id for log in reversed(self.logs[:4])])
+        first = rows[-1]
+        self.assertEqual(first['description'], '\'=HYPERLINK("x") 0')
+        self.assertEqual(json.loads(first['new_values']), {'step': 0, 'name': 'Zoë'})
+        self.assertEqual(first['performed_by_email'], 'auditor0@example.com')
+    
+    def test_export_jsonl(self):
+        """Test the JSON Lines export writes one object per log in constant queries"""
+        with self.assertQueryBudget(AuditLogExportView):
+            response = self.client.get('/api/rbac/audit-logs/export/jsonl/', {'action': 'ASSIGN'})
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['id'] for record in records], [self.logs[6].id, self.logs[3].id, self.logs[2].id])
+        self.assertEqual(records[0]['new_values'], {'step': 6, 'name': 'Zoë'})
+        
+        response = self.client.get('/api/rbac/audit-logs/export/xml/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_export_requires_super_admin(self):
+        """Test admins below super admin cannot export"""
+        user = User.objects.create(username='auditclient', email='auditclient@example.com')
+        UserRoleAssignment.objects.create(
+            user=user, role=UserRole.objects.create(name='Audit Admin', code='AUDIT_ADMIN', level=RoleLevel.ADMIN)
+        )
+        self.client.force_authenticate(user=user)
+        response = self.client.get('/api/rbac/audit-logs/export/csv/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RBACCatalogTests(APITestCase):
+    """Test cases for the versioned app / feature / role catalog"""
+    
+    def setUp(self):
+        """Set up test data"""
+        CatalogService.reset()
+        self.admin = User.objects.create(username='catalogadmin', email='catalogadmin@example.com')
+        self.developer_role = UserRole.objects.create(name='Catalog Dev', code='CATALOG_DEV', level=RoleLevel.DEVELOPER)
+        UserRoleAssignment.objects.create(user=self.admin, role=self.developer_role, is_primary=True)
+        self.client.force_authenticate(user=self.admin)
+        
+        self.app = App.objects.create(name='Catalog App', code='CATALOG_APP', display_order=2)
+        self.first_app = App.objects.create(name='Catalog First', code='CATALOG_FIRST', display_order=1)
+        self.hidden_app = App.objects.create(name='Catalog Hidden', code='CATALOG_HIDDEN', is_active=False)
+        self.feature = Feature.objects.create(app=self.app, name='Catalog Feature', code='CATALOG_FEATURE')
+        Feature.objects.create(app=self.app, name='Catalog Off', code='CATALOG_OFF', is_active=False)
+        self.hidden_feature = Feature.objects.create(app=self.hidden_app, name='Catalog Hidden F', code='CATALOG_HIDDEN_F')
+    
+    def test_endpoint_payload(self):
+        """Test the endpoint lists active apps, their active features and active roles"""
+        response = self.client.get('/api/rbac/all-access-items/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = json.loads(response.content)
+        self.assertTrue(body['success'])
+        data = body['data']
+        
+        apps = {app['app_code']: app for app in data['apps']}
+        self.assertNotIn('CATALOG_HIDDEN', apps)
+        self.assertLess(
+            [app['app_code'] for app in data['apps']].index('CATALOG_FIRST'),
+            [app['app_code'] for app in data['apps']].index('CATALOG_APP'),
+        )
+        self.assertEqual(apps['CATALOG_APP']['features'], [{
+            'feature_id': self.feature.id,
+            'feature_code': 'CATALOG_FEATURE',
+            'feature_name': 'Catalog Feature',
+            'feature_description': self.feature.description,
+            'feature_type': self.feature.feature_type,
+        }])
+        self.assertEqual(data['total_apps'], App.objects.filter(is_active=True).count())
+        self.assertEqual(
+            data['total_features'], Feature.objects.filter(is_active=True, app__is_active=True).count()
+        )
+        self.assertEqual(
+            [role['role_code'] for role in data['roles']],
+            list(UserRole.objects.filter(is_active=True).order_by('level', 'name').values_list('code', flat=True)),
+        )
+    
+    def test_snapshot_reused_until_generation_moves(self):
+        """Test the catalog is loaded once per generation and rebuilt after a change"""
+        catalog = CatalogService.get_catalog()
+        with self.assertNumQueries(0):
+            self.assertIs(CatalogService.get_catalog(), catalog)
+        
+        self.feature.name = 'Catalog Renamed'
+        self.feature.save()
+        with self.assertNumQueries(3):
+            rebuilt = CatalogService.get_catalog()
+        self.assertIsNot(rebuilt, catalog)
+        self.assertIn('Catalog Renamed', [feature.name for feature in rebuilt.features])
+        self.assertIn(b'Catalog Renamed', rebuilt.response_bytes)
+    
+    def test_snapshot_rebuilt_after_max_age(self):
+        """Test a change that bumped no generation is seen once the snapshot is too old"""
+        catalog = CatalogService.get_catalog()
+        Feature.objects.filter(pk=self.feature.pk).update(name='Catalog Updated')
+        self.assertIs(CatalogService.get_catalog(), catalog)
+        
+        later = time.monotonic() + CatalogService.get_max_age()
+        with mock.patch('rbac.catalog.time.monotonic', return_value=later):
+            rebuilt = CatalogService.get_catalog()
+        self.assertIn('Catalog Updated', [feature.name for feature in rebuilt.features])
+    
+    def test_rebuilt_every_call_without_shared_cache(self):
+        """Test the snapshot is not reused when other workers' bumps can't be seen"""
+        with self.settings(CACHE_LOCAL_IS_SHARED=False):
+            CatalogService.get_catalog()
+            Feature.objects.filter(pk=self.feature.pk).update(name='Catalog Elsewhere')
+            with self.assertNumQueries(3):
+                catalog = CatalogService.get_catalog()
+        self.assertIn('Catalog Elsewhere', [feature.name for feature in catalog.features])
+    
+    def test_lookup_maps(self):
+        """Test code -> id maps and their immutability"""
+        catalog = CatalogService.get_catalog()
+        self.assertEqual(catalog.app_ids['CATALOG_APP'], self.app.id)
+        self.assertNotIn('CATALOG_HIDDEN', catalog.app_ids)
+        self.assertEqual(catalog.feature_ids[('CATALOG_APP', 'CATALOG_FEATURE')], self.feature.id)
+        self.assertEqual(catalog.role_ids['CATALOG_DEV'], self.developer_role.id)
+        with self.assertRaises(TypeError):
+            catalog.app_ids['NEW'] = 1
+    
+    def test_developer_permissions_from_catalog(self):
+        """Test a developer's permission listing is built from the catalog"""
+        CatalogService.get_catalog()
+        with self.assertNumQueries(1):
+            permissions = get_user_permissions(self.admin)
+        
+        self.assertTrue(permissions['is_developer'])
+        self.assertEqual(
+            [app['code'] for app in permissions['apps']],
+            list(App.objects.filter(is_active=True).values_list('code', flat=True)),
+        )
+        # Active features of inactive apps are listed too, as before
+        features = {feature['code']: feature for feature in permissions['features']}
+        self.assertEqual(features['CATALOG_HIDDEN_F']['app_code'], 'CATALOG_HIDDEN')
+        self.assertNotIn('CATALOG_OFF', features)
+        self.assertTrue(all(features['CATALOG_FEATURE'][flag] for flag in ('can_view', 'can_create', 'can_update', 'can_delete')))
+    
+    def test_requires_admin(self):
+        """Test non-admins are refused before the catalog is read"""
+        client_user = User.objects.create(username='catalogclient', email='catalogclient@example.com')
+        client_role = UserRole.objects.create(name='Catalog Client', code='CATALOG_CLIENT', level=RoleLevel.CLIENT)
+        UserRoleAssignment.objects.create(user=client_user, role=client_role, is_primary=True)
+        self.client.force_authenticate(user=client_user)
+        
+        response = self.client.get('/api/rbac/all-access-items/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
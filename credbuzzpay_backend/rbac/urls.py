@@ -44,8 +44,11 @@ urlpatterns = [
     
     # Permission Checks
     path('check-permission/', views.CheckPermissionView.as_view(), name='check-permission'),
+    path('check-permissions/', views.BatchCheckPermissionView.as_view(), name='check-permissions'),
     path('my-permissions/', views.MyPermissionsView.as_view(), name='my-permissions'),
+    path('permission-matrix/', views.PermissionMatrixView.as_view(), name='permission-matrix'),
     
     # Audit Logs
     path('audit-logs/', views.AuditLogListView.as_view(), name='audit-log-list'),
+    path('audit-logs/export/<str:export_format>/', views.AuditLogExportView.as_view(), name='audit-log-export'),
 ]
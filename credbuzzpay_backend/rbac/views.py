@@ -2,12 +2,22 @@
 RBAC Views - API views for Role-Based Access Control System
 """
 
+import csv
+import json
+from datetime import datetime, time, timedelta
+
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.utils import encoders
 from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from credbuzzpay_backend.pagination import KeysetPaginator
 
 from .models import (
     UserRole, App, Feature, RoleAppMapping, 
@@ -29,9 +39,16 @@ from .serializers import (
 )
 from .permissions import (
     IsDeveloper, IsSuperAdmin, IsAdmin,
-    has_role_level, get_user_permissions, get_user_level
+    has_role_level, get_user_permissions, get_user_level, can_manage_role, can_assign_role,
+    PermissionSnapshot, get_permission_snapshot
 )
+from .cache import bump_rbac_generation, get_user_access_version
+from .bulk import BulkRBAC
+from .catalog import CatalogService
+from .effective_access import EffectiveAccess
+from .permission_matrix import PERMISSIONS, PermissionMatrixService
 from users_auth.authentication import JWTAuthentication
+from credbuzzpay_backend.conditional import conditional_get
 
 
 def success_response(data=None, message="Success", status_code=status.HTTP_200_OK):
@@ -76,6 +93,7 @@ class UserRoleListView(APIView):
     """List all user roles or create a new role"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 14}
     
     def get(self, request):
         """Get list of all user roles"""
@@ -86,6 +104,7 @@ class UserRoleListView(APIView):
         if level:
             roles = roles.filter(level=level)
         
+        roles = UserRoleListSerializer.setup_eager_loading(roles)
         serializer = UserRoleListSerializer(roles, many=True)
         return success_response(serializer.data)
     
@@ -119,6 +138,7 @@ class UserRoleDetailView(APIView):
     """Get, update, or delete a specific user role"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 8, 'put': 19, 'delete': 8}
     
     def get(self, request, pk):
         """Get a specific role"""
@@ -131,8 +151,7 @@ class UserRoleDetailView(APIView):
         role = get_object_or_404(UserRole, pk=pk)
         
         # Check permission
-        user_level = get_user_level(request.user)
-        if user_level is None or user_level >= role.level:
+        if not can_manage_role(request.user, role, 'can_modify_permissions'):
             return error_response(
                 "You don't have permission to update this role",
                 status_code=status.HTTP_403_FORBIDDEN
@@ -167,8 +186,7 @@ class UserRoleDetailView(APIView):
             )
         
         # Check permission
-        user_level = get_user_level(request.user)
-        if user_level is None or user_level >= role.level:
+        if not can_manage_role(request.user, role, 'can_modify_permissions'):
             return error_response(
                 "You don't have permission to delete this role",
                 status_code=status.HTTP_403_FORBIDDEN
@@ -194,6 +212,7 @@ class AppListView(APIView):
     """List all apps or create a new app"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 12}
     
     def get(self, request):
         """Get list of all apps"""
@@ -206,6 +225,7 @@ class AppListView(APIView):
         elif request.query_params.get('root_only') == 'true':
             apps = apps.filter(parent_app__isnull=True)
         
+        apps = AppListSerializer.setup_eager_loading(apps)
         serializer = AppListSerializer(apps, many=True)
         return success_response(serializer.data)
     
@@ -239,6 +259,7 @@ class AppDetailView(APIView):
     """Get, update, or delete a specific app"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 8, 'put': 19, 'delete': 8}
     
     def get(self, request, pk):
         """Get a specific app"""
@@ -301,6 +322,7 @@ class FeatureListView(APIView):
     """List all features or create a new feature"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 11}
     
     def get(self, request):
         """Get list of all features"""
@@ -315,6 +337,7 @@ class FeatureListView(APIView):
         if app_code:
             features = features.filter(app__code=app_code)
         
+        features = FeatureListSerializer.setup_eager_loading(features)
         serializer = FeatureListSerializer(features, many=True)
         return success_response(serializer.data)
     
@@ -347,6 +370,7 @@ class FeatureDetailView(APIView):
     """Get, update, or delete a specific feature"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 7, 'put': 14, 'delete': 9}
     
     def get(self, request, pk):
         """Get a specific feature"""
@@ -409,6 +433,7 @@ class RoleAppMappingListView(APIView):
     """List all role-app mappings or create a new mapping"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 16}
     
     def get(self, request):
         """Get list of all role-app mappings"""
@@ -424,6 +449,7 @@ class RoleAppMappingListView(APIView):
         if app_id:
             mappings = mappings.filter(app_id=app_id)
         
+        mappings = RoleAppMappingSerializer.setup_eager_loading(mappings)
         serializer = RoleAppMappingSerializer(mappings, many=True)
         return success_response(serializer.data)
     
@@ -456,6 +482,7 @@ class RoleAppMappingDetailView(APIView):
     """Get, update, or delete a specific role-app mapping"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 7, 'put': 16, 'delete': 14}
     
     def get(self, request, pk):
         """Get a specific mapping"""
@@ -518,6 +545,7 @@ class RoleFeatureMappingListView(APIView):
     """List all role-feature mappings or create a new mapping"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 17}
     
     def get(self, request):
         """Get list of all role-feature mappings"""
@@ -538,6 +566,7 @@ class RoleFeatureMappingListView(APIView):
         if app_id:
             mappings = mappings.filter(feature__app_id=app_id)
         
+        mappings = RoleFeatureMappingSerializer.setup_eager_loading(mappings)
         serializer = RoleFeatureMappingSerializer(mappings, many=True)
         return success_response(serializer.data)
     
@@ -570,6 +599,7 @@ class RoleFeatureMappingDetailView(APIView):
     """Get, update, or delete a specific role-feature mapping"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 8, 'put': 17, 'delete': 14}
     
     def get(self, request, pk):
         """Get a specific mapping"""
@@ -632,6 +662,7 @@ class UserRoleAssignmentListView(APIView):
     """List all user role assignments or create a new assignment"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'post': 19}
     
     def get(self, request):
         """Get list of all user role assignments"""
@@ -647,6 +678,7 @@ class UserRoleAssignmentListView(APIView):
         if role_id:
             assignments = assignments.filter(role_id=role_id)
         
+        assignments = UserRoleAssignmentSerializer.setup_eager_loading(assignments)
         serializer = UserRoleAssignmentSerializer(assignments, many=True)
         return success_response(serializer.data)
     
@@ -664,8 +696,7 @@ class UserRoleAssignmentListView(APIView):
         if role_id:
             try:
                 role = UserRole.objects.get(id=role_id)
-                user_level = get_user_level(request.user)
-                if user_level is None or user_level >= role.level:
+                if not can_assign_role(request.user, role):
                     return error_response(
                         "You cannot assign a role with equal or higher privilege than your own",
                         status_code=status.HTTP_403_FORBIDDEN
@@ -694,6 +725,7 @@ class UserRoleAssignmentDetailView(APIView):
     """Get, update, or delete a specific user role assignment"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 8, 'put': 20, 'delete': 16}
     
     def get(self, request, pk):
         """Get a specific assignment"""
@@ -712,8 +744,7 @@ class UserRoleAssignmentDetailView(APIView):
         assignment = get_object_or_404(UserRoleAssignment, pk=pk)
         
         # Check if user can manage this role
-        user_level = get_user_level(request.user)
-        if user_level is None or user_level >= assignment.role.level:
+        if not can_manage_role(request.user, assignment.role, 'can_assign'):
             return error_response(
                 "You cannot modify assignments for roles with equal or higher privilege",
                 status_code=status.HTTP_403_FORBIDDEN
@@ -747,8 +778,7 @@ class UserRoleAssignmentDetailView(APIView):
         assignment = get_object_or_404(UserRoleAssignment, pk=pk)
         
         # Check if user can manage this role
-        user_level = get_user_level(request.user)
-        if user_level is None or user_level >= assignment.role.level:
+        if not can_manage_role(request.user, assignment.role, 'can_revoke'):
             return error_response(
                 "You cannot revoke assignments for roles with equal or higher privilege",
                 status_code=status.HTTP_403_FORBIDDEN
@@ -771,9 +801,16 @@ class UserRoleAssignmentDetailView(APIView):
 # =============================================================================
 
 class BulkRoleAppMappingView(APIView):
-    """Bulk assign apps to a role"""
+    """
+    Bulk assign apps to a role.
+    
+    Existing mappings are updated to the submitted permissions (and
+    reactivated); with "sync": true the role's mappings to apps not listed
+    are deactivated, making its app set exactly app_ids.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 24
     
     def post(self, request):
         """Bulk assign apps to a role"""
@@ -785,46 +822,33 @@ class BulkRoleAppMappingView(APIView):
         
         serializer = BulkRoleAppMappingSerializer(data=request.data)
         if serializer.is_valid():
-            role_id = serializer.validated_data['role_id']
-            app_ids = serializer.validated_data['app_ids']
-            
-            try:
-                role = UserRole.objects.get(id=role_id)
-            except UserRole.DoesNotExist:
-                return error_response("Role not found")
-            
-            created = []
+            data = serializer.validated_data
             with transaction.atomic():
-                for app_id in app_ids:
-                    try:
-                        app = App.objects.get(id=app_id)
-                        mapping, is_new = RoleAppMapping.objects.get_or_create(
-                            role=role,
-                            app=app,
-                            defaults={
-                                'can_view': serializer.validated_data['can_view'],
-                                'can_create': serializer.validated_data['can_create'],
-                                'can_update': serializer.validated_data['can_update'],
-                                'can_delete': serializer.validated_data['can_delete'],
-                                'assigned_by': request.user
-                            }
-                        )
-                        if is_new:
-                            created.append(mapping.id)
-                    except App.DoesNotExist:
-                        continue
+                role = UserRole.objects.select_for_update().filter(id=data['role_id']).first()
+                if role is None:
+                    return error_response("Role not found")
+                result = BulkRBAC.assign_apps(
+                    role, data['app_ids'], data, assigned_by=request.user, sync=data['sync'], request=request
+                )
             
             return success_response(
-                {'created_mappings': created, 'count': len(created)},
-                f"Successfully assigned {len(created)} apps to role"
+                {'created_mappings': result.created_row_ids, 'count': len(result.created), **result.as_dict()},
+                f"Successfully assigned {len(result.created)} apps to role"
             )
         return error_response("Validation failed", serializer.errors)
 
 
 class BulkRoleFeatureMappingView(APIView):
-    """Bulk assign features to a role"""
+    """
+    Bulk assign features to a role.
+    
+    Existing mappings are updated to the submitted permissions (and
+    reactivated); with "sync": true the role's mappings to features not
+    listed are deactivated.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 24
     
     def post(self, request):
         """Bulk assign features to a role"""
@@ -836,46 +860,32 @@ class BulkRoleFeatureMappingView(APIView):
         
         serializer = BulkRoleFeatureMappingSerializer(data=request.data)
         if serializer.is_valid():
-            role_id = serializer.validated_data['role_id']
-            feature_ids = serializer.validated_data['feature_ids']
-            
-            try:
-                role = UserRole.objects.get(id=role_id)
-            except UserRole.DoesNotExist:
-                return error_response("Role not found")
-            
-            created = []
+            data = serializer.validated_data
             with transaction.atomic():
-                for feature_id in feature_ids:
-                    try:
-                        feature = Feature.objects.get(id=feature_id)
-                        mapping, is_new = RoleFeatureMapping.objects.get_or_create(
-                            role=role,
-                            feature=feature,
-                            defaults={
-                                'can_view': serializer.validated_data['can_view'],
-                                'can_create': serializer.validated_data['can_create'],
-                                'can_update': serializer.validated_data['can_update'],
-                                'can_delete': serializer.validated_data['can_delete'],
-                                'assigned_by': request.user
-                            }
-                        )
-                        if is_new:
-                            created.append(mapping.id)
-                    except Feature.DoesNotExist:
-                        continue
+                role = UserRole.objects.select_for_update().filter(id=data['role_id']).first()
+                if role is None:
+                    return error_response("Role not found")
+                result = BulkRBAC.assign_features(
+                    role, data['feature_ids'], data, assigned_by=request.user, sync=data['sync'], request=request
+                )
             
             return success_response(
-                {'created_mappings': created, 'count': len(created)},
-                f"Successfully assigned {len(created)} features to role"
+                {'created_mappings': result.created_row_ids, 'count': len(result.created), **result.as_dict()},
+                f"Successfully assigned {len(result.created)} features to role"
             )
         return error_response("Validation failed", serializer.errors)
 
 
 class BulkUserRoleAssignmentView(APIView):
-    """Bulk assign a role to multiple users"""
+    """
+    Bulk assign a role to multiple users.
+    
+    Inactive assignments are reactivated; with "sync": true the role is
+    deactivated for users not listed.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 26
     
     def post(self, request):
         """Bulk assign a role to multiple users"""
@@ -887,45 +897,27 @@ class BulkUserRoleAssignmentView(APIView):
         
         serializer = BulkUserRoleAssignmentSerializer(data=request.data)
         if serializer.is_valid():
-            user_ids = serializer.validated_data['user_ids']
-            role_id = serializer.validated_data['role_id']
-            is_primary = serializer.validated_data['is_primary']
-            
-            try:
-                role = UserRole.objects.get(id=role_id)
-            except UserRole.DoesNotExist:
-                return error_response("Role not found")
-            
-            # Check if user can assign this role
-            user_level = get_user_level(request.user)
-            if user_level is None or user_level >= role.level:
-                return error_response(
-                    "You cannot assign a role with equal or higher privilege",
-                    status_code=status.HTTP_403_FORBIDDEN
-                )
-            
-            from users_auth.models import User
-            created = []
+            data = serializer.validated_data
             with transaction.atomic():
-                for user_id in user_ids:
-                    try:
-                        user = User.objects.get(id=user_id)
-                        assignment, is_new = UserRoleAssignment.objects.get_or_create(
-                            user=user,
-                            role=role,
-                            defaults={
-                                'is_primary': is_primary,
-                                'assigned_by': request.user
-                            }
-                        )
-                        if is_new:
-                            created.append(assignment.id)
-                    except User.DoesNotExist:
-                        continue
+                role = UserRole.objects.select_for_update().filter(id=data['role_id']).first()
+                if role is None:
+                    return error_response("Role not found")
+                
+                # Check if user can assign this role
+                if not can_assign_role(request.user, role):
+                    return error_response(
+                        "You cannot assign a role with equal or higher privilege",
+                        status_code=status.HTTP_403_FORBIDDEN
+                    )
+                
+                result = BulkRBAC.assign_role(
+                    role, data['user_ids'], is_primary=data['is_primary'],
+                    assigned_by=request.user, sync=data['sync'], request=request
+                )
             
             return success_response(
-                {'created_assignments': created, 'count': len(created)},
-                f"Successfully assigned role to {len(created)} users"
+                {'created_assignments': result.created_row_ids, 'count': len(result.created), **result.as_dict()},
+                f"Successfully assigned role to {len(result.created)} users"
             )
         return error_response("Validation failed", serializer.errors)
 
@@ -938,6 +930,7 @@ class CheckPermissionView(APIView):
     """Check if current user has a specific permission"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         """Check permission"""
@@ -962,57 +955,424 @@ class CheckPermissionView(APIView):
         })
 
 
+class BatchCheckPermissionView(APIView):
+    """
+    Check many permissions of the current user in one call.
+    
+    POST /api/rbac/check-permissions/
+    {
+        "checks": [
+            {"app_code": "BILL_PAY", "permission": "view"},
+            {"app_code": "BILL_PAY", "feature_code": "REFUNDS", "permission": "create"}
+        ]
+    }
+    
+    Each check is evaluated like CheckPermissionView, all of them against one
+    read of the user's effective access; results come back in request order.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    
+    MAX_CHECKS = 500
+    query_budget = 7
+    
+    def post(self, request):
+        """Check permissions"""
+        checks = request.data.get('checks')
+        if not isinstance(checks, list) or not checks:
+            return error_response("checks must be a non-empty list")
+        if len(checks) > self.MAX_CHECKS:
+            return error_response(f"At most {self.MAX_CHECKS} checks per request")
+        
+        errors = {}
+        for index, check in enumerate(checks):
+            if not isinstance(check, dict):
+                errors[index] = "Each check must be an object"
+            elif not all(isinstance(check.get(field), (str, type(None))) for field in ('app_code', 'feature_code')):
+                errors[index] = "app_code and feature_code must be strings or null"
+            elif check.get('permission', 'view') not in PermissionSnapshot.PERMISSIONS:
+                errors[index] = f"permission must be one of: {', '.join(PermissionSnapshot.PERMISSIONS)}"
+        if errors:
+            return error_response("Validation failed", errors)
+        
+        snapshot = get_permission_snapshot(request.user)
+        results = []
+        for check in checks:
+            app_code = check.get('app_code')
+            feature_code = check.get('feature_code')
+            permission = check.get('permission', 'view')
+            results.append({
+                'app_code': app_code,
+                'feature_code': feature_code,
+                'permission': permission,
+                'has_permission': snapshot.check(app_code, feature_code, permission),
+            })
+        
+        return success_response({'results': results, 'count': len(results)})
+
+
+def my_permissions_version(view, request):
+    """Permissions change only with RBAC data or an assignment window"""
+    return (request.user.pk, get_user_access_version(request.user)), None
+
+
 class MyPermissionsView(APIView):
-    """Get all permissions of the current user"""
+    """
+    Get all permissions of the current user.
+    
+    Supports conditional GET: send the ETag back in If-None-Match to get
+    304 Not Modified while nothing changed.
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 8
     
+    @conditional_get(my_permissions_version)
     def get(self, request):
         """Get current user's permissions"""
         permissions = get_user_permissions(request.user)
         return success_response(permissions)
 
 
-# =============================================================================
-# Audit Log Views
-# =============================================================================
-
-class AuditLogListView(APIView):
-    """List audit logs"""
+class PermissionMatrixView(APIView):
+    """
+    Bulk authorization queries against the compiled permission matrix.
+    
+    GET /api/rbac/permission-matrix/?feature_id=12&permission=update
+    GET /api/rbac/permission-matrix/?app_code=BILL_PAY
+        Users holding a permission on a feature or app
+    
+    POST /api/rbac/permission-matrix/
+        {"user_ids": [1, 2, ...], "permission": "view"}
+        Apps and features each of the users holds the permission on
+    """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
     
-    def get(self, request):
-        """Get list of audit logs"""
+    MAX_USERS = 10000
+    query_budget = 12
+    
+    def _forbidden(self, request):
         if not has_role_level(request.user, RoleLevel.SUPER_ADMIN):
             return error_response(
-                "You don't have permission to view audit logs",
+                "You don't have permission to query the permission matrix",
                 status_code=status.HTTP_403_FORBIDDEN
             )
+        return None
+    
+    def _matrix_info(self, matrix):
+        users, roles, apps, features = matrix.shape
+        return {
+            'generation': matrix.generation,
+            'built_at': matrix.built_at.isoformat(),
+            'users': users,
+            'roles': roles,
+            'apps': apps,
+            'features': features,
+        }
+    
+    def get(self, request):
+        """Get the users holding a permission on one app or feature"""
+        forbidden = self._forbidden(request)
+        if forbidden:
+            return forbidden
+        
+        permission = request.query_params.get('permission', 'view')
+        if permission not in PERMISSIONS:
+            return error_response(f"permission must be one of: {', '.join(PERMISSIONS)}")
+        
+        feature_id = request.query_params.get('feature_id')
+        app_id = request.query_params.get('app_id')
+        feature_code = request.query_params.get('feature_code')
+        app_code = request.query_params.get('app_code')
+        
+        if feature_code:
+            features = Feature.objects.filter(code=feature_code)
+            if app_code:
+                features = features.filter(app__code=app_code)
+            feature_id = features.values_list('id', flat=True).first()
+            if feature_id is None:
+                return error_response("Feature not found", status_code=status.HTTP_404_NOT_FOUND)
+        elif app_code:
+            app_id = App.objects.filter(code=app_code).values_list('id', flat=True).first()
+            if app_id is None:
+                return error_response("App not found", status_code=status.HTTP_404_NOT_FOUND)
+        
+        try:
+            feature_id = int(feature_id) if feature_id else None
+            app_id = int(app_id) if app_id else None
+        except ValueError:
+            return error_response("feature_id and app_id must be integers")
+        
+        matrix = PermissionMatrixService.get_matrix()
+        if feature_id:
+            user_ids = matrix.users_with_feature(feature_id, permission)
+        elif app_id:
+            user_ids = matrix.users_with_app(app_id, permission)
+        else:
+            return error_response("Provide feature_id, app_id, feature_code or app_code")
+        
+        return success_response({
+            'app_id': app_id,
+            'feature_id': feature_id,
+            'permission': permission,
+            'count': len(user_ids),
+            'user_ids': user_ids,
+            'matrix': self._matrix_info(matrix),
+        })
+    
+    def post(self, request):
+        """Get the apps and features held by each of a batch of users"""
+        forbidden = self._forbidden(request)
+        if forbidden:
+            return forbidden
+        
+        permission = request.data.get('permission', 'view')
+        if permission not in PERMISSIONS:
+            return error_response(f"permission must be one of: {', '.join(PERMISSIONS)}")
+        
+        user_ids = request.data.get('user_ids')
+        if not isinstance(user_ids, list) or not all(isinstance(pk, int) for pk in user_ids):
+            return error_response("user_ids must be a list of integers")
+        if len(user_ids) > self.MAX_USERS:
+            return error_response(f"At most {self.MAX_USERS} users per request")
+        
+        matrix = PermissionMatrixService.get_matrix()
+        apps = matrix.apps_for_users(user_ids, permission)
+        features = matrix.features_for_users(user_ids, permission)
         
+        return success_response({
+            'permission': permission,
+            'users': {
+                str(user_id): {'app_ids': apps[user_id], 'feature_ids': features[user_id]}
+                for user_id in apps
+            },
+            'matrix': self._matrix_info(matrix),
+        })
+
+
+# =============================================================================
+# Audit Log Views
+# =============================================================================
+
+class AuditLogQueryMixin:
+    """
+    Filters shared by the audit log list and export.
+    
+    Query params:
+    - action, entity_type, user_id: Equality filters, each backed by an
+      index on (filter, created_at, id)
+    - start_date, end_date: Inclusive range on created_at, as a date
+      (YYYY-MM-DD, whole days) or an ISO 8601 datetime
+    """
+    
+    def parse_bound(self, value, end=False):
+        """Turn a start_date / end_date param into (datetime, inclusive)"""
+        try:
+            day = parse_date(value)
+            moment = None if day else parse_datetime(value)
+        except ValueError:
+            day = moment = None
+        if day is not None:
+            if end:
+                # Up to, not including, midnight after the last day
+                return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min)), False
+            return timezone.make_aware(datetime.combine(day, time.min)), True
+        if moment is None:
+            raise ValueError(f"Invalid date: {value}")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment, True
+    
+    def get_queryset(self, request):
+        """
+        Build the filtered audit log queryset from the query params.
+        
+        Raises:
+            ValueError: If a date or user_id is malformed
+        """
         logs = AuditLog.objects.all()
         
-        # Filter by action
         action = request.query_params.get('action')
         if action:
             logs = logs.filter(action=action)
         
-        # Filter by entity type
         entity_type = request.query_params.get('entity_type')
         if entity_type:
             logs = logs.filter(entity_type=entity_type)
         
-        # Filter by user
         user_id = request.query_params.get('user_id')
         if user_id:
+            if not user_id.isdigit():
+                raise ValueError(f"Invalid user_id: {user_id}")
             logs = logs.filter(performed_by_id=user_id)
         
-        # Limit results
-        limit = int(request.query_params.get('limit', 100))
-        logs = logs[:limit]
+        # Ranges on the column itself (not created_at__date) so the indexes apply
+        start_date = request.query_params.get('start_date')
+        if start_date:
+            moment, _ = self.parse_bound(start_date)
+            logs = logs.filter(created_at__gte=moment)
         
-        serializer = AuditLogSerializer(logs, many=True)
-        return success_response(serializer.data)
+        end_date = request.query_params.get('end_date')
+        if end_date:
+            moment, inclusive = self.parse_bound(end_date, end=True)
+            logs = logs.filter(**{'created_at__lte' if inclusive else 'created_at__lt': moment})
+        
+        return logs
+
+
+class AuditLogListView(AuditLogQueryMixin, APIView):
+    """
+    List audit logs, newest first, one page at a time (keyset pagination
+    on created_at, id).
+    
+    Query params (besides the AuditLogQueryMixin filters):
+    - page_size: Logs per page (default 100, max 500); `limit` is accepted
+      as an alias
+    - cursor: next_cursor from the previous page
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 6
+    
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 500
+    
+    paginator = KeysetPaginator('created_at')
+    
+    def get(self, request):
+        """Get a page of audit logs"""
+        if not has_role_level(request.user, RoleLevel.SUPER_ADMIN):
+            return error_response(
+                "You don't have permission to view audit logs",
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            page_size = int(request.query_params.get(
+                'page_size', request.query_params.get('limit', self.DEFAULT_PAGE_SIZE)
+            ))
+        except ValueError:
+            page_size = self.DEFAULT_PAGE_SIZE
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        
+        try:
+            logs = self.get_queryset(request).select_related('performed_by')
+            page, next_cursor = self.paginator.page(logs, page_size, request.query_params.get('cursor'))
+        except ValueError as exc:
+            return error_response(str(exc))
+        
+        return Response({
+            'success': True,
+            'message': 'Success',
+            'data': AuditLogSerializer(page, many=True).data,
+            'count': len(page),
+            'next_cursor': next_cursor,
+        }, status=status.HTTP_200_OK)
+
+
+class _Echo:
+    """File-like object handing csv.writer rows straight back"""
+    
+    def write(self, value):
+        return value
+
+
+class AuditLogExportView(AuditLogQueryMixin, APIView):
+    """
+    Stream every matching audit log as CSV or JSON Lines, newest first.
+    
+    GET /api/rbac/audit-logs/export/csv/
+    GET /api/rbac/audit-logs/export/jsonl/
+    
+    Takes the AuditLogQueryMixin filters. Rows are read with
+    QuerySet.iterator() - a server-side cursor on PostgreSQL - and written
+    as they arrive, so memory stays constant however many rows match.
+    Behind a transaction-pooling PgBouncer, set
+    DISABLE_SERVER_SIDE_CURSORS and rows are fetched in chunks instead.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 6
+    
+    CHUNK_SIZE = 2000
+    
+    # (column name, values() lookup)
+    COLUMNS = (
+        ('id', 'id'),
+        ('uuid', 'uuid'),
+        ('created_at', 'created_at'),
+        ('action', 'action'),
+        ('entity_type', 'entity_type'),
+        ('entity_id', 'entity_id'),
+        ('entity_uuid', 'entity_uuid'),
+        ('description', 'description'),
+        ('performed_by', 'performed_by_id'),
+        ('performed_by_email', 'performed_by__email'),
+        ('ip_address', 'ip_address'),
+        ('user_agent', 'user_agent'),
+        ('old_values', 'old_values'),
+        ('new_values', 'new_values'),
+    )
+    
+    CONTENT_TYPES = {
+        'csv': 'text/csv; charset=utf-8',
+        'jsonl': 'application/x-ndjson',
+    }
+    
+    def get(self, request, export_format):
+        """Stream the export"""
+        if not has_role_level(request.user, RoleLevel.SUPER_ADMIN):
+            return error_response(
+                "You don't have permission to export audit logs",
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+        
+        if export_format not in self.CONTENT_TYPES:
+            return error_response(
+                f"Unsupported export format: {export_format}",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            logs = self.get_queryset(request)
+        except ValueError as exc:
+            return error_response(str(exc))
+        
+        rows = logs.order_by('-created_at', '-id').values_list(
+            *(lookup for _, lookup in self.COLUMNS)
+        ).iterator(chunk_size=self.CHUNK_SIZE)
+        stream = self.stream_csv(rows) if export_format == 'csv' else self.stream_jsonl(rows)
+        
+        response = StreamingHttpResponse(stream, content_type=self.CONTENT_TYPES[export_format])
+        filename = f"audit-logs-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    @staticmethod
+    def csv_cell(value):
+        """Render a value as a CSV cell"""
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, cls=encoders.JSONEncoder, ensure_ascii=False)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        # Keep spreadsheets from evaluating user-supplied text as a formula
+        if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+            return "'" + value
+        return str(value)
+    
+    def stream_csv(self, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow([name for name, _ in self.COLUMNS])
+        for row in rows:
+            yield writer.writerow([self.csv_cell(value) for value in row])
+    
+    def stream_jsonl(self, rows):
+        names = [name for name, _ in self.COLUMNS]
+        for row in rows:
+            yield json.dumps(dict(zip(names, row)), cls=encoders.JSONEncoder, ensure_ascii=False) + '\n'
 
 
 # =============================================================================
@@ -1023,6 +1383,7 @@ class InitializeDefaultRolesView(APIView):
     """Initialize default system roles"""
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 25
     
     def post(self, request):
         """Create default system roles if they don't exist"""
@@ -1101,6 +1462,7 @@ class UserAccessOverviewView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 9
     
     def get(self, request, user_id):
         """Get complete access overview for a user"""
@@ -1127,53 +1489,42 @@ class UserAccessOverviewView(APIView):
             is_active=True
         ).select_related('role')
         
-        # Get all accessible apps and features based on roles
+        # Apps and features from the materialized projection, one row per granting role
         accessible_apps = []
         accessible_features = []
-        
-        for assignment in role_assignments:
-            role = assignment.role
-            
-            # Get role's app mappings
-            app_mappings = RoleAppMapping.objects.filter(
-                role=role,
-                is_active=True
-            ).select_related('app')
-            
-            for mapping in app_mappings:
-                app_data = {
-                    'app_id': mapping.app.id,
-                    'app_code': mapping.app.code,
-                    'app_name': mapping.app.name,
-                    'can_view': mapping.can_view,
-                    'can_create': mapping.can_create,
-                    'can_update': mapping.can_update,
-                    'can_delete': mapping.can_delete,
-                    'assigned_via_role': role.name,
-                }
-                if app_data not in accessible_apps:
-                    accessible_apps.append(app_data)
+        seen = set()
+        
+        for entry in EffectiveAccess.for_user(user):
+            key = (entry.app_id, entry.feature_id, entry.role_id, entry.can_view,
+                   entry.can_create, entry.can_update, entry.can_delete)
+            if key in seen:
+                continue
+            seen.add(key)
             
-            # Get role's feature mappings
-            feature_mappings = RoleFeatureMapping.objects.filter(
-                role=role,
-                is_active=True
-            ).select_related('feature', 'feature__app')
-            
-            for mapping in feature_mappings:
-                feature_data = {
-                    'feature_id': mapping.feature.id,
-                    'feature_code': mapping.feature.code,
-                    'feature_name': mapping.feature.name,
-                    'app_code': mapping.feature.app.code,
-                    'app_name': mapping.feature.app.name,
-                    'can_execute': mapping.can_execute,
-                    'can_view': mapping.can_view,
-                    'can_edit': mapping.can_edit,
-                    'assigned_via_role': role.name,
-                }
-                if feature_data not in accessible_features:
-                    accessible_features.append(feature_data)
+            permissions = {
+                'can_view': entry.can_view,
+                'can_create': entry.can_create,
+                'can_update': entry.can_update,
+                'can_delete': entry.can_delete,
+            }
+            if entry.feature_id is None:
+                accessible_apps.append({
+                    'app_id': entry.app.id,
+                    'app_code': entry.app.code,
+                    'app_name': entry.app.name,
+                    **permissions,
+                    'assigned_via_role': entry.role.name,
+                })
+            else:
+                accessible_features.append({
+                    'feature_id': entry.feature.id,
+                    'feature_code': entry.feature.code,
+                    'feature_name': entry.feature.name,
+                    'app_code': entry.app.code,
+                    'app_name': entry.app.name,
+                    **permissions,
+                    'assigned_via_role': entry.role.name,
+                })
         
         # Get KYC status if exists
         kyc_status = None
@@ -1206,7 +1557,7 @@ class UserAccessOverviewView(APIView):
                 'role_code': a.role.code,
                 'role_name': a.role.name,
                 'role_level': a.role.level,
-                'assigned_at': a.assigned_at.isoformat() if a.assigned_at else None,
+                'assigned_at': a.created_at.isoformat() if a.created_at else None,
             } for a in role_assignments],
             'apps': accessible_apps,
             'features': accessible_features,
@@ -1230,6 +1581,7 @@ class AssignAccessToUserView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 50
     
     def post(self, request, user_id):
         """Assign access to a user"""
@@ -1270,8 +1622,7 @@ class AssignAccessToUserView(APIView):
             )
         
         # Check if requesting user can assign this role (hierarchy check)
-        user_level = get_user_level(request.user)
-        if user_level >= role.level:
+        if not can_assign_role(request.user, role):
             return error_response(
                 f"You cannot assign a role equal to or higher than your own",
                 status_code=status.HTTP_403_FORBIDDEN
@@ -1293,48 +1644,27 @@ class AssignAccessToUserView(APIView):
                 target_user.user_role = role.code
                 target_user.save(update_fields=['user_role'])
             
-            # If specific apps are provided, create app mappings
+            # If specific apps are provided, create app mappings (unknown codes are skipped)
             apps_assigned = []
             if app_codes:
-                for app_code in app_codes:
-                    try:
-                        app = App.objects.get(code=app_code, is_active=True)
-                        mapping, _ = RoleAppMapping.objects.update_or_create(
-                            role=role,
-                            app=app,
-                            defaults={
-                                'is_active': True,
-                                'can_view': True,
-                                'can_create': True,
-                                'can_update': True,
-                                'can_delete': True,
-                                'assigned_by': request.user,
-                            }
-                        )
-                        apps_assigned.append(app.name)
-                    except App.DoesNotExist:
-                        pass
+                apps = list(App.objects.filter(code__in=app_codes, is_active=True).values_list('id', 'name'))
+                BulkRBAC.assign_apps(
+                    role, [app_id for app_id, _ in apps],
+                    {'can_view': True, 'can_create': True, 'can_update': True, 'can_delete': True},
+                    assigned_by=request.user, request=request,
+                )
+                apps_assigned = [name for _, name in apps]
             
             # If specific features are provided, create feature mappings
             features_assigned = []
             if feature_codes:
-                for feature_code in feature_codes:
-                    try:
-                        feature = Feature.objects.get(code=feature_code, is_active=True)
-                        mapping, _ = RoleFeatureMapping.objects.update_or_create(
-                            role=role,
-                            feature=feature,
-                            defaults={
-                                'is_active': True,
-                                'can_execute': True,
-                                'can_view': True,
-                                'can_edit': True,
-                                'assigned_by': request.user,
-                            }
-                        )
-                        features_assigned.append(feature.name)
-                    except Feature.DoesNotExist:
-                        pass
+                features = list(Feature.objects.filter(code__in=feature_codes, is_active=True).values_list('id', 'name'))
+                BulkRBAC.assign_features(
+                    role, [feature_id for feature_id, _ in features],
+                    {'can_view': True, 'can_create': True, 'can_update': True, 'can_delete': False},
+                    assigned_by=request.user, request=request,
+                )
+                features_assigned = [name for _, name in features]
             
             # Log audit
             log_audit(
@@ -1376,6 +1706,7 @@ class RevokeAccessFromUserView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 28
     
     def post(self, request, user_id):
         """Revoke access from a user"""
@@ -1413,10 +1744,15 @@ class RevokeAccessFromUserView(APIView):
                 assignments = UserRoleAssignment.objects.filter(
                     user=target_user,
                     is_active=True
-                )
+                ).select_related('role')
+                revoked_assignment_ids = []
                 for assignment in assignments:
                     revoked_items['roles'].append(assignment.role.name)
-                assignments.update(is_active=False)
+                    revoked_assignment_ids.append(assignment.id)
+                UserRoleAssignment.objects.filter(id__in=revoked_assignment_ids).update(
+                    is_active=False, updated_at=timezone.now()
+                )
+                EffectiveAccess.refresh_assignments(revoked_assignment_ids)
                 
                 # Reset user to END_USER
                 target_user.user_role = 'END_USER'
@@ -1450,48 +1786,43 @@ class RevokeAccessFromUserView(APIView):
                 except UserRole.DoesNotExist:
                     pass
             
+            # Find user's roles and remove app / feature access from them
+            if app_codes or feature_codes:
+                user_roles = list(UserRoleAssignment.objects.filter(
+                    user=target_user,
+                    is_active=True
+                ).values_list('role_id', flat=True))
+            
             # Revoke specific apps (from role mappings)
             if app_codes:
-                for app_code in app_codes:
-                    try:
-                        app = App.objects.get(code=app_code)
-                        # Find user's roles and remove app access
-                        user_roles = UserRoleAssignment.objects.filter(
-                            user=target_user,
-                            is_active=True
-                        ).values_list('role_id', flat=True)
-                        
-                        mappings = RoleAppMapping.objects.filter(
-                            role_id__in=user_roles,
-                            app=app,
-                            is_active=True
-                        )
-                        for mapping in mappings:
-                            revoked_items['apps'].append(app.name)
-                        mappings.update(is_active=False)
-                    except App.DoesNotExist:
-                        pass
+                mappings = RoleAppMapping.objects.filter(
+                    role_id__in=user_roles,
+                    app__code__in=app_codes,
+                    is_active=True
+                ).select_related('app')
+                mapping_ids = []
+                for mapping in mappings:
+                    revoked_items['apps'].append(mapping.app.name)
+                    mapping_ids.append(mapping.id)
+                RoleAppMapping.objects.filter(id__in=mapping_ids).update(is_active=False, updated_at=timezone.now())
+                EffectiveAccess.refresh_app_mappings(mapping_ids)
             
             # Revoke specific features
             if feature_codes:
-                for feature_code in feature_codes:
-                    try:
-                        feature = Feature.objects.get(code=feature_code)
-                        user_roles = UserRoleAssignment.objects.filter(
-                            user=target_user,
-                            is_active=True
-                        ).values_list('role_id', flat=True)
-                        
-                        mappings = RoleFeatureMapping.objects.filter(
-                            role_id__in=user_roles,
-                            feature=feature,
-                            is_active=True
-                        )
-                        for mapping in mappings:
-                            revoked_items['features'].append(feature.name)
-                        mappings.update(is_active=False)
-                    except Feature.DoesNotExist:
-                        pass
+                mappings = RoleFeatureMapping.objects.filter(
+                    role_id__in=user_roles,
+                    feature__code__in=feature_codes,
+                    is_active=True
+                ).select_related('feature')
+                mapping_ids = []
+                for mapping in mappings:
+                    revoked_items['features'].append(mapping.feature.name)
+                    mapping_ids.append(mapping.id)
+                RoleFeatureMapping.objects.filter(id__in=mapping_ids).update(is_active=False, updated_at=timezone.now())
+                EffectiveAccess.refresh_feature_mappings(mapping_ids)
+            
+            # Queryset updates above bypass model signals
+            bump_rbac_generation()
             
             # Log audit
             log_audit(
@@ -1520,6 +1851,7 @@ class AllAppsAndFeaturesView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 8
     
     def get(self, request):
         """Get all apps and features"""
@@ -1530,40 +1862,5 @@ class AllAppsAndFeaturesView(APIView):
                 status_code=status.HTTP_403_FORBIDDEN
             )
         
-        apps = App.objects.filter(is_active=True).prefetch_related('features')
-        
-        result = []
-        for app in apps:
-            features = app.features.filter(is_active=True)
-            result.append({
-                'app_id': app.id,
-                'app_code': app.code,
-                'app_name': app.name,
-                'app_description': app.description,
-                'app_icon': app.icon,
-                'features': [{
-                    'feature_id': f.id,
-                    'feature_code': f.code,
-                    'feature_name': f.name,
-                    'feature_description': f.description,
-                    'feature_type': f.feature_type,
-                } for f in features]
-            })
-        
-        # Get all roles
-        roles = UserRole.objects.filter(is_active=True).order_by('level')
-        roles_data = [{
-            'role_id': r.id,
-            'role_code': r.code,
-            'role_name': r.name,
-            'role_level': r.level,
-            'is_system_role': r.is_system_role,
-        } for r in roles]
-        
-        return success_response({
-            'apps': result,
-            'roles': roles_data,
-            'total_apps': len(result),
-            'total_features': sum(len(app['features']) for app in result),
-            'total_roles': len(roles_data),
-        })
+        # Built once per RBAC generation, served as pre-rendered bytes
+        return HttpResponse(CatalogService.get_catalog().response_bytes, content_type='application/json')
@@ -0,0 +1,357 @@
+"""
+Buffered, batched writer for UserActivityLog
+
+UserActivityLog.log_activity no longer inserts a row inside the request:
+- the entry is queued in memory once the surrounding transaction commits
+  (so entries of rolled-back work are dropped, as before)
+- every queued entry is also appended to a per-process spool file, so
+  entries survive a worker that is killed before it flushes
+- the queue is written with one bulk_create after a response once
+  ACTIVITY_LOG_BATCH_SIZE entries are pending or ACTIVITY_LOG_FLUSH_SECONDS
+  have passed, and when the worker exits
+
+A flush inserts its whole batch in one transaction and then deletes the
+spool files it covered. Spool files left by dead workers are loaded with the
+replay_activity_spool management command:
+
+- each worker holds an exclusive lock on its spool files until it deletes
+  them, so a file is orphaned exactly when nobody holds its lock (process
+  IDs are reused, notably across container restarts); file names carry a
+  random token so a new process never appends to a dead one's file
+- a worker killed between its insert and the delete leaves a spool whose
+  entries are already stored, so replay skips entries already present
+  (same user, activity, action and event time)
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to checking the owner's PID
+    fcntl = None
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityLogBuffer:
+    """
+    Process-wide queue of activity log entries backed by a spool file.
+    Entries are plain dicts of UserActivityLog field attnames.
+    """
+
+    SPOOL_PREFIX = 'activity'
+
+    _pending = []
+    _spool_paths = []
+    # Open, locked spool files by path, kept until the file is deleted
+    _spool_files = {}
+    _spool = None
+    _spool_seq = 0
+    _spool_token = uuid.uuid4().hex[:12]
+    _lock = threading.Lock()
+    _last_flush = time.monotonic()
+
+    @staticmethod
+    def is_enabled():
+        """Check if activity logs are buffered (False writes every entry inline)"""
+        return getattr(settings, 'ACTIVITY_LOG_BUFFERED', False)
+
+    @staticmethod
+    def get_batch_size():
+        """Get the number of pending entries that triggers a flush"""
+        return getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 200)
+
+    @staticmethod
+    def get_flush_interval():
+        """Get the maximum time an entry waits in the queue in seconds"""
+        return getattr(settings, 'ACTIVITY_LOG_FLUSH_SECONDS', 5)
+
+    @staticmethod
+    def get_spool_dir():
+        """Get the directory holding spool files"""
+        return getattr(settings, 'ACTIVITY_LOG_SPOOL_DIR')
+
+    @classmethod
+    def enqueue(cls, entry):
+        """
+        Queue an unsaved UserActivityLog once the current transaction commits.
+        """
+        record = {
+            field.attname: getattr(entry, field.attname)
+            for field in entry._meta.concrete_fields
+            if not field.primary_key
+        }
+        transaction.on_commit(lambda: cls._append(record))
+
+    @classmethod
+    def _append(cls, record):
+        with cls._lock:
+            try:
+                cls._write_spool(record)
+            except OSError as e:
+                # Still queued in memory; only crash safety is lost
+                logger.error(f"Failed to spool activity log entry: {str(e)}")
+            cls._pending.append(record)
+
+    @classmethod
+    def _write_spool(cls, record):
+        """Append record to this process's current spool file (lock held)"""
+        if cls._spool is None:
+            spool_dir = cls.get_spool_dir()
+            os.makedirs(spool_dir, exist_ok=True)
+            cls._spool_seq += 1
+            path = os.path.join(
+                spool_dir, f"{cls.SPOOL_PREFIX}-{os.getpid()}-{cls._spool_token}-{cls._spool_seq}.jsonl"
+            )
+            spool = open(path, 'x', encoding='utf-8')
+            _lock(spool)
+            cls._spool = spool
+            cls._spool_files[path] = spool
+            cls._spool_paths.append(path)
+        cls._spool.write(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+        cls._spool.flush()
+
+    @classmethod
+    def _close_spool(cls):
+        """Start a new spool file for later entries; the current one stays locked until deleted"""
+        cls._spool = None
+
+    @classmethod
+    def flush_if_due(cls):
+        """Flush if the batch is full or the flush interval has passed"""
+        with cls._lock:
+            due = cls._pending and (
+                len(cls._pending) >= cls.get_batch_size()
+                or time.monotonic() - cls._last_flush >= cls.get_flush_interval()
+            )
+        # Never write from inside someone else's transaction
+        if not due or connection.in_atomic_block:
+            return 0
+        try:
+            return cls.flush()
+        except Exception as e:
+            # Entries were re-queued and are still spooled; the next flush retries them
+            logger.error(f"Failed to flush activity logs: {str(e)}")
+            return 0
+
+    @classmethod
+    def flush(cls):
+        """
+        Write all pending entries with bulk_create and delete their spool files.
+
+        Returns:
+            int: Number of rows inserted
+        """
+        with cls._lock:
+            pending, cls._pending = cls._pending, []
+            spool_paths, cls._spool_paths = cls._spool_paths, []
+            cls._close_spool()
+            cls._last_flush = time.monotonic()
+
+        if not pending:
+            cls._remove(spool_paths)
+            return 0
+
+        try:
+            # All or nothing, so a retried batch is never inserted twice
+            with transaction.atomic(savepoint=False):
+                created = cls.write(pending)
+        except Exception:
+            with cls._lock:
+                cls._pending[:0] = pending
+                cls._spool_paths[:0] = spool_paths
+            raise
+
+        cls._remove(spool_paths)
+        return created
+
+    @classmethod
+    def write(cls, records):
+        """
+        Insert records, skipping entries whose user has since been deleted.
+
+        Returns:
+            int: Number of rows inserted
+        """
+        from .models import User, UserActivityLog
+
+        user_ids = set(
+            User.objects.filter(pk__in={r['user_id'] for r in records}).values_list('pk', flat=True)
+        )
+        entries = [UserActivityLog(**r) for r in records if r['user_id'] in user_ids]
+        UserActivityLog.objects.bulk_create(entries, batch_size=cls.get_batch_size())
+        return len(entries)
+
+    @classmethod
+    def _remove(cls, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            # Unlock only once the file is gone, so a replay can't claim it in between
+            spool = cls._spool_files.pop(path, None)
+            if spool is not None:
+                spool.close()
+
+    @classmethod
+    def skip_stored(cls, records):
+        """
+        Drop records already inserted by an earlier flush or replay.
+
+        Spooled event times are rounded to milliseconds by the JSON encoder,
+        so stored rows are compared at that precision.
+        """
+        from .models import UserActivityLog
+
+        if not records:
+            return []
+
+        def identity(user_id, activity_type, action, created_at):
+            return (user_id, activity_type, action, created_at.replace(microsecond=created_at.microsecond // 1000 * 1000))
+
+        times = [r['created_at'] for r in records]
+        stored = Counter(
+            identity(*row) for row in UserActivityLog.objects.filter(
+                user_id__in={r['user_id'] for r in records},
+                created_at__gte=min(times),
+                created_at__lt=max(times) + timedelta(milliseconds=1),
+            ).values_list('user_id', 'activity_type', 'action', 'created_at')
+        )
+        fresh = []
+        for record in records:
+            key = identity(record['user_id'], record['activity_type'], record['action'], record['created_at'])
+            if stored[key]:
+                stored[key] -= 1
+            else:
+                fresh.append(record)
+        return fresh
+
+    @classmethod
+    def replay_spool(cls, path, dry_run=False):
+        """
+        Insert the entries of an orphaned spool file and delete it. Entries
+        already stored are skipped, so replaying a file twice is harmless.
+
+        Returns:
+            int: Number of rows inserted (or that would be), None if the file
+            is owned by a running process or already gone
+        """
+        spool = _claim(path)
+        if spool is None:
+            return None
+        try:
+            records = cls.read_spool(path)
+            if dry_run:
+                return len(cls.skip_stored(records))
+            with transaction.atomic():
+                inserted = cls.write(cls.skip_stored(records)) if records else 0
+            os.remove(path)
+            return inserted
+        finally:
+            spool.close()
+
+    @classmethod
+    def read_spool(cls, path):
+        """
+        Load the records of a spool file. A line cut short by a killed
+        worker is skipped.
+        """
+        records = []
+        with open(path, encoding='utf-8') as spool:
+            for line in spool:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping truncated activity spool line in {path}")
+                    continue
+                record['created_at'] = parse_datetime(record['created_at'])
+                records.append(record)
+        return records
+
+    @classmethod
+    def orphaned_spools(cls):
+        """Get spool files whose owning process is no longer running"""
+        spool_dir = cls.get_spool_dir()
+        if not os.path.isdir(spool_dir):
+            return []
+
+        paths = []
+        for name in sorted(os.listdir(spool_dir)):
+            parts = name.split('-')
+            if len(parts) != 4 or parts[0] != cls.SPOOL_PREFIX or not name.endswith('.jsonl'):
+                continue
+            path = os.path.join(spool_dir, name)
+            if path in cls._spool_files:
+                continue
+            spool = _claim(path)
+            if spool is not None:
+                spool.close()
+                paths.append(path)
+        return paths
+
+
+def _lock(spool):
+    """Take the spool file's lock without waiting; raises BlockingIOError if held"""
+    if fcntl is not None:
+        fcntl.flock(spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _claim(path):
+    """
+    Open and lock a spool file nobody else holds.
+
+    Returns:
+        The open file, or None if its owner is alive or it was deleted
+    """
+    if fcntl is None:
+        if _process_alive(int(os.path.basename(path).split('-')[1])):
+            return None
+    try:
+        spool = open(path, encoding='utf-8')
+    except FileNotFoundError:
+        return None
+    try:
+        _lock(spool)
+        # The owner deletes the file before unlocking it: make sure it is still there
+        if os.fstat(spool.fileno()).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except (BlockingIOError, FileNotFoundError):
+        spool.close()
+        return None
+    return spool
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _flush_on_exit():
+    """Flush when a worker is recycled; anything unwritten stays spooled"""
+    try:
+        ActivityLogBuffer.flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_on_exit)
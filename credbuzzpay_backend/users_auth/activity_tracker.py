@@ -0,0 +1,189 @@
+"""
+Write-behind tracking of UserSession.last_activity
+
+Authenticated requests record a heartbeat instead of issuing an UPDATE:
+- the heartbeat is written to the shared cache immediately, so inactivity
+  checks on any worker see the freshest value
+- the worker also keeps the latest heartbeat per session in memory and
+  flushes them to the database in one bulk UPDATE once
+  JWT_ACTIVITY_FLUSH_SECONDS have passed: on the next heartbeat or request
+  after that, or from a timer armed with the first pending heartbeat, so an
+  idle worker flushes too
+
+The database value therefore lags real activity by at most about one flush
+window. A worker that can't see the heartbeat (process-local cache, or a
+lost cache entry) reads the database value, so a session can expire there
+up to one flush window early. Setting JWT_ACTIVITY_FLUSH_SECONDS to 0 makes
+every heartbeat write through.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import Case, When, Value, DateTimeField
+
+logger = logging.getLogger(__name__)
+
+
+class SessionActivityTracker:
+    """
+    Coalesces session heartbeats and flushes them to the database in batches.
+    Sessions are identified by their token_id (the refresh token jti).
+    """
+
+    KEY_PREFIX = 'auth:activity'
+
+    _pending = {}
+    _lock = threading.Lock()
+    _last_flush = time.monotonic()
+    _timer = None
+
+    @staticmethod
+    def get_flush_interval():
+        """Get the write-behind flush window in seconds"""
+        return getattr(settings, 'JWT_ACTIVITY_FLUSH_SECONDS', 60)
+
+    @staticmethod
+    def get_max_pending():
+        """Get the number of pending sessions that forces an early flush"""
+        return getattr(settings, 'JWT_ACTIVITY_FLUSH_MAX_PENDING', 500)
+
+    @staticmethod
+    def _cache_timeout():
+        # Heartbeats older than the inactivity timeout are irrelevant
+        return getattr(settings, 'JWT_INACTIVITY_TIMEOUT_MINUTES', 30) * 60 + 60
+
+    @classmethod
+    def _key(cls, token_id):
+        return f"{cls.KEY_PREFIX}:{token_id}"
+
+    @classmethod
+    def record(cls, token_id, timestamp):
+        """Record activity for a session at timestamp (aware datetime)"""
+        cache.set(cls._key(token_id), timestamp, timeout=cls._cache_timeout())
+
+        with cls._lock:
+            previous = cls._pending.get(token_id)
+            if previous is None or previous < timestamp:
+                cls._pending[token_id] = timestamp
+            due = cls._is_due()
+            if not due:
+                cls._schedule_flush()
+
+        if due:
+            cls._try_flush()
+
+    @classmethod
+    def _is_due(cls):
+        """Check if pending heartbeats should be written now (lock held)"""
+        return bool(cls._pending) and (
+            time.monotonic() - cls._last_flush >= cls.get_flush_interval()
+            or len(cls._pending) >= cls.get_max_pending()
+        )
+
+    @classmethod
+    def _schedule_flush(cls):
+        """Arm the timer flushing this worker's heartbeats (lock held)"""
+        if cls._timer is not None:
+            return
+        delay = max(cls.get_flush_interval() - (time.monotonic() - cls._last_flush), 0)
+        cls._timer = threading.Timer(delay, cls._flush_from_timer)
+        cls._timer.daemon = True
+        cls._timer.start()
+
+    @classmethod
+    def _flush_from_timer(cls):
+        with cls._lock:
+            cls._timer = None
+        try:
+            cls._try_flush()
+        finally:
+            # The timer thread's connection would otherwise stay open
+            connections.close_all()
+
+    @classmethod
+    def _try_flush(cls):
+        try:
+            return cls.flush()
+        except Exception as e:
+            # Heartbeats were re-queued; the next flush retries them
+            logger.error(f"Failed to flush session activity: {str(e)}")
+            with cls._lock:
+                cls._schedule_flush()
+            return 0
+
+    @classmethod
+    def flush_if_due(cls):
+        """Flush if the flush window has passed since the last flush"""
+        with cls._lock:
+            due = cls._is_due()
+        # Never write from inside someone else's transaction
+        if not due or connection.in_atomic_block:
+            return 0
+        return cls._try_flush()
+
+    @classmethod
+    def get_last_activity(cls, token_id, stored_last_activity):
+        """Get the freshest known activity: the cached heartbeat or the stored value"""
+        heartbeat = cache.get(cls._key(token_id))
+        if heartbeat is None or (stored_last_activity and heartbeat < stored_last_activity):
+            return stored_last_activity
+        return heartbeat
+
+    @classmethod
+    def forget(cls, token_id):
+        """Discard any heartbeat for a session (an explicit write is authoritative)"""
+        cache.delete(cls._key(token_id))
+        with cls._lock:
+            cls._pending.pop(token_id, None)
+
+    @classmethod
+    def flush(cls):
+        """
+        Write all pending heartbeats with a single UPDATE.
+
+        Returns:
+            int: Number of session rows updated
+        """
+        from .models import UserSession
+
+        with cls._lock:
+            pending = cls._pending
+            cls._pending = {}
+            cls._last_flush = time.monotonic()
+            if cls._timer is not None:
+                cls._timer.cancel()
+                cls._timer = None
+
+        if not pending:
+            return 0
+
+        try:
+            return UserSession.objects.filter(token_id__in=list(pending)).update(
+                last_activity=Case(
+                    *[When(token_id=token_id, then=Value(ts)) for token_id, ts in pending.items()],
+                    output_field=DateTimeField(),
+                )
+            )
+        except Exception:
+            with cls._lock:
+                for token_id, ts in pending.items():
+                    current = cls._pending.get(token_id)
+                    if current is None or current < ts:
+                        cls._pending[token_id] = ts
+            raise
+
+
+def _flush_on_exit():
+    """Best-effort flush when a worker is recycled"""
+    try:
+        SessionActivityTracker.flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_on_exit)
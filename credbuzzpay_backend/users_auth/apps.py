@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersAuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users_auth'
+    
+    def ready(self):
+        # Import signals to register them
+        from . import signals  # noqa: F401
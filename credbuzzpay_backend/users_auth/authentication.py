@@ -3,8 +3,13 @@ Custom authentication for users_auth app
 """
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+from django.utils import timezone
+from datetime import timedelta
 from .models import User, UserSession
 from .jwt_utils import JWTManager
+from .session_cache import SessionIdentityCache
+from .activity_tracker import SessionActivityTracker
+import copy
 import jwt
 
 
@@ -17,6 +22,7 @@ class JWTAuthentication(BaseAuthentication):
     - Checks session inactivity (30 minutes like bank apps)
     - Updates last activity on each request
     - Returns user info from token for middleware use
+    - Caches the resolved user + session per access token (see session_cache)
     """
     
     def authenticate(self, request):
@@ -56,6 +62,13 @@ class JWTAuthentication(BaseAuthentication):
             if payload.get('token_type') != 'access':
                 raise AuthenticationFailed('Invalid token type.')
             
+            # Fast path: user + session already resolved for this token
+            if SessionIdentityCache.is_enabled():
+                user = self._authenticate_cached(payload)
+                if user is not None:
+                    return (user, payload)
+                generation = SessionIdentityCache.get_generation(payload.get('user_id'))
+            
             # Get user
             user_id = payload.get('user_id')
             try:
@@ -66,7 +79,10 @@ class JWTAuthentication(BaseAuthentication):
             # Check session inactivity timeout (like bank apps)
             # This requires finding the session from a refresh token
             # For access tokens, we check the inactivity from user's sessions
-            self._check_session_inactivity(user)
+            session = self._check_session_inactivity(user)
+            
+            if SessionIdentityCache.is_enabled():
+                SessionIdentityCache.set(payload, user, session, generation)
             
             return (user, payload)
             
@@ -75,6 +91,33 @@ class JWTAuthentication(BaseAuthentication):
         except Exception as e:
             raise AuthenticationFailed(f'Authentication failed: {str(e)}')
     
+    def _authenticate_cached(self, payload):
+        """
+        Resolve the user from the identity cache.
+        
+        Returns the user if the cached session is still within the inactivity
+        window, otherwise None so the caller falls back to the database. A
+        cached entry is never trusted to *reject* a request: another worker may
+        have seen more recent activity, so expiry is always confirmed against
+        the database.
+        """
+        entry = SessionIdentityCache.get(payload)
+        if entry is None:
+            return None
+        
+        now = timezone.now()
+        inactivity_timeout = JWTManager.get_inactivity_timeout()
+        last_activity = SessionActivityTracker.get_last_activity(
+            entry['session_token_id'], entry['last_activity']
+        )
+        if now > last_activity + timedelta(minutes=inactivity_timeout):
+            return None
+        
+        SessionActivityTracker.record(entry['session_token_id'], now)
+        
+        # Hand out a copy so per-request mutations never leak into the cache
+        return copy.copy(entry['user'])
+    
     def _check_session_inactivity(self, user):
         """
         Check if user has any active session that's not expired due to inactivity.
@@ -83,6 +126,9 @@ class JWTAuthentication(BaseAuthentication):
         Single Session Login:
         - When user logs in on a new device, all previous sessions are invalidated
         - If no active session exists, the user must login again
+        
+        Returns:
+            UserSession: the active session whose activity was updated
         """
         inactivity_timeout = JWTManager.get_inactivity_timeout()
         
@@ -106,11 +152,11 @@ class JWTAuthentication(BaseAuthentication):
                 all_inactive = False
                 # Update activity for the valid session
                 session.update_activity()
-                break
+                return session
         
         if all_inactive:
             # Invalidate all sessions
-            active_sessions.update(is_active=False)
+            UserSession.deactivate_for_user(user)
             raise AuthenticationFailed(
                 'Session expired due to inactivity. Please login again.'
             )
@@ -0,0 +1,163 @@
+"""
+Block allocation of unique user codes
+
+UserCodeGenerator.generate_unique_code guesses random codes and checks each
+one with an exists() query. UserCodeAllocator hands out codes from an
+in-memory pool instead:
+
+- a worker reserves BLOCK_SIZE sequence numbers at a time by advancing a
+  CodeSequence row, so no two workers ever get the same numbers
+- each number maps to a code through a keyed permutation of the base-36
+  code space, so codes look random and distinct numbers give distinct codes
+- the block is checked against existing codes (legacy random codes) with
+  one set-based query per 500 codes, and any that are taken are dropped
+
+Creating users therefore costs no per-user uniqueness queries; a block of
+1,000 codes costs three or four queries in total.
+
+A block reserved inside a transaction only serves that transaction until
+it commits: if it rolls back, the sequence advance is undone and the block
+is discarded so it can't be handed out twice.
+"""
+import hashlib
+import threading
+import weakref
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+
+class UserCodeAllocator:
+    """
+    Per-worker pool of pre-verified unique user codes.
+    """
+
+    ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    SEQUENCE_NAME = 'user_code'
+    MIN_LENGTH = 6
+    ROUNDS = 4
+    VERIFY_BATCH = 500
+
+    _pool = deque()
+    _scoped = None  # (weakref to the outermost atomic block, deque of codes)
+    _lock = threading.Lock()
+    _key = None
+
+    @staticmethod
+    def get_block_size():
+        """Get the number of codes reserved per block"""
+        return getattr(settings, 'USER_CODE_BLOCK_SIZE', 1000)
+
+    @classmethod
+    def _get_key(cls):
+        if cls._key is None:
+            cls._key = hashlib.blake2b(settings.SECRET_KEY.encode(), digest_size=32, person=b'user-code').digest()
+        return cls._key
+
+    @classmethod
+    def _permute(cls, value, size):
+        """Keyed bijection on range(size): a Feistel network with cycle walking"""
+        half_bits = ((size - 1).bit_length() + 1) // 2
+        mask = (1 << half_bits) - 1
+        key = cls._get_key()
+        while True:
+            left, right = value >> half_bits, value & mask
+            for round_number in range(cls.ROUNDS):
+                digest = hashlib.blake2b(
+                    f'{round_number}:{right}'.encode(), key=key, digest_size=8
+                ).digest()
+                left, right = right, left ^ (int.from_bytes(digest, 'big') & mask)
+            value = (left << half_bits) | right
+            if value < size:
+                return value
+
+    @classmethod
+    def code_for(cls, number):
+        """
+        Map a sequence number to its code. Numbers fill the 6-character space
+        first, then 7 characters, and so on.
+        """
+        length = cls.MIN_LENGTH
+        size = len(cls.ALPHABET) ** length
+        while number >= size:
+            number -= size
+            length += 1
+            size = len(cls.ALPHABET) ** length
+
+        value = cls._permute(number, size)
+        chars = []
+        for _ in range(length):
+            value, index = divmod(value, len(cls.ALPHABET))
+            chars.append(cls.ALPHABET[index])
+        return ''.join(reversed(chars))
+
+    @classmethod
+    def reserve(cls, size=None):
+        """
+        Reserve the next block of sequence numbers and return its free codes.
+        """
+        from .models import CodeSequence, User
+
+        size = size or cls.get_block_size()
+        with transaction.atomic():
+            sequence, _ = CodeSequence.objects.select_for_update().get_or_create(name=cls.SEQUENCE_NAME)
+            start = sequence.next_value
+            CodeSequence.objects.filter(pk=sequence.pk).update(next_value=F('next_value') + size)
+
+        codes = [cls.code_for(number) for number in range(start, start + size)]
+        taken = set()
+        for i in range(0, len(codes), cls.VERIFY_BATCH):
+            taken.update(
+                User.objects.filter(user_code__in=codes[i:i + cls.VERIFY_BATCH]).values_list('user_code', flat=True)
+            )
+        return [code for code in codes if code not in taken]
+
+    @classmethod
+    def allocate(cls):
+        """Get one unique user code"""
+        return cls.allocate_many(1)[0]
+
+    @classmethod
+    def allocate_many(cls, count):
+        """
+        Get count unique user codes, e.g. to assign before bulk_create.
+        """
+        connection = transaction.get_connection()
+        codes = []
+        with cls._lock:
+            while len(codes) < count:
+                if cls._pool:
+                    codes.append(cls._pool.popleft())
+                    continue
+                if not connection.in_atomic_block:
+                    cls._pool.extend(cls.reserve())
+                    continue
+
+                # Inside a transaction: the reservation only becomes durable on commit
+                owner = connection.atomic_blocks[0]
+                scoped = cls._scoped
+                if scoped is None or scoped[0]() is not owner:
+                    scoped = cls._scoped = (weakref.ref(owner), deque())
+                    transaction.on_commit(lambda scoped=scoped: cls._promote(scoped))
+                if not scoped[1]:
+                    scoped[1].extend(cls.reserve())
+                codes.append(scoped[1].popleft())
+        return codes
+
+    @classmethod
+    def _promote(cls, scoped):
+        """Move the unused codes of a committed transaction's block to the pool"""
+        with cls._lock:
+            cls._pool.extend(scoped[1])
+            scoped[1].clear()
+            if cls._scoped is scoped:
+                cls._scoped = None
+
+    @classmethod
+    def clear(cls):
+        """Drop all pooled codes"""
+        with cls._lock:
+            cls._pool.clear()
+            cls._scoped = None
@@ -0,0 +1,275 @@
+"""
+Outbound email queue
+
+Requests call EmailQueue.enqueue(), which only inserts an OutboundEmail row
+(part of the request's transaction, so a rolled-back request sends nothing).
+The `run_email_worker` management command drains the queue:
+
+- claims a batch of due messages by leasing them (status SENDING with
+  locked_until), so several workers can run side by side and a crashed
+  worker's messages are picked up again once the lease expires
+- sends the batch over a pool of EMAIL_QUEUE_CONNECTIONS persistent
+  connections (one per thread), paying the SMTP/TLS handshake once per
+  connection instead of once per message
+- marks each message SENT, or reschedules it with exponential backoff and
+  marks it FAILED after EMAIL_QUEUE_MAX_ATTEMPTS
+- never sends a message past its expires_at (an OTP or reset code that is no
+  longer valid): such messages are marked EXPIRED instead
+
+Bodies are cleared as soon as a message is SENT, FAILED or EXPIRED, so codes
+and tokens don't outlive their delivery.
+"""
+import logging
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class EmailQueue:
+    """
+    Enqueue outbound emails and deliver them in batches.
+    """
+
+    @staticmethod
+    def is_enabled():
+        """Check if emails are queued (False sends them inline)"""
+        return getattr(settings, 'EMAIL_QUEUE_ENABLED', True)
+
+    @staticmethod
+    def get_batch_size():
+        """Get the number of messages claimed per batch"""
+        return getattr(settings, 'EMAIL_QUEUE_BATCH_SIZE', 50)
+
+    @staticmethod
+    def get_max_attempts():
+        """Get the number of delivery attempts before a message is marked FAILED"""
+        return getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 6)
+
+    @staticmethod
+    def get_retry_delay(attempts):
+        """Get the backoff before retry number attempts, in seconds"""
+        base = getattr(settings, 'EMAIL_QUEUE_RETRY_BASE_SECONDS', 30)
+        return min(base * 2 ** (attempts - 1), getattr(settings, 'EMAIL_QUEUE_RETRY_MAX_SECONDS', 3600))
+
+    @staticmethod
+    def get_lease_seconds():
+        """Get how long a claimed batch is reserved for one worker"""
+        return getattr(settings, 'EMAIL_QUEUE_LEASE_SECONDS', 300)
+
+    # Field values that redact a finished message
+    REDACTED = {'body': '', 'html_body': ''}
+
+    @classmethod
+    def enqueue(cls, to_email, subject, body, html_body='', category='', from_email=None, expires_at=None):
+        """
+        Queue an email for delivery.
+
+        Args:
+            expires_at: Don't send the message after this moment
+
+        Returns:
+            OutboundEmail: The queued message
+        """
+        from .models import OutboundEmail
+        return OutboundEmail.objects.create(
+            to_email=to_email,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            subject=subject,
+            body=body,
+            html_body=html_body,
+            category=category,
+            expires_at=expires_at,
+        )
+
+    @classmethod
+    def expire(cls, now=None):
+        """
+        Mark unsent messages past their expires_at EXPIRED and clear their bodies.
+
+        Returns:
+            int: Number of messages expired
+        """
+        from .models import OutboundEmail
+
+        now = now or timezone.now()
+        return OutboundEmail.objects.filter(
+            Q(status=OutboundEmail.Status.QUEUED)
+            | Q(status=OutboundEmail.Status.SENDING, locked_until__lt=now),
+            expires_at__lte=now,
+        ).update(status=OutboundEmail.Status.EXPIRED, locked_until=None, **cls.REDACTED)
+
+    @staticmethod
+    def build_message(outbound, connection=None):
+        """Build the Django email message for a queued row"""
+        message = EmailMultiAlternatives(
+            subject=outbound.subject,
+            body=outbound.body,
+            from_email=outbound.from_email,
+            to=[outbound.to_email],
+            connection=connection,
+        )
+        if outbound.html_body:
+            message.attach_alternative(outbound.html_body, 'text/html')
+        return message
+
+    @classmethod
+    def claim(cls, batch_size=None):
+        """
+        Lease a batch of due messages to this worker.
+
+        Returns:
+            list: OutboundEmail rows, now SENDING with attempts incremented
+        """
+        from .models import OutboundEmail
+
+        now = timezone.now()
+        cls.expire(now)
+        due = OutboundEmail.objects.filter(
+            Q(status=OutboundEmail.Status.QUEUED, next_attempt_at__lte=now)
+            | Q(status=OutboundEmail.Status.SENDING, locked_until__lt=now)
+        ).exclude(expires_at__lte=now)
+        with transaction.atomic():
+            ids = list(
+                due.select_for_update(skip_locked=True)
+                .order_by('next_attempt_at')
+                .values_list('id', flat=True)[:batch_size or cls.get_batch_size()]
+            )
+            if not ids:
+                return []
+            # Re-checking `due` keeps a concurrent worker from claiming the same rows
+            due.filter(id__in=ids).update(
+                status=OutboundEmail.Status.SENDING,
+                locked_until=now + timedelta(seconds=cls.get_lease_seconds()),
+                attempts=F('attempts') + 1,
+            )
+        return list(OutboundEmail.objects.filter(id__in=ids, status=OutboundEmail.Status.SENDING))
+
+    @classmethod
+    def record_results(cls, results):
+        """
+        Store delivery outcomes: results maps OutboundEmail -> error (None if sent).
+        """
+        from .models import OutboundEmail
+
+        now = timezone.now()
+        sent_ids = [outbound.id for outbound, error in results.items() if error is None]
+        if sent_ids:
+            OutboundEmail.objects.filter(id__in=sent_ids).update(
+                status=OutboundEmail.Status.SENT, sent_at=now, locked_until=None, last_error='', **cls.REDACTED
+            )
+
+        for outbound, error in results.items():
+            if error is None:
+                continue
+            next_attempt_at = now + timedelta(seconds=cls.get_retry_delay(outbound.attempts))
+            if outbound.attempts >= cls.get_max_attempts():
+                updates = dict(status=OutboundEmail.Status.FAILED, **cls.REDACTED)
+                logger.error(f"Giving up on email {outbound.id} to {outbound.to_email}: {error}")
+            elif outbound.expires_at is not None and next_attempt_at >= outbound.expires_at:
+                # The retry would deliver a code that is no longer valid
+                updates = dict(status=OutboundEmail.Status.EXPIRED, **cls.REDACTED)
+                logger.error(f"Email {outbound.id} to {outbound.to_email} expires before its retry: {error}")
+            else:
+                updates = {
+                    'status': OutboundEmail.Status.QUEUED,
+                    'next_attempt_at': next_attempt_at,
+                }
+                logger.warning(f"Email {outbound.id} to {outbound.to_email} failed, will retry: {error}")
+            OutboundEmail.objects.filter(id=outbound.id).update(locked_until=None, last_error=error[:2000], **updates)
+
+
+class SMTPConnectionPool:
+    """
+    Persistent email backend connections, one per sender thread.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='email-sender')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _discard(self):
+        """Drop this thread's connection after an error; the next send reconnects"""
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _send(self, outbound):
+        for _ in range(2):
+            reused = getattr(self._local, 'connection', None) is not None
+            try:
+                connection = self._connection()
+                EmailQueue.build_message(outbound, connection=connection).send(fail_silently=False)
+                return None
+            except smtplib.SMTPServerDisconnected as e:
+                # The server dropped an idle pooled connection: reconnect once
+                self._discard()
+                if not reused:
+                    return str(e) or e.__class__.__name__
+            except Exception as e:
+                self._discard()
+                return str(e) or e.__class__.__name__
+
+    def send_batch(self, batch):
+        """
+        Send messages concurrently over the pooled connections.
+
+        Returns:
+            dict: OutboundEmail -> error message, or None if sent
+        """
+        return dict(zip(batch, self._executor.map(self._send, batch)))
+
+    def close(self):
+        """Close every pooled connection and stop the sender threads"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def process_batch(pool, batch_size=None):
+    """
+    Claim, send and record one batch.
+
+    Returns:
+        tuple: (sent, failed) counts
+    """
+    batch = EmailQueue.claim(batch_size)
+    if not batch:
+        return 0, 0
+    results = pool.send_batch(batch)
+    EmailQueue.record_results(results)
+    failed = sum(1 for error in results.values() if error is not None)
+    return len(results) - failed, failed
@@ -2,16 +2,63 @@
 Email Service
 =============
 Service for sending emails including OTP verification emails.
+
+Emails are sent inline, or with EMAIL_QUEUE_ENABLED queued in OutboundEmail
+and delivered by the `run_email_worker` management command (see email_queue),
+so requests never wait on SMTP.
 """
 
-from django.core.mail import send_mail, EmailMultiAlternatives
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from django.template.loader import render_to_string
+from django.utils import timezone
 import logging
 
+from .email_queue import EmailQueue
+
 logger = logging.getLogger(__name__)
 
 
+def _deliver(email: str, subject: str, plain_message: str, html_message: str = '', category: str = '',
+             valid_minutes: int = None) -> bool:
+    """
+    Queue an email (or send it inline if the queue is disabled).
+    
+    Args:
+        valid_minutes: Lifetime of a code in the message; a queued message
+            isn't sent after it
+    
+    Returns:
+        bool: True if the email was queued or sent, False otherwise
+    """
+    try:
+        if EmailQueue.is_enabled():
+            expires_at = timezone.now() + timedelta(minutes=valid_minutes) if valid_minutes else None
+            EmailQueue.enqueue(
+                email, subject, plain_message, html_body=html_message, category=category, expires_at=expires_at
+            )
+            logger.info(f"{category or 'Email'} queued for {email}")
+            return True
+        
+        email_message = EmailMultiAlternatives(
+            subject=subject,
+            body=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email]
+        )
+        if html_message:
+            email_message.attach_alternative(html_message, "text/html")
+        email_message.send(fail_silently=False)
+        logger.info(f"{category or 'Email'} sent successfully to {email}")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Failed to send {category or 'email'} to {email}: {str(e)}")
+        return False
+
+
 def send_otp_email(email: str, otp_code: str, user_name: str = None) -> bool:
     """
     Send OTP verification email to user.
@@ -22,7 +69,7 @@ def send_otp_email(email: str, otp_code: str, user_name: str = None) -> bool:
         user_name: Optional user's name for personalization
         
     Returns:
-        bool: True if email sent successfully, False otherwise
+        bool: True if the email was queued (or sent), False otherwise
     """
     subject = "CredBuzzPay - Your Verification Code"
     
@@ -101,22 +148,7 @@ The CredBuzzPay Team
 </html>
     """
     
-    try:
-        email_message = EmailMultiAlternatives(
-            subject=subject,
-            body=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email]
-        )
-        email_message.attach_alternative(html_message, "text/html")
-        email_message.send(fail_silently=False)
-        
-        logger.info(f"OTP email sent successfully to {email}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send OTP email to {email}: {str(e)}")
-        return False
+    return _deliver(email, subject, plain_message, html_message, category='OTP', valid_minutes=settings.OTP_EXPIRY_MINUTES)
 
 
 def send_welcome_email(email: str, user_name: str) -> bool:
@@ -141,20 +173,7 @@ Thanks,
 The CredBuzzPay Team
     """.strip()
     
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-            fail_silently=False,
-        )
-        logger.info(f"Welcome email sent to {email}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send welcome email to {email}: {str(e)}")
-        return False
+    return _deliver(email, subject, plain_message, category='WELCOME')
 
 
 def send_password_reset_email(email: str, reset_token: str, user_name: str = None) -> bool:
@@ -178,17 +197,4 @@ Thanks,
 The CredBuzzPay Team
     """.strip()
     
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-            fail_silently=False,
-        )
-        logger.info(f"Password reset email sent to {email}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send password reset email to {email}: {str(e)}")
-        return False
+    return _deliver(email, subject, plain_message, category='PASSWORD_RESET', valid_minutes=10)
@@ -8,6 +8,9 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone
 
+from .permission_claims import PermissionClaims
+from .permission_cache import PermissionSnapshotCache
+
 
 class JWTManager:
     """
@@ -44,9 +47,40 @@ class JWTManager:
         """
         Get user's app and feature permissions from RBAC.
         Returns list of app IDs and feature IDs the user has access to.
+        
+        Results are served from PermissionSnapshotCache while the RBAC
+        generation is unchanged, so repeat calls cost a single cache hit.
+        """
+        generation = None
+        if PermissionSnapshotCache.is_enabled():
+            try:
+                from rbac.cache import get_rbac_generation
+                # Read before loading so a concurrent RBAC change is never cached over
+                generation = get_rbac_generation()
+            except Exception:
+                generation = None
+            snapshot = PermissionSnapshotCache.get(user, generation)
+            if snapshot is not None:
+                return snapshot
+        
+        app_access, feature_access, valid_until, loaded = cls._load_user_permissions(user)
+        if loaded:
+            PermissionSnapshotCache.set(user, generation, app_access, feature_access, valid_until)
+        return app_access, feature_access
+    
+    @classmethod
+    def _load_user_permissions(cls, user):
+        """
+        Resolve user's app and feature permissions from the database.
+        
+        Returns:
+            tuple: (app_ids, feature_ids, valid_until, loaded) where valid_until is
+            the next time a temporary role assignment starts or ends (or None) and
+            loaded is False if RBAC could not be queried
         """
         app_access = []
         feature_access = []
+        valid_until = None
         
         try:
             from rbac.models import UserRoleAssignment, RoleAppMapping, RoleFeatureMapping
@@ -57,7 +91,18 @@ class JWTManager:
                 is_active=True
             ).select_related('role')
             
-            role_ids = [ra.role_id for ra in role_assignments if ra.is_valid()]
+            role_ids = []
+            now = timezone.now()
+            for ra in role_assignments:
+                if ra.is_valid():
+                    role_ids.append(ra.role_id)
+                    boundary = ra.valid_until
+                elif ra.valid_from > now:
+                    boundary = ra.valid_from
+                else:
+                    boundary = None
+                if boundary is not None and (valid_until is None or boundary < valid_until):
+                    valid_until = boundary
             
             # Get app access for all user's roles
             app_mappings = RoleAppMapping.objects.filter(
@@ -77,24 +122,27 @@ class JWTManager:
             
         except Exception:
             # If RBAC is not set up, return empty lists
-            pass
+            return [], [], None, False
         
-        return app_access, feature_access
+        return app_access, feature_access, valid_until, True
     
     @classmethod
-    def generate_access_token(cls, user, include_permissions=True):
+    def generate_access_token(cls, user, include_permissions=True, permissions=None):
         """
         Generate JWT access token for user with complete user info.
         
         The token includes:
         - user_id, email, username, user_code, user_role
-        - app_access: list of app IDs user can access
-        - feature_access: list of feature IDs user can access
+        - app_access: bitmap of app IDs user can access
+        - feature_access: bitmap of feature IDs user can access
+        - perm_ver: permission catalog version of the bitmaps
+          (see PermissionClaims; decode with get_token_permissions)
         - Session tracking for inactivity timeout
         
         Args:
             user: User model instance
             include_permissions: Whether to include RBAC permissions
+            permissions: Optional (app_ids, feature_ids) already resolved by the caller
             
         Returns:
             tuple: (token_string, token_id, expiry_datetime)
@@ -106,7 +154,9 @@ class JWTManager:
         # Get permissions if requested
         app_access, feature_access = [], []
         if include_permissions:
-            app_access, feature_access = cls.get_user_permissions(user)
+            if permissions is None:
+                permissions = cls.get_user_permissions(user)
+            app_access, feature_access = permissions
         
         payload = {
             # User identification
@@ -118,8 +168,7 @@ class JWTManager:
             'full_name': user.full_name,
             
             # RBAC permissions (for middleware/frontend use)
-            'app_access': app_access,
-            'feature_access': feature_access,
+            **PermissionClaims.build_claims(app_access, feature_access),
             
             # Token metadata
             'jti': token_id,  # JWT ID
@@ -171,17 +220,18 @@ class JWTManager:
         return token, token_id, expiry_datetime
     
     @classmethod
-    def generate_tokens(cls, user):
+    def generate_tokens(cls, user, permissions=None):
         """
         Generate both access and refresh tokens
         
         Args:
             user: User model instance
+            permissions: Optional (app_ids, feature_ids) already resolved by the caller
             
         Returns:
             dict: Dictionary containing access and refresh tokens with their expiry
         """
-        access_token, access_token_id, access_expiry = cls.generate_access_token(user)
+        access_token, access_token_id, access_expiry = cls.generate_access_token(user, permissions=permissions)
         refresh_token, refresh_token_id, refresh_expiry = cls.generate_refresh_token(user)
         
         return {
@@ -242,6 +292,22 @@ class JWTManager:
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
             return None
     
+    @staticmethod
+    def get_token_permissions(payload):
+        """
+        Decode the permission claims of an access token payload
+        
+        Args:
+            payload: Decoded access token payload
+            
+        Returns:
+            tuple: (app_ids, feature_ids) as frozensets, empty if the claims can't be decoded
+        """
+        try:
+            return PermissionClaims.decode(payload)
+        except ValueError:
+            return frozenset(), frozenset()
+    
     @classmethod
     def get_user_id_from_token(cls, token):
         """
@@ -0,0 +1,404 @@
+"""
+Cache-backed login lockout engine
+
+Failed logins are counted with atomic cache counters instead of LoginAttempt
+row writes, so credential-stuffing traffic never touches the database:
+
+- per identifier: a sliding-window failure counter; every
+  LOGIN_MAX_ATTEMPTS_PER_STAGE failures advance the identifier one step
+  through LOGIN_LOCKOUT_STAGES (2, 5, 10, 30, 60 minutes, then blocked)
+- per IP address: a sliding-window failure counter that locks the address
+  out for LOGIN_IP_LOCKOUT_MINUTES after LOGIN_IP_MAX_FAILURES failures
+
+The current stage of an identifier lives in the cache and is persisted to
+LoginAttempt only on stage transitions, permanent blocks and the reset of a
+persisted stage. A cold cache reloads it from LoginAttempt once per identifier.
+
+Without a cache shared by every worker (cache_is_shared) per-worker counters
+would multiply the allowance, so identifier failures are counted on the
+LoginAttempt row instead, under a row lock, as before the engine existed.
+The IP address counters stay in the cache and are best effort per worker.
+
+Sliding windows use the two-bucket approximation: the count is the current
+bucket plus the previous bucket weighted by how much of it still overlaps
+the window.
+"""
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from credbuzzpay_backend.cache_utils import cache_is_shared
+
+logger = logging.getLogger(__name__)
+
+
+class LoginLockoutEngine:
+    """
+    Progressive login lockout per identifier and per IP address.
+    """
+
+    KEY_PREFIX = 'auth:lockout'
+
+    DEFAULT_STAGES = [
+        (0, 0),
+        (1, 2),
+        (2, 5),
+        (3, 10),
+        (4, 30),
+        (5, 60),
+        (6, -1),
+    ]
+
+    @staticmethod
+    def get_max_attempts():
+        """Get the number of failures allowed per lockout stage"""
+        return getattr(settings, 'LOGIN_MAX_ATTEMPTS_PER_STAGE', 5)
+
+    @classmethod
+    def get_stages(cls):
+        """Get (stage, lockout_minutes) pairs; -1 minutes means permanent block"""
+        return getattr(settings, 'LOGIN_LOCKOUT_STAGES', cls.DEFAULT_STAGES)
+
+    @staticmethod
+    def get_failure_window():
+        """Get the sliding window for identifier failures in seconds"""
+        return getattr(settings, 'LOGIN_FAILURE_WINDOW_SECONDS', 3600)
+
+    @staticmethod
+    def get_state_ttl():
+        """Get how long an identifier's stage is kept in the cache in seconds"""
+        return getattr(settings, 'LOGIN_LOCKOUT_STATE_TTL_SECONDS', 86400)
+
+    @staticmethod
+    def get_ip_max_failures():
+        """Get the number of failures allowed per IP address per window"""
+        return getattr(settings, 'LOGIN_IP_MAX_FAILURES', 100)
+
+    @staticmethod
+    def get_ip_window():
+        """Get the sliding window for IP failures in seconds"""
+        return getattr(settings, 'LOGIN_IP_WINDOW_SECONDS', 600)
+
+    @staticmethod
+    def get_ip_lockout_minutes():
+        """Get the lockout duration for an IP address in minutes"""
+        return getattr(settings, 'LOGIN_IP_LOCKOUT_MINUTES', 15)
+
+    @classmethod
+    def _digest(cls, *parts):
+        # Identifiers are user input: hash them into safe, bounded cache keys
+        raw = ':'.join(str(p) for p in parts).lower()
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    @classmethod
+    def _state_key(cls, identifier, identifier_type):
+        return f"{cls.KEY_PREFIX}:state:{cls._digest(identifier_type, identifier)}"
+
+    @classmethod
+    def _ip_lock_key(cls, ip_address):
+        return f"{cls.KEY_PREFIX}:iplock:{cls._digest(ip_address)}"
+
+    @staticmethod
+    def _incr(key, timeout):
+        """Atomically increment a counter, creating it if missing"""
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, timeout=timeout):
+                return 1
+            return cache.incr(key)
+
+    @staticmethod
+    def _window_keys(prefix, window, now):
+        """Get the (current, previous) bucket keys of a sliding window"""
+        bucket = int(now // window)
+        return f"{prefix}:{bucket}", f"{prefix}:{bucket - 1}"
+
+    @classmethod
+    def _window_count(cls, prefix, window, now, previous=None):
+        """
+        Record one event and return the sliding-window event count.
+        Pass the previous bucket's value if it was already fetched.
+        """
+        current_key, previous_key = cls._window_keys(prefix, window, now)
+        current = cls._incr(current_key, timeout=window * 2)
+        if previous is None:
+            previous = cache.get(previous_key) or 0
+        overlap = 1 - (now % window) / window
+        return current + previous * overlap
+
+    @classmethod
+    def _lockout_minutes(cls, stage):
+        for stage_number, minutes in cls.get_stages():
+            if stage_number == stage:
+                return minutes
+        return None
+
+    @staticmethod
+    def _message(is_blocked, lockout_until, now):
+        """Lockout message in the same wording as LoginAttempt.is_locked_out"""
+        if is_blocked:
+            return "Account is blocked. Please contact support."
+        remaining = lockout_until - now
+        minutes = int(remaining / 60)
+        seconds = int(remaining % 60)
+        if minutes > 0:
+            return f"Too many failed attempts. Please try again in {minutes} minute(s)."
+        return f"Too many failed attempts. Please try again in {seconds} second(s)."
+
+    @classmethod
+    def _db_state(cls, identifier, identifier_type):
+        """Read the identifier's state from its LoginAttempt row"""
+        from .models import LoginAttempt
+        row = LoginAttempt.objects.filter(
+            identifier=identifier.lower(),
+            identifier_type=identifier_type
+        ).values('lockout_stage', 'lockout_until', 'is_blocked').first()
+
+        state = {'stage': 0, 'lockout_until': None, 'blocked': False, 'persisted': False, 'epoch': time.time_ns()}
+        if row and (row['lockout_stage'] or row['is_blocked']):
+            state.update(
+                stage=row['lockout_stage'],
+                lockout_until=row['lockout_until'].timestamp() if row['lockout_until'] else None,
+                blocked=row['is_blocked'],
+                persisted=True,
+            )
+        return state
+
+    @classmethod
+    def _load_state(cls, identifier, identifier_type):
+        """Get the identifier's state, loading it from LoginAttempt on a cache miss"""
+        key = cls._state_key(identifier, identifier_type)
+        state = cache.get(key)
+        if state is not None:
+            return state
+
+        state = cls._db_state(identifier, identifier_type)
+        # Cached even when clean, so unknown identifiers cost one read per TTL
+        cache.add(key, state, timeout=cls.get_state_ttl())
+        return cache.get(key) or state
+
+    @classmethod
+    def _save_state(cls, identifier, identifier_type, state):
+        cache.set(cls._state_key(identifier, identifier_type), state, timeout=cls.get_state_ttl())
+
+    @classmethod
+    def _persist(cls, identifier, identifier_type, state, ip_address=None, user_agent=None):
+        """Write a stage transition (or reset) through to LoginAttempt"""
+        from .models import LoginAttempt
+        lockout_until = state['lockout_until']
+        try:
+            LoginAttempt.objects.update_or_create(
+                identifier=identifier.lower(),
+                identifier_type=identifier_type,
+                defaults={
+                    'attempt_count': 0,
+                    'lockout_stage': state['stage'],
+                    'is_blocked': state['blocked'],
+                    'is_successful': False,
+                    'lockout_until': (
+                        datetime.fromtimestamp(lockout_until, tz=dt_timezone.utc) if lockout_until else None
+                    ),
+                    'ip_address': ip_address,
+                    'user_agent': user_agent,
+                }
+            )
+        except Exception as e:
+            # The cache still enforces the lockout; the row is best effort
+            logger.error(f"Failed to persist login lockout for {identifier_type}: {str(e)}")
+
+    @classmethod
+    def check(cls, identifier, identifier_type, ip_address=None):
+        """
+        Check whether a login for identifier (from ip_address) is locked out.
+
+        Returns:
+            dict: is_locked, message, lockout_stage, is_blocked
+        """
+        state_key = cls._state_key(identifier, identifier_type)
+        ip_lock_key = cls._ip_lock_key(ip_address) if ip_address else None
+        if not cache_is_shared():
+            ip_locked_until = cache.get(ip_lock_key) if ip_lock_key else None
+            return cls._status(cls._db_state(identifier, identifier_type), ip_locked_until, time.time())
+
+        values = cache.get_many([key for key in (state_key, ip_lock_key) if key])
+        state = values.get(state_key) or cls._load_state(identifier, identifier_type)
+        return cls._status(state, values.get(ip_lock_key), time.time())
+
+    @classmethod
+    def _status(cls, state, ip_locked_until, now):
+        result = {
+            'is_locked': False,
+            'message': None,
+            'lockout_stage': state['stage'],
+            'is_blocked': state['blocked'],
+        }
+
+        if state['blocked'] or (state['lockout_until'] and now < state['lockout_until']):
+            result['is_locked'] = True
+            result['message'] = cls._message(state['blocked'], state['lockout_until'], now)
+        elif ip_locked_until and now < ip_locked_until:
+            result['is_locked'] = True
+            result['message'] = cls._message(False, ip_locked_until, now)
+        return result
+
+    @classmethod
+    def record_failure(cls, identifier, identifier_type, ip_address=None, user_agent=None):
+        """
+        Record a failed login and advance the lockout stage if needed.
+
+        Costs four cache round trips and no database access unless the
+        failure completes a stage (or the cache is not shared, see
+        _record_failure_db).
+
+        Returns:
+            dict: remaining_attempts, lockout_stage, is_blocked, lockout_until,
+            is_locked, message
+        """
+        now = time.time()
+        max_attempts = cls.get_max_attempts()
+        state_key = cls._state_key(identifier, identifier_type)
+
+        shared = cache_is_shared()
+        keys = [state_key] if shared else []
+        if ip_address:
+            ip_window = cls.get_ip_window()
+            ip_prefix = f"{cls.KEY_PREFIX}:ip:{cls._digest(ip_address)}"
+            ip_lock_key = cls._ip_lock_key(ip_address)
+            ip_previous_key = cls._window_keys(ip_prefix, ip_window, now)[1]
+            keys += [ip_previous_key, ip_lock_key]
+        values = cache.get_many(keys) if keys else {}
+
+        ip_locked_until = None
+        if ip_address:
+            ip_locked_until = values.get(ip_lock_key)
+            ip_failures = cls._window_count(ip_prefix, ip_window, now, previous=values.get(ip_previous_key, 0))
+            if ip_failures >= cls.get_ip_max_failures() and not ip_locked_until:
+                lockout_seconds = cls.get_ip_lockout_minutes() * 60
+                ip_locked_until = now + lockout_seconds
+                cache.add(ip_lock_key, ip_locked_until, timeout=lockout_seconds)
+
+        if not shared:
+            state, failures = cls._record_failure_db(identifier, identifier_type, now, ip_address, user_agent)
+            return cls._failure_result(state, failures, ip_locked_until, now)
+
+        state = values.get(state_key) or cls._load_state(identifier, identifier_type)
+
+        # Counters are scoped to the current stage (and reset epoch), so
+        # every stage starts with a fresh allowance like LoginAttempt did
+        prefix = f"{cls.KEY_PREFIX}:fail:{cls._digest(identifier_type, identifier, state['epoch'], state['stage'])}"
+        failures = cls._window_count(prefix, cls.get_failure_window(), now)
+
+        # Exactly one request performs each stage transition
+        if failures >= max_attempts and cache.add(f"{prefix}:advanced", True, timeout=cls.get_state_ttl()):
+            stage = state['stage'] + 1
+            minutes = cls._lockout_minutes(stage)
+            if minutes is None:
+                stage, minutes = state['stage'], cls._lockout_minutes(state['stage'])
+            state = dict(state, stage=stage, persisted=True)
+            if minutes == -1:
+                state.update(blocked=True, lockout_until=None)
+            elif minutes:
+                state['lockout_until'] = now + minutes * 60
+            cls._persist(identifier, identifier_type, state, ip_address, user_agent)
+            cls._save_state(identifier, identifier_type, state)
+            failures = 0
+
+        return cls._failure_result(state, failures, ip_locked_until, now)
+
+    @classmethod
+    def _record_failure_db(cls, identifier, identifier_type, now, ip_address=None, user_agent=None):
+        """
+        Count a failure on the identifier's LoginAttempt row.
+
+        The row is locked for the update, so concurrent workers never lose a
+        failure. Returns the new state and the failure count within the stage.
+        """
+        from .models import LoginAttempt
+        with transaction.atomic():
+            attempt, _ = LoginAttempt.objects.select_for_update().get_or_create(
+                identifier=identifier.lower(),
+                identifier_type=identifier_type,
+                defaults={'ip_address': ip_address, 'user_agent': user_agent}
+            )
+            window_start = now - cls.get_failure_window()
+            if attempt.attempt_count and attempt.last_attempt_at.timestamp() < window_start:
+                attempt.attempt_count = 0
+
+            attempt.attempt_count += 1
+            attempt.is_successful = False
+            attempt.ip_address = ip_address
+            attempt.user_agent = user_agent
+            if attempt.attempt_count >= cls.get_max_attempts():
+                stage = attempt.lockout_stage + 1
+                minutes = cls._lockout_minutes(stage)
+                if minutes is None:
+                    stage, minutes = attempt.lockout_stage, cls._lockout_minutes(attempt.lockout_stage)
+                attempt.lockout_stage = stage
+                attempt.attempt_count = 0
+                if minutes == -1:
+                    attempt.is_blocked = True
+                    attempt.lockout_until = None
+                elif minutes:
+                    attempt.lockout_until = datetime.fromtimestamp(now + minutes * 60, tz=dt_timezone.utc)
+            attempt.save()
+
+        state = {
+            'stage': attempt.lockout_stage,
+            'lockout_until': attempt.lockout_until.timestamp() if attempt.lockout_until else None,
+            'blocked': attempt.is_blocked,
+            'persisted': True,
+            'epoch': None,
+        }
+        return state, attempt.attempt_count
+
+    @classmethod
+    def _failure_result(cls, state, failures, ip_locked_until, now):
+        max_attempts = cls.get_max_attempts()
+        result = {
+            'remaining_attempts': max(0, max_attempts - int(failures)),
+            'lockout_stage': state['stage'],
+            'is_blocked': state['blocked'],
+            'lockout_until': (
+                datetime.fromtimestamp(state['lockout_until'], tz=dt_timezone.utc)
+                if state['lockout_until'] else None
+            ),
+        }
+        result.update(
+            {k: v for k, v in cls._status(state, ip_locked_until, now).items() if k in ('is_locked', 'message')}
+        )
+        return result
+
+    @classmethod
+    def record_success(cls, identifier, identifier_type):
+        """Reset the identifier's failures and stage after a successful login"""
+        if not cache_is_shared():
+            from .models import LoginAttempt
+            LoginAttempt.objects.filter(
+                identifier=identifier.lower(),
+                identifier_type=identifier_type
+            ).exclude(
+                attempt_count=0, lockout_stage=0, is_blocked=False, lockout_until=None
+            ).update(attempt_count=0, lockout_stage=0, is_blocked=False, lockout_until=None, is_successful=True)
+            return
+
+        state = cls._load_state(identifier, identifier_type)
+        if state['persisted']:
+            from .models import LoginAttempt
+            LoginAttempt.objects.filter(
+                identifier=identifier.lower(),
+                identifier_type=identifier_type
+            ).update(attempt_count=0, lockout_stage=0, is_blocked=False, lockout_until=None, is_successful=True)
+        cls._save_state(identifier, identifier_type, {
+            'stage': 0, 'lockout_until': None, 'blocked': False, 'persisted': False, 'epoch': time.time_ns(),
+        })
+
+    @classmethod
+    def reset(cls, identifier, identifier_type):
+        """Drop the cached state so the next check reloads it from LoginAttempt"""
+        cache.delete(cls._state_key(identifier, identifier_type))
@@ -0,0 +1,95 @@
+"""
+Management command to backfill the normalized login identifier index.
+
+Walks the users table in primary-key batches and brings each user's
+UserIdentifier rows (email, username, user_code, 10-digit phone key) in
+line with their current values. Safe to re-run: users already indexed
+correctly cost no writes.
+
+Usage:
+    python manage.py backfill_login_identifiers
+    python manage.py backfill_login_identifiers --batch-size 5000
+    python manage.py backfill_login_identifiers --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users_auth.models import User, UserIdentifier
+
+
+class Command(BaseCommand):
+    help = 'Backfill the normalized login identifier index for existing users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users processed per batch (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without writing',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        last_id = 0
+        users_seen = 0
+        created_total = 0
+        deleted_total = 0
+
+        while True:
+            users = list(
+                User.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', *User.IDENTIFIER_FIELDS)[:batch_size]
+            )
+            if not users:
+                break
+            last_id = users[-1].id
+            users_seen += len(users)
+
+            created, deleted = self._sync_batch(users, dry_run)
+            created_total += created
+            deleted_total += deleted
+
+            self.stdout.write(f'  Processed {users_seen} users (up to id {last_id})')
+
+        prefix = '[DRY RUN] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Indexed {users_seen} users: '
+            f'{created_total} identifiers created, {deleted_total} stale identifiers removed'
+        ))
+
+    def _sync_batch(self, users, dry_run):
+        """Sync identifier rows for one batch of users with three queries at most"""
+        existing = {}
+        for row in UserIdentifier.objects.filter(user_id__in=[u.id for u in users]):
+            existing[(row.user_id, row.identifier_type)] = row
+
+        stale_ids = []
+        missing = []
+        for user in users:
+            identifiers = UserIdentifier.identifiers_for(user)
+            for identifier_type, _ in UserIdentifier.TYPE_CHOICES:
+                row = existing.get((user.id, identifier_type))
+                value = identifiers.get(identifier_type)
+                if row is not None and row.value != value:
+                    stale_ids.append(row.id)
+                    row = None
+                if row is None and value:
+                    missing.append(UserIdentifier(user_id=user.id, identifier_type=identifier_type, value=value))
+
+        if not dry_run:
+            with transaction.atomic():
+                if stale_ids:
+                    UserIdentifier.objects.filter(id__in=stale_ids).delete()
+                if missing:
+                    # Values claimed by another user (shared 10-digit phone key) are skipped
+                    UserIdentifier.objects.bulk_create(missing, ignore_conflicts=True)
+
+        return len(missing), len(stale_ids)
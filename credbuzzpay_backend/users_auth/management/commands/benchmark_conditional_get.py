@@ -0,0 +1,86 @@
+"""
+Management command to measure what conditional GET saves on polled endpoints.
+
+Replays a polling client against the profile, permission and catalog
+endpoints twice: once always fetching the full response, and once sending
+back the ETag it last received in If-None-Match, as a well-behaved client
+does. Reports bytes sent (body and headers) and CPU time per request.
+
+Requests are dispatched to the views in-process as the given user, so the
+numbers cover view, query and serializer work but not the network.
+
+Usage:
+    python manage.py benchmark_conditional_get --email admin@example.com
+    python manage.py benchmark_conditional_get --email admin@example.com --polls 500
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from bill_pay.views import BillCategoryListView, BillerListView
+from rbac.views import MyPermissionsView
+from users_auth.models import User
+from users_auth.views import UserProfileWithAccessView
+
+
+ENDPOINTS = (
+    ('profile-full', '/api/auth-user/profile-full/', UserProfileWithAccessView),
+    ('my-permissions', '/api/rbac/my-permissions/', MyPermissionsView),
+    ('bill categories', '/api/bills/categories/', BillCategoryListView),
+    ('billers', '/api/bills/billers/', BillerListView),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare bytes and CPU per poll with and without If-None-Match'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', required=True, help='User to poll as')
+        parser.add_argument('--polls', type=int, default=200, help='Requests per endpoint and mode (default: 200)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['email']} not found")
+
+        factory = APIRequestFactory()
+        polls = options['polls']
+        self.stdout.write(self.style.SUCCESS(f'Conditional GET benchmark: {polls} polls per endpoint'))
+
+        for name, path, view_class in ENDPOINTS:
+            view = view_class.as_view()
+            full = self._replay(factory, view, path, user, polls, conditional=False)
+            conditional = self._replay(factory, view, path, user, polls, conditional=True)
+
+            saved_bytes = 1 - conditional['bytes'] / full['bytes'] if full['bytes'] else 0
+            saved_cpu = 1 - conditional['cpu_ms'] / full['cpu_ms'] if full['cpu_ms'] else 0
+            self.stdout.write(f'  {name} ({path})')
+            self.stdout.write(f"    full:        {full['bytes'] / polls:.0f} bytes, {full['cpu_ms'] / polls:.3f} ms CPU per poll")
+            self.stdout.write(
+                f"    conditional: {conditional['bytes'] / polls:.0f} bytes, "
+                f"{conditional['cpu_ms'] / polls:.3f} ms CPU per poll ({conditional['not_modified']} x 304)"
+            )
+            self.stdout.write(f'    saved:       {saved_bytes:.0%} bytes, {saved_cpu:.0%} CPU')
+
+    def _replay(self, factory, view, path, user, polls, conditional):
+        """Poll path, optionally revalidating with the last ETag received"""
+        etag = None
+        sent = not_modified = 0
+        started = time.process_time()
+        for _ in range(polls):
+            headers = {'HTTP_IF_NONE_MATCH': etag} if conditional and etag else {}
+            request = factory.get(path, **headers)
+            force_authenticate(request, user=user)
+            response = view(request)
+            if hasattr(response, 'render'):
+                response.render()
+
+            etag = response.get('ETag', etag)
+            if response.status_code == 304:
+                not_modified += 1
+            sent += len(response.content) + len(response.serialize_headers())
+        elapsed = time.process_time() - started
+        return {'bytes': sent, 'cpu_ms': elapsed * 1000, 'not_modified': not_modified}
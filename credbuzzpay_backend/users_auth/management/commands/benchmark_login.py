@@ -0,0 +1,156 @@
+"""
+Management command to benchmark the login pipeline.
+
+Seeds verified users (with an RBAC role and app/feature mappings), logs
+them in repeatedly through LoginView and reports latency percentiles and
+the number of queries per login against LoginView.query_budget.
+
+All seeded data is rolled back when the command finishes.
+
+Usage:
+    python manage.py benchmark_login
+    python manage.py benchmark_login --users 500 --iterations 2000
+"""
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from users_auth.models import User
+from users_auth.views import LoginView
+from rbac.models import UserRole, App, Feature, RoleAppMapping, RoleFeatureMapping, UserRoleAssignment, RoleLevel
+
+
+# Transaction control statements don't count against the query budget
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class BenchmarkLoginView(LoginView):
+    """LoginView without rate limiting"""
+
+    def get_throttles(self):
+        return []
+
+
+class _Rollback(Exception):
+    pass
+
+
+def count_queries(captured_queries):
+    """Count captured queries, ignoring transaction control statements"""
+    return sum(
+        1 for query in captured_queries
+        if not query['sql'].upper().startswith(TRANSACTION_STATEMENTS)
+    )
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark login latency (p50/p99) and query count against a seeded database'
+
+    PASSWORD = 'Bench@12345'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Number of users to seed')
+        parser.add_argument('--iterations', type=int, default=1000, help='Number of logins to run')
+        parser.add_argument('--apps', type=int, default=10, help='Number of apps (with 5 features each) to seed')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        identifiers = self._seed(options['users'], options['apps'])
+        factory = APIRequestFactory()
+        view = BenchmarkLoginView.as_view()
+
+        latencies = []
+        query_counts = []
+        failures = 0
+
+        for i in range(options['iterations']):
+            request = factory.post(
+                '/api/auth-user/login/',
+                {'identifier': identifiers[i % len(identifiers)], 'password': self.PASSWORD},
+                format='json'
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = view(request)
+                elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                failures += 1
+                continue
+            latencies.append(elapsed)
+            query_counts.append(count_queries(ctx.captured_queries))
+
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'All {failures} logins failed'))
+            return
+
+        budget = LoginView.query_budget
+        steady = query_counts[len(identifiers):] or query_counts
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('Login benchmark'))
+        self.stdout.write(f'  Users: {len(identifiers)}   Logins: {len(latencies)}   Failures: {failures}')
+        self.stdout.write(f'  Latency p50: {percentile(latencies, 50):.2f} ms')
+        self.stdout.write(f'  Latency p99: {percentile(latencies, 99):.2f} ms')
+        self.stdout.write(f'  Latency mean: {statistics.mean(latencies):.2f} ms')
+        self.stdout.write(
+            f'  Queries per login (first pass): min {min(query_counts)}, '
+            f'median {statistics.median(query_counts):g}, max {max(query_counts)}'
+        )
+        self.stdout.write(
+            f'  Queries per login (steady state): min {min(steady)}, '
+            f'median {statistics.median(steady):g}, max {max(steady)}'
+        )
+
+        if max(steady) > budget:
+            self.stdout.write(self.style.WARNING(f'  Over query budget of {budget}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'  Within query budget of {budget}'))
+
+    def _seed(self, user_count, app_count):
+        """Create verified users with a role granting access to every seeded app and feature"""
+        role = UserRole.objects.create(name='Benchmark Admin', code='BENCHMARK_ADMIN', level=RoleLevel.ADMIN)
+
+        for a in range(app_count):
+            app = App.objects.create(name=f'Benchmark App {a}', code=f'BENCHMARK_APP_{a}')
+            RoleAppMapping.objects.create(role=role, app=app, can_view=True)
+            for f in range(5):
+                feature = Feature.objects.create(app=app, name=f'Benchmark Feature {a}.{f}', code=f'BENCHMARK_FEATURE_{a}_{f}')
+                RoleFeatureMapping.objects.create(role=role, feature=feature, can_view=True)
+
+        identifiers = []
+        for i in range(user_count):
+            user = User(
+                email=f'benchmark{i}@example.com',
+                username=f'benchmark_user_{i}',
+                first_name='Benchmark',
+                last_name=f'User{i}',
+                user_role='ADMIN',
+                is_email_verified=True,
+                is_phone_verified=True,
+            )
+            user.set_password(self.PASSWORD)
+            user.save()
+            UserRoleAssignment.objects.create(user=user, role=role, is_primary=True)
+            identifiers.append(user.email)
+
+        self.stdout.write(f'Seeded {user_count} users, {app_count} apps, {app_count * 5} features')
+        return identifiers
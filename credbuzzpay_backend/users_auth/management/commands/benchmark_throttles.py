@@ -0,0 +1,84 @@
+"""
+Management command to benchmark the GCRA throttle against SimpleRateThrottle.
+
+Runs the same request stream through DRF's SimpleRateThrottle and
+GCRARateThrottle and reports the cost per allow_request() check and the
+size of the state stored per key.
+
+Two workloads are measured:
+    - hot key: one client sending far more than the rate allows, so the
+      SimpleRateThrottle history is always full
+    - many keys: requests spread over --keys clients
+
+By default both run against a private local-memory cache; --shared uses the
+configured default cache (e.g. Redis) under a throwaway key prefix.
+
+Usage:
+    python manage.py benchmark_throttles
+    python manage.py benchmark_throttles --rate 100/minute --checks 50000
+    python manage.py benchmark_throttles --shared
+"""
+
+import pickle
+import time
+import uuid
+
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from rest_framework.throttling import SimpleRateThrottle
+
+from users_auth.throttling import GCRARateThrottle
+
+
+class Command(BaseCommand):
+    help = 'Compare per-check cost and memory per key of GCRA and SimpleRateThrottle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', default='10/minute', help='Throttle rate (default: 10/minute)')
+        parser.add_argument('--checks', type=int, default=20000, help='Checks per workload')
+        parser.add_argument('--keys', type=int, default=1000, help='Clients in the many-keys workload')
+        parser.add_argument('--shared', action='store_true', help='Use the configured default cache')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        if options['shared']:
+            cache = default_cache
+        else:
+            cache = LocMemCache(f'throttle-benchmark-{run_id}', {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 4}})
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Throttle benchmark: rate {options['rate']}, {options['checks']} checks per workload"
+        ))
+        for name, base in (('SimpleRateThrottle', SimpleRateThrottle), ('GCRARateThrottle', GCRARateThrottle)):
+            throttle_class = type(f'Benchmark{name}', (base,), {
+                'rate': options['rate'],
+                'cache': cache,
+                'get_cache_key': lambda self, request, view: request,
+            })
+            prefix = f'throttle_benchmark_{run_id}_{name}'
+            hot = self._run(throttle_class, [f'{prefix}_hot'], options['checks'])
+            many = self._run(throttle_class, [f'{prefix}_{i}' for i in range(options['keys'])], options['checks'])
+            state_bytes = self._state_size(cache, throttle_class, f'{prefix}_hot')
+
+            self.stdout.write(f'  {name}')
+            self.stdout.write(f"    hot key:   {hot['us']:.2f} us/check ({hot['allowed']} allowed)")
+            self.stdout.write(f"    many keys: {many['us']:.2f} us/check ({many['allowed']} allowed)")
+            self.stdout.write(f'    state per key at full burst: {state_bytes} bytes (pickled)')
+
+    def _run(self, throttle_class, keys, checks):
+        """Time allow_request() over checks requests cycling through keys"""
+        throttle = throttle_class()
+        allowed = 0
+        started = time.perf_counter()
+        for i in range(checks):
+            if throttle.allow_request(keys[i % len(keys)], None):
+                allowed += 1
+        elapsed = time.perf_counter() - started
+        return {'us': elapsed / checks * 1_000_000, 'allowed': allowed}
+
+    def _state_size(self, cache, throttle_class, key):
+        """Size of the value stored for a key whose burst is exhausted"""
+        throttle = throttle_class()
+        throttle.allow_request(key, None)
+        return len(pickle.dumps(cache.get(throttle.key), pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,95 @@
+"""
+Management command to purge old activity logs, login attempts and outbound emails.
+
+Deletes rows past their retention period in primary-key chunks, each in its
+own short transaction, so it can run against very large tables while the
+application keeps inserting. Progress is reported as the last primary key
+processed; pass it back with --start-id to resume an interrupted run.
+
+Targets:
+    activity_logs   - UserActivityLog older than ACTIVITY_LOG_RETENTION_DAYS
+    login_attempts  - LoginAttempt (not blocked) idle for LOGIN_ATTEMPT_RETENTION_DAYS
+    outbound_emails - OutboundEmail sent, failed or expired, older than OUTBOUND_EMAIL_RETENTION_DAYS
+
+Usage:
+    python manage.py purge_old_records
+    python manage.py purge_old_records activity_logs --days 180 --chunk-size 10000 --sleep 0.2
+    python manage.py purge_old_records activity_logs --start-id 48250000
+    python manage.py purge_old_records --dry-run
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from users_auth.retention import ChunkedRetention, RETENTION_TARGETS
+
+
+class Command(BaseCommand):
+    help = 'Delete expired activity logs, login attempts and outbound emails in small primary-key chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets',
+            nargs='*',
+            help=f"Targets to purge (default: all): {', '.join(RETENTION_TARGETS)}",
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Retention period in days (default: the target\'s setting)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Primary-key range deleted per transaction (default: 5000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.05,
+            help='Seconds to pause between chunks (default: 0.05)',
+        )
+        parser.add_argument(
+            '--start-id',
+            type=int,
+            help='Resume after this primary key (single target only)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count rows that would be deleted without deleting',
+        )
+
+    def handle(self, *args, **options):
+        targets = options['targets'] or list(RETENTION_TARGETS)
+        unknown = [t for t in targets if t not in RETENTION_TARGETS]
+        if unknown:
+            raise CommandError(f"Unknown target(s): {', '.join(unknown)}")
+        if options['start_id'] is not None and len(targets) != 1:
+            raise CommandError('--start-id requires exactly one target')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        outcome = 'rows would be deleted' if options['dry_run'] else 'rows deleted'
+        for target in targets:
+            retention = ChunkedRetention.for_target(
+                target,
+                days=options['days'],
+                chunk_size=options['chunk_size'],
+                sleep=options['sleep'],
+                progress=self._progress(target),
+            )
+            try:
+                total = retention.run(start_id=options['start_id'], dry_run=options['dry_run'])
+            except KeyboardInterrupt:
+                if retention.cursor is not None:
+                    self.stdout.write(self.style.WARNING(
+                        f'Interrupted. Resume with: purge_old_records {target} --start-id {retention.cursor}'
+                    ))
+                raise
+            self.stdout.write(self.style.SUCCESS(f'{target}: {total} {outcome}'))
+
+    def _progress(self, target):
+        def report(cursor, high, total, elapsed):
+            rate = total / elapsed if elapsed else 0
+            self.stdout.write(f'  {target}: up to id {cursor}/{high}, {total} rows ({rate:.0f} rows/s)')
+        return report
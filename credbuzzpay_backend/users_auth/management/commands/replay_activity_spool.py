@@ -0,0 +1,48 @@
+"""
+Management command to load activity log spool files left by dead workers.
+
+A worker killed before flushing its buffered activity logs leaves its
+entries in a spool file under ACTIVITY_LOG_SPOOL_DIR. This command inserts
+them and deletes the files. Spool files still locked by a running process
+are skipped, as are entries already stored, so it is safe to re-run.
+
+Usage:
+    python manage.py replay_activity_spool
+    python manage.py replay_activity_spool --dry-run
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+from users_auth.activity_buffer import ActivityLogBuffer
+
+
+class Command(BaseCommand):
+    help = 'Insert activity log entries from spool files of dead workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be inserted without writing',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        paths = ActivityLogBuffer.orphaned_spools()
+        if not paths:
+            self.stdout.write('No orphaned spool files found')
+            return
+
+        total = 0
+        for path in paths:
+            inserted = ActivityLogBuffer.replay_spool(path, dry_run=dry_run)
+            if inserted is None:
+                continue
+            total += inserted
+            self.stdout.write(f'  {os.path.basename(path)}: {inserted} entries')
+
+        prefix = '[DRY RUN] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Replayed {total} activity log entries from {len(paths)} spool files'
+        ))
@@ -0,0 +1,72 @@
+"""
+Management command to deliver queued outbound emails.
+
+Runs until interrupted: claims due OutboundEmail rows in batches and sends
+them over a pool of persistent SMTP connections, retrying failures with
+exponential backoff. Several workers can run at once.
+
+Usage:
+    python manage.py run_email_worker
+    python manage.py run_email_worker --connections 8 --batch-size 100
+    python manage.py run_email_worker --once
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from users_auth.email_queue import EmailQueue, SMTPConnectionPool, process_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbound emails over persistent SMTP connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=getattr(settings, 'EMAIL_QUEUE_CONNECTIONS', 4),
+            help='Persistent SMTP connections (default: EMAIL_QUEUE_CONNECTIONS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=EmailQueue.get_batch_size(),
+            help='Messages claimed per batch (default: EMAIL_QUEUE_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the messages that are due now, then exit',
+        )
+
+    def handle(self, *args, **options):
+        pool = SMTPConnectionPool(options['connections'])
+        self.stdout.write(f"Email worker started with {options['connections']} connections")
+
+        sent_total = failed_total = 0
+        try:
+            while True:
+                close_old_connections()
+                sent, failed = process_batch(pool, options['batch_size'])
+                sent_total += sent
+                failed_total += failed
+                if sent or failed:
+                    self.stdout.write(f'  Sent {sent}, failed {failed}')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Email worker stopped: {sent_total} sent, {failed_total} failed'))
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.20 on 2026-10-19 00:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_auth', '0005_user_email_verified_at_user_is_email_verified_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserIdentifier',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('identifier_type', models.CharField(choices=[('EMAIL', 'Email'), ('USERNAME', 'Username'), ('USER_CODE', 'User Code'), ('PHONE', 'Phone Number')], max_length=20)),
+                ('value', models.CharField(max_length=255)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='login_identifiers', to='users_auth.user')),
+            ],
+            options={
+                'db_table': 'users_auth_user_identifier',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='useridentifier',
+            constraint=models.UniqueConstraint(fields=('identifier_type', 'value'), name='unique_login_identifier'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.20 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+SEARCH_FIELDS = ('email', 'username', 'first_name', 'last_name', 'user_code')
+
+
+def backfill_search_text(apps, schema_editor):
+    """Fill search_text for existing users in primary-key batches"""
+    User = apps.get_model('users_auth', 'User')
+    last_id = 0
+    while True:
+        users = list(User.objects.filter(id__gt=last_id).order_by('id').only('id', *SEARCH_FIELDS)[:1000])
+        if not users:
+            break
+        for user in users:
+            user.search_text = '\n'.join(
+                str(getattr(user, f)).lower() for f in SEARCH_FIELDS if getattr(user, f)
+            )
+        User.objects.bulk_update(users, ['search_text'])
+        last_id = users[-1].id
+
+
+def create_trigram_index(apps, schema_editor):
+    """Trigram GIN index so substring search doesn't scan the table (PostgreSQL only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS user_search_text_trgm_idx '
+        'ON users_auth_user USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS user_search_text_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_auth', '0007_activity_log_event_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-created_at', '-id'], name='user_created_id_desc_idx'),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.20 on 2026-10-19 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_auth', '0008_user_search_and_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'users_auth_code_sequence',
+            },
+        ),
+    ]
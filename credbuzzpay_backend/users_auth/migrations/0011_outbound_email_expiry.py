@@ -0,0 +1,30 @@
+# Generated by Django 4.2.20 on 2026-10-19 01:57
+
+from django.db import migrations, models
+
+
+def redact_finished_emails(apps, schema_editor):
+    """Clear the bodies (codes, reset tokens) of messages already sent or failed"""
+    OutboundEmail = apps.get_model('users_auth', 'OutboundEmail')
+    OutboundEmail.objects.filter(status__in=['SENT', 'FAILED']).update(body='', html_body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users_auth', '0010_outbound_email_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, help_text="Not sent after this (e.g. the OTP's expiry)", null=True),
+        ),
+        migrations.AlterField(
+            model_name='outboundemail',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('SENDING', 'Sending'), ('SENT', 'Sent'), ('FAILED', 'Failed'), ('EXPIRED', 'Expired')], default='QUEUED', max_length=10),
+        ),
+        migrations.RunPython(redact_finished_emails, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,9 @@
 Custom User Model for users_auth app
 This model is completely custom without using Django's AbstractUser or AbstractBaseUser
 """
-from django.db import models
+from django.db import models, transaction
 import hashlib
+import re
 import secrets
 import string
 import random
@@ -15,6 +16,9 @@ class UserCodeGenerator:
     """
     Utility class to generate unique user codes.
     Format: ABC001, XY1234, A0B221 (minimum 5 characters, alphanumeric)
+    
+    New users get their code from UserCodeAllocator (see code_allocator),
+    which hands out pre-verified codes without per-user queries.
     """
     
     @staticmethod
@@ -117,18 +121,62 @@ class User(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     last_login = models.DateTimeField(blank=True, null=True)
     
+    # Lowercased SEARCH_FIELDS, one per line, so user search is a single
+    # substring match (trigram-indexed on PostgreSQL)
+    search_text = models.TextField(blank=True, default='', editable=False)
+    
     class Meta:
         db_table = 'users_auth_user'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the user list
+            models.Index(fields=['-created_at', '-id'], name='user_created_id_desc_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user_code} - {self.email}"
     
+    # Fields mirrored into the UserIdentifier login index
+    IDENTIFIER_FIELDS = ('email', 'username', 'user_code', 'phone_number')
+    
+    # Fields matched by the user list search
+    SEARCH_FIELDS = ('email', 'username', 'first_name', 'last_name', 'user_code')
+    
+    def build_search_text(self):
+        """Build the normalized search column from SEARCH_FIELDS"""
+        return '\n'.join(str(getattr(self, f)).lower() for f in self.SEARCH_FIELDS if getattr(self, f))
+    
+    @staticmethod
+    def normalize_search(term):
+        """Normalize a search term the same way as search_text"""
+        return (term or '').replace('\n', ' ').strip().lower()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the login identifiers as loaded, so unchanged saves skip the index sync"""
+        instance = super().from_db(db, field_names, values)
+        if all(field in field_names for field in cls.IDENTIFIER_FIELDS):
+            instance._indexed_identifiers = UserIdentifier.identifiers_for(instance)
+        return instance
+    
     def save(self, *args, **kwargs):
-        """Override save to auto-generate user_code if not provided"""
+        """Override save to auto-generate user_code and maintain the search column and login identifier index"""
         if not self.user_code:
-            self.user_code = UserCodeGenerator.generate_unique_code(User, 'user_code', length=6)
+            from .code_allocator import UserCodeAllocator
+            self.user_code = UserCodeAllocator.allocate()
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(self.SEARCH_FIELDS):
+            self.search_text = self.build_search_text()
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = [*update_fields, 'search_text']
         super().save(*args, **kwargs)
+        
+        if update_fields is None or set(update_fields) & set(self.IDENTIFIER_FIELDS):
+            identifiers = UserIdentifier.identifiers_for(self)
+            if identifiers != getattr(self, '_indexed_identifiers', None):
+                UserIdentifier.sync_for_user(self, identifiers)
+                self._indexed_identifiers = identifiers
     
     @staticmethod
     def generate_salt():
@@ -214,6 +262,201 @@ class User(models.Model):
         return self.role_level < target_user.role_level
 
 
+class UserIdentifier(models.Model):
+    """
+    Normalized login identifier index.
+    
+    One row per (type, normalized value) for each user, so a login
+    identifier of any type resolves with a single indexed lookup:
+    - EMAIL: lowercased email
+    - USERNAME: username as entered
+    - USER_CODE: uppercased user_code
+    - PHONE: canonical 10-digit phone key (last 10 digits)
+    
+    Rows are maintained by User.save(); backfill existing users with
+    `python manage.py backfill_login_identifiers`.
+    """
+    
+    EMAIL = 'EMAIL'
+    USERNAME = 'USERNAME'
+    USER_CODE = 'USER_CODE'
+    PHONE = 'PHONE'
+    
+    TYPE_CHOICES = [
+        (EMAIL, 'Email'),
+        (USERNAME, 'Username'),
+        (USER_CODE, 'User Code'),
+        (PHONE, 'Phone Number'),
+    ]
+    
+    # Resolution order when an identifier matches several types
+    PRIORITY = [EMAIL, USERNAME, USER_CODE, PHONE]
+    
+    # Digits with an optional leading + and separators; only these are tried as phones
+    PHONE_PATTERN = re.compile(r'^\+?[\d\s().-]+$')
+    
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_identifiers')
+    identifier_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    value = models.CharField(max_length=255)
+    
+    class Meta:
+        db_table = 'users_auth_user_identifier'
+        constraints = [
+            models.UniqueConstraint(fields=['identifier_type', 'value'], name='unique_login_identifier'),
+        ]
+    
+    def __str__(self):
+        return f"{self.identifier_type}: {self.value}"
+    
+    @staticmethod
+    def phone_key(phone_number):
+        """Canonical phone key: the last 10 digits, or None if there are fewer"""
+        digits = re.sub(r'\D', '', phone_number or '')
+        if len(digits) < 10:
+            return None
+        return digits[-10:]
+    
+    @classmethod
+    def normalize(cls, identifier_type, value):
+        """Normalize a raw identifier value for its type (None if it can't be indexed)"""
+        if not value:
+            return None
+        value = str(value).strip()
+        if identifier_type == cls.EMAIL:
+            return value.lower()
+        if identifier_type == cls.USER_CODE:
+            return value.upper()
+        if identifier_type == cls.PHONE:
+            return cls.phone_key(value)
+        return value
+    
+    @classmethod
+    def identifiers_for(cls, user):
+        """Get the {type: normalized value} identifiers a user should be indexed under"""
+        raw = {
+            cls.EMAIL: user.email,
+            cls.USERNAME: user.username,
+            cls.USER_CODE: user.user_code,
+            cls.PHONE: user.phone_number,
+        }
+        identifiers = {}
+        for identifier_type, value in raw.items():
+            normalized = cls.normalize(identifier_type, value)
+            if normalized:
+                identifiers[identifier_type] = normalized
+        return identifiers
+    
+    @classmethod
+    def sync_for_user(cls, user, identifiers=None):
+        """
+        Bring a user's index rows in line with their current identifiers.
+        
+        Values already claimed by another user (e.g. two phone numbers that
+        share the same last 10 digits) are skipped; such users still resolve
+        through the exact-match fallback in find_user().
+        """
+        if identifiers is None:
+            identifiers = cls.identifiers_for(user)
+        
+        with transaction.atomic():
+            existing = {
+                row.identifier_type: row
+                for row in cls.objects.filter(user=user)
+            }
+            stale = [
+                row.id for identifier_type, row in existing.items()
+                if identifiers.get(identifier_type) != row.value
+            ]
+            if stale:
+                cls.objects.filter(id__in=stale).delete()
+            missing = [
+                cls(user=user, identifier_type=identifier_type, value=value)
+                for identifier_type, value in identifiers.items()
+                if identifier_type not in existing or existing[identifier_type].id in stale
+            ]
+            if missing:
+                cls.objects.bulk_create(missing, ignore_conflicts=True)
+    
+    @classmethod
+    def candidates(cls, identifier, detected_type=None):
+        """
+        Get (type, normalized value) pairs to try for a raw login identifier,
+        detected type first, then every other type in PRIORITY order.
+        
+        The PHONE candidate is only tried for phone-shaped identifiers, so a
+        mistyped email or username never resolves to an account whose phone
+        number shares its last 10 digits.
+        """
+        order = cls.PRIORITY
+        if detected_type in order:
+            order = [detected_type] + [t for t in order if t != detected_type]
+        if not cls.PHONE_PATTERN.match(str(identifier or '').strip()):
+            order = [t for t in order if t != cls.PHONE]
+        pairs = []
+        for identifier_type in order:
+            value = cls.normalize(identifier_type, identifier)
+            if value and (identifier_type, value) not in pairs:
+                pairs.append((identifier_type, value))
+        return pairs
+    
+    @classmethod
+    def find_user(cls, identifier, detected_type=None, select_related=()):
+        """
+        Resolve a raw login identifier to a User.
+        
+        Tries every candidate type in one indexed query on the identifier
+        index. If nothing matches (e.g. index not yet backfilled) it falls
+        back to a single exact-match query on the unique User columns and
+        re-indexes the user it finds.
+        
+        Returns:
+            User or None
+        """
+        identifier = str(identifier or '').strip()
+        pairs = cls.candidates(identifier, detected_type)
+        if not pairs:
+            return None
+        
+        query = models.Q()
+        for identifier_type, value in pairs:
+            query |= models.Q(identifier_type=identifier_type, value=value)
+        related = ['user'] + [f'user__{name}' for name in select_related]
+        rows = {
+            (row.identifier_type, row.value): row
+            for row in cls.objects.filter(query).select_related(*related)
+        }
+        for pair in pairs:
+            if pair in rows:
+                return rows[pair].user
+        
+        user = User.objects.select_related(*select_related).filter(
+            models.Q(email=identifier.lower()) |
+            models.Q(username=identifier) |
+            models.Q(user_code=identifier.upper()) |
+            models.Q(phone_number=identifier)
+        ).first()
+        if user:
+            cls.sync_for_user(user)
+        return user
+
+
+class CodeSequence(models.Model):
+    """
+    Named counters that hand out blocks of sequence numbers.
+    Used by UserCodeAllocator to reserve user codes per worker.
+    """
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'users_auth_code_sequence'
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
 class PasswordResetToken(models.Model):
     """
     Model to store password reset tokens
@@ -284,23 +527,57 @@ class UserSession(models.Model):
     
     def invalidate(self):
         """Invalidate this session"""
+        from .session_cache import SessionIdentityCache
         self.is_active = False
         self.save(update_fields=['is_active'])
+        SessionIdentityCache.invalidate_user(self.user_id)
+    
+    @classmethod
+    def deactivate_for_user(cls, user):
+        """
+        Invalidate all active sessions of a user (logout everywhere).
+        Also drops the user's cached identities so existing access tokens
+        are re-checked against the database.
+        
+        Returns:
+            int: Number of sessions deactivated
+        """
+        from .session_cache import SessionIdentityCache
+        count = cls.objects.filter(user=user, is_active=True).update(is_active=False)
+        SessionIdentityCache.invalidate_user(user.pk)
+        return count
     
     def is_valid(self):
         """Check if session is still valid"""
         return self.is_active and self.expires_at > timezone.now()
     
+    def save(self, *args, **kwargs):
+        """Override save so an explicit last_activity write supersedes pending heartbeats"""
+        update_fields = kwargs.get('update_fields')
+        if self.pk and (update_fields is None or 'last_activity' in update_fields):
+            from .activity_tracker import SessionActivityTracker
+            SessionActivityTracker.forget(self.token_id)
+        super().save(*args, **kwargs)
+    
     def update_activity(self):
-        """Update last activity timestamp"""
+        """
+        Update last activity timestamp.
+        The write is deferred to SessionActivityTracker and flushed in batches.
+        """
+        from .activity_tracker import SessionActivityTracker
         self.last_activity = timezone.now()
-        self.save(update_fields=['last_activity'])
+        SessionActivityTracker.record(self.token_id, self.last_activity)
+    
+    def get_last_activity(self):
+        """Get the freshest last activity, including heartbeats not yet flushed"""
+        from .activity_tracker import SessionActivityTracker
+        return SessionActivityTracker.get_last_activity(self.token_id, self.last_activity)
     
     def is_inactive_expired(self, inactivity_minutes=30):
         """Check if session has expired due to inactivity"""
         if not self.is_active:
             return True
-        inactivity_threshold = self.last_activity + timedelta(minutes=inactivity_minutes)
+        inactivity_threshold = self.get_last_activity() + timedelta(minutes=inactivity_minutes)
         return timezone.now() > inactivity_threshold
 
 
@@ -316,6 +593,10 @@ class LoginAttempt(models.Model):
     - Then wait 30 minutes
     - Then wait 60 minutes
     - Then account is blocked (needs admin intervention)
+    
+    Login requests are tracked by LoginLockoutEngine in the cache; a row is
+    only written on stage transitions and permanent blocks. Saving a row
+    (e.g. an admin unblock) makes the engine reload it.
     """
     
     LOCKOUT_STAGES = [
@@ -473,12 +754,10 @@ class LoginAttempt(models.Model):
     
     @classmethod
     def cleanup_old_records(cls, days=30):
-        """Clean up old login attempt records"""
-        threshold = timezone.now() - timedelta(days=days)
-        return cls.objects.filter(
-            last_attempt_at__lt=threshold,
-            is_blocked=False
-        ).delete()
+        """Clean up old login attempt records in primary-key chunks"""
+        from .retention import ChunkedRetention
+        deleted = ChunkedRetention.for_target('login_attempts', days=days).run()
+        return deleted, {cls._meta.label: deleted}
 
 
 class UserActivityLog(models.Model):
@@ -548,8 +827,8 @@ class UserActivityLog(models.Model):
     is_success = models.BooleanField(default=True)
     error_message = models.TextField(blank=True)
     
-    # Timestamp
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Timestamp (set when the activity happens, not when a buffered entry is written)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         db_table = 'users_auth_activity_log'
@@ -566,10 +845,14 @@ class UserActivityLog(models.Model):
     
     @classmethod
     def log_activity(cls, user, activity_type, action, description='', entity_type='', entity_id='',
-                     metadata=None, request=None, is_success=True, error_message=''):
+                     metadata=None, request=None, is_success=True, error_message='', sync=False):
         """
         Helper method to create an activity log entry.
         
+        Entries are buffered and written in batches (see activity_buffer), so
+        the returned instance is unsaved. Pass sync=True to insert the row
+        immediately when the caller needs to read it back.
+        
         Usage:
             UserActivityLog.log_activity(
                 user=request.user,
@@ -596,7 +879,14 @@ class UserActivityLog(models.Model):
             log_data['request_method'] = request.method
             log_data['request_path'] = request.path[:500]
         
-        return cls.objects.create(**log_data)
+        entry = cls(**log_data)
+        
+        from .activity_buffer import ActivityLogBuffer
+        if sync or not ActivityLogBuffer.is_enabled():
+            entry.save()
+        else:
+            ActivityLogBuffer.enqueue(entry)
+        return entry
     
     @classmethod
     def get_user_activities(cls, user, activity_types=None, start_date=None, end_date=None, limit=100):
@@ -616,6 +906,60 @@ class UserActivityLog(models.Model):
     
     @classmethod
     def cleanup_old_logs(cls, days=90):
-        """Clean up old activity logs."""
-        threshold = timezone.now() - timedelta(days=days)
-        return cls.objects.filter(created_at__lt=threshold).delete()
+        """Clean up old activity logs in primary-key chunks."""
+        from .retention import ChunkedRetention
+        deleted = ChunkedRetention.for_target('activity_logs', days=days).run()
+        return deleted, {cls._meta.label: deleted}
+
+
+class OutboundEmail(models.Model):
+    """
+    Durable outbound email queue.
+    
+    Requests only insert a row; the `run_email_worker` management command
+    sends queued messages over persistent SMTP connections, retrying
+    failures with exponential backoff (see email_queue.EmailQueue).
+    
+    Bodies can hold OTP codes and reset tokens: they are cleared once a
+    message is sent, failed or expired, and finished rows are deleted by
+    `purge_old_records outbound_emails`.
+    """
+    
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        SENDING = 'SENDING', 'Sending'
+        SENT = 'SENT', 'Sent'
+        FAILED = 'FAILED', 'Failed'
+        EXPIRED = 'EXPIRED', 'Expired'
+    
+    id = models.BigAutoField(primary_key=True)
+    
+    # Message
+    to_email = models.EmailField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    category = models.CharField(max_length=50, blank=True, help_text="Message kind (e.g. OTP, WELCOME)")
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="Not sent after this (e.g. the OTP's expiry)")
+    
+    # Delivery state
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Lease of the worker sending it")
+    last_error = models.TextField(blank=True)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'users_auth_outbound_email'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.category or 'EMAIL'} to {self.to_email} ({self.status})"
@@ -0,0 +1,109 @@
+"""
+Effective-permission snapshot cache for JWTManager.get_user_permissions
+
+Login, token refresh and the login response all need the user's app and
+feature IDs. Resolving them takes three queries, so the result is cached
+per user as an immutable snapshot.
+
+Snapshots are keyed by the global RBAC generation (see rbac.cache), which
+is bumped whenever roles, apps, features, mappings or assignments change.
+A change therefore makes every snapshot unreachable on all workers, and
+no per-user bookkeeping is needed. That only holds with a shared cache
+backend, so the cache is off on a process-local one.
+
+Temporary role assignments are handled by never keeping a snapshot past
+the next valid_from / valid_until boundary: the snapshot carries its
+expiry, which also bounds the copy a worker takes into its local LRU.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from credbuzzpay_backend.cache_utils import LocalLRUCache, cache_is_shared
+
+
+class PermissionSnapshotCache:
+    """
+    Two-level cache of (app_ids, feature_ids) per user and RBAC generation.
+    """
+
+    KEY_PREFIX = 'auth:perms'
+
+    _local = None
+
+    @staticmethod
+    def is_enabled():
+        """
+        Check if permission snapshots are enabled in settings and the cache
+        is shared, so an RBAC change reaches every worker
+        """
+        return getattr(settings, 'RBAC_PERMISSION_CACHE_ENABLED', True) and cache_is_shared()
+
+    @staticmethod
+    def get_ttl():
+        """Get maximum lifetime of a snapshot in seconds"""
+        return getattr(settings, 'RBAC_PERMISSION_CACHE_TTL_SECONDS', 3600)
+
+    @classmethod
+    def get_local_cache(cls):
+        """Get (lazily creating) the in-process LRU for this worker"""
+        if cls._local is None:
+            cls._local = LocalLRUCache(
+                maxsize=getattr(settings, 'RBAC_PERMISSION_CACHE_LOCAL_MAXSIZE', 2048),
+                ttl=cls.get_ttl(),
+            )
+        return cls._local
+
+    @classmethod
+    def _key(cls, user, generation):
+        # created_at guards against a recycled primary key picking up a stale snapshot
+        created = user.created_at.timestamp() if user.created_at else ''
+        return f"{cls.KEY_PREFIX}:{generation}:{user.pk}:{created}"
+
+    @classmethod
+    def get(cls, user, generation):
+        """
+        Get the cached snapshot for user at the given RBAC generation.
+
+        Returns:
+            tuple: (app_ids, feature_ids) lists, or None on miss
+        """
+        if generation is None:
+            return None
+        key = cls._key(user, generation)
+        local = cls.get_local_cache()
+        snapshot = local.get(key)
+        if snapshot is None:
+            snapshot = cache.get(key)
+            if snapshot is None:
+                return None
+            # Keep the local copy no longer than the shared entry's own expiry
+            remaining = snapshot[2] - time.time()
+            if remaining <= 0:
+                return None
+            local.set(key, snapshot, ttl=remaining)
+        return list(snapshot[0]), list(snapshot[1])
+
+    @classmethod
+    def set(cls, user, generation, app_ids, feature_ids, valid_until=None):
+        """
+        Cache a snapshot resolved at generation.
+
+        Args:
+            valid_until: Earliest moment the snapshot may change without an
+                RBAC write (a temporary assignment starting or ending)
+        """
+        if generation is None:
+            return
+        ttl = cls.get_ttl()
+        if valid_until is not None:
+            ttl = min(ttl, int((valid_until - timezone.now()).total_seconds()))
+        if ttl <= 0:
+            return
+        key = cls._key(user, generation)
+        # (app_ids, feature_ids, expires_at as a UNIX timestamp)
+        snapshot = (tuple(app_ids), tuple(feature_ids), time.time() + ttl)
+        cls.get_local_cache().set(key, snapshot, ttl=ttl)
+        cache.set(key, snapshot, timeout=ttl)
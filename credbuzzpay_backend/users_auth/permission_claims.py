@@ -0,0 +1,144 @@
+"""
+Compact permission claims for access tokens
+
+Access tokens used to carry app_access / feature_access as plain lists of
+IDs, which made admin tokens several KB long. They are now encoded as a
+bitset over the permission catalog:
+
+- catalog position of an app or feature is its primary key; keys are never
+  reused, so a position stays valid for the lifetime of the catalog
+- bit N of the bitset is set when the user can access the entry with id N
+- the bitset is serialized little-endian, zlib-compressed when that is
+  shorter, and base64url encoded with a one-character format prefix:
+  'b' for raw bytes, 'z' for compressed bytes
+
+The 'perm_ver' claim records the catalog version a token was encoded with.
+Tokens without 'perm_ver' carry the legacy ID lists; decode() accepts both.
+"""
+import base64
+import zlib
+
+from django.conf import settings
+
+
+class PermissionClaims:
+    """
+    Encode and decode bitmap permission claims.
+    """
+
+    # Catalog version: bump when catalog positions or the wire format change
+    CATALOG_VERSION = 1
+
+    RAW_PREFIX = 'b'
+    COMPRESSED_PREFIX = 'z'
+
+    @staticmethod
+    def is_enabled():
+        """Check if compact permission claims are enabled in settings"""
+        return getattr(settings, 'JWT_COMPACT_PERMISSION_CLAIMS', True)
+
+    @staticmethod
+    def ids_to_mask(ids):
+        """Build an integer bitmask from catalog IDs"""
+        mask = 0
+        for position in ids:
+            mask |= 1 << int(position)
+        return mask
+
+    @staticmethod
+    def mask_to_ids(mask):
+        """Expand an integer bitmask into a sorted list of catalog IDs"""
+        bits = bin(mask)[:1:-1]
+        return [position for position, bit in enumerate(bits) if bit == '1']
+
+    @classmethod
+    def encode(cls, ids):
+        """
+        Encode catalog IDs as a bitmap claim.
+
+        Args:
+            ids: Iterable of app or feature IDs
+
+        Returns:
+            str: Prefixed base64url bitmap ('b' for an empty set)
+        """
+        mask = cls.ids_to_mask(ids)
+        raw = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+        prefix, data = cls.RAW_PREFIX, raw
+        compressed = zlib.compress(raw, 9)
+        if len(compressed) < len(raw):
+            prefix, data = cls.COMPRESSED_PREFIX, compressed
+        return prefix + base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+    @classmethod
+    def decode_mask(cls, claim):
+        """
+        Decode a bitmap claim into an integer bitmask.
+
+        Raises:
+            ValueError: If the claim is malformed
+        """
+        if not isinstance(claim, str) or not claim:
+            raise ValueError("Permission claim must be a non-empty string")
+        prefix, body = claim[0], claim[1:]
+        try:
+            data = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+            if prefix == cls.COMPRESSED_PREFIX:
+                data = zlib.decompress(data)
+            elif prefix != cls.RAW_PREFIX:
+                raise ValueError(f"Unknown permission claim format: {prefix}")
+        except (ValueError, zlib.error) as e:
+            raise ValueError(f"Invalid permission claim: {str(e)}")
+        return int.from_bytes(data, 'little')
+
+    @classmethod
+    def build_claims(cls, app_ids, feature_ids):
+        """
+        Build the permission claims for an access token payload.
+
+        Returns:
+            dict: app_access, feature_access and (when compact) perm_ver
+        """
+        if not cls.is_enabled():
+            return {
+                'app_access': list(app_ids),
+                'feature_access': list(feature_ids),
+            }
+        return {
+            'app_access': cls.encode(app_ids),
+            'feature_access': cls.encode(feature_ids),
+            'perm_ver': cls.CATALOG_VERSION,
+        }
+
+    @classmethod
+    def get_masks(cls, payload):
+        """
+        Get (app_mask, feature_mask) integer bitmasks from a token payload.
+
+        Accepts both compact and legacy list claims.
+
+        Raises:
+            ValueError: If the claims use an unknown catalog version or are malformed
+        """
+        perm_ver = payload.get('perm_ver')
+        app_claim = payload.get('app_access') or []
+        feature_claim = payload.get('feature_access') or []
+
+        if perm_ver is None:
+            return cls.ids_to_mask(app_claim), cls.ids_to_mask(feature_claim)
+        if perm_ver != cls.CATALOG_VERSION:
+            raise ValueError(f"Unsupported permission catalog version: {perm_ver}")
+        return cls.decode_mask(app_claim), cls.decode_mask(feature_claim)
+
+    @classmethod
+    def decode(cls, payload):
+        """
+        Get (app_ids, feature_ids) frozensets from a token payload.
+        """
+        app_mask, feature_mask = cls.get_masks(payload)
+        return frozenset(cls.mask_to_ids(app_mask)), frozenset(cls.mask_to_ids(feature_mask))
+
+    @staticmethod
+    def has(mask, catalog_id):
+        """Check whether catalog_id is set in a decoded bitmask"""
+        return bool((mask >> catalog_id) & 1)
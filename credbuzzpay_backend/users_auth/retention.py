@@ -0,0 +1,118 @@
+"""
+Chunked retention for append-heavy tables
+
+QuerySet.delete() on an unbounded queryset collects every row in memory
+(for signals and cascades) and deletes them in one long transaction.
+ChunkedRetention instead walks the primary key in fixed-width ranges and
+issues one `DELETE ... WHERE pk > a AND pk <= b AND <condition>` per range,
+each in its own short transaction:
+
+- a transaction never touches more than chunk_size rows
+- rows are never loaded into Python
+- concurrent inserts land above the scanned range and are never blocked
+- progress is the last primary key processed, so an interrupted run can be
+  resumed from it
+
+Because rows are deleted without loading them, no delete signals are sent
+and nothing is cascaded; only use it for tables without dependents.
+"""
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+
+# name -> (model label, condition for a threshold, retention-days setting, default days)
+RETENTION_TARGETS = {
+    'activity_logs': (
+        'users_auth.UserActivityLog',
+        lambda threshold: Q(created_at__lt=threshold),
+        'ACTIVITY_LOG_RETENTION_DAYS',
+        90,
+    ),
+    'login_attempts': (
+        'users_auth.LoginAttempt',
+        lambda threshold: Q(last_attempt_at__lt=threshold, is_blocked=False),
+        'LOGIN_ATTEMPT_RETENTION_DAYS',
+        30,
+    ),
+    'outbound_emails': (
+        'users_auth.OutboundEmail',
+        lambda threshold: Q(created_at__lt=threshold, status__in=['SENT', 'FAILED', 'EXPIRED']),
+        'OUTBOUND_EMAIL_RETENTION_DAYS',
+        30,
+    ),
+}
+
+
+class ChunkedRetention:
+    """
+    Delete the rows of model matching condition in primary-key ranges.
+    """
+
+    def __init__(self, model, condition, chunk_size=5000, sleep=0.0, progress=None):
+        self.model = model
+        self.condition = condition
+        self.chunk_size = chunk_size
+        self.sleep = sleep
+        self.progress = progress
+        self.cursor = None
+
+    @classmethod
+    def for_target(cls, name, days=None, **kwargs):
+        """Build the retention run for a named target in RETENTION_TARGETS"""
+        label, condition, days_setting, default_days = RETENTION_TARGETS[name]
+        if days is None:
+            days = getattr(settings, days_setting, default_days)
+        threshold = timezone.now() - timedelta(days=days)
+        return cls(apps.get_model(label), condition(threshold), **kwargs)
+
+    def bounds(self):
+        """
+        Get the (lowest, highest) primary key of matching rows, or (None, None).
+        Rows inserted after this call are outside the range and never scanned.
+        """
+        result = self.model.objects.filter(self.condition).aggregate(low=Min('pk'), high=Max('pk'))
+        return result['low'], result['high']
+
+    def run(self, start_id=None, dry_run=False):
+        """
+        Delete (or with dry_run, count) matching rows chunk by chunk.
+
+        Args:
+            start_id: Resume after this primary key (the cursor of an earlier run)
+
+        Returns:
+            int: Number of rows deleted (or matched)
+        """
+        low, high = self.bounds()
+        if high is None:
+            return 0
+
+        self.cursor = low - 1 if start_id is None else max(start_id, low - 1)
+        total = 0
+        started = time.monotonic()
+
+        while self.cursor < high:
+            upper = min(self.cursor + self.chunk_size, high)
+            queryset = self.model.objects.filter(self.condition, pk__gt=self.cursor, pk__lte=upper)
+            if dry_run:
+                count = queryset.count()
+            else:
+                with transaction.atomic(using=queryset.db):
+                    # The single-statement DELETE that QuerySet.delete() uses when no
+                    # signals or cascades are involved, without checking for them
+                    count = queryset._raw_delete(queryset.db)
+            total += count
+            self.cursor = upper
+
+            if self.progress:
+                self.progress(self.cursor, high, total, time.monotonic() - started)
+            if self.sleep and self.cursor < high:
+                time.sleep(self.sleep)
+
+        return total
@@ -2,7 +2,7 @@
 Serializers for users_auth app
 """
 from rest_framework import serializers
-from .models import User, PasswordResetToken, RoleName
+from .models import User, PasswordResetToken, RoleName, UserIdentifier
 import re
 from django.utils import timezone
 
@@ -125,6 +125,9 @@ class UserLoginSerializer(serializers.Serializer):
     )
     password = serializers.CharField(write_only=True)
     
+    # KYC status is prefetched with the user, so the login response needs no extra query
+    USER_SELECT_RELATED = ('kyc_application',)
+    
     def _detect_identifier_type(self, identifier):
         """
         Auto-detect the type of identifier provided.
@@ -167,26 +170,13 @@ class UserLoginSerializer(serializers.Serializer):
         data['identifier'] = identifier
         data['identifier_type'] = identifier_type
         
-        # Try to find user by the detected identifier type
-        user = None
-        try:
-            if identifier_type == 'EMAIL':
-                user = User.objects.get(email=identifier)
-            elif identifier_type == 'USERNAME':
-                user = User.objects.get(username=identifier)
-            elif identifier_type == 'USER_CODE':
-                user = User.objects.get(user_code=identifier)
-            elif identifier_type == 'PHONE':
-                # Try exact match first, then try normalized
-                try:
-                    user = User.objects.get(phone_number=identifier)
-                except User.DoesNotExist:
-                    # Try with just the digits
-                    normalized = re.sub(r'[\s\-\(\)]', '', identifier)
-                    user = User.objects.get(phone_number__endswith=normalized[-10:])
-        except User.DoesNotExist:
-            # If not found with detected type, try all types as fallback
-            user = self._find_user_fallback(identifier_input)
+        # Resolve the user through the normalized identifier index: the
+        # detected type is tried first, then every other type, in one query
+        user = UserIdentifier.find_user(
+            identifier_input,
+            detected_type=identifier_type,
+            select_related=self.USER_SELECT_RELATED
+        )
         
         if not user:
             raise serializers.ValidationError({
@@ -227,36 +217,6 @@ class UserLoginSerializer(serializers.Serializer):
         
         data['user'] = user
         return data
-    
-    def _find_user_fallback(self, identifier):
-        """
-        Fallback: Try to find user by checking all identifier types.
-        This handles edge cases where detection might be wrong.
-        """
-        identifier_lower = identifier.lower().strip()
-        identifier_upper = identifier.upper().strip()
-        
-        # Try email
-        user = User.objects.filter(email=identifier_lower).first()
-        if user:
-            return user
-        
-        # Try username
-        user = User.objects.filter(username=identifier.strip()).first()
-        if user:
-            return user
-        
-        # Try user_code
-        user = User.objects.filter(user_code=identifier_upper).first()
-        if user:
-            return user
-        
-        # Try phone_number
-        user = User.objects.filter(phone_number=identifier.strip()).first()
-        if user:
-            return user
-        
-        return None
 
 
 class ForgotPasswordSerializer(serializers.Serializer):
@@ -0,0 +1,149 @@
+"""
+Session identity cache for JWTAuthentication
+
+Caches the resolved user and active session for an access token so that
+authenticated requests don't need to hit the database on every call.
+
+Entries are keyed by the access token's jti and held in two levels:
+- an in-process LRU (per gunicorn worker)
+- the shared Django cache (across workers)
+
+Every entry is stamped with a per-user generation number kept in the
+shared cache. Logout, password change, deactivation and the single-session
+invalidation on login bump that generation, which makes all cached
+entries for the user unreachable on every worker at once. That only holds
+with a shared cache backend, so the cache is off on a process-local one.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from credbuzzpay_backend.cache_utils import LocalLRUCache, bump_generation, cache_is_shared, get_generation
+
+
+class SessionIdentityCache:
+    """
+    Two-level cache of {user, active session} keyed by access token jti.
+    """
+
+    KEY_PREFIX = 'auth:identity'
+
+    _local = None
+
+    @staticmethod
+    def is_enabled():
+        """
+        Check if cached authentication is enabled in settings and the cache
+        is shared, so an invalidation reaches every worker
+        """
+        return getattr(settings, 'JWT_AUTH_CACHE_ENABLED', True) and cache_is_shared()
+
+    @staticmethod
+    def get_ttl():
+        """Get maximum lifetime of a cached identity in seconds"""
+        return getattr(settings, 'JWT_AUTH_CACHE_TTL_SECONDS', 300)
+
+    @classmethod
+    def get_local_cache(cls):
+        """Get (lazily creating) the in-process LRU for this worker"""
+        if cls._local is None:
+            cls._local = LocalLRUCache(
+                maxsize=getattr(settings, 'JWT_AUTH_CACHE_LOCAL_MAXSIZE', 2048),
+                ttl=cls.get_ttl(),
+            )
+        return cls._local
+
+    @classmethod
+    def _key(cls, token_id):
+        return f"{cls.KEY_PREFIX}:{token_id}"
+
+    @staticmethod
+    def _generation_name(user_id):
+        return f"auth:user:{user_id}"
+
+    @classmethod
+    def _entry_ttl(cls, payload):
+        """Never keep an entry beyond the access token's own expiry"""
+        ttl = cls.get_ttl()
+        exp = payload.get('exp')
+        if exp:
+            remaining = int(exp - datetime.now(dt_timezone.utc).timestamp())
+            ttl = min(ttl, remaining)
+        return ttl
+
+    @classmethod
+    def get(cls, payload):
+        """
+        Get the cached identity for a decoded access token payload.
+
+        Returns:
+            dict with 'user', 'session_id' and 'last_activity', or None on miss
+        """
+        token_id = payload.get('jti')
+        user_id = payload.get('user_id')
+        if not token_id or user_id is None:
+            return None
+
+        generation = get_generation(cls._generation_name(user_id))
+        if generation is None:
+            return None
+
+        local = cls.get_local_cache()
+        entry = local.get(token_id)
+        if entry is None:
+            entry = cache.get(cls._key(token_id))
+            if entry is None:
+                return None
+            local.set(token_id, entry, ttl=max(cls._entry_ttl(payload), 0))
+
+        if entry['generation'] != generation or entry['user_id'] != user_id:
+            local.delete(token_id)
+            return None
+        return entry
+
+    @classmethod
+    def get_generation(cls, user_id):
+        """
+        Get the user's current identity generation.
+
+        Read this *before* loading from the database and pass it to set(),
+        so an invalidation that races with the load is never lost.
+        """
+        return get_generation(cls._generation_name(user_id))
+
+    @classmethod
+    def set(cls, payload, user, session, generation):
+        """Cache the identity resolved for a decoded access token payload"""
+        token_id = payload.get('jti')
+        if not token_id or generation is None:
+            return
+        ttl = cls._entry_ttl(payload)
+        if ttl <= 0:
+            return
+        entry = {
+            'generation': generation,
+            'user_id': user.id,
+            'user': user,
+            'session_id': session.id,
+            'session_token_id': session.token_id,
+            'last_activity': session.last_activity,
+        }
+        cls.get_local_cache().set(token_id, entry, ttl=ttl)
+        cache.set(cls._key(token_id), entry, timeout=ttl)
+
+    @classmethod
+    def invalidate_user(cls, user_id):
+        """
+        Invalidate every cached identity of a user on all workers.
+
+        Inside a transaction the generation is bumped again on commit, so a
+        concurrent request can't re-cache the pre-commit state.
+        """
+        if user_id is None:
+            return
+        name = cls._generation_name(user_id)
+        bump_generation(name)
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: bump_generation(name))
@@ -0,0 +1,38 @@
+"""
+Signal handlers for users_auth app
+"""
+from django.core.signals import request_finished
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User, LoginAttempt
+from .session_cache import SessionIdentityCache
+from .lockout import LoginLockoutEngine
+from .activity_buffer import ActivityLogBuffer
+from .activity_tracker import SessionActivityTracker
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_identity(sender, instance, **kwargs):
+    """Any change to a user (profile, password, status) drops their cached identities"""
+    SessionIdentityCache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=LoginAttempt)
+@receiver(post_delete, sender=LoginAttempt)
+def reload_login_lockout(sender, instance, **kwargs):
+    """Admin changes to a lockout row (unblock, reset) take effect immediately"""
+    LoginLockoutEngine.reset(instance.identifier, instance.identifier_type)
+
+
+@receiver(request_finished)
+def flush_activity_logs(sender, **kwargs):
+    """Write buffered activity logs after the response, once a batch is due"""
+    ActivityLogBuffer.flush_if_due()
+
+
+@receiver(request_finished)
+def flush_session_activity(sender, **kwargs):
+    """Write pending session heartbeats after the response, once the flush window has passed"""
+    SessionActivityTracker.flush_if_due()
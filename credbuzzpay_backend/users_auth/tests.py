@@ -1,13 +1,41 @@
 """
 Tests for users_auth app
 """
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
 from django.test import TestCase
-from rest_framework.test import APITestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework import status
 from django.utils import timezone
 from datetime import timedelta
-from .models import User, PasswordResetToken, UserSession, LoginAttempt
+from django.core import mail
+from django.core.management import call_command
+from .models import (
+    User, PasswordResetToken, UserSession, LoginAttempt, UserIdentifier, UserActivityLog, OutboundEmail
+)
 from .jwt_utils import JWTManager
+from credbuzzpay_backend.cache_utils import cache_is_shared
+from .activity_tracker import SessionActivityTracker
+from .permission_claims import PermissionClaims
+from .session_cache import SessionIdentityCache
+from .lockout import LoginLockoutEngine
+from .throttling import LoginRateThrottle, RegistrationRateThrottle
+from .activity_buffer import ActivityLogBuffer
+from .retention import ChunkedRetention
+from .views import UserListView
+from .code_allocator import UserCodeAllocator
+from .email_queue import EmailQueue, SMTPConnectionPool, process_batch
+from .email_service import send_otp_email
 
 
 class UserModelTests(TestCase):
@@ -66,6 +94,83 @@ class UserModelTests(TestCase):
         self.assertEqual(len(user.user_code), 6)
 
 
+class UserIdentifierTests(TestCase):
+    """Tests for the normalized login identifier index"""
+    
+    def setUp(self):
+        self.user = User(
+            email='Index.User@Example.com',
+            username='indexuser',
+            phone_number='+91 98765-43210'
+        )
+        self.user.set_password('Test@1234')
+        self.user.save()
+    
+    def _indexed(self, user):
+        return dict(UserIdentifier.objects.filter(user=user).values_list('identifier_type', 'value'))
+    
+    def test_save_indexes_identifiers(self):
+        """Test saving a user indexes normalized identifiers"""
+        self.assertEqual(self._indexed(self.user), {
+            'EMAIL': 'index.user@example.com',
+            'USERNAME': 'indexuser',
+            'USER_CODE': self.user.user_code,
+            'PHONE': '9876543210',
+        })
+    
+    def test_identifier_change_updates_index(self):
+        """Test changing an identifier replaces its index row"""
+        self.user.email = 'new@example.com'
+        self.user.save()
+        
+        self.assertEqual(self._indexed(self.user)['EMAIL'], 'new@example.com')
+        self.assertIsNone(UserIdentifier.find_user('index.user@example.com'))
+    
+    def test_unrelated_save_skips_index(self):
+        """Test saves that don't touch identifiers don't query the index"""
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.update_last_login()
+        with self.assertNumQueries(1):
+            user.first_name = 'Changed'
+            user.save()
+    
+    def test_find_user_single_query(self):
+        """Test each identifier type resolves with one query"""
+        for identifier in ['INDEX.USER@example.com', 'indexuser', self.user.user_code.lower(), '9876543210', '(987) 654-3210']:
+            with self.assertNumQueries(1):
+                self.assertEqual(UserIdentifier.find_user(identifier), self.user, identifier)
+    
+    def test_phone_candidate_only_for_phone_shaped_identifiers(self):
+        """Test an unknown email or username never resolves through its digits"""
+        self.assertNotIn(('PHONE', '9876543210'), UserIdentifier.candidates('a9876543210@x.com', 'EMAIL'))
+        self.assertIsNone(UserIdentifier.find_user('a9876543210@x.com'))
+        self.assertIsNone(UserIdentifier.find_user('user9876543210'))
+        self.assertIn(('PHONE', '9876543210'), UserIdentifier.candidates('+91 (987) 654-3210'))
+    
+    def test_find_user_heals_missing_index(self):
+        """Test users missing from the index are found and re-indexed"""
+        UserIdentifier.objects.filter(user=self.user).delete()
+        
+        self.assertEqual(UserIdentifier.find_user('indexuser'), self.user)
+        self.assertEqual(len(self._indexed(self.user)), 4)
+    
+    def test_backfill_command(self):
+        """Test the backfill command rebuilds the index in batches"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        other = User(email='other@example.com', username='otheruser')
+        other.set_password('Test@1234')
+        other.save()
+        UserIdentifier.objects.all().delete()
+        
+        call_command('backfill_login_identifiers', batch_size=1, stdout=StringIO())
+        
+        self.assertEqual(len(self._indexed(self.user)), 4)
+        self.assertEqual(len(self._indexed(other)), 3)
+
+
 class LoginAttemptTests(TestCase):
     """Tests for LoginAttempt model and lockout logic"""
     
@@ -304,6 +409,82 @@ class JWTManagerTests(TestCase):
         self.assertEqual(user_id, self.user.id)
 
 
+class PermissionClaimsTests(TestCase):
+    """Tests for bitmap-encoded permission claims"""
+    
+    def test_encode_decode_roundtrip(self):
+        """Test IDs survive encoding, including sparse and large IDs"""
+        ids = [1, 2, 3, 64, 65, 1000, 4097]
+        mask = PermissionClaims.decode_mask(PermissionClaims.encode(ids))
+        
+        self.assertEqual(PermissionClaims.mask_to_ids(mask), ids)
+        self.assertTrue(PermissionClaims.has(mask, 1000))
+        self.assertFalse(PermissionClaims.has(mask, 999))
+    
+    def test_empty_set(self):
+        """Test an empty permission set encodes and decodes"""
+        claim = PermissionClaims.encode([])
+        self.assertEqual(PermissionClaims.decode_mask(claim), 0)
+    
+    def test_dense_sets_are_compact(self):
+        """Test a large permission set is much smaller than the ID list"""
+        ids = list(range(1, 2001))
+        claim = PermissionClaims.encode(ids)
+        
+        self.assertTrue(claim.startswith(PermissionClaims.COMPRESSED_PREFIX))
+        self.assertLess(len(claim), len(str(ids)) // 20)
+        self.assertEqual(PermissionClaims.mask_to_ids(PermissionClaims.decode_mask(claim)), ids)
+    
+    def test_invalid_claim(self):
+        """Test malformed claims raise ValueError"""
+        with self.assertRaises(ValueError):
+            PermissionClaims.decode_mask('x123')
+        with self.assertRaises(ValueError):
+            PermissionClaims.decode_mask('z!!!')
+    
+    def test_decode_payloads(self):
+        """Test compact and legacy payloads decode to the same sets"""
+        compact = PermissionClaims.build_claims([1, 5], [2, 7, 9])
+        legacy = {'app_access': [1, 5], 'feature_access': [2, 7, 9]}
+        
+        self.assertEqual(compact['perm_ver'], PermissionClaims.CATALOG_VERSION)
+        self.assertEqual(PermissionClaims.decode(compact), (frozenset({1, 5}), frozenset({2, 7, 9})))
+        self.assertEqual(PermissionClaims.decode(legacy), PermissionClaims.decode(compact))
+    
+    def test_unknown_catalog_version(self):
+        """Test tokens from an unknown catalog version decode to no permissions"""
+        payload = dict(PermissionClaims.build_claims([1], [1]), perm_ver=99)
+        
+        with self.assertRaises(ValueError):
+            PermissionClaims.decode(payload)
+        self.assertEqual(JWTManager.get_token_permissions(payload), (frozenset(), frozenset()))
+    
+    def test_access_token_claims(self):
+        """Test access tokens carry bitmap claims that decode to the user's permissions"""
+        user = User(email='claims@example.com', username='claimsuser')
+        user.set_password('Test@1234')
+        user.save()
+        
+        token, _, _ = JWTManager.generate_access_token(user)
+        payload = JWTManager.decode_token(token)
+        app_ids, feature_ids = JWTManager.get_user_permissions(user)
+        
+        self.assertEqual(payload['perm_ver'], PermissionClaims.CATALOG_VERSION)
+        self.assertIsInstance(payload['app_access'], str)
+        self.assertEqual(
+            JWTManager.get_token_permissions(payload),
+            (frozenset(app_ids), frozenset(feature_ids))
+        )
+    
+    def test_legacy_claims_setting(self):
+        """Test compact claims can be switched off"""
+        with self.settings(JWT_COMPACT_PERMISSION_CLAIMS=False):
+            claims = PermissionClaims.build_claims([1, 2], [3])
+        
+        self.assertNotIn('perm_ver', claims)
+        self.assertEqual(claims['app_access'], [1, 2])
+
+
 class AuthAPITests(APITestCase):
     """Tests for authentication API endpoints"""
     
@@ -728,3 +909,972 @@ class AuthAPITests(APITestCase):
         
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+
+
+class SessionIdentityCacheTests(APITestCase):
+    """Tests for the cached user/session fast path in JWTAuthentication"""
+    
+    def setUp(self):
+        self.user = User(email='test@example.com', username='testuser')
+        self.user.set_password('Test@1234')
+        self.user.save()
+        
+        tokens = JWTManager.generate_tokens(self.user)
+        self.session = UserSession.objects.create(
+            user=self.user,
+            token_id=tokens['refresh_token_id'],
+            expires_at=tokens['refresh_token_expiry'],
+            is_active=True
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access_token"]}')
+    
+    def test_repeat_request_served_from_cache(self):
+        """Test second request skips user/session lookups"""
+        response = self.client.get('/api/auth-user/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        # No queries at all: last_activity is written behind
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=3600), self.assertNumQueries(0):
+            response = self.client.get('/api/auth-user/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['email'], 'test@example.com')
+    
+    def test_logout_all_invalidates_cache(self):
+        """Test logout from all devices rejects the cached token"""
+        self.client.get('/api/auth-user/profile/')
+        self.client.post('/api/auth-user/logout/', {'logout_all': True}, format='json')
+        
+        response = self.client.get('/api/auth-user/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_deactivation_invalidates_cache(self):
+        """Test deactivating the user rejects the cached token"""
+        self.client.get('/api/auth-user/profile/')
+        self.user.is_active = False
+        self.user.save()
+        
+        response = self.client.get('/api/auth-user/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_profile_update_visible_immediately(self):
+        """Test cached user is refreshed after the user row changes"""
+        self.client.get('/api/auth-user/profile/')
+        self.user.first_name = 'Changed'
+        self.user.save()
+        
+        response = self.client.get('/api/auth-user/profile/')
+        self.assertEqual(response.data['data']['first_name'], 'Changed')
+    
+    def test_stale_cached_activity_rechecked_against_database(self):
+        """Test an inactive session is still rejected after falling back to the database"""
+        self.client.get('/api/auth-user/profile/')
+        UserSession.objects.filter(pk=self.session.pk).update(
+            last_activity=timezone.now() - timedelta(minutes=31)
+        )
+        
+        with self.settings(JWT_INACTIVITY_TIMEOUT_MINUTES=0):
+            response = self.client.get('/api/auth-user/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_disabled_without_shared_cache(self):
+        """Test a process-local cache resolves every request from the database"""
+        with self.settings(CACHE_LOCAL_IS_SHARED=False):
+            self.assertFalse(SessionIdentityCache.is_enabled())
+            self.client.get('/api/auth-user/profile/')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/auth-user/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(any('users_auth_user_session' in query['sql'] for query in queries))
+    
+    def test_shared_backend_enabled(self):
+        """Test a shared backend enables the cache whatever CACHE_LOCAL_IS_SHARED says"""
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+        with self.settings(CACHE_LOCAL_IS_SHARED=False, CACHES=caches):
+            self.assertTrue(cache_is_shared())
+
+
+class SessionActivityTrackerTests(TestCase):
+    """Tests for write-behind session last_activity updates"""
+    
+    def setUp(self):
+        self.user = User(email='test@example.com', username='testuser')
+        self.user.set_password('Test@1234')
+        self.user.save()
+        SessionActivityTracker.flush()
+    
+    def _create_session(self, token_id):
+        return UserSession.objects.create(
+            user=self.user,
+            token_id=token_id,
+            expires_at=timezone.now() + timedelta(days=7),
+            is_active=True
+        )
+    
+    def test_update_activity_is_deferred(self):
+        """Test update_activity doesn't write until the flush window elapses"""
+        session = self._create_session('tracker-deferred')
+        old_activity = timezone.now() - timedelta(minutes=20)
+        UserSession.objects.filter(pk=session.pk).update(last_activity=old_activity)
+        session.refresh_from_db()
+        
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=3600), self.assertNumQueries(0):
+            session.update_activity()
+        
+        stored = UserSession.objects.get(pk=session.pk)
+        self.assertEqual(stored.last_activity, old_activity)
+        # The freshest value is still visible to inactivity checks
+        self.assertGreater(stored.get_last_activity(), old_activity)
+    
+    def test_inactivity_uses_pending_heartbeat(self):
+        """Test a session with a recent heartbeat is not treated as inactive"""
+        session = self._create_session('tracker-heartbeat')
+        UserSession.objects.filter(pk=session.pk).update(
+            last_activity=timezone.now() - timedelta(minutes=31)
+        )
+        session.refresh_from_db()
+        
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=3600):
+            self.assertTrue(session.is_inactive_expired(inactivity_minutes=30))
+            session.update_activity()
+            self.assertFalse(session.is_inactive_expired(inactivity_minutes=30))
+    
+    def test_flush_writes_all_sessions_in_one_query(self):
+        """Test pending heartbeats are flushed with a single UPDATE"""
+        sessions = [self._create_session(f'tracker-bulk-{i}') for i in range(5)]
+        
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=3600):
+            for session in sessions:
+                session.update_activity()
+        
+        with self.assertNumQueries(1):
+            updated = SessionActivityTracker.flush()
+        
+        self.assertEqual(updated, 5)
+        for session in sessions:
+            stored = UserSession.objects.get(pk=session.pk)
+            self.assertEqual(stored.last_activity, session.last_activity)
+    
+    def test_zero_window_writes_through(self):
+        """Test a flush window of 0 writes every heartbeat immediately"""
+        session = self._create_session('tracker-write-through')
+        
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=0):
+            session.update_activity()
+        
+        stored = UserSession.objects.get(pk=session.pk)
+        self.assertEqual(stored.last_activity, session.last_activity)
+    
+    def test_idle_worker_flushes_on_timer(self):
+        """Test the first pending heartbeat arms a timer that writes it after the window"""
+        session = self._create_session('tracker-timer')
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=3600):
+            session.update_activity()
+        timer = SessionActivityTracker._timer
+        self.assertIsNotNone(timer)
+        self.assertTrue(timer.daemon)
+        self.assertLessEqual(timer.interval, 3600)
+        
+        # Run the timer's callback here instead of waiting for it
+        with mock.patch('users_auth.activity_tracker.connections'):
+            SessionActivityTracker._flush_from_timer()
+        stored = UserSession.objects.get(pk=session.pk)
+        self.assertEqual(stored.last_activity, session.last_activity)
+        self.assertIsNone(SessionActivityTracker._timer)
+        timer.cancel()
+    
+    def test_request_finished_flushes_when_due(self):
+        """Test heartbeats older than the window are written after any request"""
+        session = self._create_session('tracker-request')
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=3600):
+            session.update_activity()
+            self.assertEqual(SessionActivityTracker.flush_if_due(), 0)
+        
+        SessionActivityTracker._last_flush -= 7200
+        with self.settings(JWT_ACTIVITY_FLUSH_SECONDS=3600), \
+                mock.patch('users_auth.activity_tracker.connection') as outside_transaction:
+            outside_transaction.in_atomic_block = False
+            self.assertEqual(SessionActivityTracker.flush_if_due(), 1)
+        stored = UserSession.objects.get(pk=session.pk)
+        self.assertEqual(stored.last_activity, session.last_activity)
+        self.assertIsNone(SessionActivityTracker._timer)
+
+
+class LoginQueryBudgetTests(APITestCase):
+    """Tests for the query-budgeted login pipeline"""
+    
+    def setUp(self):
+        # Reset login rate limits left by other tests
+        cache.clear()
+        self.user = User(
+            email='budget@example.com',
+            username='budgetuser',
+            user_role='ADMIN',
+            is_email_verified=True,
+            is_phone_verified=True
+        )
+        self.user.set_password('Test@1234')
+        self.user.save()
+        self.credentials = {'identifier': 'budget@example.com', 'password': 'Test@1234'}
+    
+    def test_login_within_query_budget(self):
+        """Test a repeat login stays within LoginView.query_budget"""
+        from kyc_verification.models import KYCApplication, KYCStatus
+        from .views import LoginView
+        KYCApplication.objects.create(user=self.user, status=KYCStatus.IN_PROGRESS)
+        
+        self.client.post('/api/auth-user/login/', self.credentials, format='json')
+        
+        with self.assertNumQueries(LoginView.query_budget):
+            response = self.client.post('/api/auth-user/login/', self.credentials, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['kyc_status']['status'], KYCStatus.IN_PROGRESS)
+    
+    def test_login_rotates_session(self):
+        """Test login deactivates the previous session"""
+        first = self.client.post('/api/auth-user/login/', self.credentials, format='json')
+        second = self.client.post('/api/auth-user/login/', self.credentials, format='json')
+        
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        active = UserSession.objects.filter(user=self.user, is_active=True)
+        self.assertEqual(list(active.values_list('token_id', flat=True)), [second.data['data']['session']['session_id']])
+        self.assertNotEqual(first.data['data']['session']['session_id'], second.data['data']['session']['session_id'])
+    
+    def test_failed_login_writes_nothing(self):
+        """Test a failed login below the lockout threshold performs no writes"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                '/api/auth-user/login/',
+                {'identifier': 'budget@example.com', 'password': 'Wrong@1234'},
+                format='json'
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['data']['remaining_attempts'], 4)
+        self.assertFalse([q for q in ctx.captured_queries if not q['sql'].startswith('SELECT')])
+        self.assertFalse(LoginAttempt.objects.exists())
+
+
+class LoginLockoutEngineTests(TestCase):
+    """Tests for the cache-backed login lockout engine"""
+    
+    def setUp(self):
+        cache.clear()
+        self.identifier = 'victim@example.com'
+    
+    def _fail(self, times, ip_address='10.0.0.1'):
+        result = None
+        for _ in range(times):
+            result = LoginLockoutEngine.record_failure(self.identifier, 'EMAIL', ip_address)
+        return result
+    
+    def _expire_lockout(self):
+        key = LoginLockoutEngine._state_key(self.identifier, 'EMAIL')
+        state = cache.get(key)
+        state['lockout_until'] = 1
+        cache.set(key, state)
+    
+    def test_failures_below_threshold_write_nothing(self):
+        """Test failures within a stage touch only the cache"""
+        LoginLockoutEngine.check(self.identifier, 'EMAIL')
+        
+        with self.assertNumQueries(0):
+            result = self._fail(4)
+        
+        self.assertEqual(result['remaining_attempts'], 1)
+        self.assertFalse(result['is_locked'])
+        self.assertFalse(LoginAttempt.objects.exists())
+    
+    def test_stage_transition_is_persisted(self):
+        """Test the fifth failure locks the identifier and persists the stage"""
+        result = self._fail(5)
+        
+        self.assertTrue(result['is_locked'])
+        self.assertEqual(result['lockout_stage'], 1)
+        self.assertEqual(result['remaining_attempts'], 5)
+        self.assertTrue(LoginLockoutEngine.check(self.identifier, 'EMAIL')['is_locked'])
+        
+        attempt = LoginAttempt.objects.get(identifier=self.identifier, identifier_type='EMAIL')
+        self.assertEqual(attempt.lockout_stage, 1)
+        self.assertIsNotNone(attempt.lockout_until)
+    
+    def test_progression_ends_in_block(self):
+        """Test stages progress like LOCKOUT_STAGES and end in a permanent block"""
+        for stage in range(1, 6):
+            result = self._fail(5)
+            self.assertEqual(result['lockout_stage'], stage)
+            self.assertFalse(result['is_blocked'])
+            self._expire_lockout()
+        
+        result = self._fail(5)
+        
+        self.assertTrue(result['is_blocked'])
+        status_ = LoginLockoutEngine.check(self.identifier, 'EMAIL')
+        self.assertTrue(status_['is_locked'])
+        self.assertIn('blocked', status_['message'])
+        self.assertTrue(LoginAttempt.objects.get(identifier=self.identifier).is_blocked)
+    
+    def test_cold_cache_reloads_persisted_stage(self):
+        """Test a lockout survives losing the cache"""
+        self._fail(5)
+        cache.clear()
+        
+        self.assertTrue(LoginLockoutEngine.check(self.identifier, 'EMAIL')['is_locked'])
+    
+    def test_success_resets_failures(self):
+        """Test a successful login starts a fresh allowance"""
+        self._fail(4)
+        LoginLockoutEngine.record_success(self.identifier, 'EMAIL')
+        
+        result = self._fail(1)
+        self.assertEqual(result['remaining_attempts'], 4)
+    
+    def test_admin_unblock_takes_effect(self):
+        """Test resetting the LoginAttempt row lifts a cached lockout"""
+        self._fail(5)
+        
+        LoginAttempt.objects.get(identifier=self.identifier).reset_lockout()
+        
+        self.assertFalse(LoginLockoutEngine.check(self.identifier, 'EMAIL')['is_locked'])
+    
+    def test_ip_lockout(self):
+        """Test an IP address spraying many identifiers is locked out"""
+        with self.settings(LOGIN_IP_MAX_FAILURES=10):
+            for i in range(10):
+                LoginLockoutEngine.record_failure(f'user{i}@example.com', 'EMAIL', '10.9.9.9')
+        
+        self.assertTrue(LoginLockoutEngine.check('fresh@example.com', 'EMAIL', '10.9.9.9')['is_locked'])
+        self.assertFalse(LoginLockoutEngine.check('fresh@example.com', 'EMAIL', '10.0.0.2')['is_locked'])
+
+
+class LoginLockoutDatabaseTests(TestCase):
+    """Tests for the lockout engine without a cache shared by every worker"""
+    
+    def setUp(self):
+        cache.clear()
+        self.identifier = 'victim@example.com'
+        settings = self.settings(CACHE_LOCAL_IS_SHARED=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+    
+    def _fail_on_fresh_workers(self, times):
+        # Every failure lands on a worker with an empty process-local cache
+        result = None
+        for _ in range(times):
+            cache.clear()
+            result = LoginLockoutEngine.record_failure(self.identifier, 'EMAIL', '10.0.0.1')
+        return result
+    
+    def test_failures_are_counted_across_workers(self):
+        """Test failures spread over workers still lock the identifier"""
+        result = self._fail_on_fresh_workers(4)
+        self.assertEqual(result['remaining_attempts'], 1)
+        self.assertFalse(result['is_locked'])
+        
+        result = self._fail_on_fresh_workers(1)
+        
+        self.assertTrue(result['is_locked'])
+        self.assertEqual(result['lockout_stage'], 1)
+        cache.clear()
+        self.assertTrue(LoginLockoutEngine.check(self.identifier, 'EMAIL')['is_locked'])
+        attempt = LoginAttempt.objects.get(identifier=self.identifier, identifier_type='EMAIL')
+        self.assertEqual(attempt.lockout_stage, 1)
+        self.assertEqual(attempt.attempt_count, 0)
+    
+    def test_stale_failures_do_not_count(self):
+        """Test failures older than the window start a fresh allowance"""
+        self._fail_on_fresh_workers(4)
+        LoginAttempt.objects.filter(identifier=self.identifier).update(
+            last_attempt_at=timezone.now() - timedelta(hours=2)
+        )
+        
+        result = self._fail_on_fresh_workers(1)
+        
+        self.assertEqual(result['remaining_attempts'], 4)
+    
+    def test_success_resets_failures(self):
+        """Test a successful login resets the row's failures"""
+        self._fail_on_fresh_workers(4)
+        LoginLockoutEngine.record_success(self.identifier, 'EMAIL')
+        
+        result = self._fail_on_fresh_workers(1)
+        
+        self.assertEqual(result['remaining_attempts'], 4)
+    
+    def test_admin_unblock_takes_effect(self):
+        """Test resetting the LoginAttempt row lifts the lockout"""
+        self._fail_on_fresh_workers(5)
+        
+        LoginAttempt.objects.get(identifier=self.identifier).reset_lockout()
+        
+        self.assertFalse(LoginLockoutEngine.check(self.identifier, 'EMAIL')['is_locked'])
+
+
+class GCRARateThrottleTests(TestCase):
+    """Tests for the GCRA throttle base class"""
+    
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.now = 1_000_000.0
+    
+    def _throttle(self, throttle_class=RegistrationRateThrottle):
+        throttle = throttle_class()
+        throttle.timer = lambda: self.now
+        return throttle
+    
+    def _allow(self, throttle_class=RegistrationRateThrottle, ip='10.0.0.1'):
+        request = self.factory.post('/', REMOTE_ADDR=ip)
+        throttle = self._throttle(throttle_class)
+        return throttle.allow_request(request, None), throttle
+    
+    def test_allows_burst(self):
+        """Test a burst of half the rate is admitted, then throttled"""
+        for _ in range(3):
+            self.assertTrue(self._allow()[0])
+        
+        allowed, throttle = self._allow()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 1200, places=3)
+    
+    def test_admits_one_request_per_emission_interval(self):
+        """Test a throttled key recovers one request every period / (N - burst + 1) seconds"""
+        for _ in range(3):
+            self._allow()
+        
+        self.now += 1200
+        self.assertTrue(self._allow()[0])
+        self.assertFalse(self._allow()[0])
+    
+    def test_at_most_rate_per_window(self):
+        """Test a client retrying every 0.1s gets at most N requests through per period"""
+        class OTPLikeThrottle(LoginRateThrottle):
+            rate = '5/min'
+            burst = None
+        
+        admitted = []
+        start = self.now
+        for step in range(3000):
+            self.now = start + step / 10
+            if self._allow(OTPLikeThrottle)[0]:
+                admitted.append(self.now)
+        
+        self.assertEqual(len([t for t in admitted if t < start + 60]), 5)
+        for first in admitted:
+            self.assertLessEqual(len([t for t in admitted if first <= t < first + 60]), 5)
+        # Sustained rate: 5 requests in the first minute, then one every 20s
+        self.assertEqual(len(admitted), 5 + 12)
+    
+    def test_explicit_burst(self):
+        """Test a full burst spaces later requests a whole period apart"""
+        class FullBurstThrottle(RegistrationRateThrottle):
+            burst = 5
+        
+        for _ in range(5):
+            self.assertTrue(self._allow(FullBurstThrottle)[0])
+        allowed, throttle = self._allow(FullBurstThrottle)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 3600, places=3)
+    
+    def test_keys_are_independent(self):
+        """Test limits are tracked per client"""
+        for _ in range(3):
+            self._allow(ip='10.0.0.1')
+        
+        self.assertFalse(self._allow(ip='10.0.0.1')[0])
+        self.assertTrue(self._allow(ip='10.0.0.2')[0])
+    
+    def test_stores_single_integer_per_key(self):
+        """Test the only state per key is the theoretical arrival time"""
+        _, throttle = self._allow(LoginRateThrottle)
+        
+        self.assertEqual(cache.get(throttle.key), int((self.now + 60) * 1_000_000))
+    
+    def test_ignores_simple_rate_throttle_history(self):
+        """Test timestamp lists left by SimpleRateThrottle don't break checks"""
+        cache.set('registration_10.0.0.1', [self.now] * 5, 3600)
+        
+        self.assertTrue(self._allow()[0])
+
+
+class ActivityLogBufferTests(TestCase):
+    """Tests for buffered activity log writes"""
+    
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        spool_settings = self.settings(ACTIVITY_LOG_BUFFERED=True, ACTIVITY_LOG_SPOOL_DIR=self.spool_dir)
+        spool_settings.enable()
+        self.addCleanup(spool_settings.disable)
+        ActivityLogBuffer._pending = []
+        ActivityLogBuffer._spool_paths = []
+        ActivityLogBuffer._spool_files = {}
+        ActivityLogBuffer._spool = None
+        self.user = User.objects.create(email='activity@example.com', username='activityuser')
+    
+    def _log(self, user=None, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return UserActivityLog.log_activity(
+                user=user or self.user,
+                activity_type=UserActivityLog.ActivityType.PROFILE_UPDATE,
+                action='Profile updated',
+                **kwargs
+            )
+    
+    def _spool_lines(self):
+        lines = []
+        for name in os.listdir(self.spool_dir):
+            with open(os.path.join(self.spool_dir, name)) as spool:
+                lines.extend(spool.readlines())
+        return lines
+    
+    def test_entries_are_buffered_and_spooled(self):
+        """Test log_activity queues the entry and spools it instead of inserting"""
+        entry = self._log(metadata={'fields': ['username']})
+        
+        self.assertIsNone(entry.pk)
+        self.assertFalse(UserActivityLog.objects.exists())
+        self.assertEqual(len(ActivityLogBuffer._pending), 1)
+        self.assertEqual(json.loads(self._spool_lines()[0])['metadata'], {'fields': ['username']})
+    
+    def test_flush_bulk_inserts_and_removes_spool(self):
+        """Test a flush writes all entries with their event time and deletes the spool"""
+        entries = [self._log() for _ in range(3)]
+        
+        with self.assertNumQueries(2):
+            self.assertEqual(ActivityLogBuffer.flush(), 3)
+        
+        self.assertEqual(
+            sorted(UserActivityLog.objects.values_list('created_at', flat=True)),
+            sorted(e.created_at for e in entries)
+        )
+        self.assertEqual(os.listdir(self.spool_dir), [])
+    
+    def test_sync_writes_immediately(self):
+        """Test sync=True inserts the row for read-after-write callers"""
+        entry = UserActivityLog.log_activity(
+            user=self.user,
+            activity_type=UserActivityLog.ActivityType.LOGIN,
+            action='User logged in',
+            sync=True
+        )
+        
+        self.assertTrue(UserActivityLog.objects.filter(pk=entry.pk).exists())
+        self.assertEqual(ActivityLogBuffer._pending, [])
+    
+    def test_rolled_back_entries_are_dropped(self):
+        """Test entries are only queued once their transaction commits"""
+        UserActivityLog.log_activity(
+            user=self.user,
+            activity_type=UserActivityLog.ActivityType.PROFILE_UPDATE,
+            action='Profile updated'
+        )
+        
+        self.assertEqual(ActivityLogBuffer._pending, [])
+    
+    def test_flush_skips_deleted_users(self):
+        """Test entries of users deleted before the flush don't fail the batch"""
+        other = User.objects.create(email='gone@example.com', username='goneuser')
+        self._log()
+        self._log(user=other)
+        other.delete()
+        
+        self.assertEqual(ActivityLogBuffer.flush(), 1)
+    
+    def _orphan(self):
+        """Drop this process's ownership of its spool, as if the worker died"""
+        spool = ActivityLogBuffer._spool_paths[0]
+        ActivityLogBuffer._spool_files.pop(spool).close()
+        ActivityLogBuffer._close_spool()
+        ActivityLogBuffer._pending = []
+        ActivityLogBuffer._spool_paths = []
+        return spool
+    
+    def test_replay_orphaned_spool(self):
+        """Test spool files of dead workers are inserted and deleted"""
+        self._log()
+        orphan = self._orphan()
+        with open(orphan, 'a') as f:
+            f.write('{"user_id": ')
+        
+        with self.assertLogs('users_auth.activity_buffer', level='WARNING'):
+            call_command('replay_activity_spool', stdout=io.StringIO())
+        
+        self.assertEqual(UserActivityLog.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(os.path.exists(orphan))
+    
+    def test_replay_skips_stored_entries(self):
+        """Test a spool whose batch was inserted before the worker died isn't inserted twice"""
+        self._log()
+        self._log()
+        records = list(ActivityLogBuffer._pending)
+        ActivityLogBuffer.write(records)
+        orphan = self._orphan()
+        
+        self.assertEqual(ActivityLogBuffer.replay_spool(orphan), 0)
+        self.assertEqual(UserActivityLog.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(os.path.exists(orphan))
+    
+    def test_locked_spool_is_not_orphaned(self):
+        """Test a spool still locked by a live process is left alone, whatever its PID"""
+        self._log()
+        spool = ActivityLogBuffer._spool_paths[0]
+        
+        # Another process holds the lock; its PID in the name is irrelevant
+        holder = subprocess.Popen([sys.executable, '-c', (
+            'import fcntl, sys, time\n'
+            f'f = open({spool!r})\n'
+            'fcntl.flock(f.fileno(), fcntl.LOCK_EX)\n'
+            'print("locked", flush=True)\n'
+            'time.sleep(30)\n'
+        )], stdout=subprocess.PIPE, text=True)
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.kill)
+        ActivityLogBuffer._spool_files.pop(spool).close()
+        holder.stdout.readline()
+        
+        self.assertEqual(ActivityLogBuffer.orphaned_spools(), [])
+        self.assertIsNone(ActivityLogBuffer.replay_spool(spool))
+        self.assertTrue(os.path.exists(spool))
+        
+        holder.kill()
+        holder.wait()
+        self.assertEqual(ActivityLogBuffer.orphaned_spools(), [spool])
+    
+    def test_own_spools_are_not_orphaned(self):
+        """Test this process never replays the spool it is still writing"""
+        self._log()
+        self.assertEqual(ActivityLogBuffer.orphaned_spools(), [])
+
+
+class ChunkedRetentionTests(TestCase):
+    """Tests for chunked retention of activity logs and login attempts"""
+    
+    def setUp(self):
+        self.user = User.objects.create(email='retention@example.com', username='retentionuser')
+        now = timezone.now()
+        self.logs = UserActivityLog.objects.bulk_create([
+            UserActivityLog(user=self.user, action=f'Event {i}', created_at=now - timedelta(days=100 if i < 7 else 1))
+            for i in range(10)
+        ])
+    
+    def test_deletes_expired_rows_in_bounded_chunks(self):
+        """Test only expired rows go, with at most chunk_size rows per chunk"""
+        chunks = []
+        retention = ChunkedRetention.for_target(
+            'activity_logs', days=90, chunk_size=3,
+            progress=lambda cursor, high, total, elapsed: chunks.append(total)
+        )
+        
+        self.assertEqual(retention.run(), 7)
+        self.assertEqual(chunks, [3, 6, 7])
+        self.assertEqual(UserActivityLog.objects.count(), 3)
+    
+    def test_resume_from_cursor(self):
+        """Test a run started after an id leaves earlier rows alone"""
+        retention = ChunkedRetention.for_target('activity_logs', days=90)
+        
+        self.assertEqual(retention.run(start_id=self.logs[3].pk), 3)
+        self.assertEqual(UserActivityLog.objects.count(), 7)
+    
+    def test_dry_run_deletes_nothing(self):
+        """Test a dry run only counts matching rows"""
+        self.assertEqual(ChunkedRetention.for_target('activity_logs', days=90).run(dry_run=True), 7)
+        self.assertEqual(UserActivityLog.objects.count(), 10)
+    
+    def test_login_attempts_keep_blocked_rows(self):
+        """Test cleanup_old_records keeps blocked identifiers"""
+        LoginAttempt.objects.create(identifier='old@example.com', identifier_type='EMAIL')
+        LoginAttempt.objects.create(identifier='blocked@example.com', identifier_type='EMAIL', is_blocked=True)
+        LoginAttempt.objects.update(last_attempt_at=timezone.now() - timedelta(days=60))
+        
+        deleted, _ = LoginAttempt.cleanup_old_records(days=30)
+        
+        self.assertEqual(deleted, 1)
+        self.assertEqual(list(LoginAttempt.objects.values_list('identifier', flat=True)), ['blocked@example.com'])
+    
+    def test_purge_command(self):
+        """Test the management command purges every target"""
+        out = io.StringIO()
+        call_command('purge_old_records', '--sleep', '0', stdout=out)
+        
+        self.assertIn('activity_logs: 7 rows deleted', out.getvalue())
+        self.assertEqual(UserActivityLog.objects.count(), 3)
+
+
+class UserListViewTests(APITestCase):
+    """Tests for the keyset-paginated user list"""
+    
+    def setUp(self):
+        cache.clear()
+        self.users = []
+        for i in range(5):
+            user = User(email=f'list{i}@example.com', username=f'listuser{i}', first_name=f'Name{i}')
+            user.set_password('Test@1234')
+            user.save()
+            self.users.append(user)
+        # Identical timestamps exercise the id tie-breaker
+        User.objects.filter(pk__in=[u.pk for u in self.users[:3]]).update(created_at=self.users[0].created_at)
+        
+        tokens = JWTManager.generate_tokens(self.users[0])
+        UserSession.objects.create(
+            user=self.users[0],
+            token_id=tokens['refresh_token_id'],
+            expires_at=tokens['refresh_token_expiry'],
+            is_active=True
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access_token"]}')
+    
+    def test_cursor_pages_cover_all_users_once(self):
+        """Test following next_cursor returns every user exactly once, newest first"""
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/auth-user/users/', params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(row['id'] for row in response.data['data'])
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        
+        expected = list(User.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+    
+    def test_total_count_is_opt_in(self):
+        """Test total_count is only computed when asked for"""
+        response = self.client.get('/api/auth-user/users/', {'page_size': 2})
+        self.assertNotIn('total_count', response.data)
+        
+        response = self.client.get('/api/auth-user/users/', {'page_size': 2, 'include_total': 'true'})
+        self.assertEqual(response.data['total_count'], 5)
+    
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        response = self.client.get('/api/auth-user/users/', {'cursor': 'not-a-cursor'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['success'])
+    
+    def test_search_uses_normalized_column(self):
+        """Test search is case-insensitive and follows profile updates"""
+        response = self.client.get('/api/auth-user/users/', {'search': 'LISTUSER3'})
+        self.assertEqual([row['id'] for row in response.data['data']], [self.users[3].pk])
+        
+        self.users[4].last_name = 'Fernandes'
+        self.users[4].save(update_fields=['last_name'])
+        response = self.client.get('/api/auth-user/users/', {'search': 'fernand'})
+        self.assertEqual([row['id'] for row in response.data['data']], [self.users[4].pk])
+    
+    def test_stream_returns_all_users(self):
+        """Test the streamed export is one JSON document with every user"""
+        with mock.patch.object(UserListView, 'STREAM_CHUNK_SIZE', 2):
+            response = self.client.get('/api/auth-user/users/', {'stream': 'true'})
+            body = json.loads(b''.join(response.streaming_content))
+        
+        self.assertTrue(body['success'])
+        self.assertEqual(body['count'], 5)
+        self.assertEqual(len({row['id'] for row in body['data']}), 5)
+
+
+class UserCodeAllocatorTests(TestCase):
+    """Tests for block-allocated user codes"""
+    
+    def setUp(self):
+        UserCodeAllocator.clear()
+        self.addCleanup(UserCodeAllocator.clear)
+    
+    def test_codes_are_unique_and_well_formed(self):
+        """Test allocated codes are distinct 6-character alphanumeric codes across blocks"""
+        with self.settings(USER_CODE_BLOCK_SIZE=100):
+            codes = UserCodeAllocator.allocate_many(450)
+        
+        self.assertEqual(len(set(codes)), 450)
+        for code in codes:
+            self.assertRegex(code, r'^[A-Z0-9]{6}$')
+    
+    def test_code_space_grows_after_six_characters(self):
+        """Test numbers past the 6-character space map to 7-character codes"""
+        self.assertEqual(len(UserCodeAllocator.code_for(36 ** 6 - 1)), 6)
+        self.assertEqual(len(UserCodeAllocator.code_for(36 ** 6)), 7)
+    
+    def test_existing_codes_are_skipped(self):
+        """Test codes already used (e.g. legacy random codes) are never handed out"""
+        taken = UserCodeAllocator.code_for(0)
+        User.objects.create(email='legacy@example.com', username='legacyuser', user_code=taken)
+        
+        with self.settings(USER_CODE_BLOCK_SIZE=10):
+            codes = UserCodeAllocator.allocate_many(9)
+        
+        self.assertNotIn(taken, codes)
+        self.assertEqual(len(set(codes)), 9)
+    
+    def test_user_creation_needs_no_uniqueness_queries(self):
+        """Test creating users from a reserved block never queries the users table"""
+        User.objects.create(email='first@example.com', username='firstuser')
+        
+        with CaptureQueriesContext(connection) as ctx:
+            for i in range(5):
+                User.objects.create(email=f'bulk{i}@example.com', username=f'bulkuser{i}')
+        
+        lookups = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "users_auth_user"' in q['sql']
+        ]
+        self.assertEqual(lookups, [])
+        self.assertEqual(User.objects.values('user_code').distinct().count(), 6)
+
+
+class EmailQueueTests(TestCase):
+    """Tests for the outbound email queue"""
+    
+    def setUp(self):
+        queue_settings = self.settings(EMAIL_QUEUE_ENABLED=True)
+        queue_settings.enable()
+        self.addCleanup(queue_settings.disable)
+        self.pool = SMTPConnectionPool(2)
+        self.addCleanup(self.pool.close)
+    
+    def test_inline_by_default(self):
+        """Test emails are sent from the request unless a worker is configured"""
+        with self.settings(EMAIL_QUEUE_ENABLED=False):
+            self.assertTrue(send_otp_email('inline@example.com', '123456'))
+        
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+    
+    def test_send_only_enqueues(self):
+        """Test sending an OTP email queues it without touching the mail backend"""
+        self.assertTrue(send_otp_email('queued@example.com', '123456', 'Queued'))
+        
+        self.assertEqual(len(mail.outbox), 0)
+        outbound = OutboundEmail.objects.get()
+        self.assertEqual(outbound.status, OutboundEmail.Status.QUEUED)
+        self.assertEqual(outbound.category, 'OTP')
+        self.assertIn('123456', outbound.html_body)
+    
+    def test_worker_delivers_batch(self):
+        """Test a batch is sent and marked SENT"""
+        for i in range(3):
+            EmailQueue.enqueue(f'user{i}@example.com', 'Subject', 'Body', html_body='<p>Body</p>')
+        
+        self.assertEqual(process_batch(self.pool), (3, 0))
+        
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Body</p>', 'text/html')])
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.Status.SENT).exists())
+    
+    def test_failure_retries_with_backoff_then_fails(self):
+        """Test failed sends are rescheduled with growing delays and finally marked FAILED"""
+        outbound = EmailQueue.enqueue('flaky@example.com', 'Subject', 'Body')
+        
+        delays = []
+        with self.settings(EMAIL_QUEUE_MAX_ATTEMPTS=3), \
+                self.assertLogs('users_auth.email_queue', level='WARNING'), \
+                mock.patch.object(EmailQueue, 'build_message', side_effect=ConnectionError('refused')):
+            for _ in range(3):
+                OutboundEmail.objects.filter(pk=outbound.pk).update(next_attempt_at=timezone.now())
+                before = timezone.now()
+                self.assertEqual(process_batch(self.pool), (0, 1))
+                outbound.refresh_from_db()
+                delays.append(round((outbound.next_attempt_at - before).total_seconds()))
+        
+        self.assertEqual(delays[:2], [30, 60])
+        self.assertEqual(outbound.status, OutboundEmail.Status.FAILED)
+        self.assertEqual(outbound.attempts, 3)
+        self.assertEqual(outbound.last_error, 'refused')
+    
+    def test_expired_lease_is_reclaimed(self):
+        """Test messages left SENDING by a crashed worker are picked up again"""
+        outbound = EmailQueue.enqueue('crashed@example.com', 'Subject', 'Body')
+        OutboundEmail.objects.filter(pk=outbound.pk).update(
+            status=OutboundEmail.Status.SENDING,
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        
+        self.assertEqual(process_batch(self.pool), (1, 0))
+    
+    def test_worker_command_once(self):
+        """Test run_email_worker --once drains the queue"""
+        EmailQueue.enqueue('command@example.com', 'Subject', 'Body')
+        
+        call_command('run_email_worker', '--once', stdout=io.StringIO())
+        
+        self.assertEqual(len(mail.outbox), 1)
+    
+    def test_sent_body_is_cleared(self):
+        """Test a delivered OTP doesn't stay readable in the queue table"""
+        send_otp_email('otp@example.com', '654321')
+        
+        self.assertEqual(process_batch(self.pool), (1, 0))
+        
+        self.assertIn('654321', mail.outbox[0].body)
+        outbound = OutboundEmail.objects.get()
+        self.assertEqual((outbound.body, outbound.html_body), ('', ''))
+        self.assertEqual(outbound.subject, 'CredBuzzPay - Your Verification Code')
+    
+    def test_expired_message_is_not_sent(self):
+        """Test an OTP still queued after the code expired is dropped"""
+        send_otp_email('late@example.com', '111111')
+        self.assertIsNotNone(OutboundEmail.objects.get().expires_at)
+        OutboundEmail.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        
+        self.assertEqual(process_batch(self.pool), (0, 0))
+        
+        self.assertEqual(len(mail.outbox), 0)
+        outbound = OutboundEmail.objects.get()
+        self.assertEqual(outbound.status, OutboundEmail.Status.EXPIRED)
+        self.assertEqual(outbound.html_body, '')
+    
+    def test_no_retry_past_expiry(self):
+        """Test a failed send isn't retried once the retry would come after the code expired"""
+        outbound = EmailQueue.enqueue(
+            'expiring@example.com', 'Subject', 'Code 222222', expires_at=timezone.now() + timedelta(seconds=20)
+        )
+        with self.assertLogs('users_auth.email_queue', level='ERROR'), \
+                mock.patch.object(EmailQueue, 'build_message', side_effect=ConnectionError('refused')):
+            self.assertEqual(process_batch(self.pool), (0, 1))
+        
+        outbound.refresh_from_db()
+        self.assertEqual(outbound.status, OutboundEmail.Status.EXPIRED)
+        self.assertEqual(outbound.body, '')
+    
+    def test_finished_messages_are_purged(self):
+        """Test purge_old_records deletes old finished messages but keeps queued ones"""
+        sent = EmailQueue.enqueue('old@example.com', 'Subject', 'Body')
+        queued = EmailQueue.enqueue('pending@example.com', 'Subject', 'Body')
+        OutboundEmail.objects.filter(pk=sent.pk).update(status=OutboundEmail.Status.SENT)
+        OutboundEmail.objects.update(created_at=timezone.now() - timedelta(days=31))
+        
+        call_command('purge_old_records', 'outbound_emails', '--sleep', '0', stdout=io.StringIO())
+        
+        self.assertEqual(list(OutboundEmail.objects.values_list('pk', flat=True)), [queued.pk])
+
+
+class ConditionalProfileTests(APITestCase):
+    """Tests for ETag revalidation of the full profile"""
+    
+    def setUp(self):
+        self.user = User.objects.create(username='profilepoller', email='profilepoller@example.com')
+        self.client.force_authenticate(user=self.user)
+    
+    def test_unchanged_profile_returns_not_modified(self):
+        """Test the current ETag is answered with an empty 304"""
+        etag = self.client.get('/api/auth-user/profile-full/')['ETag']
+        
+        response = self.client.get('/api/auth-user/profile-full/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+    
+    def test_profile_update_changes_etag(self):
+        """Test editing the profile invalidates the ETag"""
+        etag = self.client.get('/api/auth-user/profile-full/')['ETag']
+        
+        self.client.patch('/api/auth-user/profile-full/', {'first_name': 'Changed'}, format='json')
+        response = self.client.get('/api/auth-user/profile-full/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['data']['first_name'], 'Changed')
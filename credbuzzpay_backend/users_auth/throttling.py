@@ -2,17 +2,142 @@
 Custom Throttling Classes for CredBuzz API
 ============================================
 Rate limiting for sensitive operations like login, OTP, and password reset.
+
+The throttles use the generic cell rate algorithm (GCRA): instead of a list
+of request timestamps per key, only the key's theoretical arrival time (TAT)
+is stored, as one integer in microseconds.
+
+Like SimpleRateThrottle, a rate of N requests per period admits at most N
+requests in any window of one period. GCRA can't offer both a burst of N and
+a sustained N per period under that bound, so the N are split: a burst of
+B requests (`burst`, half of N by default), then one request every
+period / (N - B + 1) seconds. In any window of length period that is at most
+B + (N - B + 1) - 1 = N requests.
+
+With the Redis cache backend each check is a single atomic script call, so
+limits are shared exactly by all gunicorn workers. Other backends update the
+TAT under a process lock, which is exact for the per-process local-memory
+cache and best effort for shared backends without scripting.
 """
 
+import math
+import threading
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches, cache as default_cache
+from django.core.cache.backends.redis import RedisCache
 from rest_framework.throttling import SimpleRateThrottle
 
 
-class LoginRateThrottle(SimpleRateThrottle):
+# KEYS[1] = throttle key; ARGV = now, emission interval, limit (microseconds),
+# limit being burst * interval. Returns {allowed, wait}: wait is 0 when allowed,
+# else microseconds until the next request conforms.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+if new_tat - now > limit then
+    return {0, new_tat - limit - now}
+end
+redis.call('SET', KEYS[1], string.format('%d', new_tat), 'PX', string.format('%d', math.ceil((new_tat - now) / 1000)))
+return {1, 0}
+"""
+
+
+class GCRARateThrottle(SimpleRateThrottle):
+    """
+    Drop-in replacement for SimpleRateThrottle using the generic cell rate
+    algorithm. Subclasses only override `.get_cache_key()` and set `scope`
+    or `rate`, exactly as with SimpleRateThrottle, and may set `burst`.
+    """
+
+    # Keeps GCRA state apart from timestamp lists left by SimpleRateThrottle
+    key_prefix = 'gcra_'
+    # Requests admitted back to back; None = half the rate's requests, rounded up
+    burst = None
+
+    _lock = threading.Lock()
+    _script = None
+
+    def allow_request(self, request, view):
+        """
+        Admit the request if it conforms to the rate, advancing the key's TAT.
+        """
+        if self.rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        self.key = self.key_prefix + key
+
+        self.now = self.timer()
+        now = int(self.now * 1_000_000)
+        interval, limit = self.get_schedule()
+
+        # `cache` is usually the default-cache proxy; inspect the real backend
+        backend = caches[DEFAULT_CACHE_ALIAS] if self.cache is default_cache else self.cache
+        if isinstance(backend, RedisCache):
+            allowed, wait = self._check_redis(backend, now, interval, limit)
+        else:
+            allowed, wait = self._check_local(now, interval, limit)
+
+        self._wait = wait / 1_000_000
+        if not allowed:
+            return self.throttle_failure()
+        return True
+
+    def get_schedule(self):
+        """
+        Get the emission interval and the burst limit (burst * interval) in
+        microseconds, chosen so at most num_requests conform per duration.
+
+        Returns:
+            tuple: (interval, limit)
+        """
+        burst = self.burst if self.burst is not None else math.ceil(self.num_requests / 2)
+        burst = min(max(burst, 1), self.num_requests)
+        interval = self.duration * 1_000_000 // (self.num_requests - burst + 1)
+        return interval, burst * interval
+
+    def _check_redis(self, backend, now, interval, limit):
+        """Run the GCRA step atomically inside Redis"""
+        key = backend.make_and_validate_key(self.key)
+        client = backend._cache.get_client(key, write=True)
+        if GCRARateThrottle._script is None:
+            GCRARateThrottle._script = client.register_script(GCRA_SCRIPT)
+        allowed, wait = GCRARateThrottle._script(keys=[key], args=[now, interval, limit], client=client)
+        return bool(allowed), int(wait)
+
+    def _check_local(self, now, interval, limit):
+        """Run the GCRA step as a read-modify-write under a process lock"""
+        with self._lock:
+            tat = max(self.cache.get(self.key) or now, now)
+            new_tat = tat + interval
+            if new_tat - now > limit:
+                return False, new_tat - limit - now
+            self.cache.set(self.key, new_tat, math.ceil((new_tat - now) / 1_000_000))
+        return True, 0
+
+    def wait(self):
+        """
+        Returns the number of seconds until the next request conforms.
+        """
+        return self._wait
+
+
+class LoginRateThrottle(GCRARateThrottle):
     """
     Rate limit for login attempts.
     Uses IP address as the identifier for anonymous users.
     """
     scope = 'login'
+    # Let a user reach the lockout engine's own messages before the IP limit
+    burst = 10
     
     def get_cache_key(self, request, view):
         # Use IP address for login attempts
@@ -23,7 +148,7 @@ class LoginRateThrottle(SimpleRateThrottle):
         }
 
 
-class OTPRateThrottle(SimpleRateThrottle):
+class OTPRateThrottle(GCRARateThrottle):
     """
     Rate limit for OTP requests.
     Uses phone/email + IP combination to prevent abuse.
@@ -45,7 +170,7 @@ class OTPRateThrottle(SimpleRateThrottle):
         }
 
 
-class SensitiveOperationThrottle(SimpleRateThrottle):
+class SensitiveOperationThrottle(GCRARateThrottle):
     """
     Rate limit for sensitive operations like password change, 
     bank details update, etc.
@@ -64,7 +189,7 @@ class SensitiveOperationThrottle(SimpleRateThrottle):
         }
 
 
-class RegistrationRateThrottle(SimpleRateThrottle):
+class RegistrationRateThrottle(GCRARateThrottle):
     """
     Rate limit for registration attempts.
     Prevents mass account creation.
@@ -76,7 +201,7 @@ class RegistrationRateThrottle(SimpleRateThrottle):
         return f"registration_{ident}"
 
 
-class PasswordResetThrottle(SimpleRateThrottle):
+class PasswordResetThrottle(GCRARateThrottle):
     """
     Rate limit for password reset requests.
     Prevents email/SMS bombing.
@@ -89,7 +214,7 @@ class PasswordResetThrottle(SimpleRateThrottle):
         return f"password_reset_{ident}_{email}"
 
 
-class KYCUploadThrottle(SimpleRateThrottle):
+class KYCUploadThrottle(GCRARateThrottle):
     """
     Rate limit for KYC document uploads.
     Prevents storage abuse.
@@ -2,14 +2,17 @@
 Views for users_auth app
 All user authentication and management endpoints
 """
+import json
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.db import transaction
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 
-from .models import User, PasswordResetToken, UserSession, LoginAttempt
+from .models import User, PasswordResetToken, UserSession
 from django.utils import timezone
 from .serializers import (
     UserRegistrationSerializer,
@@ -25,6 +28,10 @@ from .serializers import (
 )
 from .jwt_utils import JWTManager
 from .authentication import JWTAuthentication, get_client_ip, get_user_agent
+from .session_cache import SessionIdentityCache
+from .lockout import LoginLockoutEngine
+from credbuzzpay_backend.conditional import conditional_get
+from credbuzzpay_backend.pagination import KeysetPaginator
 
 
 class RegisterView(APIView):
@@ -50,6 +57,7 @@ class RegisterView(APIView):
     """
     permission_classes = [AllowAny]
     throttle_classes = []  # Using custom throttle below
+    query_budget = 12
     
     def get_throttles(self):
         """Apply registration rate throttle."""
@@ -65,24 +73,18 @@ class RegisterView(APIView):
         if serializer.is_valid():
             user = serializer.save()
             
-            # Import OTP model from kyc_verification
-            from kyc_verification.models import OTPVerification, OTPType
-            import random
+            from kyc_verification.models import OTPType
+            from kyc_verification.otp_store import OTPStore
             
-            # Get OTP settings
-            otp_length = getattr(settings, 'OTP_LENGTH', 6)
-            otp_expiry = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
+            otp_expiry = OTPStore.get_expiry_seconds() // 60
             
             # Track email delivery status
             email_sent = False
             
             # Generate Email OTP
-            email_otp_code = ''.join([str(random.randint(0, 9)) for _ in range(otp_length)])
-            email_otp = OTPVerification.objects.create(
-                user=user,
-                otp_type=OTPType.EMAIL,
-                otp_code=email_otp_code,
-                expires_at=timezone.now() + timezone.timedelta(minutes=otp_expiry),
+            email_otp = OTPStore.issue(
+                user,
+                OTPType.EMAIL,
                 ip_address=get_client_ip(request),
                 user_agent=get_user_agent(request)
             )
@@ -91,17 +93,14 @@ class RegisterView(APIView):
             user_name = user.first_name or user.email.split('@')[0]
             email_sent = send_otp_email(
                 email=user.email,
-                otp_code=email_otp_code,
+                otp_code=email_otp.code,
                 user_name=user_name
             )
             
             # Generate Phone OTP (SMS not implemented yet)
-            phone_otp_code = ''.join([str(random.randint(0, 9)) for _ in range(otp_length)])
-            phone_otp = OTPVerification.objects.create(
-                user=user,
-                otp_type=OTPType.PHONE,
-                otp_code=phone_otp_code,
-                expires_at=timezone.now() + timezone.timedelta(minutes=otp_expiry),
+            phone_otp = OTPStore.issue(
+                user,
+                OTPType.PHONE,
                 ip_address=get_client_ip(request),
                 user_agent=get_user_agent(request)
             )
@@ -124,8 +123,8 @@ class RegisterView(APIView):
             # Include OTP in response only in DEBUG mode for testing
             if settings.DEBUG:
                 response_data['data']['test_otps'] = {
-                    'email_otp': email_otp_code,
-                    'phone_otp': phone_otp_code,
+                    'email_otp': email_otp.code,
+                    'phone_otp': phone_otp.code,
                 }
             
             return Response(response_data, status=status.HTTP_201_CREATED)
@@ -150,9 +149,17 @@ class LoginView(APIView):
     
     POST /api/auth-user/login/
     Request body: {"identifier": "email/username/user_code/phone", "password": "..."}
+    
+    Query budget (successful login, warm permission snapshot):
+    user + KYC lookup, last_login update, session deactivation, session insert.
+    The writes run in a single transaction. Lockout tracking lives in the
+    cache (see LoginLockoutEngine) and only writes on stage transitions.
+    A user's first login on a cold cache also reads the lockout row and the
+    role assignments (6 queries), which QueryBudgetMiddleware logs.
     """
     permission_classes = [AllowAny]
     throttle_classes = []  # Using custom throttle below
+    query_budget = 4
     
     def get_throttles(self):
         """Apply login rate throttle."""
@@ -181,6 +188,41 @@ class LoginView(APIView):
         # Default to username
         return 'USERNAME', identifier
     
+    def _rotate_session(self, user, tokens, ip_address, user_agent):
+        """
+        Invalidate all previous active sessions and create the new one.
+        This ensures user can only be logged in from one device at a time.
+        """
+        UserSession.deactivate_for_user(user)
+        
+        # Create session with activity tracking
+        return UserSession.objects.create(
+            user=user,
+            token_id=tokens['refresh_token_id'],
+            expires_at=tokens['refresh_token_expiry'],
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+    
+    def _get_kyc_status(self, user):
+        """Get KYC status summary for the login response"""
+        if hasattr(user, 'kyc_application'):
+            kyc_app = user.kyc_application
+            return {
+                'status': kyc_app.status,
+                'application_id': kyc_app.application_id,
+                'current_step': kyc_app.current_step,
+                'mega_step': kyc_app.mega_step,
+                'completion_percentage': kyc_app.completion_percentage,
+            }
+        return {
+            'status': 'NOT_STARTED',
+            'application_id': None,
+            'current_step': 0,
+            'mega_step': None,
+            'completion_percentage': 0,
+        }
+    
     def post(self, request):
         ip_address = get_client_ip(request)
         user_agent = get_user_agent(request)
@@ -194,27 +236,19 @@ class LoginView(APIView):
             identifier_type, identifier = self._detect_identifier_type(identifier_input)
         
         # Check for lockout if we have an identifier
-        login_attempt = None
         if identifier and identifier_type:
-            login_attempt = LoginAttempt.get_or_create_for_identifier(
-                identifier=identifier,
-                identifier_type=identifier_type,
-                ip_address=ip_address,
-                user_agent=user_agent
-            )
-            
-            is_locked, lockout_message = login_attempt.is_locked_out()
-            if is_locked:
+            lockout = LoginLockoutEngine.check(identifier, identifier_type, ip_address)
+            if lockout['is_locked']:
                 return Response({
                     'success': False,
-                    'message': lockout_message,
+                    'message': lockout['message'],
                     'errors': {
-                        'non_field_errors': [lockout_message]
+                        'non_field_errors': [lockout['message']]
                     },
                     'data': {
                         'is_locked': True,
-                        'lockout_stage': login_attempt.lockout_stage,
-                        'is_blocked': login_attempt.is_blocked,
+                        'lockout_stage': lockout['lockout_stage'],
+                        'is_blocked': lockout['is_blocked'],
                     }
                 }, status=status.HTTP_429_TOO_MANY_REQUESTS)
         
@@ -223,15 +257,16 @@ class LoginView(APIView):
         
         if not serializer.is_valid():
             # Record failed attempt if we have an identifier
-            if identifier and identifier_type and login_attempt:
-                result = login_attempt.record_failed_attempt()
+            if identifier and identifier_type:
+                result = LoginLockoutEngine.record_failure(
+                    identifier, identifier_type, ip_address, user_agent
+                )
                 
                 # Check if user just got locked out
-                is_locked, lockout_message = login_attempt.is_locked_out()
-                if is_locked:
+                if result['is_locked']:
                     return Response({
                         'success': False,
-                        'message': lockout_message,
+                        'message': result['message'],
                         'errors': serializer.errors,
                         'data': {
                             'is_locked': True,
@@ -266,53 +301,23 @@ class LoginView(APIView):
         
         user = serializer.validated_data['user']
         
-        # Record successful login
-        if identifier and identifier_type and login_attempt:
-            login_attempt.record_successful_login(user=user)
-        
-        # Update last login
-        user.update_last_login()
-        
-        # Generate tokens (now includes permissions)
-        tokens = JWTManager.generate_tokens(user)
-        
-        # Invalidate all previous active sessions (single session login)
-        # This ensures user can only be logged in from one device at a time
-        previous_sessions = UserSession.objects.filter(user=user, is_active=True)
-        previous_sessions_count = previous_sessions.count()
-        previous_sessions.update(is_active=False)
+        # Resolve permissions once (a snapshot cache hit in steady state) and
+        # reuse them for the token claims and the response
+        app_access, feature_access = JWTManager.get_user_permissions(user)
+        tokens = JWTManager.generate_tokens(user, permissions=(app_access, feature_access))
         
-        # Create session with activity tracking
-        session = UserSession.objects.create(
-            user=user,
-            token_id=tokens['refresh_token_id'],
-            expires_at=tokens['refresh_token_expiry'],
-            ip_address=ip_address,
-            user_agent=user_agent
-        )
+        # Reset lockout tracking
+        if identifier and identifier_type:
+            LoginLockoutEngine.record_success(identifier, identifier_type)
         
-        # Get app and feature access for response
-        app_access, feature_access = JWTManager.get_user_permissions(user)
+        with transaction.atomic(savepoint=False):
+            # Update last login
+            user.update_last_login()
+            
+            session = self._rotate_session(user, tokens, ip_address, user_agent)
         
-        # Get KYC status
-        kyc_status = None
-        if hasattr(user, 'kyc_application'):
-            kyc_app = user.kyc_application
-            kyc_status = {
-                'status': kyc_app.status,
-                'application_id': kyc_app.application_id,
-                'current_step': kyc_app.current_step,
-                'mega_step': kyc_app.mega_step,
-                'completion_percentage': kyc_app.completion_percentage,
-            }
-        else:
-            kyc_status = {
-                'status': 'NOT_STARTED',
-                'application_id': None,
-                'current_step': 0,
-                'mega_step': None,
-                'completion_percentage': 0,
-            }
+        # KYC status for redirect decision (prefetched with the user)
+        kyc_status = self._get_kyc_status(user)
         
         return Response({
             'success': True,
@@ -345,6 +350,7 @@ class LogoutView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def post(self, request):
         # Get token ID from auth payload
@@ -354,12 +360,13 @@ class LogoutView(APIView):
         logout_all = request.data.get('logout_all', False)
         
         if logout_all:
-            UserSession.objects.filter(user=request.user, is_active=True).update(is_active=False)
+            UserSession.deactivate_for_user(request.user)
             message = 'Logged out from all devices successfully.'
         else:
             # Just mark the current session type tokens as invalid
             # For single logout, we'd need the refresh token ID
-            # For now, just return success
+            # For now, drop the cached identity so the next request is re-checked
+            SessionIdentityCache.invalidate_user(request.user.id)
             message = 'Logged out successfully.'
         
         return Response({
@@ -374,6 +381,7 @@ class ForgotPasswordView(APIView):
     POST /api/auth-user/forgot-password/
     """
     permission_classes = [AllowAny]
+    query_budget = 6
     
     def post(self, request):
         serializer = ForgotPasswordSerializer(data=request.data)
@@ -419,6 +427,7 @@ class ResetPasswordView(APIView):
     POST /api/auth-user/reset-password/
     """
     permission_classes = [AllowAny]
+    query_budget = 9
     
     def post(self, request):
         serializer = ResetPasswordSerializer(data=request.data)
@@ -437,7 +446,7 @@ class ResetPasswordView(APIView):
                 reset_token.mark_as_used()
                 
                 # Invalidate all existing sessions
-                UserSession.objects.filter(user=user, is_active=True).update(is_active=False)
+                UserSession.deactivate_for_user(user)
             
             return Response({
                 'success': True,
@@ -458,6 +467,7 @@ class ChangePasswordView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 8
     
     def post(self, request):
         serializer = ChangePasswordSerializer(data=request.data)
@@ -482,7 +492,7 @@ class ChangePasswordView(APIView):
             # Optionally invalidate other sessions
             logout_others = request.data.get('logout_others', False)
             if logout_others:
-                UserSession.objects.filter(user=user, is_active=True).update(is_active=False)
+                UserSession.deactivate_for_user(user)
             
             return Response({
                 'success': True,
@@ -502,6 +512,7 @@ class RefreshTokenView(APIView):
     POST /api/auth-user/refresh-token/
     """
     permission_classes = [AllowAny]
+    query_budget = 4
     
     def post(self, request):
         serializer = TokenRefreshSerializer(data=request.data)
@@ -541,6 +552,7 @@ class UserProfileView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 4, 'put': 8, 'patch': 8}
     
     def get(self, request):
         """Get current user profile"""
@@ -580,19 +592,37 @@ class UserListView(APIView):
     API endpoint for listing all users (admin only in production)
     GET /api/auth-user/users/
     
+    Users are returned newest first, one page at a time (keyset pagination).
+    
     Query params:
     - is_active: Filter by active status (true/false)
     - is_deleted: Filter by deleted status (true/false) - default is false
     - include_deleted: Include deleted users in results (true/false)
-    - search: Search by email, username, first_name, last_name
+    - search: Search by email, username, first_name, last_name, user_code
+    - page_size: Users per page (default 50, max 500)
+    - cursor: next_cursor from the previous page
+    - include_total: Also return total_count (costs a COUNT query)
+    - stream: Stream all matching users as one JSON document, for exports (true/false)
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
     
-    def get(self, request):
-        """Get list of all users"""
-        # Start with all users
-        users = User.objects.all()
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+    STREAM_CHUNK_SIZE = 1000
+    
+    # Columns needed by UserListSerializer
+    LIST_FIELDS = (
+        'id', 'user_code', 'email', 'username', 'first_name', 'middle_name', 'last_name',
+        'user_role', 'is_active', 'is_deleted', 'deleted_at', 'created_at',
+    )
+    
+    paginator = KeysetPaginator('created_at')
+    query_budget = 5
+    
+    def get_queryset(self, request):
+        """Build the filtered user queryset from the query params"""
+        users = User.objects.only(*self.LIST_FIELDS)
         
         # By default, exclude soft-deleted users unless include_deleted=true
         include_deleted = request.query_params.get('include_deleted', 'false').lower() == 'true'
@@ -611,23 +641,55 @@ class UserListView(APIView):
             is_active = is_active.lower() == 'true'
             users = users.filter(is_active=is_active)
         
-        # Search by email or username
-        search = request.query_params.get('search')
+        # Search the normalized search column (one indexed substring match)
+        search = User.normalize_search(request.query_params.get('search'))
         if search:
-            from django.db.models import Q
-            users = users.filter(
-                Q(email__icontains=search) |
-                Q(username__icontains=search) |
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(user_code__icontains=search)
-            )
+            users = users.filter(search_text__contains=search)
         
-        return Response({
+        return users
+    
+    def get(self, request):
+        """Get a page of users, or stream all of them"""
+        users = self.get_queryset(request)
+        
+        if request.query_params.get('stream', 'false').lower() == 'true':
+            response = StreamingHttpResponse(self.stream_users(users), content_type='application/json')
+            response['Content-Disposition'] = 'attachment; filename="users.json"'
+            return response
+        
+        try:
+            page_size = int(request.query_params.get('page_size', self.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            page_size = self.DEFAULT_PAGE_SIZE
+        page_size = max(1, min(page_size, self.MAX_PAGE_SIZE))
+        
+        try:
+            page, next_cursor = self.paginator.page(users, page_size, request.query_params.get('cursor'))
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': 'Invalid cursor.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = {
             'success': True,
-            'data': UserListSerializer(users, many=True).data,
-            'count': users.count()
-        }, status=status.HTTP_200_OK)
+            'data': UserListSerializer(page, many=True).data,
+            'count': len(page),
+            'next_cursor': next_cursor,
+        }
+        if request.query_params.get('include_total', 'false').lower() == 'true':
+            data['total_count'] = users.count()
+        return Response(data, status=status.HTTP_200_OK)
+    
+    def stream_users(self, users):
+        """Yield a JSON document of every user, holding one chunk in memory at a time"""
+        yield '{"success": true, "data": ['
+        count = 0
+        for chunk in self.paginator.chunks(users, self.STREAM_CHUNK_SIZE):
+            rows = ','.join(json.dumps(row) for row in UserListSerializer(chunk, many=True).data)
+            yield (',' if count else '') + rows
+            count += len(chunk)
+        yield f'], "count": {count}}}'
 
 
 class UserDetailView(APIView):
@@ -639,6 +701,7 @@ class UserDetailView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 5, 'put': 6, 'patch': 6, 'delete': 7}
     
     def get_user(self, user_id):
         """Get user by ID (exclude soft deleted users)"""
@@ -719,7 +782,7 @@ class UserDetailView(APIView):
         user.save()
         
         # Invalidate all sessions
-        UserSession.objects.filter(user=user, is_active=True).update(is_active=False)
+        UserSession.deactivate_for_user(user)
         
         return Response({
             'success': True,
@@ -743,6 +806,7 @@ class UserHardDeleteView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 45
     
     def delete(self, request, user_id):
         """
@@ -789,6 +853,7 @@ class UserRestoreView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 6
     
     def post(self, request, user_id):
         """Restore a soft-deleted user"""
@@ -821,6 +886,7 @@ class UserActivateView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 7
     
     def post(self, request, user_id, action):
         """Activate or deactivate user"""
@@ -840,7 +906,7 @@ class UserActivateView(APIView):
             user.is_active = False
             user.save()
             # Invalidate all sessions
-            UserSession.objects.filter(user=user, is_active=True).update(is_active=False)
+            UserSession.deactivate_for_user(user)
             message = 'User deactivated successfully.'
         else:
             return Response({
@@ -874,6 +940,7 @@ class VerifyRegistrationOTPView(APIView):
     }
     """
     permission_classes = [AllowAny]
+    query_budget = 4
     
     def post(self, request):
         email = request.data.get('email')
@@ -900,8 +967,7 @@ class VerifyRegistrationOTPView(APIView):
                 'message': 'User not found.',
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Import OTP model
-        from kyc_verification.models import OTPVerification, OTPType
+        from kyc_verification.otp_store import OTPStore
         
         # Validate OTP type
         valid_types = ['EMAIL', 'PHONE']
@@ -911,26 +977,19 @@ class VerifyRegistrationOTPView(APIView):
                 'message': f'Invalid OTP type. Must be one of: {", ".join(valid_types)}',
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get the latest active OTP for this user and type
-        otp_record = OTPVerification.objects.filter(
-            user=user,
-            otp_type=otp_type.upper(),
-            is_verified=False
-        ).order_by('-created_at').first()
+        # Count the attempt and check the code against the pending OTP
+        result = OTPStore.verify(user, otp_type.upper(), otp_code)
         
-        if not otp_record:
+        if not result.found:
             return Response({
                 'success': False,
                 'message': f'No active OTP found for {otp_type}. Please request a new OTP.',
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Verify OTP
-        success, message = otp_record.verify(otp_code)
-        
-        if not success:
+        if not result.success:
             return Response({
                 'success': False,
-                'message': message,
+                'message': result.message,
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Update user verification status
@@ -971,9 +1030,9 @@ class ResendRegistrationOTPView(APIView):
     }
     """
     permission_classes = [AllowAny]
+    query_budget = 3
     
     def post(self, request):
-        import random
         from django.conf import settings
         from .email_service import send_otp_email
         
@@ -995,8 +1054,7 @@ class ResendRegistrationOTPView(APIView):
                 'message': 'User not found.',
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Import OTP model
-        from kyc_verification.models import OTPVerification, OTPType
+        from kyc_verification.otp_store import OTPStore
         
         # Check if already verified
         if otp_type.upper() == 'EMAIL' and user.is_email_verified:
@@ -1011,36 +1069,24 @@ class ResendRegistrationOTPView(APIView):
                 'message': 'Phone is already verified.',
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get OTP settings
-        otp_length = getattr(settings, 'OTP_LENGTH', 6)
-        otp_expiry = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
+        otp_expiry = OTPStore.get_expiry_seconds() // 60
         
-        # Invalidate existing OTPs
-        OTPVerification.objects.filter(
-            user=user,
-            otp_type=otp_type.upper(),
-            is_verified=False
-        ).update(expires_at=timezone.now())
-        
-        # Generate new OTP
-        otp_code = ''.join([str(random.randint(0, 9)) for _ in range(otp_length)])
-        
-        otp = OTPVerification.objects.create(
-            user=user,
-            otp_type=otp_type.upper(),
-            otp_code=otp_code,
-            expires_at=timezone.now() + timezone.timedelta(minutes=otp_expiry),
+        # Replaces any pending OTP; a repeat within the coalesce window
+        # returns the one already sent (code is None) instead
+        otp = OTPStore.issue(
+            user,
+            otp_type.upper(),
             ip_address=get_client_ip(request),
             user_agent=get_user_agent(request)
         )
         
-        # Send OTP via email if type is EMAIL
+        # Send OTP via email if type is EMAIL; a coalesced send sends nothing
         email_sent = False
-        if otp_type.upper() == 'EMAIL':
+        if otp_type.upper() == 'EMAIL' and not otp.coalesced:
             user_name = user.first_name or user.email.split('@')[0]
             email_sent = send_otp_email(
                 email=user.email,
-                otp_code=otp_code,
+                otp_code=otp.code,
                 user_name=user_name
             )
         
@@ -1049,6 +1095,7 @@ class ResendRegistrationOTPView(APIView):
             'message': f'OTP sent to your {otp_type.lower()}.',
             'data': {
                 'expires_in_minutes': otp_expiry,
+                'coalesced': otp.coalesced,
             }
         }
         
@@ -1056,8 +1103,8 @@ class ResendRegistrationOTPView(APIView):
             response_data['data']['email_sent'] = email_sent
         
         # Include OTP in response only in DEBUG mode for testing
-        if settings.DEBUG:
-            response_data['data']['test_otp'] = otp_code
+        if settings.DEBUG and otp.code:
+            response_data['data']['test_otp'] = otp.code
         
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -1081,6 +1128,7 @@ class UserActivityLogListView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         from .models import UserActivityLog
@@ -1143,6 +1191,7 @@ class MyActivityLogView(APIView):
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 5
     
     def get(self, request):
         from .models import UserActivityLog
@@ -1174,6 +1223,21 @@ class MyActivityLogView(APIView):
 # USER PROFILE WITH KYC STATUS AND ACCESS
 # =============================================================================
 
+def profile_full_version(view, request):
+    """
+    The full profile changes with the user row, the KYC application or the
+    user's effective access; none of these needs the serializers.
+    """
+    from kyc_verification.models import KYCApplication
+    from rbac.cache import get_user_access_version
+    
+    user = request.user
+    kyc_updated_at = KYCApplication.objects.filter(user=user, is_deleted=False).values_list(
+        'updated_at', flat=True
+    ).first()
+    return (view.get_user_data(user), kyc_updated_at, get_user_access_version(user)), None
+
+
 class UserProfileWithAccessView(APIView):
     """
     API endpoint to get comprehensive user profile with:
@@ -1184,35 +1248,22 @@ class UserProfileWithAccessView(APIView):
     
     GET /api/auth-user/profile-full/
     
+    Supports conditional GET: send the ETag back in If-None-Match to get
+    304 Not Modified while nothing changed.
+    
     Can also update profile:
     PATCH /api/auth-user/profile-full/
     """
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {'get': 8, 'patch': 5}
     
+    @conditional_get(profile_full_version)
     def get(self, request):
         user = request.user
         
         # Build profile data
-        profile_data = {
-            'id': user.id,
-            'user_code': user.user_code,
-            'email': user.email,
-            'username': user.username,
-            'first_name': user.first_name,
-            'middle_name': getattr(user, 'middle_name', None),
-            'last_name': user.last_name,
-            'full_name': user.full_name,
-            'phone_number': user.phone_number,
-            'user_role': user.user_role,
-            'is_active': user.is_active,
-            'is_verified': user.is_verified,
-            'is_email_verified': getattr(user, 'is_email_verified', False),
-            'is_phone_verified': getattr(user, 'is_phone_verified', False),
-            'created_at': user.created_at.isoformat() if user.created_at else None,
-            'updated_at': user.updated_at.isoformat() if user.updated_at else None,
-            'last_login': user.last_login.isoformat() if user.last_login else None,
-        }
+        profile_data = self.get_user_data(user)
         
         # Get KYC status
         kyc_status = None
@@ -1240,61 +1291,39 @@ class UserProfileWithAccessView(APIView):
                 'message': 'KYC not yet initiated'
             }
         
-        # Get app and feature access
-        app_access = []
-        feature_access = []
-        
-        try:
-            from rbac.models import UserRoleAssignment, RoleAppMapping, RoleFeatureMapping
-            
-            # Get user's active role assignments
-            role_assignments = UserRoleAssignment.objects.filter(
-                user=user,
-                is_active=True
-            ).select_related('role')
-            
-            for assignment in role_assignments:
-                role = assignment.role
-                
-                # Get app access
-                app_mappings = RoleAppMapping.objects.filter(
-                    role=role,
-                    is_active=True
-                ).select_related('app')
-                
-                for mapping in app_mappings:
-                    app_data = {
-                        'app_id': mapping.app.id,
-                        'app_code': mapping.app.code,
-                        'app_name': mapping.app.name,
-                        'can_view': mapping.can_view,
-                        'can_create': mapping.can_create,
-                        'can_update': mapping.can_update,
-                        'can_delete': mapping.can_delete,
-                    }
-                    if app_data not in app_access:
-                        app_access.append(app_data)
-                
-                # Get feature access
-                feature_mappings = RoleFeatureMapping.objects.filter(
-                    role=role,
-                    is_active=True
-                ).select_related('feature', 'feature__app')
-                
-                for mapping in feature_mappings:
-                    feature_data = {
-                        'feature_id': mapping.feature.id,
-                        'feature_code': mapping.feature.code,
-                        'feature_name': mapping.feature.name,
-                        'app_code': mapping.feature.app.code,
-                        'can_execute': mapping.can_execute,
-                        'can_view': mapping.can_view,
-                        'can_edit': mapping.can_edit,
-                    }
-                    if feature_data not in feature_access:
-                        feature_access.append(feature_data)
-        except:
-            pass
+        # Get app and feature access from the materialized projection,
+        # merging the permissions granted by each of the user's roles
+        from rbac.effective_access import EffectiveAccess
+        
+        apps = {}
+        features = {}
+        for entry in EffectiveAccess.for_user(user):
+            if entry.feature_id is None:
+                data = apps.setdefault(entry.app_id, {
+                    'app_id': entry.app.id,
+                    'app_code': entry.app.code,
+                    'app_name': entry.app.name,
+                    'can_view': False,
+                    'can_create': False,
+                    'can_update': False,
+                    'can_delete': False,
+                })
+            else:
+                data = features.setdefault(entry.feature_id, {
+                    'feature_id': entry.feature.id,
+                    'feature_code': entry.feature.code,
+                    'feature_name': entry.feature.name,
+                    'app_code': entry.app.code,
+                    'can_view': False,
+                    'can_create': False,
+                    'can_update': False,
+                    'can_delete': False,
+                })
+            for flag in ('can_view', 'can_create', 'can_update', 'can_delete'):
+                data[flag] = data[flag] or getattr(entry, flag)
+        
+        app_access = list(apps.values())
+        feature_access = list(features.values())
         
         # Add to profile
         profile_data['kyc_status'] = kyc_status
@@ -1307,6 +1336,28 @@ class UserProfileWithAccessView(APIView):
             'data': profile_data
         }, status=status.HTTP_200_OK)
     
+    def get_user_data(self, user):
+        """Profile fields of the user row"""
+        return {
+            'id': user.id,
+            'user_code': user.user_code,
+            'email': user.email,
+            'username': user.username,
+            'first_name': user.first_name,
+            'middle_name': getattr(user, 'middle_name', None),
+            'last_name': user.last_name,
+            'full_name': user.full_name,
+            'phone_number': user.phone_number,
+            'user_role': user.user_role,
+            'is_active': user.is_active,
+            'is_verified': user.is_verified,
+            'is_email_verified': getattr(user, 'is_email_verified', False),
+            'is_phone_verified': getattr(user, 'is_phone_verified', False),
+            'created_at': user.created_at.isoformat() if user.created_at else None,
+            'updated_at': user.updated_at.isoformat() if user.updated_at else None,
+            'last_login': user.last_login.isoformat() if user.last_login else None,
+        }
+    
     def patch(self, request):
         """Update user profile"""
         user = request.user
@@ -1368,6 +1419,7 @@ class CreatePrivilegedUserView(APIView):
     """
     permission_classes = [AllowAny]
     throttle_classes = [] 
+    query_budget = 12
     
     def post(self, request):
         # Check for system setup secret key